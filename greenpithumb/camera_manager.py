@@ -1,19 +1,25 @@
+import io
 import logging
 import os
 
+import image_layout
+import latest_readings
+import metrics
+
 logger = logging.getLogger(__name__)
 
-# Format of filename to write for camera image file (assumes timestamp is in
-# UTC), as YYYY-MM-DDTHH:MMZ (minutes-level precision).
-_FILENAME_FORMAT = '%Y-%m-%dT%H%MZ.jpg'
 # Light level below which camera will not capture photos.
 LIGHT_THRESHOLD_PCT = 60
 
+_capture_seconds = metrics.histogram('greenpithumb_camera_capture_seconds',
+                                     'Time taken to capture each photo.')
+
 
 class CameraManager(object):
-    """Captures and saves photos to the filesystem."""
+    """Captures photos and hands them off to be saved to the filesystem."""
 
-    def __init__(self, image_path, clock, camera, light_sensor):
+    def __init__(self, image_path, clock, camera, light_sensor, readings,
+                 image_processor):
         """Creates a new camera manager instance.
 
         Args:
@@ -21,6 +27,10 @@ class CameraManager(object):
             clock: Clock interface.
             camera: Camera interface.
             light_sensor: An interface for reading the light level.
+            readings: Registry of latest sensor readings, used to share light
+                readings with the light poller.
+            image_processor: An interface for saving and processing captured
+                frames in the background.
         """
         if not os.path.exists(image_path):
             os.makedirs(image_path)
@@ -28,27 +38,44 @@ class CameraManager(object):
         self._clock = clock
         self._camera = camera
         self._light_sensor = light_sensor
+        self._readings = readings
+        self._image_processor = image_processor
 
     def sufficient_light(self):
         """Checks if there is sufficient light to capture a photo.
 
+        Reuses the light poller's reading if it is recent, so that the decision
+        is consistent with the stored light levels and the sensor is read only
+        once when both poll at the same time.
+
         Returns:
             A boolean indicating whether or not there is sufficient light.
         """
-        if self._light_sensor.light() >= LIGHT_THRESHOLD_PCT:
+        light = self._readings.read(latest_readings.LIGHT,
+                                    latest_readings.DEFAULT_MAX_AGE,
+                                    self._light_sensor.light)
+        if light >= LIGHT_THRESHOLD_PCT:
             return True
         return False
 
     def save_photo(self):
-        """Captures an image from the camera and saves it to the filesystem."""
-        path = os.path.join(self._image_path,
-                            self._clock.now().strftime(_FILENAME_FORMAT))
-        self._camera.capture(path)
-        logger.info('saved new photo to %s', path)
+        """Captures an image from the camera and queues it to be saved.
+
+        Returns as soon as the frame is captured. The image processor writes
+        the image to the filesystem in the background.
+        """
+        timestamp = self._clock.now()
+        stream = io.BytesIO()
+        with _capture_seconds.time():
+            self._camera.capture(stream, format='jpeg')
+        self._image_processor.submit(timestamp,
+                                     image_layout.relative_path(timestamp),
+                                     stream.getvalue())
 
     def close(self):
-        """Closes the camera.
+        """Closes the camera and finishes processing any captured images.
 
         Should be called when use of the camera is complete.
         """
         self._camera.close()
+        self._image_processor.close()
@@ -1,6 +1,9 @@
+import calendar
 import datetime
+import threading
 import time
 
+import monotonic as monotonic_clock
 import pytz
 import tzlocal
 
@@ -22,17 +25,43 @@ class Clock(object):
     def now(self):
         return datetime.datetime.now(tz=pytz.utc)
 
+    def now_unix(self):
+        """Returns the current time as whole seconds since the UNIX epoch."""
+        return int(time.time())
+
+    def monotonic(self):
+        """Returns the time (in seconds) of a clock that never goes backwards.
+
+        The value has no defined starting point, so it is only meaningful when
+        compared to other values returned by this method.
+        """
+        return monotonic_clock.monotonic()
+
 
 class LocalClock(Clock):
-    """An implementation of Clock that operates in the local time zone."""
+    """An implementation of Clock that operates in the local time zone.
+
+    The local time zone is resolved once, when the clock is created. Call
+    refresh_timezone() to pick up a change to the system's time zone.
+    """
+
+    def __init__(self):
+        self._timezone = tzlocal.get_localzone()
+
+    def refresh_timezone(self):
+        """Resolves the system's local time zone again."""
+        self._timezone = tzlocal.reload_localzone()
 
     def now(self):
-        time_utc = super(LocalClock, self).now()
-        return time_utc.astimezone(tzlocal.get_localzone())
+        return datetime.datetime.now(tz=self._timezone)
 
 
 class Timer(object):
-    """A countdown timer."""
+    """A countdown timer.
+
+    Measures time with the clock's monotonic clock, so the countdown is not
+    affected by changes to the wall clock time.
+    """
 
     def __init__(self, clock, duration):
         """Creates a new timer.
@@ -62,12 +91,183 @@ class Timer(object):
         if time_remaining > self._duration:
             raise ValueError(
                 'Cannot set time_remaining to longer than duration')
-        self._end_time = self._clock.now() + time_remaining
+        self._end_time = (
+            self._clock.monotonic() + time_remaining.total_seconds())
+        self._deadline = self._clock.now() + time_remaining
 
     def expired(self):
         """Returns True if the countdown has expired."""
-        return self._clock.now() >= self._end_time
+        return self._clock.monotonic() >= self._end_time
+
+    def deadline(self):
+        """Returns the wall clock time at which the countdown expires.
+
+        The time is fixed when the countdown is set, so it only changes when
+        the timer is reset or adjusted.
+        """
+        return self._deadline
 
     def reset(self):
         """Resets the countdown timer to its starting duration."""
-        self._end_time = self._clock.now() + self._duration
+        self._end_time = (
+            self._clock.monotonic() + self._duration.total_seconds())
+        self._deadline = self._clock.now() + self._duration
+
+
+class SimulatedClock(Clock):
+    """A clock that runs on virtual time, for accelerated simulation.
+
+    Virtual time stands still while any participating thread is busy. Once all
+    participating threads are blocked in wait(), virtual time jumps to the
+    earliest time at which one of them is due to wake. This lets the normal
+    polling, watering and photo logic run through days of activity in seconds
+    of real time, with each thread seeing the same times it would see in real
+    operation.
+
+    A thread becomes a participant when it first calls wait(). Virtual time
+    does not advance until the number of participants given to
+    set_participant_count() have all called wait(), so that threads that start
+    late do not miss events. Threads stop participating when they exit or call
+    leave().
+    """
+
+    def __init__(self, start_time):
+        """Creates a new SimulatedClock instance.
+
+        Args:
+            start_time: A timezone-aware datetime of the initial virtual time.
+        """
+        self._start_time = start_time
+        self._start_unix = calendar.timegm(start_time.utctimetuple())
+        self._elapsed_seconds = 0.0
+        self._condition = threading.Condition()
+        self._participant_count = None
+        self._started = False
+        self._participants = set()
+        # Virtual wake-up time (in elapsed seconds) of each waiting thread.
+        self._wake_times = {}
+
+    def set_participant_count(self, participant_count):
+        """Sets the number of threads that must wait before time can advance.
+
+        Args:
+            participant_count: Number of threads that will call wait().
+        """
+        with self._condition:
+            self._participant_count = participant_count
+            self._condition.notify_all()
+
+    def leave(self):
+        """Stops the calling thread from participating in the simulation."""
+        with self._condition:
+            if threading.current_thread() in self._participants:
+                self._participants.remove(threading.current_thread())
+                # A participant that leaves before the simulation starts is no
+                # longer expected to arrive.
+                if not self._started and self._participant_count:
+                    self._participant_count -= 1
+            self._advance_if_idle()
+
+    def wait(self, wait_time_seconds):
+        """Blocks the caller until virtual time advances by the given amount.
+
+        Args:
+            wait_time_seconds: Number of virtual seconds to wait.
+        """
+        if wait_time_seconds < 0.0:
+            raise ValueError(
+                'Wait time cannot be negative: %f' % wait_time_seconds)
+        current_thread = threading.current_thread()
+        with self._condition:
+            if current_thread not in self._participants:
+                self._participants.add(current_thread)
+                self._watch_participant(current_thread)
+            wake_time = self._elapsed_seconds + wait_time_seconds
+            self._wake_times[current_thread] = wake_time
+            try:
+                self._advance_if_idle()
+                while self._elapsed_seconds < wake_time:
+                    self._condition.wait()
+            finally:
+                del self._wake_times[current_thread]
+
+    def _watch_participant(self, participant):
+        """Stops counting a participant thread once it exits."""
+        # The process ends when the main thread exits, so there is nothing to
+        # watch for.
+        if isinstance(participant, threading._MainThread):
+            return
+
+        def remove_when_exited():
+            participant.join()
+            with self._condition:
+                self._participants.discard(participant)
+                self._advance_if_idle()
+
+        watcher = threading.Thread(target=remove_when_exited)
+        watcher.setDaemon(True)
+        watcher.start()
+
+    def _advance_if_idle(self):
+        """Advances virtual time if every participant is waiting.
+
+        Must be called while holding self._condition.
+        """
+        if not self._started:
+            if (self._participant_count is None or
+                    len(self._participants) < self._participant_count):
+                return
+            self._started = True
+        waiting = [
+            self._wake_times[t] for t in self._participants
+            if t in self._wake_times
+        ]
+        if not waiting or len(waiting) < len(self._participants):
+            return
+        next_wake_time = min(waiting)
+        if next_wake_time > self._elapsed_seconds:
+            self._elapsed_seconds = next_wake_time
+            self._condition.notify_all()
+
+    def now(self):
+        with self._condition:
+            elapsed_seconds = self._elapsed_seconds
+        return (self._start_time + datetime.timedelta(
+            seconds=elapsed_seconds)).astimezone(pytz.utc)
+
+    def now_unix(self):
+        with self._condition:
+            return self._start_unix + int(self._elapsed_seconds)
+
+    def monotonic(self):
+        with self._condition:
+            return self._elapsed_seconds
+
+
+class SimulatedLocalClock(object):
+    """A view of a SimulatedClock that operates in the local time zone."""
+
+    def __init__(self, simulated_clock):
+        """Creates a new SimulatedLocalClock instance.
+
+        Args:
+            simulated_clock: The SimulatedClock that keeps virtual time.
+        """
+        self._clock = simulated_clock
+        self._timezone = tzlocal.get_localzone()
+
+    def refresh_timezone(self):
+        """Resolves the system's local time zone again."""
+        self._timezone = tzlocal.reload_localzone()
+
+    def wait(self, wait_time_seconds):
+        self._clock.wait(wait_time_seconds)
+
+    def now(self):
+        return self._clock.now().astimezone(self._timezone)
+
+    def now_unix(self):
+        return self._clock.now_unix()
+
+    def monotonic(self):
+        return self._clock.monotonic()
@@ -0,0 +1,178 @@
+"""Applies changed settings to a running GreenPiThumb without restarting it."""
+
+import collections
+import datetime
+import logging
+import threading
+
+import poller
+import sleep_windows
+import wiring_config_parser
+
+logger = logging.getLogger(__name__)
+
+# Shortest poll interval that a reload may set.
+_MIN_POLL_INTERVAL = datetime.timedelta(seconds=1)
+# Range of soil moisture levels that the ADC can report.
+_MIN_MOISTURE_THRESHOLD = 0
+_MAX_MOISTURE_THRESHOLD = 1023
+
+
+class Error(Exception):
+    pass
+
+
+class InvalidSettingsError(Error):
+    """Indicates that reloaded settings are invalid."""
+    pass
+
+
+# Settings that can change while GreenPiThumb is running.
+#  moisture_threshold: Soil moisture level below which the pump turns on.
+#  sleep_windows: A list of 2-tuples of datetime.time objects, each
+#    representing a sleep window.
+#  poll_interval: timedelta of how often to poll non-camera sensors.
+#  photo_interval: timedelta of how often to capture photos.
+#  wiring_config: Wiring configuration for the GreenPiThumb. Only the pump pin
+#    can change while running.
+Settings = collections.namedtuple('Settings', [
+    'moisture_threshold', 'sleep_windows', 'poll_interval', 'photo_interval',
+    'wiring_config'
+])
+
+
+def _validate(settings):
+    """Validates reloaded settings.
+
+    Args:
+        settings: The Settings to validate.
+
+    Raises:
+        InvalidSettingsError if any setting is out of range.
+    """
+    if not (_MIN_MOISTURE_THRESHOLD <= settings.moisture_threshold <=
+            _MAX_MOISTURE_THRESHOLD):
+        raise InvalidSettingsError(
+            'Moisture threshold must be between %d and %d: %d' %
+            (_MIN_MOISTURE_THRESHOLD, _MAX_MOISTURE_THRESHOLD,
+             settings.moisture_threshold))
+    for interval in (settings.poll_interval, settings.photo_interval):
+        if interval < _MIN_POLL_INTERVAL:
+            raise InvalidSettingsError('Poll interval must be at least %s: %s' %
+                                       (_MIN_POLL_INTERVAL, interval))
+
+
+def _restart_only_wiring_changed(old_wiring_config, new_wiring_config):
+    """Returns True if wiring that is only read at startup changed.
+
+    Every pin other than the pump pin is set up when GreenPiThumb starts, so
+    changing them requires a restart.
+    """
+    if (old_wiring_config.gpio_pins._replace(pump=None) !=
+            new_wiring_config.gpio_pins._replace(pump=None)):
+        return True
+    old_adc_channels = old_wiring_config.adc_channels
+    new_adc_channels = new_wiring_config.adc_channels
+    return ((old_adc_channels.soil_moisture_sensor !=
+             new_adc_channels.soil_moisture_sensor) or
+            (old_adc_channels.light_sensor != new_adc_channels.light_sensor))
+
+
+class ConfigReloader(object):
+    """Reloads settings and swaps them into running components.
+
+    A reload is requested with request_reload(), which is safe to call from a
+    signal handler. The main loop then calls reload_if_requested(), which
+    loads and validates the new settings and applies them only if they are all
+    valid. Pollers keep polling throughout.
+    """
+
+    def __init__(self, load_settings_func, settings, pump_manager,
+                 pump_scheduler, water_pump, retention_job, schedulers,
+                 record_processor):
+        """Creates a new ConfigReloader instance.
+
+        Args:
+            load_settings_func: Function that loads the current Settings. It
+                may raise an Error, IOError, wiring_config_parser.Error or
+                sleep_windows.Error if the settings cannot be loaded.
+            settings: The Settings with which GreenPiThumb started.
+            pump_manager: PumpManager whose moisture threshold to update.
+            pump_scheduler: PumpScheduler whose sleep windows to update.
+            water_pump: Pump whose GPIO pin to update.
+            retention_job: RetentionJob whose sleep windows to update.
+            schedulers: A dictionary of poller names to their schedulers, whose
+                poll intervals to update.
+            record_processor: RecordProcessor whose poll interval for
+                recording gaps in readings to update.
+        """
+        self._load_settings_func = load_settings_func
+        self._settings = settings
+        self._startup_wiring_config = settings.wiring_config
+        self._pump_manager = pump_manager
+        self._pump_scheduler = pump_scheduler
+        self._water_pump = water_pump
+        self._retention_job = retention_job
+        self._schedulers = schedulers
+        self._record_processor = record_processor
+        self._reload_requested = threading.Event()
+
+    def request_reload(self):
+        """Requests that settings be reloaded on the next check."""
+        self._reload_requested.set()
+
+    def reload_if_requested(self):
+        """Reloads settings if a reload was requested.
+
+        Returns:
+            True if new settings were applied, False otherwise.
+        """
+        if not self._reload_requested.is_set():
+            return False
+        self._reload_requested.clear()
+        logger.info('reloading settings')
+        try:
+            settings = self._load_settings_func()
+            _validate(settings)
+        except (Error, IOError, sleep_windows.Error,
+                wiring_config_parser.Error) as e:
+            logger.error('keeping current settings, failed to reload: %s', e)
+            return False
+        self._apply(settings)
+        return True
+
+    def _apply(self, settings):
+        """Swaps new settings into the running components."""
+        old_settings = self._settings
+        if settings.moisture_threshold != old_settings.moisture_threshold:
+            logger.info('changing moisture threshold from %d to %d',
+                        old_settings.moisture_threshold,
+                        settings.moisture_threshold)
+            self._pump_manager.set_moisture_threshold(
+                settings.moisture_threshold)
+        if settings.sleep_windows != old_settings.sleep_windows:
+            logger.info('changing sleep windows to %s', settings.sleep_windows)
+            self._pump_scheduler.set_sleep_windows(settings.sleep_windows)
+            self._retention_job.set_sleep_windows(settings.sleep_windows)
+        for name, scheduler in self._schedulers.items():
+            if name == poller.CAMERA_POLLER:
+                old_interval = old_settings.photo_interval
+                new_interval = settings.photo_interval
+            else:
+                old_interval = old_settings.poll_interval
+                new_interval = settings.poll_interval
+            if new_interval != old_interval:
+                logger.info('changing poll interval of %s poller to %s', name,
+                            new_interval)
+                scheduler.set_poll_interval(new_interval)
+        if settings.poll_interval != old_settings.poll_interval:
+            self._record_processor.set_poll_interval(settings.poll_interval)
+        new_pump_pin = settings.wiring_config.gpio_pins.pump
+        if new_pump_pin != old_settings.wiring_config.gpio_pins.pump:
+            logger.info('changing pump pin to %d', new_pump_pin)
+            self._water_pump.set_pin(new_pump_pin)
+        if _restart_only_wiring_changed(self._startup_wiring_config,
+                                        settings.wiring_config):
+            logger.warning('wiring changes other than the pump pin take '
+                           'effect after a restart')
+        self._settings = settings
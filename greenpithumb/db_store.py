@@ -1,4 +1,6 @@
+import calendar
 import collections
+import contextlib
 import datetime
 import logging
 import os
@@ -6,6 +8,8 @@ import sqlite3
 
 import pytz
 
+import metrics
+
 logger = logging.getLogger(__name__)
 
 # For each record, timestamp is a datetime representing the time of the reading
@@ -21,6 +25,31 @@ TemperatureRecord = collections.namedtuple('TemperatureRecord',
 # water_pumped is the volume of water pumped in mL.
 WateringEventRecord = collections.namedtuple('WateringEventRecord',
                                              ['timestamp', 'water_pumped'])
+# path, thumbnail_path, and web_path are relative to the image directory. width
+# and height are the dimensions (in pixels) of the full-resolution image and
+# size_bytes is its size on disk. brightness is the mean brightness of the image
+# as a percentage.
+ImageRecord = collections.namedtuple('ImageRecord', [
+    'timestamp', 'path', 'thumbnail_path', 'web_path', 'width', 'height',
+    'size_bytes', 'brightness'
+])
+# Summary of the readings in a time bucket. timestamp is the start of the
+# bucket, and mean, minimum and maximum summarize the values of the count
+# readings within it.
+ReadingSummary = collections.namedtuple(
+    'ReadingSummary', ['timestamp', 'mean', 'minimum', 'maximum', 'count'])
+# Readings of every sensor aligned on their timestamps, as NumPy arrays of equal
+# length. timestamp is a datetime64[s] array of UTC timestamps, and each other
+# field is a float64 array of a sensor's readings, holding NaN at the
+# timestamps where the sensor has no reading.
+AlignedReadings = collections.namedtuple('AlignedReadings', [
+    'timestamp', 'temperature', 'humidity', 'light', 'soil_moisture'
+])
+# Poll ticks missed between two consecutive readings of a sensor. start and end
+# are the timestamps of the readings before and after the gap, and
+# missing_ticks is the number of poll ticks between them without a reading.
+ReadingGap = collections.namedtuple('ReadingGap',
+                                    ['start', 'end', 'missing_ticks'])
 
 # SQL statements to create database tables. Each statement is separated by a
 # semicolon and newline.
@@ -52,18 +81,234 @@ CREATE TABLE watering_events
 );
 """
 
+# SQL statements to upgrade a database from one schema version to the next. The
+# statement at index i upgrades a database from schema version i to version
+# i + 1. Schema version 0 is the schema defined by _CREATE_TABLE_COMMANDS.
+_SCHEMA_UPGRADE_COMMANDS = [
+    """
+CREATE TABLE images
+(
+    timestamp TEXT,
+    path TEXT,
+    thumbnail_path TEXT,
+    web_path TEXT,
+    width INTEGER,      --width of full-resolution image (in pixels)
+    height INTEGER,     --height of full-resolution image (in pixels)
+    size_bytes INTEGER  --size of full-resolution image file (in bytes)
+);
+""",
+    """
+ALTER TABLE images ADD COLUMN brightness REAL;  --mean brightness (percentage)
+CREATE INDEX images_timestamp ON images (timestamp);
+CREATE INDEX images_path ON images (path);
+""",
+    """
+CREATE INDEX temperature_timestamp ON temperature (timestamp);
+CREATE INDEX humidity_timestamp ON humidity (timestamp);
+CREATE INDEX soil_moisture_timestamp ON soil_moisture (timestamp);
+CREATE INDEX light_timestamp ON light (timestamp);
+CREATE INDEX watering_events_timestamp ON watering_events (timestamp);
+""",
+    # Sensors take at most one reading per minute, so collapses readings that
+    # share a timestamp (e.g. from replayed records) into the last one stored
+    # and then keeps each timestamp unique.
+    """
+DELETE FROM temperature WHERE rowid IN (
+    SELECT rowid FROM (
+        SELECT rowid, ROW_NUMBER() OVER (
+            PARTITION BY timestamp ORDER BY rowid DESC) AS position
+        FROM temperature)
+    WHERE position > 1);
+DELETE FROM humidity WHERE rowid IN (
+    SELECT rowid FROM (
+        SELECT rowid, ROW_NUMBER() OVER (
+            PARTITION BY timestamp ORDER BY rowid DESC) AS position
+        FROM humidity)
+    WHERE position > 1);
+DELETE FROM soil_moisture WHERE rowid IN (
+    SELECT rowid FROM (
+        SELECT rowid, ROW_NUMBER() OVER (
+            PARTITION BY timestamp ORDER BY rowid DESC) AS position
+        FROM soil_moisture)
+    WHERE position > 1);
+DELETE FROM light WHERE rowid IN (
+    SELECT rowid FROM (
+        SELECT rowid, ROW_NUMBER() OVER (
+            PARTITION BY timestamp ORDER BY rowid DESC) AS position
+        FROM light)
+    WHERE position > 1);
+DROP INDEX temperature_timestamp;
+DROP INDEX humidity_timestamp;
+DROP INDEX soil_moisture_timestamp;
+DROP INDEX light_timestamp;
+CREATE UNIQUE INDEX temperature_timestamp ON temperature (timestamp);
+CREATE UNIQUE INDEX humidity_timestamp ON humidity (timestamp);
+CREATE UNIQUE INDEX soil_moisture_timestamp ON soil_moisture (timestamp);
+CREATE UNIQUE INDEX light_timestamp ON light (timestamp);
+""",
+    """
+CREATE TABLE reading_gaps
+(
+    sensor TEXT,                --name of the sensor's reading table
+    previous_timestamp TEXT,    --timestamp of the reading before the gap
+    next_timestamp TEXT,        --timestamp of the reading after the gap
+    poll_interval INTEGER,      --poll interval (in seconds) of the ticks
+    missing_ticks INTEGER       --number of ticks without a reading
+);
+CREATE UNIQUE INDEX reading_gaps_sensor_previous_timestamp
+    ON reading_gaps (sensor, previous_timestamp);
+""",
+]
+
 # Format to store timestamps to database (assumes timestamp is in UTC) in format
 # of YYYY-MM-DDTHH:MMZ.
 _TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%MZ'
 
+# Number of rows to fetch at a time when reading readings into arrays.
+_ARRAY_CHUNK_SIZE = 10000
+# Number of records to read at a time when iterating over records.
+_ITER_PAGE_SIZE = 1000
+
 
 def _timestamp_to_utc(timestamp):
     return timestamp.replace(tzinfo=timestamp.tzinfo).astimezone(pytz.utc)
 
 
+def _format_timestamp(timestamp):
+    """Formats a datetime as a UTC timestamp string for the database."""
+    return _timestamp_to_utc(timestamp).strftime(_TIMESTAMP_FORMAT)
+
+
+def _parse_timestamp(timestamp):
+    """Parses a UTC timestamp string from the database into a datetime."""
+    return datetime.datetime.strptime(timestamp, _TIMESTAMP_FORMAT).replace(
+        tzinfo=pytz.utc)
+
+
+def _missing_ticks(previous_seconds, next_seconds, poll_interval_seconds):
+    """Counts the poll ticks strictly between two times.
+
+    Ticks fall on multiples of the poll interval since the UNIX epoch, as the
+    poller's scheduler aligns polls to them. Counting ticks rather than
+    comparing the time between the readings tolerates polls that run late.
+
+    Args:
+        previous_seconds: Earlier time in seconds since the UNIX epoch.
+        next_seconds: Later time in seconds since the UNIX epoch.
+        poll_interval_seconds: Number of seconds between ticks.
+    """
+    return (next_seconds / poll_interval_seconds -
+            previous_seconds / poll_interval_seconds - 1)
+
+
+_commit_seconds = metrics.histogram('greenpithumb_db_commit_seconds',
+                                    'Time taken by each database commit.')
+
+# Connections whose inserts are committed together at the end of a
+# deferred_commits() block rather than one at a time.
+_connections_deferring_commits = set()
+
+
+@contextlib.contextmanager
+def deferred_commits(connection):
+    """Groups the inserts made within a block into a single commit.
+
+    Committing once for many records is much faster than committing each one,
+    which matters when storing a backlog of records (e.g. at shutdown).
+
+    Args:
+        connection: SQLite database connection that stores use for inserts.
+    """
+    _connections_deferring_commits.add(connection)
+    try:
+        yield
+    finally:
+        _connections_deferring_commits.discard(connection)
+        with _commit_seconds.time():
+            connection.commit()
+
+
+@contextlib.contextmanager
+def deferred_indexes(connection, table):
+    """Drops a table's indexes within a block and rebuilds them at its end.
+
+    Building an index once over every row is faster than updating it row by
+    row during a bulk insert that is large compared to the table.
+
+    Dropping the indexes, the block's changes and rebuilding the indexes form
+    a single transaction, so an error or crash partway through leaves the
+    table and its indexes as they were. Store inserts within the block are not
+    committed on their own, and the block must not commit.
+
+    Args:
+        connection: SQLite database connection.
+        table: Name of the table whose indexes to defer.
+    """
+    isolation_level = connection.isolation_level
+    # Python's sqlite3 module commits before each DROP or CREATE statement
+    # unless it leaves transactions to the caller.
+    connection.isolation_level = None
+    deferring_commits = connection not in _connections_deferring_commits
+    _connections_deferring_commits.add(connection)
+    try:
+        connection.execute('BEGIN')
+        try:
+            indexes = connection.execute(
+                'SELECT name, sql FROM sqlite_master WHERE type = \'index\' '
+                'AND tbl_name = ? AND sql IS NOT NULL', (table,)).fetchall()
+            for name, _ in indexes:
+                connection.execute('DROP INDEX %s' % name)
+            yield
+            for _, sql in indexes:
+                connection.execute(sql)
+        except:
+            connection.execute('ROLLBACK')
+            raise
+        with _commit_seconds.time():
+            connection.execute('COMMIT')
+    finally:
+        if deferring_commits:
+            _connections_deferring_commits.discard(connection)
+        connection.isolation_level = isolation_level
+
+
 def _open_db(db_path):
     logger.info('opening existing greenpithumb database at "%s"', db_path)
-    return sqlite3.connect(db_path)
+    connection = sqlite3.connect(db_path)
+    # Write-ahead logging lets read-only connections query the database while
+    # GreenPiThumb writes to it, without either waiting for the other.
+    connection.execute('PRAGMA journal_mode=WAL')
+    return connection
+
+
+def _upgrade_schema(connection):
+    """Upgrades a GreenPiThumb database to the latest schema version.
+
+    Applies, in order, each schema upgrade that the database does not yet have.
+    Each upgrade and the schema version it brings the database to are committed
+    together, so a failed upgrade leaves the database at the last version that
+    applied cleanly. Does nothing if the database is already at the latest
+    schema version.
+
+    Args:
+        connection: SQLite database connection.
+    """
+    cursor = connection.cursor()
+    cursor.execute('PRAGMA user_version')
+    schema_version = cursor.fetchone()[0]
+    if schema_version >= len(_SCHEMA_UPGRADE_COMMANDS):
+        return
+    for version in range(schema_version, len(_SCHEMA_UPGRADE_COMMANDS)):
+        logger.info('upgrading database schema to version %d', version + 1)
+        # PRAGMA statements do not support parameter substitution.
+        try:
+            cursor.executescript(
+                'BEGIN;\n%s\nPRAGMA user_version = %d;\nCOMMIT;' %
+                (_SCHEMA_UPGRADE_COMMANDS[version], version + 1))
+        except sqlite3.Error:
+            # executescript leaves the failed step's transaction open.
+            connection.execute('ROLLBACK')
+            raise
 
 
 def _create_db(db_path):
@@ -86,6 +331,7 @@ def _create_db(db_path):
     for sql_command in sql_commands:
         cursor.execute(sql_command)
     connection.commit()
+    _upgrade_schema(connection)
     return connection
 
 
@@ -93,22 +339,57 @@ def open_or_create_db(db_path):
     """Opens a database file or creates one if the file does not exist.
 
     If a file exists at the given path, opens the file at that path as a
-    database and returns a connection to it. If no file exists, creates and
-    initializes a GreenPiThumb database at the given file path.
+    database, upgrades it to the latest schema, and returns a connection to it.
+    If no file exists, creates and initializes a GreenPiThumb database at the
+    given file path.
 
     Returns:
         A sqlite connection object for the database. The caller is responsible
         for closing the object.
     """
     if os.path.exists(db_path):
-        return _open_db(db_path)
+        connection = _open_db(db_path)
+        _upgrade_schema(connection)
+        return connection
     else:
         return _create_db(db_path)
 
 
+def open_read_only(db_path):
+    """Opens an existing database for queries only.
+
+    Returns:
+        A sqlite connection object for the database that refuses to modify it.
+        The caller is responsible for closing the object.
+
+    Raises:
+        IOError if no database exists at the given path.
+    """
+    if not os.path.exists(db_path):
+        raise IOError('No database at "%s"' % db_path)
+    connection = sqlite3.connect(db_path, check_same_thread=False)
+    connection.execute('PRAGMA query_only = ON')
+    return connection
+
+
+def _parse_page_token(page_token):
+    """Parses a page token into the timestamp and rowid of the last row."""
+    try:
+        timestamp, rowid = page_token.rsplit(',', 1)
+        datetime.datetime.strptime(timestamp, _TIMESTAMP_FORMAT)
+        return timestamp, int(rowid)
+    except ValueError:
+        raise ValueError('Invalid page token: %s' % page_token)
+
+
 class _DbStoreBase(object):
     """Base class for storing information in a database."""
 
+    # Name of the table in which the store keeps its records.
+    _table = None
+    # Type of the records in the store.
+    _record_type = None
+
     def __init__(self, connection):
         """Creates a new _DbStoreBase object for storing information.
 
@@ -118,50 +399,410 @@ class _DbStoreBase(object):
         self._connection = connection
         self._cursor = connection.cursor()
 
-    def _do_insert(self, sql, timestamp, value):
+    def _do_insert(self, sql, timestamp, *values):
         """Executes and commits a SQL insert command.
 
         Args:
           sql: SQL query string for the insert command.
           timestamp: datetime instance representing the record timestamp.
-          value: Value to insert for the record.
+          *values: Values to insert for the record, following the timestamp.
         """
-        timestamp_utc = _timestamp_to_utc(timestamp)
-        self._cursor.execute(sql, (timestamp_utc.strftime(_TIMESTAMP_FORMAT),
-                                   value))
-        self._connection.commit()
+        self._cursor.execute(sql, (_format_timestamp(timestamp),) + values)
+        if self._connection not in _connections_deferring_commits:
+            with _commit_seconds.time():
+                self._connection.commit()
 
-    def _do_get(self, sql, record_type):
+    def _do_get(self, sql, record_type, parameters=()):
         """Executes a SQL select query and returns the results.
 
         Args:
           sql: SQL select query string.
           record_type: The record type to parse the SQL results into.
+          parameters: Values to substitute for the placeholders in the query.
 
         Returns:
           A list of database records corresponding to the select query.
         """
-        self._cursor.execute(sql)
+        self._cursor.execute(sql, parameters)
         data = []
         for row in self._cursor.fetchall():
             timestamp = datetime.datetime.strptime(row[0],
                                                    _TIMESTAMP_FORMAT).replace(
                                                        tzinfo=pytz.utc)
-            data.append((timestamp, row[1]))
+            data.append((timestamp,) + tuple(row[1:]))
         typed_data = map(record_type._make, data)
         return typed_data
 
+    def _get_records_after(self, start, end, limit, page_token):
+        """Retrieves records within a time range that follow a page token.
+
+        Returns:
+            A list of up to limit two-tuples, in order of timestamp, where the
+            first element is a record and the second element is a page token
+            that continues after the record.
+        """
+        # Timestamps are only precise to the minute, so a page continues after
+        # the timestamp and rowid of the last row of the previous page.
+        after_timestamp, after_rowid = '', 0
+        if page_token:
+            after_timestamp, after_rowid = _parse_page_token(page_token)
+        self._cursor.execute(
+            'SELECT rowid, * FROM %s WHERE timestamp >= ? AND timestamp < ? '
+            'AND (timestamp > ? OR (timestamp = ? AND rowid > ?)) '
+            'ORDER BY timestamp, rowid LIMIT ?' % self._table,
+            (_format_timestamp(start), _format_timestamp(end), after_timestamp,
+             after_timestamp, after_rowid, limit))
+        records = []
+        for row in self._cursor.fetchall():
+            timestamp = datetime.datetime.strptime(row[1],
+                                                   _TIMESTAMP_FORMAT).replace(
+                                                       tzinfo=pytz.utc)
+            records.append(
+                (self._record_type._make((timestamp,) + tuple(row[2:])),
+                 '%s,%d' % (row[1], row[0])))
+        return records
+
+    def get_page(self, start, end, limit, page_token=None):
+        """Retrieves one page of the records within a time range.
+
+        Pages are read from the timestamp index and continue where the last
+        page ended, so reading each page costs the same however deep into the
+        range it is.
+
+        Args:
+            start: datetime of the start of the range (inclusive).
+            end: datetime of the end of the range (exclusive).
+            limit: Maximum number of records to retrieve.
+            page_token: Token returned with the previous page, or None to
+                retrieve the first page.
+
+        Returns:
+            A two-tuple where the first element is a list of up to limit
+            records in order of timestamp and the second element is a token
+            for retrieving the next page, or None if this is the last page.
+
+        Raises:
+            ValueError if page_token is not a valid page token.
+        """
+        records = self._get_records_after(start, end, limit + 1, page_token)
+        next_page_token = None
+        if len(records) > limit:
+            records = records[:limit]
+            next_page_token = records[-1][1]
+        return [record for record, _ in records], next_page_token
+
+    def iter_records(self, start, end, page_token=None):
+        """Iterates over the records within a time range.
+
+        Records are read a page at a time, so memory use stays constant however
+        many records the range holds.
+
+        Args:
+            start: datetime of the start of the range (inclusive).
+            end: datetime of the end of the range (exclusive).
+            page_token: Page token after which to continue, or None to start
+                at the beginning of the range.
+
+        Yields:
+            Two-tuples, in order of timestamp, where the first element is a
+            record and the second element is a page token that continues after
+            the record.
+
+        Raises:
+            ValueError if page_token is not a valid page token.
+        """
+        while True:
+            records = self._get_records_after(start, end, _ITER_PAGE_SIZE,
+                                              page_token)
+            for record_and_token in records:
+                yield record_and_token
+            if len(records) < _ITER_PAGE_SIZE:
+                return
+            page_token = records[-1][1]
+
+    def get_latest(self):
+        """Retrieves the most recent record.
+
+        Returns:
+            The record with the latest timestamp, or None if there are no
+            records.
+        """
+        records = self._do_get(
+            'SELECT * FROM %s ORDER BY timestamp DESC LIMIT 1' % self._table,
+            self._record_type)
+        if not records:
+            return None
+        return records[0]
+
+
+class _ReadingStoreBase(_DbStoreBase):
+    """Base class for stores of a single value over time.
+
+    A store holds at most one reading per timestamp. Inserting a reading
+    replaces any reading with the same timestamp, so storing a record again
+    (e.g. one replayed after a restart) is harmless.
+    """
+
+    # Name of the column that holds each record's value.
+    _value_column = None
+
+    def __init__(self, connection, poll_interval=None):
+        """Creates a new reading store.
+
+        Args:
+            connection: SQLite database connection.
+            poll_interval: timedelta of how often the sensor is polled, to
+                record gaps in its readings as they are inserted, or None to
+                not record gaps.
+        """
+        super(_ReadingStoreBase, self).__init__(connection)
+        self._poll_interval_seconds = None
+        if poll_interval:
+            self.set_poll_interval(poll_interval)
+
+    def set_poll_interval(self, poll_interval):
+        """Changes the poll interval against which gaps are recorded.
+
+        Gaps already recorded keep the poll interval in effect when they were
+        recorded.
+
+        Args:
+            poll_interval: timedelta of how often the sensor is polled.
+        """
+        self._poll_interval_seconds = int(poll_interval.total_seconds())
+
+    def _do_insert(self, sql, timestamp, *values):
+        if self._poll_interval_seconds:
+            utc_timestamp = _timestamp_to_utc(timestamp)
+            # Timestamps are stored to the minute.
+            seconds = calendar.timegm(utc_timestamp.utctimetuple()) / 60 * 60
+            self._update_gaps((_format_timestamp(utc_timestamp), seconds))
+        super(_ReadingStoreBase, self)._do_insert(sql, timestamp, *values)
+
+    def _find_reading(self, timestamp, comparison, order):
+        """Finds the nearest stored reading on one side of a timestamp.
 
-class SoilMoistureStore(_DbStoreBase):
+        Returns:
+            A two-tuple of the reading's database timestamp and its time in
+            seconds since the UNIX epoch, or None if there is no such reading.
+        """
+        self._cursor.execute(
+            'SELECT timestamp, CAST(strftime(\'%s\', timestamp) AS INTEGER) '
+            'FROM {table} WHERE timestamp {comparison} ? '
+            'ORDER BY timestamp {order} LIMIT 1'.format(
+                table=self._table, comparison=comparison,
+                order=order), (timestamp,))
+        return self._cursor.fetchone()
+
+    def _insert_gap(self, previous_reading, next_reading,
+                    poll_interval_seconds):
+        """Records a gap between two readings if it misses any ticks."""
+        missing_ticks = _missing_ticks(previous_reading[1], next_reading[1],
+                                       poll_interval_seconds)
+        if missing_ticks > 0:
+            self._cursor.execute(
+                'INSERT INTO reading_gaps VALUES (?, ?, ?, ?, ?)',
+                (self._table, previous_reading[0], next_reading[0],
+                 poll_interval_seconds, missing_ticks))
+
+    def _update_gaps(self, reading):
+        """Updates the recorded gaps for a reading about to be inserted.
+
+        A reading after the latest one or before the earliest one (e.g. from a
+        backfill) may open a gap, and a reading within a gap splits it. Finding
+        the readings either side of the new one takes two index lookups, however
+        many readings exist.
+
+        Args:
+            reading: A two-tuple of the new reading's database timestamp and
+                its time in seconds since the UNIX epoch.
+        """
+        timestamp = reading[0]
+        previous_reading = self._find_reading(timestamp, '<=', 'DESC')
+        if previous_reading is not None and previous_reading[0] == timestamp:
+            # Replacing a reading changes no gaps.
+            return
+        next_reading = self._find_reading(timestamp, '>', 'ASC')
+        if previous_reading is None:
+            if next_reading is not None:
+                self._insert_gap(reading, next_reading,
+                                 self._poll_interval_seconds)
+            return
+        if next_reading is None:
+            self._insert_gap(previous_reading, reading,
+                             self._poll_interval_seconds)
+            return
+        self._cursor.execute(
+            'SELECT poll_interval FROM reading_gaps WHERE sensor = ? AND '
+            'previous_timestamp = ?', (self._table, previous_reading[0]))
+        gap = self._cursor.fetchone()
+        if gap is None:
+            return
+        self._cursor.execute('DELETE FROM reading_gaps WHERE sensor = ? AND '
+                             'previous_timestamp = ?', (self._table,
+                                                        previous_reading[0]))
+        self._insert_gap(previous_reading, reading, gap[0])
+        self._insert_gap(reading, next_reading, gap[0])
+
+    def rebuild_gaps(self, poll_interval):
+        """Recomputes the gaps in every reading against a poll interval.
+
+        Use after changing readings in bulk (e.g. importing them) or to find
+        the gaps in readings stored before gaps were recorded. Compares each
+        reading with the one before it in a single query, and commits.
+
+        Args:
+            poll_interval: timedelta of how often the sensor was polled.
+        """
+        poll_interval_seconds = int(poll_interval.total_seconds())
+        self._cursor.execute('DELETE FROM reading_gaps WHERE sensor = ?',
+                             (self._table,))
+        self._cursor.execute(
+            'INSERT INTO reading_gaps SELECT ?, previous_timestamp, timestamp, '
+            '?, tick - previous_tick - 1 FROM ('
+            'SELECT timestamp, tick, '
+            'LAG(timestamp) OVER (ORDER BY timestamp) AS previous_timestamp, '
+            'LAG(tick) OVER (ORDER BY timestamp) AS previous_tick FROM ('
+            'SELECT timestamp, '
+            'CAST(strftime(\'%s\', timestamp) AS INTEGER) / ? AS tick '
+            'FROM {table})) WHERE tick - previous_tick > 1'.format(
+                table=self._table), (self._table, poll_interval_seconds,
+                                     poll_interval_seconds))
+        self._connection.commit()
+
+    def get_gaps(self, start, end):
+        """Retrieves the gaps in readings that overlap a time range.
+
+        Args:
+            start: datetime of the start of the range (inclusive).
+            end: datetime of the end of the range (exclusive).
+
+        Returns:
+            A list of ReadingGap records in order of time.
+        """
+        self._cursor.execute(
+            'SELECT previous_timestamp, next_timestamp, missing_ticks '
+            'FROM reading_gaps WHERE sensor = ? AND previous_timestamp < ? AND '
+            'next_timestamp > ? ORDER BY previous_timestamp',
+            (self._table, _format_timestamp(end), _format_timestamp(start)))
+        return [
+            ReadingGap(
+                _parse_timestamp(previous_timestamp),
+                _parse_timestamp(next_timestamp), missing_ticks)
+            for previous_timestamp, next_timestamp, missing_ticks in
+            self._cursor.fetchall()
+        ]
+
+    def get_summaries(self, start, end, step_seconds, limit):
+        """Summarizes the readings within a time range in fixed-size buckets.
+
+        Buckets are aligned to multiples of the step since the UNIX epoch, and
+        buckets without readings are omitted.
+
+        Args:
+            start: datetime of the start of the range (inclusive).
+            end: datetime of the end of the range (exclusive).
+            step_seconds: Number of seconds that each bucket spans.
+            limit: Maximum number of buckets to retrieve.
+
+        Returns:
+            A list of up to limit ReadingSummary records in order of time.
+        """
+        self._cursor.execute(
+            'SELECT CAST(strftime(\'%s\', timestamp) AS INTEGER) / ? * ? '
+            'AS bucket, AVG({value}), MIN({value}), MAX({value}), COUNT(*) '
+            'FROM {table} WHERE timestamp >= ? AND timestamp < ? '
+            'GROUP BY bucket ORDER BY bucket LIMIT ?'.format(
+                value=self._value_column, table=self._table),
+            (step_seconds, step_seconds, _format_timestamp(start),
+             _format_timestamp(end), limit))
+        return [
+            ReadingSummary(
+                datetime.datetime.fromtimestamp(row[0], tz=pytz.utc), *row[1:])
+            for row in self._cursor.fetchall()
+        ]
+
+    def to_arrays(self, start, end):
+        """Retrieves the readings within a time range as NumPy arrays.
+
+        Builds the arrays from chunks of rows without creating a record per
+        reading, so that analyzing long time ranges is fast and needs little
+        memory.
+
+        Args:
+            start: datetime of the start of the range (inclusive).
+            end: datetime of the end of the range (exclusive).
+
+        Returns:
+            A two-tuple where the first element is a datetime64[s] array of the
+            readings' UTC timestamps and the second element is a float64 array
+            of their values, both in order of timestamp.
+        """
+        # NumPy is slow to import on a Pi, so it is only imported when needed.
+        import numpy
+        self._cursor.execute(
+            'SELECT CAST(strftime(\'%s\', timestamp) AS INTEGER), {value} '
+            'FROM {table} WHERE timestamp >= ? AND timestamp < ? '
+            'ORDER BY timestamp'.format(
+                value=self._value_column, table=self._table),
+            (_format_timestamp(start), _format_timestamp(end)))
+        chunks = [numpy.empty((0, 2))]
+        while True:
+            rows = self._cursor.fetchmany(_ARRAY_CHUNK_SIZE)
+            if not rows:
+                break
+            chunks.append(numpy.array(rows, dtype=numpy.float64))
+        columns = numpy.concatenate(chunks)
+        return (columns[:, 0].astype(numpy.int64).astype('datetime64[s]'),
+                columns[:, 1])
+
+    def get_downsampled(self, start, end, max_points):
+        """Retrieves the readings within a time range, downsampled for charting.
+
+        Selects readings with Largest-Triangle-Three-Buckets, which keeps the
+        peaks and troughs that a chart of every reading would show.
+
+        Args:
+            start: datetime of the start of the range (inclusive).
+            end: datetime of the end of the range (exclusive).
+            max_points: Maximum number of readings to retrieve. Must be at
+                least 3.
+
+        Returns:
+            A list of up to max_points records in order of timestamp. If the
+            range holds no more than max_points readings, all of them.
+
+        Raises:
+            ValueError if max_points is less than 3 and the range holds more
+            than max_points readings.
+        """
+        import numpy
+        import downsampling
+        timestamps, values = self.to_arrays(start, end)
+        seconds = timestamps.astype(numpy.int64)
+        return [
+            self._record_type(
+                datetime.datetime.fromtimestamp(seconds[i], tz=pytz.utc),
+                values[i].item())
+            for i in downsampling.largest_triangle_three_buckets(
+                seconds, values, max_points)
+        ]
+
+
+class SoilMoistureStore(_ReadingStoreBase):
     """Stores and retrieves timestamp and soil moisture readings."""
 
+    _table = 'soil_moisture'
+    _record_type = SoilMoistureRecord
+    _value_column = 'soil_moisture'
+
     def insert(self, soil_moisture_record):
         """Inserts moisture and timestamp info into an SQLite database.
 
         Args:
             soil_moisture_record: Moisture record to store.
         """
-        self._do_insert('INSERT INTO soil_moisture VALUES (?, ?)',
+        self._do_insert('INSERT OR REPLACE INTO soil_moisture VALUES (?, ?)',
                         soil_moisture_record.timestamp,
                         soil_moisture_record.soil_moisture)
 
@@ -174,16 +815,20 @@ class SoilMoistureStore(_DbStoreBase):
         return self._do_get('SELECT * FROM soil_moisture', SoilMoistureRecord)
 
 
-class LightStore(_DbStoreBase):
+class LightStore(_ReadingStoreBase):
     """Stores timestamp and light readings."""
 
+    _table = 'light'
+    _record_type = LightRecord
+    _value_column = 'light'
+
     def insert(self, light_record):
         """Inserts light and timestamp info into an SQLite database.
 
         Args:
             light_record: Light record to store.
         """
-        self._do_insert('INSERT INTO light VALUES (?, ?)',
+        self._do_insert('INSERT OR REPLACE INTO light VALUES (?, ?)',
                         light_record.timestamp, light_record.light)
 
     def get(self):
@@ -195,16 +840,20 @@ class LightStore(_DbStoreBase):
         return self._do_get('SELECT * FROM light', LightRecord)
 
 
-class HumidityStore(_DbStoreBase):
+class HumidityStore(_ReadingStoreBase):
     """Stores timestamp and humidity readings."""
 
+    _table = 'humidity'
+    _record_type = HumidityRecord
+    _value_column = 'humidity'
+
     def insert(self, humidity_record):
         """Inserts humidity and timestamp info into an SQLite database.
 
         Args:
             humidity_record: Humidity record to store.
         """
-        self._do_insert('INSERT INTO humidity VALUES (?, ?)',
+        self._do_insert('INSERT OR REPLACE INTO humidity VALUES (?, ?)',
                         humidity_record.timestamp, humidity_record.humidity)
 
     def get(self):
@@ -216,16 +865,20 @@ class HumidityStore(_DbStoreBase):
         return self._do_get('SELECT * FROM humidity', HumidityRecord)
 
 
-class TemperatureStore(_DbStoreBase):
+class TemperatureStore(_ReadingStoreBase):
     """Stores timestamp and temperature readings."""
 
+    _table = 'temperature'
+    _record_type = TemperatureRecord
+    _value_column = 'temperature'
+
     def insert(self, temperature_record):
         """Inserts temperature and timestamp info into an SQLite database.
 
         Args:
             temperature_record: Temperature record to store.
         """
-        self._do_insert('INSERT INTO temperature VALUES (?, ?)',
+        self._do_insert('INSERT OR REPLACE INTO temperature VALUES (?, ?)',
                         temperature_record.timestamp,
                         temperature_record.temperature)
 
@@ -241,6 +894,9 @@ class TemperatureStore(_DbStoreBase):
 class WateringEventStore(_DbStoreBase):
     """Stores timestamp and volume of water pumped to plant."""
 
+    _table = 'watering_events'
+    _record_type = WateringEventRecord
+
     def insert(self, watering_event_record):
         """Inserts water volume and timestamp info into an SQLite database.
 
@@ -259,3 +915,167 @@ class WateringEventStore(_DbStoreBase):
         """
         return self._do_get('SELECT * FROM watering_events',
                             WateringEventRecord)
+
+
+class ImageStore(_DbStoreBase):
+    """Stores and retrieves metadata about captured images."""
+
+    _table = 'images'
+    _record_type = ImageRecord
+
+    def insert(self, image_record):
+        """Inserts image metadata into an SQLite database.
+
+        Args:
+            image_record: Image record to store.
+        """
+        self._do_insert('INSERT INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                        image_record.timestamp, image_record.path,
+                        image_record.thumbnail_path, image_record.web_path,
+                        image_record.width, image_record.height,
+                        image_record.size_bytes, image_record.brightness)
+
+    def get(self):
+        """Retrieves metadata for all captured images.
+
+        Returns:
+            A list of objects with the fields of ImageRecord.
+        """
+        return self._do_get('SELECT * FROM images', ImageRecord)
+
+    def get_nearest(self, timestamp):
+        """Retrieves metadata for the image captured closest to a given time.
+
+        Looks up the closest image on either side of the timestamp using the
+        timestamp index, so the cost of the lookup does not grow with the
+        number of images.
+
+        Args:
+            timestamp: datetime instance representing the time of interest.
+
+        Returns:
+            The ImageRecord of the image closest to timestamp, or None if there
+            are no images.
+        """
+        timestamp_utc = _format_timestamp(timestamp)
+        records = self._do_get("""
+SELECT * FROM (
+    SELECT * FROM (SELECT * FROM images WHERE timestamp <= ?
+                   ORDER BY timestamp DESC LIMIT 1)
+    UNION ALL
+    SELECT * FROM (SELECT * FROM images WHERE timestamp > ?
+                   ORDER BY timestamp ASC LIMIT 1)
+)
+ORDER BY ABS(julianday(timestamp) - julianday(?)) LIMIT 1""", ImageRecord,
+                               (timestamp_utc, timestamp_utc, timestamp_utc))
+        if not records:
+            return None
+        return records[0]
+
+    def get_range(self, start, end, limit):
+        """Retrieves metadata for images captured within a time range.
+
+        Args:
+            start: datetime of the start of the range (inclusive).
+            end: datetime of the end of the range (exclusive).
+            limit: Maximum number of images to retrieve.
+
+        Returns:
+            A list of up to limit ImageRecords in order of capture time.
+        """
+        return self._do_get(
+            'SELECT * FROM images WHERE timestamp >= ? AND timestamp < ? '
+            'ORDER BY timestamp LIMIT ?', ImageRecord,
+            (_format_timestamp(start), _format_timestamp(end), limit))
+
+    def get_superseded_by_daily_best(self, start, end, limit):
+        """Retrieves images that are not the best image of their day.
+
+        The best image of each day (in UTC) is the brightest one, with ties
+        going to the earliest.
+
+        Args:
+            start: datetime at which to start looking for images (inclusive).
+            end: datetime before which to look for images (exclusive).
+            limit: Maximum number of images to retrieve.
+
+        Returns:
+            A list of up to limit ImageRecords in order of capture time.
+        """
+        # Timestamps are ISO 8601 strings, so the images from the same day as
+        # an image are those whose timestamps fall between its date string
+        # (YYYY-MM-DD) and that string followed by 'U', which sorts just after
+        # the 'T' separator. Using a range lets SQLite use the timestamp index.
+        return self._do_get("""
+SELECT * FROM images AS image
+WHERE timestamp >= ? AND timestamp < ? AND EXISTS (
+    SELECT 1 FROM images AS other
+    WHERE other.timestamp > substr(image.timestamp, 1, 10)
+      AND other.timestamp < substr(image.timestamp, 1, 10) || 'U'
+      AND (IFNULL(other.brightness, 0) > IFNULL(image.brightness, 0) OR
+           (IFNULL(other.brightness, 0) = IFNULL(image.brightness, 0) AND
+            other.timestamp < image.timestamp)))
+ORDER BY timestamp LIMIT ?""", ImageRecord, (_format_timestamp(start),
+                                             _format_timestamp(end), limit))
+
+    def update(self, image_record):
+        """Replaces the metadata of an image with the same path.
+
+        Args:
+            image_record: Updated image record. Its path identifies the image
+                to update.
+        """
+        self._cursor.execute(
+            'UPDATE images SET timestamp = ?, thumbnail_path = ?, web_path = ?, '
+            'width = ?, height = ?, size_bytes = ?, brightness = ? '
+            'WHERE path = ?',
+            (_format_timestamp(image_record.timestamp),
+             image_record.thumbnail_path, image_record.web_path,
+             image_record.width, image_record.height, image_record.size_bytes,
+             image_record.brightness, image_record.path))
+        self._connection.commit()
+
+    def delete(self, path):
+        """Deletes the metadata for an image.
+
+        Args:
+            path: Path of the full-resolution image (relative to the image
+                directory) whose metadata to delete.
+        """
+        self._cursor.execute('DELETE FROM images WHERE path = ?', (path,))
+        self._connection.commit()
+
+
+def load_aligned_readings(connection, start, end):
+    """Retrieves every sensor's readings within a time range, aligned.
+
+    Joins the temperature, humidity, light and soil moisture readings on their
+    timestamps, which match for readings from the same poll. Alignment is done
+    on NumPy arrays, without creating a record per reading.
+
+    Args:
+        connection: SQLite database connection.
+        start: datetime of the start of the range (inclusive).
+        end: datetime of the end of the range (exclusive).
+
+    Returns:
+        An AlignedReadings with a row for each timestamp at which any sensor
+        has a reading, in order of timestamp.
+    """
+    import numpy
+    sensor_arrays = [
+        store_type(connection).to_arrays(start, end)
+        for store_type in (TemperatureStore, HumidityStore, LightStore,
+                           SoilMoistureStore)
+    ]
+    timestamps = numpy.unique(
+        numpy.concatenate(
+            [sensor_timestamps for sensor_timestamps, _ in sensor_arrays]))
+    aligned_values = []
+    for sensor_timestamps, values in sensor_arrays:
+        aligned = numpy.full(len(timestamps), numpy.nan)
+        # Each sensor has at most one reading per timestamp, so each reading
+        # has its own row.
+        aligned[numpy.searchsorted(timestamps, sensor_timestamps)] = values
+        aligned_values.append(aligned)
+    return AlignedReadings(timestamps, *aligned_values)
@@ -4,6 +4,9 @@ import threading
 
 import pytz
 
+import log_handlers
+import metrics
+
 logger = logging.getLogger(__name__)
 
 # Maximum time a sensor reading can be used for, in seconds
@@ -13,6 +16,10 @@ _HUMIDITY_INDEX = 0
 # Position of  temperature value in the tuple returned from DHT11 read function.
 _TEMPERATURE_INDEX = 1
 
+_reads = metrics.counter('greenpithumb_dht11_reads_total',
+                         'DHT11 readings, by whether they came from the '
+                         'sensor or the cache.', ('source',))
+
 
 class CachingDHT11(object):
     """Wrapper around a DHT11 that caches sensor readings.
@@ -48,11 +55,19 @@ class CachingDHT11(object):
                     _FRESHNESS_THRESHOLD):
                 self._last_reading_time = now
                 self._last_reading = self._dht11_read_func()
-                logger.info('DHT11 raw reading = %s', self._last_reading)
+                logger.info(
+                    'DHT11 raw reading = %s',
+                    self._last_reading,
+                    extra=log_handlers.hot_path(
+                        sensor='dht11', value=self._last_reading))
+                _reads.inc(label_values=('sensor',))
             else:
+                _reads.inc(label_values=('cache',))
                 logger.info(
                     'read DHT11 too recently, returning cached reading = %s',
-                    self._last_reading)
+                    self._last_reading,
+                    extra=log_handlers.hot_path(
+                        sensor='dht11', value=self._last_reading))
 
         return self._last_reading
 
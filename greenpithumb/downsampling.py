@@ -0,0 +1,165 @@
+"""Downsamples time series for charting while keeping their visual shape.
+
+Run this module directly to benchmark downsampling on synthetic data:
+
+    python greenpithumb/downsampling.py --points 1000000 --threshold 1000
+
+With --store, the benchmark also times downsampling readings read from a
+temporary database, as the read API does.
+"""
+
+import argparse
+import datetime
+import os
+import shutil
+import tempfile
+import timeit
+
+import numpy
+import pytz
+
+
+def largest_triangle_three_buckets(x, y, threshold):
+    """Selects the points of a series that best preserve its visual shape.
+
+    Implements Largest-Triangle-Three-Buckets (Steinarsson, 2013). The first
+    and last points are always kept. The points between them are split into
+    threshold - 2 buckets, and from each bucket the point is kept that forms
+    the largest triangle with the point kept from the previous bucket and the
+    mean of the next bucket. Peaks and troughs therefore survive downsampling,
+    unlike with averaging or decimation.
+
+    Args:
+        x: Sequence of x values (e.g. seconds since the UNIX epoch) in
+            ascending order.
+        y: Sequence of y values, the same length as x.
+        threshold: Number of points to keep.
+
+    Returns:
+        A NumPy array of the indices of the kept points in ascending order. If
+        the series has no more than threshold points, the indices of all of its
+        points.
+
+    Raises:
+        ValueError if threshold is less than 3 and the series has more than
+        threshold points.
+    """
+    x = numpy.asarray(x, dtype=numpy.float64)
+    y = numpy.asarray(y, dtype=numpy.float64)
+    point_count = len(x)
+    if point_count <= threshold:
+        return numpy.arange(point_count)
+    if threshold < 3:
+        raise ValueError(
+            'Cannot downsample to fewer than 3 points: %d' % threshold)
+    bucket_count = threshold - 2
+    # Bucket i holds the points at indices edges[i] up to edges[i + 1]. Each
+    # bucket holds at least one point, as there are more points between the
+    # first and last than there are buckets.
+    bucket_size = float(point_count - 2) / bucket_count
+    edges = (
+        numpy.arange(bucket_count + 1) * bucket_size).astype(numpy.int64) + 1
+    edges[-1] = point_count - 1
+    # Mean of each bucket's points, computed for all buckets at once. The last
+    # bucket is followed by the last point rather than by a bucket.
+    counts = numpy.diff(edges)
+    next_x = numpy.empty(bucket_count)
+    next_y = numpy.empty(bucket_count)
+    next_x[:-1] = (numpy.add.reduceat(x[1:-1], edges[:-1] - 1) / counts)[1:]
+    next_y[:-1] = (numpy.add.reduceat(y[1:-1], edges[:-1] - 1) / counts)[1:]
+    next_x[-1] = x[-1]
+    next_y[-1] = y[-1]
+
+    selected = numpy.empty(threshold, dtype=numpy.int64)
+    selected[0] = 0
+    selected[-1] = point_count - 1
+    previous = 0
+    for bucket in xrange(bucket_count):
+        start, end = edges[bucket], edges[bucket + 1]
+        previous_x, previous_y = x[previous], y[previous]
+        # Twice the area of each triangle, which ranks them the same.
+        areas = numpy.abs(
+            (previous_x - next_x[bucket]) * (y[start:end] - previous_y) -
+            (previous_x - x[start:end]) * (next_y[bucket] - previous_y))
+        previous = start + numpy.argmax(areas)
+        selected[bucket + 1] = previous
+    return selected
+
+
+def _make_benchmark_series(point_count):
+    """Creates a noisy series with daily cycles, like soil moisture or light."""
+    random_state = numpy.random.RandomState(0)
+    x = numpy.arange(point_count, dtype=numpy.float64) * 60
+    y = (50 + 30 * numpy.sin(x * 2 * numpy.pi / 86400) + random_state.normal(
+        0, 2, point_count))
+    return x, y
+
+
+def _print_timings(description, point_count, timings):
+    print('%s: %.1f ms (best of %d), %.1f ns per point' %
+          (description, min(timings) * 1000, len(timings),
+           min(timings) * 1e9 / point_count))
+
+
+def _benchmark_store(x, y, threshold, repeat):
+    """Times downsampling a series read from a temporary database."""
+    import db_store
+    temp_dir = tempfile.mkdtemp()
+    try:
+        connection = db_store.open_or_create_db(
+            os.path.join(temp_dir, 'benchmark.db'))
+        connection.executemany('INSERT INTO soil_moisture VALUES (?, ?)',
+                               ((datetime.datetime.utcfromtimestamp(seconds)
+                                 .strftime('%Y-%m-%dT%H:%MZ'), value)
+                                for seconds, value in zip(x, y)))
+        connection.commit()
+        store = db_store.SoilMoistureStore(connection)
+        start = datetime.datetime.fromtimestamp(x[0], tz=pytz.utc)
+        end = datetime.datetime.fromtimestamp(x[-1] + 60, tz=pytz.utc)
+        return timeit.repeat(
+            lambda: store.get_downsampled(start, end, threshold),
+            repeat=repeat,
+            number=1)
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def main(args):
+    x, y = _make_benchmark_series(args.points)
+    _print_timings(
+        'Downsampled %d points to %d' % (args.points,
+                                         args.threshold), args.points,
+        timeit.repeat(
+            lambda: largest_triangle_three_buckets(x, y, args.threshold),
+            repeat=args.repeat,
+            number=1))
+    if args.store:
+        _print_timings(
+            'Read and downsampled %d readings from the database' % args.points,
+            args.points, _benchmark_store(x, y, args.threshold, args.repeat))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='GreenPiThumb Downsampling Benchmark',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        '--points',
+        type=int,
+        help='Number of points in the series to downsample',
+        default=1000000)
+    parser.add_argument(
+        '--threshold',
+        type=int,
+        help='Number of points to downsample to',
+        default=1000)
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        help='Number of times to repeat the benchmark',
+        default=5)
+    parser.add_argument(
+        '--store',
+        action='store_true',
+        help='Also benchmark downsampling readings read from a database')
+    main(parser.parse_args())
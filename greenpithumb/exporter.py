@@ -0,0 +1,217 @@
+"""Exports GreenPiThumb's stored data to CSV or JSON lines files.
+
+Each export writes one file per table, named after the table and the time of
+the export (e.g. temperature-20170131T020000.csv.gz). Records are formatted as
+in the read API. An export can resume where the last one in the same directory
+ended, so that regular incremental exports only read new records.
+"""
+
+import collections
+import contextlib
+import csv
+import datetime
+import gzip
+import itertools
+import json
+import logging
+import os
+
+import pytz
+
+import db_store
+import read_api
+
+logger = logging.getLogger(__name__)
+
+# Stores of each table that can be exported, keyed by table name.
+STORES = collections.OrderedDict(
+    (store_type._table, store_type)
+    for store_type in (db_store.TemperatureStore, db_store.HumidityStore,
+                       db_store.SoilMoistureStore, db_store.LightStore,
+                       db_store.WateringEventStore, db_store.ImageStore))
+# Formats to which records can be exported.
+FORMATS = ('csv', 'jsonl')
+# Name of the file in the export directory that records where each table's
+# last export ended.
+_STATE_FILENAME = 'export-state.json'
+# Version of the state file format. A file with a different version is ignored.
+_STATE_FORMAT_VERSION = 1
+# Format of the timestamp in the names of export files.
+_FILENAME_TIMESTAMP_FORMAT = '%Y%m%dT%H%M%S'
+# Range of times exported when no start or end is given.
+_EARLIEST_TIME = datetime.datetime(1970, 1, 1, tzinfo=pytz.utc)
+_LATEST_TIME = datetime.datetime(9999, 1, 1, tzinfo=pytz.utc)
+
+
+def _open_output(path, compress):
+    if compress:
+        return gzip.open(path, 'wb')
+    return open(path, 'wb')
+
+
+def _make_record_writer(output, file_format, record_type):
+    """Creates a function that writes a record to a file in a format.
+
+    For CSV, writes the header row before returning.
+    """
+    if file_format == 'csv':
+        csv_writer = csv.writer(output)
+        csv_writer.writerow(record_type._fields)
+
+        def write_csv_row(record):
+            item = read_api.format_record(record)
+            csv_writer.writerow([item[field] for field in record_type._fields])
+
+        return write_csv_row
+
+    def write_json_line(record):
+        output.write(
+            json.dumps(read_api.format_record(record), sort_keys=True) + '\n')
+
+    return write_json_line
+
+
+def export_table(store,
+                 path,
+                 file_format,
+                 compress,
+                 start,
+                 end,
+                 page_token=None):
+    """Exports a store's records within a time range to a file.
+
+    Streams records a page at a time, so memory use stays constant however many
+    records are exported. The file is written under a temporary name and
+    renamed once complete, and is not created if there are no records to
+    export.
+
+    Args:
+        store: Database store whose records to export.
+        path: Path of the file to write.
+        file_format: Format of the file, one of FORMATS.
+        compress: True to compress the file with gzip.
+        start: datetime of the start of the range (inclusive).
+        end: datetime of the end of the range (exclusive).
+        page_token: Page token after which to continue, or None to export from
+            the start of the range.
+
+    Returns:
+        A two-tuple where the first element is the number of records exported
+        and the second element is a page token that continues after the last
+        exported record, or the given page token if none were exported.
+    """
+    records = store.iter_records(start, end, page_token)
+    first = next(records, None)
+    if first is None:
+        return 0, page_token
+    count = 0
+    temp_path = path + '.tmp'
+    with contextlib.closing(_open_output(temp_path, compress)) as output:
+        write_record = _make_record_writer(output, file_format, type(first[0]))
+        for record, page_token in itertools.chain([first], records):
+            write_record(record)
+            count += 1
+    os.rename(temp_path, path)
+    return count, page_token
+
+
+def _load_page_tokens(state_path):
+    """Loads the page token at which each table's last export ended."""
+    if not os.path.exists(state_path):
+        return {}
+    try:
+        with open(state_path) as state_file:
+            state = json.load(state_file)
+        if state.get('version') != _STATE_FORMAT_VERSION:
+            logger.warning('ignoring export state with unknown version: %s',
+                           state.get('version'))
+            return {}
+        return dict(state['page_tokens'])
+    except (IOError, ValueError, KeyError, AttributeError, TypeError) as e:
+        logger.warning('ignoring unreadable export state "%s": %s', state_path,
+                       e)
+        return {}
+
+
+def _save_page_tokens(state_path, page_tokens):
+    """Saves the page token at which each table's last export ended.
+
+    Writes to a temporary file and renames it over the state file, so that a
+    crash leaves either the old or the new state. A crash between writing an
+    export file and saving the state makes the next export repeat that file's
+    records rather than skip any.
+    """
+    temp_path = state_path + '.tmp'
+    with open(temp_path, 'w') as temp_file:
+        json.dump(
+            {
+                'version': _STATE_FORMAT_VERSION,
+                'page_tokens': page_tokens
+            },
+            temp_file,
+            indent=2,
+            sort_keys=True)
+        temp_file.flush()
+        os.fsync(temp_file.fileno())
+    os.rename(temp_path, state_path)
+
+
+def export(db_path,
+           output_dir,
+           tables,
+           file_format,
+           compress,
+           start=None,
+           end=None,
+           resume=False):
+    """Exports tables from a GreenPiThumb database.
+
+    Reads from a read-only connection, so exporting while GreenPiThumb runs
+    never blocks it from storing records.
+
+    Args:
+        db_path: Path to the GreenPiThumb database.
+        output_dir: Directory in which to write export files.
+        tables: Names of the tables to export, each a key of STORES.
+        file_format: Format of the files, one of FORMATS.
+        compress: True to compress the files with gzip.
+        start: datetime of the start of the range to export (inclusive), or
+            None to export from the earliest record.
+        end: datetime of the end of the range to export (exclusive), or None to
+            export up to the latest record.
+        resume: True to export only the records after those exported by the
+            last export to the same directory that also resumed.
+
+    Returns:
+        A dictionary of table names to the number of records exported.
+
+    Raises:
+        IOError if no database exists at db_path.
+        ValueError if the export state holds an invalid page token.
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    state_path = os.path.join(output_dir, _STATE_FILENAME)
+    page_tokens = _load_page_tokens(state_path) if resume else {}
+    filename_suffix = '-%s.%s%s' % (
+        datetime.datetime.now().strftime(_FILENAME_TIMESTAMP_FORMAT),
+        file_format, '.gz' if compress else '')
+    start = start or _EARLIEST_TIME
+    end = end or _LATEST_TIME
+    counts = {}
+    with contextlib.closing(db_store.open_read_only(db_path)) as connection:
+        for table in tables:
+            path = os.path.join(output_dir, table + filename_suffix)
+            counts[table], page_token = export_table(STORES[table](connection),
+                                                     path, file_format,
+                                                     compress, start, end,
+                                                     page_tokens.get(table))
+            if not counts[table]:
+                logger.info('no records to export from %s', table)
+                continue
+            logger.info('exported %d records from %s to "%s"', counts[table],
+                        table, path)
+            if resume:
+                page_tokens[table] = page_token
+                _save_page_tokens(state_path, page_tokens)
+    return counts
@@ -2,47 +2,166 @@ import argparse
 import contextlib
 import datetime
 import logging
+import os
 import Queue
-import time
+import random
+import signal
+import sys
+import threading
 
-import Adafruit_DHT
-import Adafruit_MCP3008
-import picamera
-import RPi.GPIO as GPIO
+import monotonic as monotonic_clock
+import pytz
 
+# Modules that pull in PIL or hardware libraries are imported inside the
+# functions that need them, so that startup and database-only commands stay
+# fast and work on machines without those libraries.
 import adc_thread_safe
-import camera_manager
 import clock
+import config_reloader
 import db_store
 import dht11
+import exporter
 import humidity_sensor
+import importer
+import latest_readings
 import light_sensor
+import log_handlers
+import metrics
 import pi_io
 import poller
+import profiler
 import pump
 import pump_history
+import read_api
 import record_processor
+import record_publisher
 import sleep_windows
+import snapshots
 import soil_moisture_sensor
+import state_file
 import temperature_sensor
 import wiring_config_parser
 
 logger = logging.getLogger(__name__)
 
+# Monotonic clock time at which GreenPiThumb began starting up.
+_STARTED_AT = monotonic_clock.monotonic()
 
-def configure_logging(verbose):
-    """Configure the root logger for log output."""
+# Number of seconds the main thread idles when there are no records to process.
+_IDLE_SECONDS = 0.1
+# Number of virtual seconds that threads idle between checks for work when
+# running on simulated time. Idling in longer steps lets the simulation skip
+# ahead quickly, and stop requests only need to be noticed in virtual time.
+_SIMULATED_IDLE_SECONDS = 60
+# Number of seconds to wait at shutdown for polls in progress to finish.
+_SHUTDOWN_TIMEOUT_SECONDS = 10.0
+# Number of seconds that startup (from argument parsing until the pollers
+# start) may take before GreenPiThumb warns that it is slow.
+STARTUP_BUDGET_SECONDS = 5.0
+# Default location of the GreenPiThumb database file.
+_DEFAULT_DB_FILE = 'greenpithumb/greenpithumb.db'
+# Suffix appended to the database file's name (without its extension) to get
+# the default state file path.
+_STATE_FILE_SUFFIX = '-state.json'
+# Suffix appended to the database file's name (without its extension) to get
+# the prefix of profile and stack dump files.
+_PROFILE_SUFFIX = '-profile'
+# Default for --poll_interval, in minutes.
+_DEFAULT_POLL_INTERVAL_MINUTES = 15
+# Time range that the report command covers when no start or end is given.
+_EARLIEST_REPORT_TIME = datetime.datetime(1970, 1, 1, tzinfo=pytz.utc)
+_LATEST_REPORT_TIME = datetime.datetime(9999, 1, 1, tzinfo=pytz.utc)
+# Table names and stores of the readings of each sensor polled every poll
+# interval.
+_READING_STORES = (
+    ('temperature', db_store.TemperatureStore),
+    ('humidity', db_store.HumidityStore),
+    ('soil_moisture', db_store.SoilMoistureStore),
+    ('light', db_store.LightStore),)
+
+
+def configure_logging(
+        verbose,
+        log_file=None,
+        log_format='text',
+        rate_limit_seconds=log_handlers.DEFAULT_RATE_LIMIT_SECONDS):
+    """Configure the root logger for log output.
+
+    Log records are written in batches from a background thread. Messages from
+    hot paths, such as sensor readings, are rate limited per call site. Without
+    verbose logging, informational messages are kept in memory and written
+    only when an error occurs, to give the error context.
+
+    Args:
+        verbose: True to write informational messages as they are logged.
+        log_file: Path of a file to which to append log output, or None to log
+            to stderr.
+        log_format: "text" for human-readable lines or "json" for one JSON
+            object per line.
+        rate_limit_seconds: Minimum number of seconds between messages from
+            the same hot-path call site.
+    """
     root_logger = logging.getLogger()
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter(
-        '%(asctime)s %(name)-15s %(levelname)-4s %(message)s',
-        '%Y-%m-%d %H:%M:%S')
+    if log_file:
+        stream = open(log_file, 'a')
+    else:
+        stream = sys.stderr
+    handler = log_handlers.BatchingStreamHandler(stream)
+    if log_format == 'json':
+        formatter = log_handlers.JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            '%(asctime)s %(name)-15s %(levelname)-4s %(message)s',
+            '%Y-%m-%d %H:%M:%S')
     handler.setFormatter(formatter)
-    root_logger.addHandler(handler)
+    handler.addFilter(log_handlers.RateLimitFilter(rate_limit_seconds))
     if verbose:
-        root_logger.setLevel(logging.INFO)
+        handler.setLevel(logging.INFO)
     else:
-        root_logger.setLevel(logging.WARNING)
+        handler.setLevel(logging.WARNING)
+        root_logger.addHandler(log_handlers.RingBufferHandler(handler))
+    root_logger.addHandler(handler)
+    root_logger.setLevel(logging.INFO)
+
+
+def make_settings(args):
+    """Creates the settings that can be reloaded while GreenPiThumb runs.
+
+    Args:
+        args: Parsed command-line arguments.
+
+    Returns:
+        A config_reloader.Settings instance.
+    """
+    return config_reloader.Settings(
+        moisture_threshold=args.moisture_threshold,
+        sleep_windows=sleep_windows.parse(args.sleep_window),
+        poll_interval=datetime.timedelta(minutes=args.poll_interval),
+        photo_interval=datetime.timedelta(minutes=args.photo_interval),
+        wiring_config=read_wiring_config(args.config_file))
+
+
+def load_settings(argv):
+    """Loads the settings that can be reloaded while GreenPiThumb runs.
+
+    Parses the command line again, which rereads any argument files named on
+    it, and rereads the wiring config file.
+
+    Args:
+        argv: Command-line arguments, excluding the program name.
+
+    Returns:
+        A config_reloader.Settings instance.
+
+    Raises:
+        config_reloader.InvalidSettingsError if the arguments are invalid.
+    """
+    try:
+        args = make_main_parser().parse_args(argv)
+    except SystemExit:
+        raise config_reloader.InvalidSettingsError(
+            'invalid command-line arguments')
+    return make_settings(args)
 
 
 def read_wiring_config(config_filename):
@@ -52,15 +171,58 @@ def read_wiring_config(config_filename):
         return wiring_config_parser.parse(config_file.read())
 
 
-def make_adc(wiring_config):
+def make_simulated_hardware(args, wiring_config, utc_clock, local_clock):
+    """Creates simulated hardware if the user asked for it.
+
+    Args:
+        args: Parsed command-line arguments.
+        wiring_config: Wiring configuration for the GreenPiThumb.
+        utc_clock: Clock interface.
+        local_clock: Local clock interface.
+
+    Returns:
+        A simulated_hardware.Hardware instance, or None if GreenPiThumb should
+        use the Raspberry Pi's hardware.
+    """
+    if args.hardware != 'sim':
+        return None
+    import simulated_hardware
+    logger.info('using simulated hardware')
+    return simulated_hardware.Hardware(
+        utc_clock, local_clock, wiring_config,
+        simulated_hardware.Settings(
+            latency_seconds=args.sim_latency_ms / 1000.0,
+            noise=args.sim_noise,
+            failure_rate=args.sim_failure_rate), random.Random(args.sim_seed))
+
+
+def make_pi_io(simulated):
+    """Creates the Raspberry Pi I/O interface.
+
+    Args:
+        simulated: Simulated hardware to use, or None to use the Raspberry Pi's
+            hardware.
+    """
+    if simulated:
+        return pi_io.IO(simulated.gpio)
+    import RPi.GPIO as GPIO
+    return pi_io.IO(GPIO)
+
+
+def make_adc(wiring_config, simulated):
     """Creates ADC instance based on the given wiring_config.
 
     Args:
         wiring_config: Wiring configuration for the GreenPiThumb.
+        simulated: Simulated hardware to use, or None to use the Raspberry Pi's
+            hardware.
 
     Returns:
         An ADC instance for the specified wiring config.
     """
+    if simulated:
+        return adc_thread_safe.Adc(simulated.mcp3008)
+    import Adafruit_MCP3008
     # The MCP3008 spec and Adafruit library use different naming for the
     # Raspberry Pi GPIO pins, so we translate as follows:
     # * CLK -> CLK
@@ -75,19 +237,29 @@ def make_adc(wiring_config):
             mosi=wiring_config.gpio_pins.mcp3008_din))
 
 
-def make_dht11_sensors(wiring_config):
+def make_dht11_sensors(wiring_config, utc_clock, simulated):
     """Creates sensors derived from the DHT11 sensor.
 
     Args:
         wiring_config: Wiring configuration for the GreenPiThumb.
+        utc_clock: Clock interface.
+        simulated: Simulated hardware to use, or None to use the Raspberry Pi's
+            hardware.
 
     Returns:
         A two-tuple where the first element is a temperature sensor and the
         second element is a humidity sensor.
     """
-    local_dht11 = dht11.CachingDHT11(
-        lambda: Adafruit_DHT.read_retry(Adafruit_DHT.DHT11, wiring_config.gpio_pins.dht11),
-        clock.Clock())
+    if simulated:
+        local_dht11 = dht11.CachingDHT11(simulated.dht11.read_retry, utc_clock)
+    else:
+        import Adafruit_DHT
+
+        def read_dht11():
+            return Adafruit_DHT.read_retry(Adafruit_DHT.DHT11,
+                                           wiring_config.gpio_pins.dht11)
+
+        local_dht11 = dht11.CachingDHT11(read_dht11, utc_clock)
     return temperature_sensor.TemperatureSensor(
         local_dht11), humidity_sensor.HumiditySensor(local_dht11),
 
@@ -103,70 +275,134 @@ def make_light_sensor(adc, wiring_config):
                                     wiring_config.adc_channels.light_sensor)
 
 
-def make_camera_manager(rotation, image_path, light_sensor):
+def make_camera_manager(rotation, image_path, utc_clock, light_sensor, readings,
+                        record_queue, max_duplicate_distance,
+                        max_duplicate_hours, simulated):
     """Creates a camera manager instance.
 
     Args:
         rotation: The amount (in whole degrees) to rotate the camera image.
         image_path: The directory in which to save images.
+        utc_clock: Clock interface.
         light_sensor: A light sensor instance.
+        readings: Registry of latest sensor readings.
+        record_queue: Queue on which to put image records.
+        max_duplicate_distance: Maximum perceptual hash distance from the last
+            saved photo at which a photo is discarded as a near-duplicate. If
+            negative, every photo is saved.
+        max_duplicate_hours: Number of hours after the last saved photo after
+            which a photo is saved even if it is a near-duplicate. If
+            negative, near-duplicates are never saved.
+        simulated: Simulated hardware to use, or None to use the Raspberry Pi's
+            camera.
 
     Returns:
         A CameraManager instance with the given settings.
     """
-    camera = picamera.PiCamera(resolution=picamera.PiCamera.MAX_RESOLUTION)
+    if simulated:
+        camera = simulated.camera
+    else:
+        import picamera
+        camera = picamera.PiCamera(resolution=picamera.PiCamera.MAX_RESOLUTION)
+    import camera_manager
+    import image_processor
     camera.rotation = rotation
-    return camera_manager.CameraManager(image_path,
-                                        clock.Clock(), camera, light_sensor)
+    if max_duplicate_distance < 0:
+        max_duplicate_distance = None
+    if max_duplicate_hours < 0:
+        max_duplicate_age = None
+    else:
+        max_duplicate_age = datetime.timedelta(hours=max_duplicate_hours)
+    local_image_processor = image_processor.ImageProcessor(
+        image_path, record_queue, image_processor.DEFAULT_WORKER_COUNT,
+        max_duplicate_distance, max_duplicate_age)
+    local_image_processor.start()
+    return camera_manager.CameraManager(image_path, utc_clock, camera,
+                                        light_sensor, readings,
+                                        local_image_processor)
 
 
-def make_pump_manager(moisture_threshold, sleep_windows, raspberry_pi_io,
-                      wiring_config, pump_amount, db_connection, pump_interval):
-    """Creates a pump manager instance.
+def make_retention_job(image_path, image_store, local_clock, sleep_windows,
+                       full_resolution_days, daily_after_months):
+    """Creates a job that downscales and thins out old images.
+
+    Args:
+        image_path: The directory in which images are saved.
+        image_store: Database store for image metadata.
+        local_clock: Local clock interface.
+        sleep_windows: Sleep windows during which the job is allowed to run.
+        full_resolution_days: Number of days to keep images at full
+            resolution, or a negative number to keep them at full resolution
+            forever.
+        daily_after_months: Number of months after which to keep only one image
+            per day, or a negative number to keep every image forever.
+
+    Returns:
+        A RetentionJob instance with the given settings.
+    """
+    from dateutil import relativedelta
+    import image_retention
+    full_resolution_period = None
+    if full_resolution_days >= 0:
+        full_resolution_period = datetime.timedelta(days=full_resolution_days)
+    daily_period = None
+    if daily_after_months >= 0:
+        daily_period = relativedelta.relativedelta(months=daily_after_months)
+    return image_retention.RetentionJob(image_path, image_store, local_clock,
+                                        sleep_windows, full_resolution_period,
+                                        daily_period)
+
+
+def make_pump_timer(pump_interval, utc_clock, db_connection, saved_deadline):
+    """Creates a timer that counts down until the next forced pump run.
 
     Args:
-        moisture_threshold: The minimum moisture level below which the pump
-            turns on.
-        sleep_windows: Sleep windows during which pump will not turn on.
-        raspberry_pi_io: pi_io instance for the GreenPiThumb.
-        wiring_config: Wiring configuration for the GreenPiThumb.
-        pump_amount: Amount (in mL) to pump on each run of the pump.
-        db_connection: Database connection to use to retrieve pump history.
         pump_interval: Maximum amount of time between pump runs.
+        utc_clock: Clock interface.
+        db_connection: Database connection to use to retrieve pump history if
+            there is no saved deadline.
+        saved_deadline: Time of the next forced pump run saved by a previous
+            run, or None.
 
     Returns:
-        A PumpManager instance with the given settings.
+        A Timer instance.
     """
-    water_pump = pump.Pump(raspberry_pi_io,
-                           clock.Clock(), wiring_config.gpio_pins.pump)
-    pump_scheduler = pump.PumpScheduler(clock.LocalClock(), sleep_windows)
-    pump_timer = clock.Timer(clock.Clock(), pump_interval)
-    last_pump_time = pump_history.last_pump_time(
-        db_store.WateringEventStore(db_connection))
-    if last_pump_time:
-        logger.info('last watering was at %s', last_pump_time)
-        time_remaining = max(
-            datetime.timedelta(seconds=0),
-            (last_pump_time + pump_interval) - clock.Clock().now())
+    pump_timer = clock.Timer(utc_clock, pump_interval)
+    if saved_deadline:
+        logger.info('restoring next forced watering time of %s', saved_deadline)
+        time_remaining = saved_deadline - utc_clock.now()
     else:
-        logger.info('no previous watering found')
-        time_remaining = datetime.timedelta(seconds=0)
+        last_pump_time = pump_history.last_pump_time(
+            db_store.WateringEventStore(db_connection))
+        if last_pump_time:
+            logger.info('last watering was at %s', last_pump_time)
+            time_remaining = (last_pump_time + pump_interval) - utc_clock.now()
+        else:
+            logger.info('no previous watering found')
+            time_remaining = datetime.timedelta(seconds=0)
+    time_remaining = min(
+        max(datetime.timedelta(seconds=0), time_remaining), pump_interval)
     logger.info('time until until next watering: %s', time_remaining)
     pump_timer.set_remaining(time_remaining)
-    return pump.PumpManager(water_pump, pump_scheduler, moisture_threshold,
-                            pump_amount, pump_timer)
+    return pump_timer
 
 
-def make_sensor_pollers(poll_interval, photo_interval, record_queue,
-                        temperature_sensor, humidity_sensor,
-                        soil_moisture_sensor, light_sensor, camera_manager,
-                        pump_manager):
+def make_sensor_pollers(
+        utc_clock, idle_seconds, poll_interval, photo_interval, last_poll_times,
+        record_queue, readings, temperature_sensor, humidity_sensor,
+        soil_moisture_sensor, light_sensor, camera_manager, pump_manager):
     """Creates a poller for each GreenPiThumb sensor.
 
     Args:
+        utc_clock: Clock interface.
+        idle_seconds: Number of seconds pollers idle between checks for
+            whether they need to poll or stop.
         poll_interval: The frequency at which to poll non-camera sensors.
         photo_interval: The frequency at which to capture photos.
+        last_poll_times: A dictionary of poller names to the time of each
+            poller's last poll in a previous run.
         record_queue: Queue on which to put sensor reading records.
+        readings: Registry of latest sensor readings.
         temperature_sensor: Sensor for measuring temperature.
         humidity_sensor: Sensor for measuring humidity.
         soil_moisture_sensor: Sensor for measuring soil moisture.
@@ -175,20 +411,32 @@ def make_sensor_pollers(poll_interval, photo_interval, record_queue,
         pump_manager: Interface for turning water pump on and off.
 
     Returns:
-        A list of sensor pollers.
+        A two-tuple where the first element is a list of sensor pollers and the
+        second element is a dictionary of poller names to their schedulers.
     """
     logger.info('creating sensor pollers (poll interval=%ds")',
                 poll_interval.total_seconds())
-    utc_clock = clock.Clock()
+    schedulers = {}
 
-    make_scheduler_func = lambda: poller.Scheduler(utc_clock, poll_interval)
-    photo_make_scheduler_func = lambda: poller.Scheduler(utc_clock, photo_interval)
-    poller_factory = poller.SensorPollerFactory(make_scheduler_func,
-                                                record_queue)
+    def make_scheduler(name, interval):
+        scheduler = poller.Scheduler(utc_clock, interval, name)
+        if name in last_poll_times:
+            logger.info('restoring last poll time of %s poller: %s', name,
+                        last_poll_times[name])
+            scheduler.restore_last_poll_time(last_poll_times[name])
+        schedulers[name] = scheduler
+        return scheduler
+
+    poller_factory = poller.SensorPollerFactory(
+        lambda name: make_scheduler(name, poll_interval), record_queue,
+        readings, idle_seconds)
     camera_poller_factory = poller.SensorPollerFactory(
-        photo_make_scheduler_func, record_queue=None)
+        lambda name: make_scheduler(name, photo_interval),
+        record_queue=None,
+        readings=readings,
+        idle_seconds=idle_seconds)
 
-    return [
+    pollers = [
         poller_factory.create_temperature_poller(temperature_sensor),
         poller_factory.create_humidity_poller(humidity_sensor),
         poller_factory.create_soil_watering_poller(
@@ -197,77 +445,496 @@ def make_sensor_pollers(poll_interval, photo_interval, record_queue,
         poller_factory.create_light_poller(light_sensor),
         camera_poller_factory.create_camera_poller(camera_manager)
     ]  # yapf: disable
+    return pollers, schedulers
 
 
-def create_record_processor(db_connection, record_queue):
+def create_record_processor(db_connection,
+                            record_queue,
+                            publisher=None,
+                            poll_interval=None):
     """Creates a record processor for storing records in a database.
 
     Args:
         db_connection: Database connection to use to store records.
         record_queue: Record queue from which to process records.
+        publisher: RecordPublisher to which to publish stored records, or None.
+        poll_interval: timedelta of how often non-camera sensors are polled, to
+            record gaps in their readings, or None to not record gaps.
     """
     return record_processor.RecordProcessor(
         record_queue,
-        db_store.SoilMoistureStore(db_connection),
-        db_store.LightStore(db_connection),
-        db_store.HumidityStore(db_connection),
-        db_store.TemperatureStore(db_connection),
-        db_store.WateringEventStore(db_connection))
+        db_store.SoilMoistureStore(db_connection, poll_interval),
+        db_store.LightStore(db_connection, poll_interval),
+        db_store.HumidityStore(db_connection, poll_interval),
+        db_store.TemperatureStore(db_connection, poll_interval),
+        db_store.WateringEventStore(db_connection),
+        db_store.ImageStore(db_connection), publisher)
+
+
+def log_startup_time(startup_seconds):
+    """Logs how long startup took, warning if it went over budget."""
+    if startup_seconds > STARTUP_BUDGET_SECONDS:
+        logger.warning('startup took %.2fs, more than the budget of %.2fs',
+                       startup_seconds, STARTUP_BUDGET_SECONDS)
+    else:
+        logger.info('startup took %.2fs', startup_seconds)
+
+
+def wait_for_pollers(pollers, timeout_seconds):
+    """Waits for stopped pollers to finish polls in progress.
+
+    Args:
+        pollers: The pollers to wait for.
+        timeout_seconds: Maximum total time (in seconds) to wait for all of the
+            pollers to finish.
+
+    Returns:
+        The number of pollers that were still polling when time ran out.
+    """
+    deadline = monotonic_clock.monotonic() + timeout_seconds
+    unfinished = 0
+    for current_poller in pollers:
+        remaining_seconds = max(0, deadline - monotonic_clock.monotonic())
+        if not current_poller.join(remaining_seconds):
+            unfinished += 1
+    if unfinished:
+        logger.warning('%d pollers did not finish within %.fs', unfinished,
+                       timeout_seconds)
+    return unfinished
+
+
+def flush_records(record_processor, db_connection):
+    """Stores all queued records in a single commit.
+
+    Args:
+        record_processor: Record processor whose queue to flush.
+        db_connection: Database connection to which records are written.
+
+    Returns:
+        A two-tuple of the number of records stored and the number of records
+        that could not be stored.
+    """
+    with db_store.deferred_commits(db_connection):
+        flushed, dropped = record_processor.process_all_records()
+    if dropped:
+        logger.warning('flushed %d records and dropped %d records at shutdown',
+                       flushed, dropped)
+    else:
+        logger.info('flushed %d records at shutdown', flushed)
+    return flushed, dropped
+
+
+def make_metrics_server(address, port, record_queue):
+    """Creates a server for GreenPiThumb's metrics.
+
+    Args:
+        address: Address on which to serve metrics.
+        port: Port on which to serve metrics, or 0 to not serve metrics.
+        record_queue: Queue of records waiting to be stored, whose depth to
+            report.
+
+    Returns:
+        A MetricsServer, or None if metrics are disabled.
+    """
+    if not port:
+        return None
+    metrics.gauge_function('greenpithumb_record_queue_depth',
+                           'Records waiting to be stored.', record_queue.qsize)
+    return metrics.MetricsServer(address, port)
 
 
 def main(args):
-    configure_logging(args.verbose)
+    configure_logging(args.verbose, args.log_file, args.log_format,
+                      args.log_rate_limit_seconds)
     logger.info('starting greenpithumb')
-    wiring_config = read_wiring_config(args.config_file)
+    simulation_end = None
+    if args.simulate_days > 0:
+        utc_clock = clock.SimulatedClock(
+            datetime.datetime.now(tz=pytz.utc).replace(microsecond=0))
+        local_clock = clock.SimulatedLocalClock(utc_clock)
+        simulation_end = utc_clock.now() + datetime.timedelta(
+            days=args.simulate_days)
+        logger.info('simulating until %s', simulation_end)
+        idle_seconds = _SIMULATED_IDLE_SECONDS
+        poller_idle_seconds = _SIMULATED_IDLE_SECONDS
+    else:
+        utc_clock = clock.Clock()
+        local_clock = clock.LocalClock()
+        idle_seconds = _IDLE_SECONDS
+        poller_idle_seconds = poller.DEFAULT_IDLE_SECONDS
+    settings = make_settings(args)
+    wiring_config = settings.wiring_config
+    simulated = make_simulated_hardware(args, wiring_config, utc_clock,
+                                        local_clock)
     record_queue = Queue.Queue()
-    raspberry_pi_io = pi_io.IO(GPIO)
-    adc = make_adc(wiring_config)
+    raspberry_pi_io = make_pi_io(simulated)
+    adc = make_adc(wiring_config, simulated)
     local_soil_moisture_sensor = make_soil_moisture_sensor(
         adc, raspberry_pi_io, wiring_config)
     local_temperature_sensor, local_humidity_sensor = make_dht11_sensors(
-        wiring_config)
+        wiring_config, utc_clock, simulated)
     local_light_sensor = make_light_sensor(adc, wiring_config)
-    camera_manager = make_camera_manager(args.camera_rotation, args.image_path,
-                                         local_light_sensor)
+    readings = latest_readings.LatestReadings(utc_clock)
+    camera_manager = make_camera_manager(
+        args.camera_rotation, args.image_path, utc_clock, local_light_sensor,
+        readings, record_queue, args.max_duplicate_photo_distance,
+        args.max_duplicate_photo_hours, simulated)
 
     with contextlib.closing(
             db_store.open_or_create_db(args.db_file)) as db_connection:
-        record_processor = create_record_processor(db_connection, record_queue)
-        pump_manager = make_pump_manager(
-            args.moisture_threshold,
-            sleep_windows.parse(args.sleep_window),
-            raspberry_pi_io,
-            wiring_config,
-            args.pump_amount,
+        import image_layout
+        image_layout.migrate_flat_layout(args.image_path,
+                                         db_store.ImageStore(db_connection))
+        publisher = record_publisher.RecordPublisher()
+        record_processor = create_record_processor(
+            db_connection, record_queue, publisher, settings.poll_interval)
+        local_state_file = state_file.StateFile(
+            args.state_file or
+            os.path.splitext(args.db_file)[0] + _STATE_FILE_SUFFIX)
+        saved_state = local_state_file.load()
+        retention_job = make_retention_job(args.image_path,
+                                           db_store.ImageStore(db_connection),
+                                           local_clock, settings.sleep_windows,
+                                           args.photo_full_resolution_days,
+                                           args.photo_daily_after_months)
+        retention_job.restore_progress(saved_state.retention_progress)
+        pump_timer = make_pump_timer(
+            datetime.timedelta(hours=args.pump_interval),
+            utc_clock,
             db_connection,
-            datetime.timedelta(hours=args.pump_interval))
-        pollers = make_sensor_pollers(
-            datetime.timedelta(minutes=args.poll_interval),
-            datetime.timedelta(minutes=args.photo_interval),
-            record_queue,
-            local_temperature_sensor,
-            local_humidity_sensor,
-            local_soil_moisture_sensor,
-            local_light_sensor,
-            camera_manager,
+            saved_state.pump_deadline)
+        water_pump = pump.Pump(raspberry_pi_io, utc_clock,
+                               wiring_config.gpio_pins.pump)
+        pump_scheduler = pump.PumpScheduler(local_clock, settings.sleep_windows)
+        pump_manager = pump.PumpManager(water_pump, pump_scheduler,
+                                        settings.moisture_threshold,
+                                        args.pump_amount, pump_timer)
+        pollers, schedulers = make_sensor_pollers(
+            utc_clock, poller_idle_seconds, settings.poll_interval,
+            settings.photo_interval, saved_state.last_poll_times, record_queue,
+            readings, local_temperature_sensor, local_humidity_sensor,
+            local_soil_moisture_sensor, local_light_sensor, camera_manager,
             pump_manager)
+        state_recorder = state_file.StateRecorder(local_state_file, schedulers,
+                                                  pump_timer, retention_job)
+        reloader = config_reloader.ConfigReloader(
+            lambda: load_settings(sys.argv[1:]), settings, pump_manager,
+            pump_scheduler, water_pump, retention_job, schedulers,
+            record_processor)
+        signal.signal(signal.SIGHUP,
+                      lambda signum, frame: reloader.request_reload())
+        local_profiler = profiler.Profiler(
+            os.path.splitext(args.db_file)[0] + _PROFILE_SUFFIX,
+            args.profile_seconds)
+        signal.signal(signal.SIGUSR1,
+                      lambda signum, frame: local_profiler.request_profile())
+        shutdown_requested = threading.Event()
+        signal.signal(signal.SIGTERM,
+                      lambda signum, frame: shutdown_requested.set())
+        if simulation_end:
+            # Each poller thread and the main thread take part in the
+            # simulation.
+            utc_clock.set_participant_count(len(pollers) + 1)
+        metrics_server = make_metrics_server(args.metrics_address,
+                                             args.metrics_port, record_queue)
+        read_api_server = None
+        if args.api_port:
+            read_api_server = read_api.ReadApiServer(
+                args.api_address, args.api_port, args.db_file, publisher)
+        snapshot_writer = None
+        if args.snapshot_dir:
+            snapshot_writer = snapshots.SnapshotWriter(
+                args.snapshot_dir, db_connection, publisher, utc_clock)
         try:
+            if metrics_server:
+                metrics_server.start()
+            if read_api_server:
+                read_api_server.start()
             for current_poller in pollers:
                 current_poller.start_polling_async()
-            while True:
+            log_startup_time(monotonic_clock.monotonic() - _STARTED_AT)
+            while not shutdown_requested.is_set():
+                if simulation_end and utc_clock.now() >= simulation_end:
+                    logger.info('simulation finished at %s', utc_clock.now())
+                    break
+                local_profiler.start_if_requested()
                 if not record_processor.try_process_next_record():
-                    time.sleep(0.1)
+                    reloader.reload_if_requested()
+                    state_recorder.save_if_changed()
+                    retention_job.run_batch()
+                    if snapshot_writer:
+                        snapshot_writer.update()
+                    utc_clock.wait(idle_seconds)
+            if shutdown_requested.is_set():
+                logger.info('Caught SIGTERM. Exiting.')
         except KeyboardInterrupt:
             logger.info('Caught keyboard interrupt. Exiting.')
         finally:
             for current_poller in pollers:
+                current_poller.stop()
+            if simulation_end:
+                # Let the pollers advance virtual time without the main thread
+                # so that they notice they have been stopped.
+                utc_clock.leave()
+            wait_for_pollers(pollers, _SHUTDOWN_TIMEOUT_SECONDS)
+            for current_poller in pollers:
+                # Closing the camera poller saves captured images, which adds
+                # their records to the queue.
                 current_poller.close()
+            water_pump.turn_off()
+            flush_records(record_processor, db_connection)
+            state_recorder.save_if_changed()
+            if snapshot_writer:
+                snapshot_writer.update()
+                snapshot_writer.close()
             raspberry_pi_io.close()
+            local_profiler.close()
+            if metrics_server:
+                metrics_server.close()
+            # Ends live streams, now that the last records have been stored.
+            publisher.close()
+            if read_api_server:
+                read_api_server.close()
 
 
-if __name__ == '__main__':
+def migrate(args):
+    """Upgrades the database to the latest schema, then exits."""
+    configure_logging(args.verbose)
+    logger.info('migrating database at "%s"', args.db_file)
+    db_store.open_or_create_db(args.db_file).close()
+
+
+def make_migrate_parser():
+    """Creates the argument parser for the migrate command."""
+    parser = argparse.ArgumentParser(
+        prog='GreenPiThumb migrate',
+        description='Upgrades the GreenPiThumb database to the latest schema',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        '-d',
+        '--db_file',
+        help='Location of GreenPiThumb database file',
+        default=_DEFAULT_DB_FILE)
+    parser.add_argument(
+        '-v', '--verbose', action='store_true', help='Use verbose logging')
+    return parser
+
+
+def export(args):
+    """Exports stored data to CSV or JSON lines files, then exits."""
+    configure_logging(args.verbose)
+    exporter.export(args.db_file, args.output_dir, args.tables, args.format,
+                    args.gzip, args.start, args.end, args.resume)
+
+
+def _parse_utc_time(value):
+    """Parses a UTC time given on the command line."""
+    for time_format in ('%Y-%m-%dT%H:%MZ', '%Y-%m-%d'):
+        try:
+            return datetime.datetime.strptime(value, time_format).replace(
+                tzinfo=pytz.utc)
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(
+        'Invalid time (expected YYYY-MM-DD or YYYY-MM-DDTHH:MMZ): %s' % value)
+
+
+def make_export_parser():
+    """Creates the argument parser for the export command."""
+    parser = argparse.ArgumentParser(
+        prog='GreenPiThumb export',
+        description=('Exports stored data to one CSV or JSON lines file per '
+                     'table. Safe to run while GreenPiThumb runs'),
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        '-d',
+        '--db_file',
+        help='Location of GreenPiThumb database file',
+        default=_DEFAULT_DB_FILE)
+    parser.add_argument(
+        '-o',
+        '--output_dir',
+        help='Directory in which to write export files',
+        required=True)
+    parser.add_argument(
+        '--tables',
+        nargs='+',
+        choices=exporter.STORES.keys(),
+        help='Tables to export',
+        default=exporter.STORES.keys())
+    parser.add_argument(
+        '--format',
+        choices=exporter.FORMATS,
+        help='Format of export files',
+        default='csv')
+    parser.add_argument(
+        '--gzip', action='store_true', help='Compress export files with gzip')
+    parser.add_argument(
+        '--start',
+        type=_parse_utc_time,
+        help=('Export records from this UTC time on (YYYY-MM-DD or '
+              'YYYY-MM-DDTHH:MMZ). Defaults to the earliest record'))
+    parser.add_argument(
+        '--end',
+        type=_parse_utc_time,
+        help=('Export records before this UTC time (YYYY-MM-DD or '
+              'YYYY-MM-DDTHH:MMZ). Defaults to after the latest record'))
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help=('Export only records after those exported by the last resumed '
+              'export to the same directory, for incremental backups'))
+    parser.add_argument(
+        '-v', '--verbose', action='store_true', help='Use verbose logging')
+    return parser
+
+
+def import_data(args):
+    """Imports records from files or other databases, then exits.
+
+    Prints statistics of each table's import.
+    """
+    configure_logging(args.verbose)
+    poll_interval = datetime.timedelta(minutes=args.poll_interval)
+    db_paths = [path for path in args.sources if path.endswith('.db')]
+    file_paths = [path for path in args.sources if not path.endswith('.db')]
+    with contextlib.closing(
+            db_store.open_or_create_db(args.db_file)) as connection:
+        all_stats = []
+        for db_path in db_paths:
+            all_stats.extend(
+                importer.import_database(connection, db_path, poll_interval))
+        if file_paths:
+            all_stats.extend(
+                importer.import_files(connection, file_paths, args.table,
+                                      poll_interval))
+    for stats in all_stats:
+        print('%s: read %d, rejected %d, duplicates %d, inserted %d in %.2f s '
+              '(%d records/s)' %
+              (stats.table, stats.read, stats.rejected, stats.duplicates,
+               stats.inserted, stats.seconds,
+               stats.read / max(stats.seconds, 1e-6)))
+
+
+def make_import_parser():
+    """Creates the argument parser for the import command."""
+    parser = argparse.ArgumentParser(
+        prog='GreenPiThumb import',
+        description=('Imports records in bulk from CSV or JSON lines files, '
+                     'such as those the export command writes, or from other '
+                     'GreenPiThumb databases. Records already in the database '
+                     'are skipped. Stop GreenPiThumb before importing, as the '
+                     'import holds the database locked while it runs'),
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        '-d',
+        '--db_file',
+        help='Location of GreenPiThumb database file to import into',
+        default=_DEFAULT_DB_FILE)
+    parser.add_argument(
+        'sources',
+        nargs='+',
+        help=('Files to import (.csv or .jsonl, optionally ending in .gz) or '
+              'databases to import every table from (.db)'))
+    parser.add_argument(
+        '--table',
+        choices=importer.TABLES,
+        help=('Table into which to import every file. Defaults to the table '
+              'that each file\'s name starts with, as in export file names'))
+    parser.add_argument(
+        '-p',
+        '--poll_interval',
+        type=float,
+        help=('Number of minutes between each sensor poll, against which to '
+              'find the gaps in the imported readings'),
+        default=_DEFAULT_POLL_INTERVAL_MINUTES)
+    parser.add_argument(
+        '-v', '--verbose', action='store_true', help='Use verbose logging')
+    return parser
+
+
+def report(args):
+    """Prints the gaps in each sensor's readings, then exits."""
+    configure_logging(args.verbose)
+    start = args.start or _EARLIEST_REPORT_TIME
+    end = args.end or _LATEST_REPORT_TIME
+    if args.rebuild_gaps:
+        connection = db_store.open_or_create_db(args.db_file)
+    else:
+        connection = db_store.open_read_only(args.db_file)
+    with contextlib.closing(connection):
+        for table, store_type in _READING_STORES:
+            store = store_type(connection)
+            if args.rebuild_gaps:
+                store.rebuild_gaps(
+                    datetime.timedelta(minutes=args.poll_interval))
+            gaps = store.get_gaps(start, end)
+            print('%s: %d gaps, %d missing ticks' %
+                  (table, len(gaps), sum(gap.missing_ticks for gap in gaps)))
+            for gap in gaps[-args.limit:] if args.limit else []:
+                print('  %s to %s: %d missing ticks' %
+                      (gap.start.strftime('%Y-%m-%dT%H:%MZ'),
+                       gap.end.strftime('%Y-%m-%dT%H:%MZ'), gap.missing_ticks))
+
+
+def make_report_parser():
+    """Creates the argument parser for the report command."""
+    parser = argparse.ArgumentParser(
+        prog='GreenPiThumb report',
+        description=('Reports the gaps in each sensor\'s readings, where polls '
+                     'were due but no reading was stored. Reads the gaps that '
+                     'GreenPiThumb records as it stores readings, so it is '
+                     'fast however many readings exist and safe to run while '
+                     'GreenPiThumb runs'),
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        '-d',
+        '--db_file',
+        help='Location of GreenPiThumb database file',
+        default=_DEFAULT_DB_FILE)
+    parser.add_argument(
+        '--start',
+        type=_parse_utc_time,
+        help=('Report gaps that end after this UTC time (YYYY-MM-DD or '
+              'YYYY-MM-DDTHH:MMZ). Defaults to the earliest reading'))
+    parser.add_argument(
+        '--end',
+        type=_parse_utc_time,
+        help=('Report gaps that start before this UTC time (YYYY-MM-DD or '
+              'YYYY-MM-DDTHH:MMZ). Defaults to after the latest reading'))
+    parser.add_argument(
+        '--limit',
+        type=int,
+        help='Maximum number of the latest gaps to list for each sensor',
+        default=10)
+    parser.add_argument(
+        '--rebuild_gaps',
+        action='store_true',
+        help=('First find the gaps in every stored reading, for a database '
+              'whose readings were stored before gaps were recorded or with a '
+              'different poll interval. Stop GreenPiThumb first'))
+    parser.add_argument(
+        '-p',
+        '--poll_interval',
+        type=float,
+        help='Number of minutes between each sensor poll, for --rebuild_gaps',
+        default=_DEFAULT_POLL_INTERVAL_MINUTES)
+    parser.add_argument(
+        '-v', '--verbose', action='store_true', help='Use verbose logging')
+    return parser
+
+
+def make_main_parser():
+    """Creates the argument parser for running GreenPiThumb."""
     parser = argparse.ArgumentParser(
         prog='GreenPiThumb',
+        description=(
+            'Arguments may also be read from a file named with a leading "@" '
+            '(e.g. @greenpithumb.args), one per line. On SIGHUP, GreenPiThumb '
+            'rereads such files and the wiring config and applies any changes '
+            'to the moisture threshold, sleep windows, poll intervals and '
+            'pump pin without restarting'),
+        fromfile_prefix_chars='@',
         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument(
         '-a',
@@ -280,7 +947,7 @@ if __name__ == '__main__':
         '--poll_interval',
         type=float,
         help='Number of minutes between each sensor poll',
-        default=15)
+        default=_DEFAULT_POLL_INTERVAL_MINUTES)
     parser.add_argument(
         '-t',
         '--photo_interval',
@@ -313,11 +980,44 @@ if __name__ == '__main__':
         type=str,
         help='Path to folder where images will be stored',
         default='images/')
+    parser.add_argument(
+        '--max_duplicate_photo_distance',
+        type=int,
+        help=('Photos whose perceptual hash differs from the last saved photo '
+              'by at most this many bits are discarded as near-duplicates. '
+              'Use a negative value to save every photo'),
+        default=4)
+    parser.add_argument(
+        '--max_duplicate_photo_hours',
+        type=float,
+        help=('Number of hours after the last saved photo after which a photo '
+              'is saved even if it is a near-duplicate, so that slow growth '
+              'is still recorded. Use a negative value to never save '
+              'near-duplicates'),
+        default=24)
+    parser.add_argument(
+        '--photo_full_resolution_days',
+        type=int,
+        help=('Number of days to keep photos at full resolution before '
+              'downscaling them during sleep windows. Use a negative value to '
+              'keep photos at full resolution forever'),
+        default=30)
+    parser.add_argument(
+        '--photo_daily_after_months',
+        type=int,
+        help=('Number of months after which only the brightest photo of each '
+              'day is kept. Use a negative value to keep every photo forever'),
+        default=6)
     parser.add_argument(
         '-d',
         '--db_file',
         help='Location to store GreenPiThumb database file',
-        default='greenpithumb/greenpithumb.db')
+        default=_DEFAULT_DB_FILE)
+    parser.add_argument(
+        '--state_file',
+        help=('File in which to save poll times and the pump timer, so that a '
+              'restart resumes where the last run left off. Defaults to a '
+              'file next to the database file'))
     parser.add_argument(
         '-m',
         '--moisture_threshold',
@@ -330,6 +1030,123 @@ if __name__ == '__main__':
         type=int,
         choices=(0, 90, 180, 270),
         help='Specifies the amount to rotate the camera\'s image.')
+    parser.add_argument(
+        '--profile_seconds',
+        type=float,
+        help=('Number of seconds to profile all threads for on SIGUSR1. The '
+              'profile and a stack dump of each thread are written next to '
+              'the database file'),
+        default=30)
+    parser.add_argument(
+        '--metrics_port',
+        type=int,
+        help=('Port on which to serve pipeline health metrics in Prometheus '
+              'text format at /metrics. Use 0 to disable'),
+        default=0)
+    parser.add_argument(
+        '--metrics_address',
+        help=('Address on which to serve metrics. The default only accepts '
+              'connections from this machine'),
+        default='127.0.0.1')
+    parser.add_argument(
+        '--api_port',
+        type=int,
+        help=('Port on which to serve stored readings, watering events and '
+              'image metadata as JSON, and a live stream of new records. Use 0 '
+              'to disable'),
+        default=0)
+    parser.add_argument(
+        '--api_address',
+        help=('Address on which to serve the read API. The default only '
+              'accepts connections from this machine'),
+        default='127.0.0.1')
+    parser.add_argument(
+        '--snapshot_dir',
+        help=('Directory in which to keep static JSON snapshots of recent '
+              'readings and the latest image, for dashboards served as static '
+              'files. Snapshots are not written if this is not set'))
+    parser.add_argument(
+        '--hardware',
+        choices=('pi', 'sim'),
+        help=('Hardware to use. "sim" uses simulated sensors, pump and camera '
+              'so that GreenPiThumb can run on any computer'),
+        default='pi')
+    parser.add_argument(
+        '--sim_latency_ms',
+        type=float,
+        help='Number of milliseconds each simulated hardware operation takes',
+        default=1)
+    parser.add_argument(
+        '--sim_noise',
+        type=float,
+        help=('Standard deviation of noise added to simulated sensor '
+              'readings, as a fraction of the sensor\'s full-scale range'),
+        default=0.01)
+    parser.add_argument(
+        '--sim_failure_rate',
+        type=float,
+        help='Probability that a simulated hardware operation fails',
+        default=0)
+    parser.add_argument(
+        '--sim_seed',
+        type=int,
+        help='Seed for simulated noise and failures, for repeatable runs')
+    parser.add_argument(
+        '--simulate_days',
+        type=float,
+        help=('Run on simulated time for this many days, as fast as possible, '
+              'then exit. Useful for load-testing storage and tuning '
+              'intervals. Use 0 to run in real time'),
+        default=0)
     parser.add_argument(
         '-v', '--verbose', action='store_true', help='Use verbose logging')
-    main(parser.parse_args())
+    parser.add_argument(
+        '--log_file',
+        help='File to which to append log output. Defaults to stderr')
+    parser.add_argument(
+        '--log_format',
+        choices=('text', 'json'),
+        help=('Format of log output. "json" writes one JSON object per line, '
+              'including structured fields such as sensor readings'),
+        default='text')
+    parser.add_argument(
+        '--log_rate_limit_seconds',
+        type=float,
+        help=('Minimum number of seconds between verbose messages logged on '
+              'each hot path, such as sensor readings'),
+        default=log_handlers.DEFAULT_RATE_LIMIT_SECONDS)
+    return parser
+
+
+# Commands that may be given as the first command-line argument, mapped to
+# functions that create the command's argument parser and run the command.
+_COMMANDS = {
+    'migrate': (make_migrate_parser, migrate),
+    'export': (make_export_parser, export),
+    'import': (make_import_parser, import_data),
+    'report': (make_report_parser, report),
+}
+
+
+def parse_command_line(argv):
+    """Parses command-line arguments.
+
+    Args:
+        argv: Command-line arguments, excluding the program name. If the first
+            argument names a command (e.g. "migrate"), the remaining arguments
+            are parsed for that command. Otherwise, the arguments are parsed
+            for running GreenPiThumb.
+
+    Returns:
+        A two-tuple where the first element is the function that runs the
+        command and the second element is the parsed arguments to pass it.
+    """
+    if argv and argv[0] in _COMMANDS:
+        make_parser, command = _COMMANDS[argv[0]]
+        return command, make_parser().parse_args(argv[1:])
+    return main, make_main_parser().parse_args(argv)
+
+
+if __name__ == '__main__':
+    command, args = parse_command_line(sys.argv[1:])
+    command(args)
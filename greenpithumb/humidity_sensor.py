@@ -1,5 +1,7 @@
 import logging
 
+import log_handlers
+
 logger = logging.getLogger(__name__)
 
 
@@ -18,5 +20,8 @@ class HumiditySensor(object):
     def humidity(self):
         """Returns relative humidity level."""
         humidity = self._dht11.humidity()
-        logger.info('humidity reading = %.1f', humidity)
+        logger.info(
+            'humidity reading = %.1f',
+            humidity,
+            extra=log_handlers.hot_path(sensor='humidity', value=humidity))
         return humidity
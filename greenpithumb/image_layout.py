@@ -0,0 +1,149 @@
+"""Organizes images into directories by capture date."""
+
+import datetime
+import logging
+import os
+import re
+
+from PIL import Image
+import pytz
+
+import db_store
+import image_processor
+
+logger = logging.getLogger(__name__)
+
+# Format of filename to write for camera image file (assumes timestamp is in
+# UTC), as YYYY-MM-DDTHH:MMZ (minutes-level precision).
+_FILENAME_FORMAT = '%Y-%m-%dT%H%MZ.jpg'
+# Format of the path (relative to the image directory) of a full-resolution
+# image, which places each image in a directory for the day it was captured, as
+# YYYY/MM/DD/YYYY-MM-DDTHH:MMZ.
+_PATH_FORMAT = os.path.join('%Y', '%m', '%d', _FILENAME_FORMAT)
+# Matches full-resolution image filenames written before images were organized
+# into directories by date.
+_FLAT_FILENAME_PATTERN = re.compile(r'\d{4}-\d\d-\d\dT\d{4}Z\.jpg$')
+# Ratio by which to downscale images while decoding them to measure brightness.
+_BRIGHTNESS_SCALE = 8
+
+
+def relative_path(timestamp):
+    """Returns the path at which to store an image captured at a given time.
+
+    Args:
+        timestamp: datetime instance representing the time of capture (assumed
+            to be in UTC).
+
+    Returns:
+        The path of the image, relative to the image directory.
+    """
+    return timestamp.strftime(_PATH_FORMAT)
+
+
+def _move(image_path, old_path, new_path):
+    """Moves a file within the image directory, creating parent directories.
+
+    Args:
+        image_path: Path name of the image directory.
+        old_path: Path of the file to move, relative to the image directory.
+        new_path: Destination path, relative to the image directory.
+    """
+    new_directory = os.path.dirname(os.path.join(image_path, new_path))
+    if not os.path.exists(new_directory):
+        os.makedirs(new_directory)
+    os.rename(
+        os.path.join(image_path, old_path), os.path.join(image_path, new_path))
+
+
+def _move_if_exists(image_path, old_path, new_path):
+    """Moves a file within the image directory if the file exists.
+
+    Returns:
+        new_path if the file existed and was moved, otherwise None.
+    """
+    if not os.path.exists(os.path.join(image_path, old_path)):
+        return None
+    _move(image_path, old_path, new_path)
+    return new_path
+
+
+def _migrate_image(image_path, filename, image_store):
+    """Moves a flat full-resolution image into its date-based directory.
+
+    The image is decoded before anything is moved, so an image that cannot be
+    read is left where it is.
+
+    Args:
+        image_path: Path name of the image directory.
+        filename: Filename of the image in the top level of the image
+            directory.
+        image_store: Database store for image metadata.
+
+    Raises:
+        ValueError: The filename does not hold a valid capture time.
+        IOError: The image could not be decoded.
+        OSError: The image could not be moved.
+    """
+    timestamp = datetime.datetime.strptime(filename, _FILENAME_FORMAT).replace(
+        tzinfo=pytz.utc)
+    image = Image.open(os.path.join(image_path, filename))
+    width, height = image.size
+    image.draft('L', (width // _BRIGHTNESS_SCALE, height // _BRIGHTNESS_SCALE))
+    brightness = image_processor.mean_brightness(image)
+
+    path = relative_path(timestamp)
+    _move(image_path, filename, path)
+    thumbnail_path = _move_if_exists(
+        image_path,
+        image_processor.thumbnail_filename(filename),
+        image_processor.thumbnail_filename(path))
+    web_path = _move_if_exists(image_path,
+                               image_processor.web_filename(filename),
+                               image_processor.web_filename(path))
+    image_store.delete(filename)
+    image_store.insert(
+        db_store.ImageRecord(
+            timestamp=timestamp,
+            path=path,
+            thumbnail_path=thumbnail_path,
+            web_path=web_path,
+            width=width,
+            height=height,
+            size_bytes=os.path.getsize(os.path.join(image_path, path)),
+            brightness=brightness))
+
+
+def migrate_flat_layout(image_path, image_store):
+    """Moves images from a flat image directory into date-based directories.
+
+    Moves each full-resolution image in the top level of the image directory
+    (along with its thumbnail and web-sized versions, if they exist) into the
+    directory for the day it was captured and updates the image's metadata in
+    the image store. Images that are already organized by date are left alone,
+    so it is safe to call this function on every start. An image that cannot
+    be migrated is logged and skipped.
+
+    Args:
+        image_path: Path name of the image directory.
+        image_store: Database store for image metadata.
+
+    Returns:
+        The number of images migrated.
+    """
+    filenames = sorted(
+        f for f in os.listdir(image_path) if _FLAT_FILENAME_PATTERN.match(f))
+    if not filenames:
+        return 0
+    logger.info('moving %d images in %s into date-based directories',
+                len(filenames), image_path)
+    migrated = 0
+    for filename in filenames:
+        try:
+            _migrate_image(image_path, filename, image_store)
+        except (IOError, OSError, ValueError) as e:
+            logger.error('failed to move image "%s": %s', filename, e)
+            continue
+        migrated += 1
+    logger.info('finished moving %d images into date-based directories',
+                migrated)
+    return migrated
@@ -0,0 +1,257 @@
+import collections
+import errno
+import io
+import logging
+import os
+import Queue
+import threading
+
+from PIL import Image
+from PIL import ImageStat
+
+import db_store
+import perceptual_hash
+
+logger = logging.getLogger(__name__)
+
+# Default number of background threads that process captured frames.
+DEFAULT_WORKER_COUNT = 2
+# Maximum dimensions (in pixels) of thumbnail images.
+_THUMBNAIL_SIZE = (320, 240)
+# Maximum dimensions (in pixels) of images sized for display on the web.
+_WEB_SIZE = (1280, 960)
+# Suffixes to append to the full-resolution image's base filename to create the
+# filenames of the thumbnail and web-sized images.
+_THUMBNAIL_SUFFIX = '-thumb'
+_WEB_SUFFIX = '-web'
+# JPEG quality to use when encoding downscaled images.
+_JPEG_QUALITY = 85
+
+# A captured camera frame waiting to be processed.
+_Frame = collections.namedtuple('_Frame',
+                                ['timestamp', 'filename', 'jpeg_data'])
+
+
+def _derived_filename(filename, suffix):
+    """Returns the filename of an image derived from a full-resolution image.
+
+    Args:
+        filename: Filename of the full-resolution image.
+        suffix: Suffix to add to the base filename (e.g. '-thumb').
+
+    Returns:
+        The filename with the suffix inserted before the file extension.
+    """
+    base, extension = os.path.splitext(filename)
+    return base + suffix + extension
+
+
+def thumbnail_filename(filename):
+    """Returns the filename of the thumbnail for a full-resolution image."""
+    return _derived_filename(filename, _THUMBNAIL_SUFFIX)
+
+
+def web_filename(filename):
+    """Returns the filename of the web-sized version of an image."""
+    return _derived_filename(filename, _WEB_SUFFIX)
+
+
+def mean_brightness(image):
+    """Returns the mean brightness of a PIL image as a percentage."""
+    return 100.0 * ImageStat.Stat(image.convert('L')).mean[0] / 255
+
+
+def _make_parent_directory(path):
+    """Creates the parent directory of a path if it does not already exist."""
+    try:
+        os.makedirs(os.path.dirname(path))
+    except OSError as e:
+        # Another worker may have created the directory concurrently.
+        if e.errno != errno.EEXIST:
+            raise
+
+
+class ImageProcessor(object):
+    """Saves and post-processes captured camera frames in the background.
+
+    Captured frames are queued and processed by a pool of worker threads, so
+    the caller that submits a frame does not wait on disk I/O or image
+    processing. For each frame, a worker writes the full-resolution JPEG,
+    generates a thumbnail and a web-sized version of the image, measures the
+    image's brightness, and places an ImageRecord describing the images on the
+    record queue.
+
+    Frames that are nearly identical to the last saved frame (e.g. consecutive
+    photos on an overcast day) are discarded without being saved. Because
+    plants change slowly, a frame captured long enough after the last saved
+    frame is saved even if it looks nearly identical, so that slow growth is
+    still recorded.
+    """
+
+    def __init__(self, image_path, record_queue, worker_count,
+                 max_duplicate_distance, max_duplicate_age):
+        """Creates a new ImageProcessor instance.
+
+        Args:
+            image_path: Path name of the folder where images will be stored.
+            record_queue: Queue on which to place image records.
+            worker_count: Number of worker threads that process frames.
+            max_duplicate_distance: Maximum perceptual hash distance (in bits)
+                between a frame and the last saved frame at which the frame is
+                discarded as a near-duplicate. If None, every frame is saved.
+            max_duplicate_age: timedelta of how long after the last saved
+                frame a frame may still be discarded as a near-duplicate.
+                Frames captured later than this are always saved. If None,
+                near-duplicates are discarded no matter how old the last saved
+                frame is.
+        """
+        self._image_path = image_path
+        self._record_queue = record_queue
+        self._worker_count = worker_count
+        self._max_duplicate_distance = max_duplicate_distance
+        self._max_duplicate_age = max_duplicate_age
+        self._frame_queue = Queue.Queue()
+        self._workers = []
+        # Guards the hash and capture time of the last saved frame and the
+        # count of bytes saved, which all workers share.
+        self._duplicate_lock = threading.Lock()
+        self._last_saved_hash = None
+        self._last_saved_timestamp = None
+        self._duplicate_bytes_skipped = 0
+
+    def start(self):
+        """Starts the worker threads."""
+        for i in range(self._worker_count):
+            worker = threading.Thread(
+                target=self._process_frames, name='ImageProcessor-%d' % i)
+            worker.setDaemon(True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, timestamp, filename, jpeg_data):
+        """Queues a captured frame for processing and returns immediately.
+
+        Args:
+            timestamp: datetime instance representing the time of capture.
+            filename: Path (relative to the image directory) under which to
+                save the full-resolution image. Parent directories are created
+                as needed.
+            jpeg_data: Full-resolution JPEG-encoded frame data.
+        """
+        self._frame_queue.put(_Frame(timestamp, filename, jpeg_data))
+
+    def close(self):
+        """Processes all queued frames and stops the worker threads."""
+        for _ in self._workers:
+            self._frame_queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    def _process_frames(self):
+        while True:
+            frame = self._frame_queue.get()
+            if frame is None:
+                return
+            try:
+                self._process_frame(frame)
+            except Exception:
+                logger.exception('failed to process image %s', frame.filename)
+
+    def _is_near_duplicate(self, image, timestamp):
+        """Checks whether an image looks nearly identical to the last saved one.
+
+        If the image is not a near-duplicate, it becomes the new last saved
+        image for future comparisons.
+
+        Args:
+            image: A PIL image of the frame to check.
+            timestamp: datetime instance representing the frame's time of
+                capture.
+
+        Returns:
+            True if the image should be discarded as a near-duplicate.
+        """
+        if self._max_duplicate_distance is None:
+            return False
+        image_hash = perceptual_hash.difference_hash(image)
+        with self._duplicate_lock:
+            if (self._last_saved_hash is not None and
+                    not self._is_due_for_save(timestamp) and
+                    perceptual_hash.distance(image_hash, self._last_saved_hash)
+                    <= self._max_duplicate_distance):
+                return True
+            self._last_saved_hash = image_hash
+            self._last_saved_timestamp = timestamp
+            return False
+
+    def _is_due_for_save(self, timestamp):
+        """Checks whether a frame is old enough past the last saved frame.
+
+        Must be called while holding the duplicate lock.
+
+        Args:
+            timestamp: datetime instance representing the frame's time of
+                capture.
+
+        Returns:
+            True if the frame should be saved even if it is a near-duplicate.
+        """
+        if self._max_duplicate_age is None:
+            return False
+        return (timestamp - self._last_saved_timestamp >=
+                self._max_duplicate_age)
+
+    def _process_frame(self, frame):
+        """Saves a frame and its downscaled versions and queues its record.
+
+        Discards the frame instead if it is a near-duplicate of the last saved
+        frame.
+        """
+        image = Image.open(io.BytesIO(frame.jpeg_data))
+        width, height = image.size
+        # Have the JPEG decoder downscale while decoding, which is much cheaper
+        # than decoding at full resolution and resizing afterwards.
+        image.draft('RGB', _WEB_SIZE)
+        image = image.convert('RGB')
+
+        if self._is_near_duplicate(image, frame.timestamp):
+            with self._duplicate_lock:
+                self._duplicate_bytes_skipped += len(frame.jpeg_data)
+                bytes_skipped = self._duplicate_bytes_skipped
+            logger.info(
+                'discarded %s because it is nearly identical to the last saved '
+                'photo (saved %d bytes, %d bytes in total)', frame.filename,
+                len(frame.jpeg_data), bytes_skipped)
+            return
+
+        full_path = os.path.join(self._image_path, frame.filename)
+        _make_parent_directory(full_path)
+        with open(full_path, 'wb') as f:
+            f.write(frame.jpeg_data)
+        logger.info('saved new photo to %s', frame.filename)
+
+        web_path = web_filename(frame.filename)
+        image.thumbnail(_WEB_SIZE, Image.ANTIALIAS)
+        image.save(
+            os.path.join(self._image_path, web_path),
+            'JPEG',
+            quality=_JPEG_QUALITY)
+
+        thumbnail_path = thumbnail_filename(frame.filename)
+        image.thumbnail(_THUMBNAIL_SIZE, Image.ANTIALIAS)
+        image.save(
+            os.path.join(self._image_path, thumbnail_path),
+            'JPEG',
+            quality=_JPEG_QUALITY)
+
+        self._record_queue.put(
+            db_store.ImageRecord(
+                timestamp=frame.timestamp,
+                path=frame.filename,
+                thumbnail_path=thumbnail_path,
+                web_path=web_path,
+                width=width,
+                height=height,
+                size_bytes=len(frame.jpeg_data),
+                brightness=mean_brightness(image)))
@@ -0,0 +1,231 @@
+"""Shrinks and thins out old images to limit the growth of image storage."""
+
+import datetime
+import errno
+import logging
+import os
+
+from PIL import Image
+import pytz
+
+import sleep_windows
+
+logger = logging.getLogger(__name__)
+
+# Maximum dimensions (in pixels) to which to downscale images once they are
+# older than the full-resolution retention period.
+DOWNSCALED_SIZE = (1640, 1232)
+# JPEG quality to use when encoding downscaled images.
+_JPEG_QUALITY = 85
+# Maximum number of images to examine in each batch.
+_BATCH_SIZE = 10
+# Minimum number of seconds between the starts of consecutive batches.
+_BATCH_INTERVAL_SECONDS = 60
+# Time before which no image can have been captured.
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=pytz.utc)
+# Names of the retention tasks whose progress is saved between runs.
+_DOWNSCALE = 'downscale'
+_THIN_OUT = 'thin_out'
+
+
+def _remove_if_exists(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+
+
+def _start_of_utc_day(timestamp):
+    return timestamp.astimezone(pytz.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0)
+
+
+class RetentionJob(object):
+    """Applies a tiered retention policy to stored images.
+
+    Images older than the full-resolution period are downscaled, and images
+    older than the daily period are thinned out so that only the brightest
+    image from each day remains. The job does its work in small batches and
+    only during sleep windows, so it never competes with daytime photos and
+    watering. The image store is updated as each image changes so that it
+    always matches the files on disk. An image that cannot be downscaled is
+    logged and skipped.
+
+    Each task remembers how far it has gotten, so later batches do not examine
+    the same images again. Images added behind a task's progress (e.g. by an
+    import) are not examined by that task.
+
+    Must be called from the same thread from which the image store's database
+    connection was created.
+    """
+
+    def __init__(self, image_path, image_store, local_clock, sleep_windows,
+                 full_resolution_period, daily_period):
+        """Creates a new RetentionJob instance.
+
+        Args:
+            image_path: Path name of the image directory.
+            image_store: Database store for image metadata.
+            local_clock: A local clock interface.
+            sleep_windows: A list of 2-tuples, each representing a sleep window
+                during which the job may run. Tuple items are datetime.time
+                objects.
+            full_resolution_period: Age (as a timedelta or relativedelta)
+                beyond which images are downscaled, or None to keep images at
+                full resolution forever.
+            daily_period: Age (as a timedelta or relativedelta) beyond which
+                only one image per day is kept, or None to keep every image
+                forever.
+        """
+        self._image_path = image_path
+        self._image_store = image_store
+        self._local_clock = local_clock
+        self._sleep_windows = sleep_windows
+        self._full_resolution_period = full_resolution_period
+        self._daily_period = daily_period
+        self._last_batch_time = None
+        # Capture time of the oldest image that may still need downscaling.
+        # Images before this time were examined by an earlier batch.
+        self._downscale_start = _EPOCH
+        # Start of the oldest day that may still have images to thin out.
+        self._thin_out_start = _EPOCH
+
+    def set_sleep_windows(self, sleep_windows):
+        """Replaces the sleep windows during which the job may run.
+
+        Args:
+            sleep_windows: A list of 2-tuples, each representing a sleep window.
+                Tuple items are datetime.time objects.
+        """
+        self._sleep_windows = sleep_windows
+
+    def progress(self):
+        """Returns how far each retention task has gotten.
+
+        Returns:
+            A dictionary of task names to the datetime before which the task
+            has examined every image.
+        """
+        return {
+            _DOWNSCALE: self._downscale_start,
+            _THIN_OUT: self._thin_out_start,
+        }
+
+    def restore_progress(self, progress):
+        """Resumes the retention tasks from progress saved by a previous run.
+
+        Args:
+            progress: A dictionary of task names to datetimes, as returned by
+                progress(). Tasks missing from the dictionary start over.
+        """
+        self._downscale_start = progress.get(_DOWNSCALE, _EPOCH)
+        self._thin_out_start = progress.get(_THIN_OUT, _EPOCH)
+
+    def run_batch(self):
+        """Processes a batch of old images if the job is due to run.
+
+        Does nothing outside of sleep windows or if the previous batch started
+        less than _BATCH_INTERVAL_SECONDS ago.
+
+        Returns:
+            The number of images deleted or downscaled.
+        """
+        now = self._local_clock.now()
+        if self._last_batch_time:
+            seconds_since_last_batch = (
+                now - self._last_batch_time).total_seconds()
+            if seconds_since_last_batch < _BATCH_INTERVAL_SECONDS:
+                return 0
+        if not sleep_windows.contains(self._sleep_windows, now.time()):
+            return 0
+        self._last_batch_time = now
+
+        deleted = self._thin_out(now)
+        downscaled = self._downscale(now)
+        if deleted or downscaled:
+            logger.info('retention deleted %d images and downscaled %d images',
+                        deleted, downscaled)
+        return deleted + downscaled
+
+    def _thin_out(self, now):
+        """Deletes old images that are not the best image of their day."""
+        if self._daily_period is None:
+            return 0
+        end = now - self._daily_period
+        records = self._image_store.get_superseded_by_daily_best(
+            self._thin_out_start, end, _BATCH_SIZE)
+        for record in records:
+            # Remove the index entry first so that the index never refers to
+            # files that no longer exist.
+            self._image_store.delete(record.path)
+            for path in (record.path, record.thumbnail_path, record.web_path):
+                if path:
+                    try:
+                        _remove_if_exists(os.path.join(self._image_path, path))
+                    except OSError as e:
+                        logger.error('failed to delete image "%s": %s', path, e)
+        # Images later in the day of the last image examined may still be
+        # superseded, so the next batch starts at the beginning of that day.
+        if len(records) < _BATCH_SIZE:
+            self._thin_out_start = _start_of_utc_day(end)
+        else:
+            self._thin_out_start = _start_of_utc_day(records[-1].timestamp)
+        return len(records)
+
+    def _downscale(self, now):
+        """Downscales old images that are still at full resolution."""
+        if self._full_resolution_period is None:
+            return 0
+        records = self._image_store.get_range(
+            self._downscale_start, now - self._full_resolution_period,
+            _BATCH_SIZE)
+        downscaled = 0
+        for record in records:
+            if (record.width > DOWNSCALED_SIZE[0] or
+                    record.height > DOWNSCALED_SIZE[1]):
+                if self._downscale_image(record):
+                    downscaled += 1
+        if records:
+            # Timestamps in the image store have minute precision, so the next
+            # batch starts at the minute after the last image examined.
+            self._downscale_start = (
+                records[-1].timestamp + datetime.timedelta(minutes=1))
+        return downscaled
+
+    def _downscale_image(self, record):
+        """Replaces an image with a downscaled version and updates its record.
+
+        Args:
+            record: The ImageRecord of the image to downscale.
+
+        Returns:
+            True if the image was downscaled.
+        """
+        full_path = os.path.join(self._image_path, record.path)
+        if not os.path.exists(full_path):
+            logger.warning('image %s is missing, removing it from the index',
+                           record.path)
+            self._image_store.delete(record.path)
+            return False
+        # Write to a temporary file and rename it over the original so that an
+        # interruption never leaves a partially written image.
+        temp_path = full_path + '.tmp'
+        try:
+            image = Image.open(full_path)
+            image.draft('RGB', DOWNSCALED_SIZE)
+            image = image.convert('RGB')
+            image.thumbnail(DOWNSCALED_SIZE, Image.ANTIALIAS)
+            image.save(temp_path, 'JPEG', quality=_JPEG_QUALITY)
+            os.rename(temp_path, full_path)
+        except (IOError, OSError) as e:
+            logger.error('failed to downscale image "%s": %s', record.path, e)
+            _remove_if_exists(temp_path)
+            return False
+        width, height = image.size
+        self._image_store.update(
+            record._replace(
+                width=width,
+                height=height,
+                size_bytes=os.path.getsize(full_path)))
+        return True
@@ -0,0 +1,315 @@
+"""Imports records into a GreenPiThumb database in bulk.
+
+Records may come from CSV or JSON lines files, such as those the export command
+writes, or from another GreenPiThumb database. Each table's records are loaded
+into a temporary staging table, then validated, converted and deduplicated with
+a few SQL statements, and merged into the table in a single transaction. This
+avoids the per-row Python work and commits of storing records one at a time.
+"""
+
+import collections
+import csv
+import gzip
+import json
+import logging
+import os
+
+import monotonic as monotonic_clock
+
+import db_store
+import exporter
+
+logger = logging.getLogger(__name__)
+
+# Tables into which records can be imported.
+TABLES = exporter.STORES.keys()
+# Statistics of importing records into a table.
+#  table: Name of the table.
+#  read: Number of records read from the sources.
+#  rejected: Number of records rejected for invalid timestamps or values.
+#  duplicates: Number of records skipped because the table or an earlier
+#    record of the import already held them.
+#  inserted: Number of records inserted into the table.
+#  seconds: Number of seconds the import took.
+ImportStats = collections.namedtuple('ImportStats', [
+    'table', 'read', 'rejected', 'duplicates', 'inserted', 'seconds'
+])
+
+# Column that identifies a record in each table, for finding duplicates. Tables
+# not listed are identified by timestamp.
+_KEY_COLUMNS = {'images': 'path'}
+# Name of the temporary table in which records are staged.
+_STAGING_TABLE = 'temp.import_staging'
+# Name under which a source database is attached.
+_SOURCE_SCHEMA = 'import_source'
+# Indexes are rebuilt after the import, rather than updated as records are
+# inserted, if the import adds at least this fraction of the table's rows.
+_DEFER_INDEXES_MIN_FRACTION = 0.25
+# Timestamps are stored in UTC in this strftime() format.
+_SQL_TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%MZ'
+
+
+class Error(Exception):
+    pass
+
+
+class UnknownTableError(Error):
+    """Indicates that the table of records to import could not be determined."""
+    pass
+
+
+def table_for_path(path):
+    """Determines the table of an export file from its name.
+
+    Args:
+        path: Path of a file whose name starts with a table name, such as
+            "backup/soil_moisture-20170131T020000.csv.gz" as written by the
+            export command, or "light.jsonl".
+
+    Returns:
+        The name of the table whose records the file holds.
+
+    Raises:
+        UnknownTableError if the file's name does not start with a table name.
+    """
+    table = os.path.basename(path).split('-', 1)[0].split('.', 1)[0]
+    if table not in TABLES:
+        raise UnknownTableError(
+            'Cannot tell which table "%s" holds records for; start its name '
+            'with a table name or give a table' % path)
+    return table
+
+
+def _open_input(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def _read_csv_rows(input_file, columns):
+    """Reads rows of column values from a CSV file with a header row."""
+    rows = csv.reader(input_file)
+    header = next(rows, [])
+    positions = [
+        header.index(column) if column in header else None for column in columns
+    ]
+    for row in rows:
+        # Empty values and values missing from short rows are None.
+        yield tuple(row[position] or None
+                    if position is not None and position < len(row) else None
+                    for position in positions)
+
+
+def _read_json_rows(input_file, columns):
+    """Reads rows of column values from a JSON lines file.
+
+    A line that is not a JSON object is read as a row without values, which is
+    rejected along with the other invalid records.
+    """
+    empty_row = (None,) * len(columns)
+    for line in input_file:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield empty_row
+            continue
+        if not isinstance(record, dict):
+            yield empty_row
+            continue
+        yield tuple(record.get(column) for column in columns)
+
+
+def _read_rows(path, columns):
+    """Reads records from a CSV or JSON lines file as rows of column values.
+
+    Values missing from a record, or empty in a CSV file, are None.
+    """
+    read_rows = (_read_csv_rows
+                 if '.csv' in os.path.basename(path) else _read_json_rows)
+    with _open_input(path) as input_file:
+        for row in read_rows(input_file, columns):
+            yield row
+
+
+def _columns(connection, schema, table):
+    return [
+        row[1]
+        for row in connection.execute('PRAGMA %s.table_info(%s)' % (schema,
+                                                                    table))
+    ]
+
+
+def _numeric_columns(connection, table):
+    return [
+        row[1]
+        for row in connection.execute('PRAGMA main.table_info(%s)' % table)
+        if row[2] in ('INTEGER', 'REAL')
+    ]
+
+
+def _stage(connection, table, sources):
+    """Copies records from a table's sources into the staging table.
+
+    Args:
+        connection: SQLite database connection.
+        table: Name of the table whose records to stage.
+        sources: List of sources, each either the path of a CSV or JSON lines
+            file or None for the table of the attached source database.
+
+    Returns:
+        The number of records staged.
+    """
+    connection.execute('DROP TABLE IF EXISTS %s' % _STAGING_TABLE)
+    # Copies the table's column types, so that SQLite converts numeric text
+    # from CSV files to numbers.
+    connection.execute('CREATE TABLE %s AS SELECT * FROM main.%s WHERE 0' %
+                       (_STAGING_TABLE, table))
+    columns = _columns(connection, 'main', table)
+    insert_sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        _STAGING_TABLE, ', '.join(columns), ', '.join('?' * len(columns)))
+    for source in sources:
+        if source is None:
+            source_columns = set(_columns(connection, _SOURCE_SCHEMA, table))
+            shared_columns = ', '.join(column for column in columns
+                                       if column in source_columns)
+            connection.execute('INSERT INTO %s (%s) SELECT %s FROM %s.%s' %
+                               (_STAGING_TABLE, shared_columns, shared_columns,
+                                _SOURCE_SCHEMA, table))
+            continue
+        connection.executemany(insert_sql, _read_rows(source, columns))
+    return connection.execute(
+        'SELECT COUNT(*) FROM %s' % _STAGING_TABLE).fetchone()[0]
+
+
+def _clean_staged(connection, table):
+    """Converts staged timestamps and removes invalid and duplicate records.
+
+    Timestamps may be in any ISO 8601 form that SQLite understands (e.g.
+    2017-01-31T08:00Z, 2017-01-31 08:00:00 or 2017-01-31T09:00+01:00) or be
+    seconds since the UNIX epoch. Timestamps without a time zone are UTC.
+
+    Returns:
+        A two-tuple of the number of records rejected as invalid and the number
+        rejected as duplicates.
+    """
+    connection.execute('UPDATE {staging} SET timestamp = CASE '
+                       'WHEN CAST(timestamp AS TEXT) GLOB \'[0-9]*\' AND '
+                       'CAST(timestamp AS TEXT) NOT GLOB \'*[^0-9.]*\' '
+                       'THEN strftime(\'{format}\', timestamp, \'unixepoch\') '
+                       'ELSE strftime(\'{format}\', timestamp) END'.format(
+                           staging=_STAGING_TABLE,
+                           format=_SQL_TIMESTAMP_FORMAT))
+    invalid_conditions = ['timestamp IS NULL'] + [
+        '(%s IS NOT NULL AND typeof(%s) NOT IN (\'integer\', \'real\'))' %
+        (column, column) for column in _numeric_columns(connection, table)
+    ]
+    rejected = connection.execute('DELETE FROM %s WHERE %s' %
+                                  (_STAGING_TABLE,
+                                   ' OR '.join(invalid_conditions))).rowcount
+    key = _KEY_COLUMNS.get(table, 'timestamp')
+    duplicates = connection.execute(
+        'DELETE FROM {staging} WHERE {key} IN (SELECT {key} FROM main.{table}) '
+        'OR rowid NOT IN (SELECT MIN(rowid) FROM {staging} GROUP BY {key})'.
+        format(staging=_STAGING_TABLE, key=key, table=table)).rowcount
+    return rejected, duplicates
+
+
+def _merge_staged(connection, table, count):
+    """Inserts the staged records into a table in a single transaction."""
+    columns = ', '.join(_columns(connection, 'main', table))
+    insert_sql = 'INSERT INTO main.%s (%s) SELECT %s FROM %s ORDER BY %s' % (
+        table, columns, columns, _STAGING_TABLE, 'timestamp')
+    existing = connection.execute(
+        'SELECT COUNT(*) FROM main.%s' % table).fetchone()[0]
+    if count >= existing * _DEFER_INDEXES_MIN_FRACTION:
+        with db_store.deferred_indexes(connection, table):
+            connection.execute(insert_sql)
+    else:
+        connection.execute(insert_sql)
+        connection.commit()
+
+
+def _import_table(connection, table, sources, poll_interval):
+    started = monotonic_clock.monotonic()
+    read = _stage(connection, table, sources)
+    rejected, duplicates = _clean_staged(connection, table)
+    inserted = read - rejected - duplicates
+    _merge_staged(connection, table, inserted)
+    connection.execute('DROP TABLE %s' % _STAGING_TABLE)
+    store = exporter.STORES[table](connection)
+    # Imported readings may open or fill gaps anywhere in the table's history.
+    if poll_interval and inserted and hasattr(store, 'rebuild_gaps'):
+        store.rebuild_gaps(poll_interval)
+    stats = ImportStats(table, read, rejected, duplicates, inserted,
+                        monotonic_clock.monotonic() - started)
+    logger.info('imported %s', stats)
+    return stats
+
+
+def import_files(connection, paths, table=None, poll_interval=None):
+    """Imports records from CSV or JSON lines files.
+
+    Files whose names contain ".csv" are read as CSV with a header row of
+    column names. Other files are read as JSON lines. Files ending in ".gz" are
+    decompressed.
+
+    Args:
+        connection: Connection to the database into which to import.
+        paths: Paths of the files to import.
+        table: Name of the table into which to import every file, or None to
+            import each file into the table its name starts with.
+        poll_interval: timedelta of how often sensors were polled, to rebuild
+            the gaps in the readings of each table imported into, or None to
+            leave gaps as they are.
+
+    Returns:
+        A list of ImportStats, one for each table imported into.
+
+    Raises:
+        UnknownTableError if no table is given and a file's name does not start
+        with a table name.
+    """
+    paths_by_table = collections.OrderedDict()
+    for path in paths:
+        paths_by_table.setdefault(table or table_for_path(path),
+                                  []).append(path)
+    return [
+        _import_table(connection, path_table, table_paths, poll_interval)
+        for path_table, table_paths in paths_by_table.items()
+    ]
+
+
+def import_database(connection, source_path, poll_interval=None):
+    """Imports every table's records from another GreenPiThumb database.
+
+    Args:
+        connection: Connection to the database into which to import.
+        source_path: Path to the database from which to import.
+        poll_interval: timedelta of how often sensors were polled, to rebuild
+            the gaps in the readings of each table imported into, or None to
+            leave gaps as they are.
+
+    Returns:
+        A list of ImportStats, one for each table imported into.
+
+    Raises:
+        IOError if no database exists at source_path.
+    """
+    if not os.path.exists(source_path):
+        raise IOError('No database at "%s"' % source_path)
+    connection.execute('ATTACH DATABASE ? AS %s' % _SOURCE_SCHEMA,
+                       (source_path,))
+    try:
+        source_tables = set(
+            row[0]
+            for row in connection.execute(
+                'SELECT name FROM %s.sqlite_master WHERE type = \'table\'' %
+                _SOURCE_SCHEMA))
+        return [
+            _import_table(connection, table, [None], poll_interval)
+            for table in TABLES if table in source_tables
+        ]
+    finally:
+        connection.execute('DETACH DATABASE %s' % _SOURCE_SCHEMA)
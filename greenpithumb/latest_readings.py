@@ -0,0 +1,105 @@
+"""Shares the most recent sensor readings between pollers and other readers."""
+
+import collections
+import datetime
+import logging
+import threading
+
+import log_handlers
+
+logger = logging.getLogger(__name__)
+
+# Names under which sensor readings are registered.
+TEMPERATURE = 'temperature'
+HUMIDITY = 'humidity'
+SOIL_MOISTURE = 'soil_moisture'
+LIGHT = 'light'
+
+# Default maximum age of a registered reading that readers may reuse instead of
+# reading the sensor again. This is long enough for pollers that fire on the
+# same tick to share one reading, but short enough that each tick gets a new
+# reading.
+DEFAULT_MAX_AGE = datetime.timedelta(seconds=30)
+
+# A sensor reading along with the time at which it was taken.
+Reading = collections.namedtuple('Reading', ['timestamp', 'value'])
+
+
+class LatestReadings(object):
+    """Registry of the most recent reading from each sensor.
+
+    Pollers and other readers (such as the camera's light check) read sensors
+    through the registry, so that readers that need the same sensor at about the
+    same time share a single hardware read. This class is thread-safe.
+    """
+
+    def __init__(self, clock):
+        """Creates a new LatestReadings instance.
+
+        Args:
+            clock: A clock interface.
+        """
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._readings = {}
+        # Monotonic clock time of each sensor's latest reading, used to judge
+        # how old a reading is even if the wall clock jumps.
+        self._reading_times = {}
+        # Serializes reads of each sensor so that concurrent readers wait for
+        # an in-progress hardware read instead of starting another one.
+        self._sensor_locks = collections.defaultdict(threading.Lock)
+
+    def publish(self, sensor, value):
+        """Records a new reading for a sensor.
+
+        Args:
+            sensor: Name of the sensor (e.g. LIGHT).
+            value: Value read from the sensor.
+        """
+        with self._lock:
+            self._readings[sensor] = Reading(self._clock.now(), value)
+            self._reading_times[sensor] = self._clock.monotonic()
+
+    def latest(self, sensor):
+        """Returns the most recent Reading for a sensor, or None if none."""
+        with self._lock:
+            return self._readings.get(sensor)
+
+    def _latest_with_age(self, sensor):
+        """Returns the latest Reading for a sensor and its age in seconds."""
+        with self._lock:
+            if sensor not in self._readings:
+                return None, None
+            age_seconds = self._clock.monotonic() - self._reading_times[sensor]
+            return self._readings[sensor], age_seconds
+
+    def read(self, sensor, max_age, read_func):
+        """Returns a recent reading, reading the sensor only if necessary.
+
+        Args:
+            sensor: Name of the sensor (e.g. LIGHT).
+            max_age: timedelta of the maximum age of a registered reading that
+                may be returned instead of reading the sensor.
+            read_func: Function that reads the sensor and returns its value.
+                Its result is published to the registry.
+
+        Returns:
+            The registered value if it is no older than max_age, otherwise the
+            value returned by read_func.
+        """
+        with self._lock:
+            sensor_lock = self._sensor_locks[sensor]
+        with sensor_lock:
+            reading, age_seconds = self._latest_with_age(sensor)
+            if reading and age_seconds <= max_age.total_seconds():
+                logger.debug(
+                    'reusing %s reading from %s = %s',
+                    sensor,
+                    reading.timestamp,
+                    reading.value,
+                    extra=log_handlers.hot_path(
+                        sensor=sensor, value=reading.value))
+                return reading.value
+            value = read_func()
+            self.publish(sensor, value)
+            return value
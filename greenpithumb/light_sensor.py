@@ -1,5 +1,7 @@
 import logging
 
+import log_handlers
+
 logger = logging.getLogger(__name__)
 
 _LIGHT_SENSOR_MIN_VALUE = 0
@@ -36,7 +38,10 @@ class LightSensor(object):
                 expected value.
         """
         light = self._adc.read_adc(self._channel)
-        logger.info('light reading = %d', light)
+        logger.info(
+            'light reading = %d',
+            light,
+            extra=log_handlers.hot_path(sensor='light', value=light))
 
         if light < _LIGHT_SENSOR_MIN_VALUE:
             raise LightSensorLowError(
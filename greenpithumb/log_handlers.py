@@ -0,0 +1,232 @@
+"""Logging handlers that keep verbose diagnostics cheap in steady state."""
+
+import collections
+import datetime
+import json
+import logging
+import threading
+
+import monotonic as monotonic_clock
+
+# Default number of seconds between log messages from the same hot-path call
+# site.
+DEFAULT_RATE_LIMIT_SECONDS = 60.0
+# Default number of seconds that BatchingStreamHandler collects log records
+# before writing them out together.
+DEFAULT_FLUSH_INTERVAL_SECONDS = 1.0
+# Default number of recent log records that RingBufferHandler keeps.
+DEFAULT_RING_BUFFER_CAPACITY = 200
+
+
+def hot_path(**fields):
+    """Returns logging extras for a message logged on a hot path.
+
+    Messages logged with these extras (e.g. every sensor reading) are rate
+    limited by RateLimitFilter and carry the given fields for JsonFormatter.
+
+    Args:
+        **fields: Structured fields describing the message, such as the sensor
+            and the value read.
+
+    Returns:
+        A dictionary to pass as the extra argument of a logging call.
+    """
+    return {'fields': fields, 'rate_limited': True}
+
+
+class RateLimitFilter(logging.Filter):
+    """Limits how often each hot-path call site may log.
+
+    Only records logged with hot_path() extras are limited. Each call site may
+    log once per interval. The next message from a call site after others were
+    dropped reports how many were dropped.
+    """
+
+    def __init__(self,
+                 interval_seconds=DEFAULT_RATE_LIMIT_SECONDS,
+                 monotonic_func=monotonic_clock.monotonic):
+        """Creates a new RateLimitFilter instance.
+
+        Args:
+            interval_seconds: Minimum number of seconds between messages from
+                the same call site.
+            monotonic_func: Function that returns the current monotonic time in
+                seconds.
+        """
+        logging.Filter.__init__(self)
+        self._interval_seconds = interval_seconds
+        self._monotonic_func = monotonic_func
+        self._lock = threading.Lock()
+        # Maps (pathname, lineno) of each call site to a two-tuple of the
+        # monotonic time of its last logged message and the number of messages
+        # dropped since.
+        self._call_sites = {}
+
+    def filter(self, record):
+        if not getattr(record, 'rate_limited', False):
+            return True
+        call_site = (record.pathname, record.lineno)
+        now = self._monotonic_func()
+        with self._lock:
+            last_logged, dropped = self._call_sites.get(call_site, (None, 0))
+            if (last_logged is not None and
+                    now - last_logged < self._interval_seconds):
+                self._call_sites[call_site] = (last_logged, dropped + 1)
+                return False
+            self._call_sites[call_site] = (now, 0)
+        if dropped:
+            record.msg = '%s (dropped %d similar messages)' % (
+                record.getMessage(), dropped)
+            record.args = ()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats each log record as a line of JSON.
+
+    Includes any structured fields passed with hot_path().
+    """
+
+    def format(self, record):
+        entry = {
+            'time':
+            datetime.datetime.utcfromtimestamp(
+                record.created).strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+            'level':
+            record.levelname,
+            'logger':
+            record.name,
+            'message':
+            record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, sort_keys=True, default=str)
+
+
+class BatchingStreamHandler(logging.Handler):
+    """Writes log records to a stream in batches from a background thread.
+
+    Records are collected for up to a flush interval and written with a single
+    write and flush, so that the threads that log never wait on the SD card.
+    Records at or above the flush level are written immediately, along with
+    any records collected before them.
+    """
+
+    def __init__(self,
+                 stream,
+                 flush_interval_seconds=DEFAULT_FLUSH_INTERVAL_SECONDS,
+                 flush_level=logging.WARNING):
+        """Creates a new BatchingStreamHandler instance.
+
+        Args:
+            stream: File-like object to which to write log records.
+            flush_interval_seconds: Maximum number of seconds to collect
+                records before writing them.
+            flush_level: Level at or above which records are written
+                immediately.
+        """
+        logging.Handler.__init__(self)
+        self._stream = stream
+        self._flush_interval_seconds = flush_interval_seconds
+        self._flush_level = flush_level
+        self._pending_lock = threading.Lock()
+        self._pending = []
+        self._has_pending = threading.Event()
+        self._write_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(
+            target=self._write_batches, name='LogWriter')
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def emit(self, record):
+        with self._pending_lock:
+            self._pending.append(record)
+            self._has_pending.set()
+        if record.levelno >= self._flush_level:
+            self.flush()
+
+    def _write_batches(self):
+        while not self._closed.is_set():
+            # Blocks without a timeout, so the thread costs nothing while
+            # nothing is logged.
+            self._has_pending.wait()
+            self._closed.wait(self._flush_interval_seconds)
+            self.flush()
+
+    def flush(self):
+        """Writes every collected record to the stream."""
+        with self._write_lock:
+            with self._pending_lock:
+                records = self._pending
+                self._pending = []
+                # Once closed, leave the event set so that the background
+                # thread cannot block waiting for records that never come.
+                if not self._closed.is_set():
+                    self._has_pending.clear()
+            if not records:
+                return
+            lines = []
+            for record in records:
+                try:
+                    lines.append(self.format(record))
+                except Exception:
+                    self.handleError(record)
+            if not lines:
+                return
+            try:
+                self._stream.write('\n'.join(lines) + '\n')
+                self._stream.flush()
+            except (IOError, ValueError):
+                # The stream may be closed or full. Logging must never take
+                # down GreenPiThumb, so drop the batch.
+                pass
+
+    def close(self):
+        """Writes any collected records and stops the background thread."""
+        with self._pending_lock:
+            self._closed.set()
+            self._has_pending.set()
+        self._thread.join()
+        self.flush()
+        logging.Handler.close(self)
+
+
+class RingBufferHandler(logging.Handler):
+    """Keeps recent log records in memory and dumps them on an error.
+
+    Buffers only the records that the target handler's level filters out, so
+    that GreenPiThumb keeps verbose context for errors without writing it out
+    in steady state.
+    """
+
+    def __init__(self,
+                 target,
+                 capacity=DEFAULT_RING_BUFFER_CAPACITY,
+                 dump_level=logging.ERROR):
+        """Creates a new RingBufferHandler instance.
+
+        Args:
+            target: Handler to which to dump buffered records.
+            capacity: Maximum number of records to keep. When full, the oldest
+                record is dropped.
+            dump_level: Level at or above which a record triggers a dump of the
+                buffered records.
+        """
+        logging.Handler.__init__(self)
+        self._target = target
+        self._dump_level = dump_level
+        self._records = collections.deque(maxlen=capacity)
+
+    def emit(self, record):
+        if record.levelno < self._target.level:
+            self._records.append(record)
+        elif record.levelno >= self._dump_level:
+            # The target emits the error record itself, so only the context
+            # leading up to it is dumped here, bypassing the target's level.
+            records = list(self._records)
+            self._records.clear()
+            for buffered_record in records:
+                self._target.emit(buffered_record)
@@ -0,0 +1,302 @@
+"""Collects pipeline health metrics and serves them in Prometheus text format.
+
+Modules define their metrics at import time with counter() and histogram(), and
+update them as they work. Updating a metric only takes a lock and an addition,
+so the hooks cost next to nothing when no one scrapes the metrics.
+"""
+
+import BaseHTTPServer
+import collections
+import contextlib
+import logging
+import threading
+
+import monotonic as monotonic_clock
+
+logger = logging.getLogger(__name__)
+
+# Default histogram bucket upper bounds (in seconds), suited to timing polls,
+# commits and captures, which range from milliseconds to about a minute.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0, 60.0)
+# Content type of the Prometheus text exposition format.
+_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def _escape_label_value(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace(
+        '"', r'\"')
+
+
+def _format_labels(label_names, label_values):
+    if not label_names:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape_label_value(value))
+                             for name, value in zip(label_names, label_values))
+
+
+class _Metric(object):
+    """Base class for metrics that have a value per combination of labels."""
+
+    _type = None
+
+    def __init__(self, name, help_text, label_names):
+        self._name = name
+        self._help_text = help_text
+        self._label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+        # A metric without labels reports zero until it is first updated.
+        if not self._label_names:
+            self._values[()] = self._zero_value()
+
+    def _check_label_values(self, label_values):
+        if len(label_values) != len(self._label_names):
+            raise ValueError('%s expects labels %s, got values %s' %
+                             (self._name, self._label_names, label_values))
+        return tuple(label_values)
+
+    def render(self):
+        """Returns the metric in Prometheus text format."""
+        lines = [
+            '# HELP %s %s' % (self._name, self._help_text),
+            '# TYPE %s %s' % (self._name, self._type),
+        ]
+        with self._lock:
+            for label_values in sorted(self._values):
+                lines.extend(self._render_samples(label_values))
+        return '\n'.join(lines) + '\n'
+
+
+class Counter(_Metric):
+    """A value that only goes up, such as a count of rows written."""
+
+    _type = 'counter'
+
+    def _zero_value(self):
+        return 0
+
+    def inc(self, amount=1, label_values=()):
+        """Adds to the counter.
+
+        Args:
+            amount: Amount to add. Must not be negative.
+            label_values: Values of the counter's labels, in order.
+        """
+        label_values = self._check_label_values(label_values)
+        if amount < 0:
+            raise ValueError('Counters cannot decrease: %s' % amount)
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values,
+                                                          0) + amount
+
+    def value(self, label_values=()):
+        """Returns the counter's current value."""
+        with self._lock:
+            return self._values.get(tuple(label_values), 0)
+
+    def _render_samples(self, label_values):
+        return [
+            '%s%s %s' %
+            (self._name, _format_labels(self._label_names, label_values),
+             _format_value(self._values[label_values]))
+        ]
+
+
+# Observations of a histogram for one combination of labels.
+#  bucket_counts: List of the number of observations in each bucket (not
+#    cumulative), with one extra entry for observations above every bound.
+#  total: Sum of all observations.
+#  count: Number of observations.
+_HistogramValue = collections.namedtuple('_HistogramValue',
+                                         ['bucket_counts', 'total', 'count'])
+
+
+class Histogram(_Metric):
+    """A distribution of observed values, such as how long polls take."""
+
+    _type = 'histogram'
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self._buckets = tuple(sorted(buckets))
+        super(Histogram, self).__init__(name, help_text, label_names)
+
+    def _zero_value(self):
+        return _HistogramValue(
+            bucket_counts=[0] * (len(self._buckets) + 1), total=0.0, count=0)
+
+    def observe(self, value, label_values=()):
+        """Records an observation.
+
+        Args:
+            value: The observed value.
+            label_values: Values of the histogram's labels, in order.
+        """
+        label_values = self._check_label_values(label_values)
+        bucket_index = len(self._buckets)
+        for index, upper_bound in enumerate(self._buckets):
+            if value <= upper_bound:
+                bucket_index = index
+                break
+        with self._lock:
+            old_value = self._values.get(label_values)
+            if old_value is None:
+                old_value = self._zero_value()
+            old_value.bucket_counts[bucket_index] += 1
+            self._values[label_values] = old_value._replace(
+                total=old_value.total + value, count=old_value.count + 1)
+
+    @contextlib.contextmanager
+    def time(self, label_values=()):
+        """Observes how many seconds a block takes to run.
+
+        Args:
+            label_values: Values of the histogram's labels, in order.
+        """
+        start = monotonic_clock.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(monotonic_clock.monotonic() - start, label_values)
+
+    def count(self, label_values=()):
+        """Returns the number of observations."""
+        with self._lock:
+            histogram_value = self._values.get(tuple(label_values))
+            return histogram_value.count if histogram_value else 0
+
+    def _render_samples(self, label_values):
+        histogram_value = self._values[label_values]
+        label_names = self._label_names + ('le',)
+        samples = []
+        cumulative_count = 0
+        for upper_bound, bucket_count in zip(self._buckets + (float('inf'),),
+                                             histogram_value.bucket_counts):
+            cumulative_count += bucket_count
+            samples.append('%s_bucket%s %d' %
+                           (self._name,
+                            _format_labels(label_names, label_values +
+                                           (_format_value(upper_bound),)),
+                            cumulative_count))
+        labels = _format_labels(self._label_names, label_values)
+        samples.append('%s_sum%s %s' % (self._name, labels,
+                                        _format_value(histogram_value.total)))
+        samples.append('%s_count%s %d' % (self._name, labels,
+                                          histogram_value.count))
+        return samples
+
+
+class _GaugeFunction(object):
+    """A gauge whose value is read from a function when metrics are rendered."""
+
+    def __init__(self, name, help_text, value_func):
+        self._name = name
+        self._help_text = help_text
+        self._value_func = value_func
+
+    def render(self):
+        return '# HELP %s %s\n# TYPE %s gauge\n%s %s\n' % (
+            self._name, self._help_text, self._name, self._name,
+            _format_value(self._value_func()))
+
+
+class Registry(object):
+    """A collection of metrics that are rendered together."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = collections.OrderedDict()
+
+    def register(self, name, metric):
+        """Adds a metric, replacing any existing metric with the same name."""
+        with self._lock:
+            self._metrics[name] = metric
+        return metric
+
+    def render(self):
+        """Returns all metrics in Prometheus text format."""
+        with self._lock:
+            metrics = self._metrics.values()
+        return ''.join(metric.render() for metric in metrics)
+
+
+# Registry to which GreenPiThumb's modules add their metrics.
+REGISTRY = Registry()
+
+
+def counter(name, help_text, label_names=()):
+    """Creates a counter and adds it to the default registry."""
+    return REGISTRY.register(name, Counter(name, help_text, label_names))
+
+
+def histogram(name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+    """Creates a histogram and adds it to the default registry."""
+    return REGISTRY.register(name,
+                             Histogram(name, help_text, label_names, buckets))
+
+
+def gauge_function(name, help_text, value_func):
+    """Adds a gauge whose value is read from value_func to the registry."""
+    return REGISTRY.register(name, _GaugeFunction(name, help_text, value_func))
+
+
+class _MetricsRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serves the metrics page."""
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.registry.render()
+        self.send_response(200)
+        self.send_header('Content-Type', _CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, message_format, *args):
+        logger.debug('%s - %s', self.address_string(), message_format % args)
+
+
+class MetricsServer(object):
+    """Serves metrics over HTTP on a background thread."""
+
+    def __init__(self, address, port, registry=REGISTRY):
+        """Creates a new MetricsServer instance.
+
+        Args:
+            address: Address on which to listen (e.g. '127.0.0.1').
+            port: Port on which to listen, or 0 to pick any free port.
+            registry: Registry whose metrics to serve.
+        """
+        self._server = BaseHTTPServer.HTTPServer((address, port),
+                                                 _MetricsRequestHandler)
+        self._server.registry = registry
+        self._thread = None
+
+    @property
+    def port(self):
+        """The port on which the server listens."""
+        return self._server.server_port
+
+    def start(self):
+        """Starts serving metrics in a background thread."""
+        logger.info('serving metrics at http://%s:%d/metrics',
+                    self._server.server_address[0], self.port)
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name='MetricsServer')
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def close(self):
+        """Stops serving metrics."""
+        if self._thread:
+            self._server.shutdown()
+            self._thread.join()
+        self._server.server_close()
@@ -0,0 +1,42 @@
+"""Computes perceptual hashes for comparing the visual content of images."""
+
+from PIL import Image
+
+# Dimensions (in pixels) of the grayscale image from which a hash is computed.
+# Each row has one more pixel than the number of bits it contributes, because
+# each bit compares a pixel to its right-hand neighbor.
+_HASH_WIDTH = 9
+_HASH_HEIGHT = 8
+
+
+def difference_hash(image):
+    """Computes a difference hash (dHash) of an image.
+
+    Shrinks the image to a tiny grayscale thumbnail and records whether each
+    pixel is brighter than its right-hand neighbor. Images that look alike
+    produce hashes that differ in few bits, even if they differ slightly in
+    exposure or compression.
+
+    Args:
+        image: A PIL image. To keep hashing cheap for large JPEGs, the caller
+            can reduce the image with Image.draft before calling.
+
+    Returns:
+        A 64-bit hash of the image as an int.
+    """
+    pixels = list(
+        image.convert('L').resize((_HASH_WIDTH, _HASH_HEIGHT), Image.ANTIALIAS)
+        .getdata())
+    image_hash = 0
+    for row in range(_HASH_HEIGHT):
+        for column in range(_HASH_WIDTH - 1):
+            offset = row * _HASH_WIDTH + column
+            image_hash <<= 1
+            if pixels[offset] > pixels[offset + 1]:
+                image_hash |= 1
+    return image_hash
+
+
+def distance(hash_a, hash_b):
+    """Returns the number of bits that differ between two hashes."""
+    return bin(hash_a ^ hash_b).count('1')
@@ -1,3 +1,4 @@
+import calendar
 import datetime
 import logging
 import threading
@@ -5,6 +6,8 @@ import threading
 import pytz
 
 import db_store
+import latest_readings
+import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -12,52 +15,80 @@ _SECONDS_PER_MINUTE = 60
 # Number of seconds to idle between checks for whether a poller needs to poll or
 # a poller needs to stop (note that this is NOT the total time a poller sleeps
 # between polls).
-_IDLE_SECONDS = 0.5
+DEFAULT_IDLE_SECONDS = 0.5
+# Number of seconds that the wall clock may drift relative to the monotonic
+# clock before the scheduler treats it as a jump in the wall clock.
+_MAX_CLOCK_SKEW_SECONDS = 5
+
+# Names of the pollers, under which their schedules are saved between runs.
+TEMPERATURE_POLLER = 'temperature'
+HUMIDITY_POLLER = 'humidity'
+LIGHT_POLLER = 'light'
+SOIL_WATERING_POLLER = 'soil_watering'
+CAMERA_POLLER = 'camera'
+
+_poll_seconds = metrics.histogram('greenpithumb_poll_seconds',
+                                  'Time taken by each poll.', ('poller',))
+_poll_lateness_seconds = metrics.histogram(
+    'greenpithumb_poll_lateness_seconds',
+    'Time by which each poll started after its scheduled time.', ('poller',))
 
 
 class SensorPollerFactory(object):
     """Factory for creating sensor poller objects."""
 
-    def __init__(self, make_scheduler_func, record_queue):
+    def __init__(self,
+                 make_scheduler_func,
+                 record_queue,
+                 readings,
+                 idle_seconds=DEFAULT_IDLE_SECONDS):
         """Create a new SensorPollerFactory instance.
 
         Args:
             make_scheduler_func: A function for creating a polling scheduler.
+                Takes the name of the poller that will use the scheduler.
             record_queue: Queue on which to place database records.
+            readings: Registry of latest sensor readings through which pollers
+                read their sensors.
+            idle_seconds: Number of seconds pollers idle between checks for
+                whether they need to poll or stop.
         """
         self._make_scheduler_func = make_scheduler_func
         self._record_queue = record_queue
+        self._readings = readings
+        self._idle_seconds = idle_seconds
 
     def create_temperature_poller(self, temperature_sensor):
         return _SensorPoller(
-            _TemperaturePollWorker(self._make_scheduler_func(),
-                                   self._record_queue, temperature_sensor))
+            _TemperaturePollWorker(
+                self._make_scheduler_func(
+                    TEMPERATURE_POLLER), self._record_queue, temperature_sensor,
+                self._readings, self._idle_seconds))
 
     def create_humidity_poller(self, humidity_sensor):
         return _SensorPoller(
-            _HumidityPollWorker(self._make_scheduler_func(), self._record_queue,
-                                humidity_sensor))
+            _HumidityPollWorker(
+                self._make_scheduler_func(HUMIDITY_POLLER), self._record_queue,
+                humidity_sensor, self._readings, self._idle_seconds))
 
     def create_light_poller(self, light_sensor):
         return _SensorPoller(
-            _LightPollWorker(self._make_scheduler_func(), self._record_queue,
-                             light_sensor))
+            _LightPollWorker(
+                self._make_scheduler_func(LIGHT_POLLER), self._record_queue,
+                light_sensor, self._readings, self._idle_seconds))
 
     def create_soil_watering_poller(self, soil_moisture_sensor, pump_manager):
         return _SensorPoller(
-            _SoilWateringPollWorker(self._make_scheduler_func(
-            ), self._record_queue, soil_moisture_sensor, pump_manager))
+            _SoilWateringPollWorker(
+                self._make_scheduler_func(SOIL_WATERING_POLLER),
+                self._record_queue, soil_moisture_sensor, self._readings,
+                pump_manager, self._idle_seconds))
 
     def create_camera_poller(self, camera_manager):
         return _SensorPoller(
-            _CameraPollWorker(self._make_scheduler_func(), self._record_queue,
-                              camera_manager))
-
-
-def _datetime_to_unix_time(dt):
-    """Converts a datetime into seconds since UNIX epoch."""
-    unix_epoch = datetime.datetime(year=1970, month=1, day=1, tzinfo=pytz.utc)
-    return int((dt - unix_epoch).total_seconds())
+            _CameraPollWorker(
+                self._make_scheduler_func(CAMERA_POLLER), self._record_queue,
+                camera_manager, self._readings, self._idle_seconds))
 
 
 def _unix_time_to_datetime(unix_time):
@@ -76,41 +107,103 @@ def _round_up_to_multiple(value, multiple):
 
 
 class Scheduler(object):
-    """Scheduler for choosing the next time a poller performs a poll."""
+    """Scheduler for choosing the next time a poller performs a poll.
+
+    Poll times fall on multiples of the poll interval in wall clock time, but
+    the scheduler measures the time until the next poll with a monotonic clock.
+    This way, a jump in the wall clock (e.g., when NTP first syncs on a
+    Raspberry Pi, which has no real-time clock) neither fires a burst of polls
+    nor stalls polling. When the scheduler detects a jump, it reschedules the
+    next poll against the new wall clock time.
+    """
 
-    def __init__(self, clock, poll_interval):
+    def __init__(self, clock, poll_interval, name=''):
         """Creates a new Scheduler instance.
 
         Args:
             clock: A clock interface.
             poll_interval: A timedelta representing how often the data should be
                 polled.
+            name: Name of the poller that uses the scheduler, under which the
+                scheduler reports poll lateness.
         """
         self._clock = clock
-        self._poll_interval = poll_interval
-        self._last_poll_time = None
-
-    def _unix_now(self):
-        return _datetime_to_unix_time(self._clock.now())
-
-    def _next_poll_time_unix(self):
-        """Calculates time of next poll in UNIX time.
+        self._name = name
+        self._poll_interval_seconds = int(poll_interval.total_seconds())
+        self._last_poll_time_unix = None
+        # UNIX time of the last poll that finished queueing its records, or
+        # None.
+        self._completed_poll_time_unix = None
+        # UNIX time of the next scheduled poll, or None if no poll is scheduled.
+        self._next_poll_time_unix = None
+        # Monotonic clock time at which the next scheduled poll is due.
+        self._next_poll_deadline = None
+        # Difference between wall clock and monotonic clock time when the next
+        # poll was scheduled.
+        self._wall_clock_offset = None
+        # Poll interval set by set_poll_interval() that the polling thread has
+        # not yet applied, or None.
+        self._new_poll_interval_seconds = None
+        self._new_poll_interval_lock = threading.Lock()
+
+    def set_poll_interval(self, poll_interval):
+        """Changes how often to poll.
+
+        May be called from any thread. The polling thread applies the new
+        interval the next time it checks whether it is time to poll, and
+        reschedules its next poll to fall on a multiple of the new interval.
 
-        Calculates time of next poll so that it is a multiple of
-        self._poll_interval. If the next multiple is the same as the last poll
-        time, returns a poll time that is the current time + one poll interval.
+        Args:
+            poll_interval: A timedelta representing how often the data should be
+                polled.
+        """
+        with self._new_poll_interval_lock:
+            self._new_poll_interval_seconds = int(poll_interval.total_seconds())
+
+    def _apply_new_poll_interval(self):
+        """Applies a poll interval set by set_poll_interval(), if any."""
+        with self._new_poll_interval_lock:
+            new_poll_interval_seconds = self._new_poll_interval_seconds
+            self._new_poll_interval_seconds = None
+        if new_poll_interval_seconds is None:
+            return
+        self._poll_interval_seconds = new_poll_interval_seconds
+        self._next_poll_deadline = None
+
+    def _schedule_next_poll(self):
+        """Schedules the next poll.
+
+        Chooses the next poll time so that it is a multiple of the poll
+        interval. If the next multiple is the same as the last poll time,
+        chooses the multiple after that.
+        """
+        now_unix = self._clock.now_unix()
+        now_monotonic = self._clock.monotonic()
+        next_poll_time_unix = _round_up_to_multiple(now_unix,
+                                                    self._poll_interval_seconds)
+        if next_poll_time_unix == self._last_poll_time_unix:
+            next_poll_time_unix += self._poll_interval_seconds
+        self._next_poll_time_unix = next_poll_time_unix
+        self._next_poll_deadline = now_monotonic + (
+            next_poll_time_unix - now_unix)
+        self._wall_clock_offset = now_unix - now_monotonic
+
+    def _wall_clock_jumped(self):
+        """Checks whether the wall clock jumped since the poll was scheduled.
 
         Returns:
-            UNIX time of next scheduled poll.
+            True if the wall clock moved relative to the monotonic clock by
+            more than _MAX_CLOCK_SKEW_SECONDS.
         """
-        next_poll_time_unix = _round_up_to_multiple(
-            self._unix_now(), int(self._poll_interval.total_seconds()))
-        if self._last_poll_time and (
-                next_poll_time_unix == _datetime_to_unix_time(
-                    self._last_poll_time)):
-            next_poll_time_unix += int(self._poll_interval.total_seconds())
-
-        return next_poll_time_unix
+        offset = self._clock.now_unix() - self._clock.monotonic()
+        jump_seconds = offset - self._wall_clock_offset
+        if abs(jump_seconds) <= _MAX_CLOCK_SKEW_SECONDS:
+            return False
+        logger.warning(
+            'wall clock jumped by %d seconds, rescheduling poll that was due '
+            'at %s', jump_seconds,
+            _unix_time_to_datetime(self._next_poll_time_unix))
+        return True
 
     def wait_until_poll_time(self, timeout):
         """Waits until the next poll time.
@@ -122,20 +215,62 @@ class Scheduler(object):
         Returns:
             True if wait to poll time completed, False if wait timed out.
         """
-        next_poll_time_unix = self._next_poll_time_unix()
-        seconds_until_poll_time = next_poll_time_unix - self._unix_now()
+        self._apply_new_poll_interval()
+        if self._next_poll_deadline is None or self._wall_clock_jumped():
+            self._schedule_next_poll()
+        seconds_until_deadline = (
+            self._next_poll_deadline - self._clock.monotonic())
+        seconds_until_poll_time = max(0, seconds_until_deadline)
         wait_seconds = min(seconds_until_poll_time, timeout)
         if wait_seconds:
             self._clock.wait(wait_seconds)
         # If we didn't time out waiting, return True and update the last poll
         # time.
         if seconds_until_poll_time <= timeout:
-            self._last_poll_time = _unix_time_to_datetime(next_poll_time_unix)
+            _poll_lateness_seconds.observe(
+                max(0, -seconds_until_deadline), (self._name,))
+            self._last_poll_time_unix = self._next_poll_time_unix
+            self._next_poll_deadline = None
             return True
         return False
 
+    def restore_last_poll_time(self, last_poll_time):
+        """Restores the time of the last poll from a previous run.
+
+        Prevents the scheduler from polling again on a tick that a previous run
+        already polled.
+
+        Args:
+            last_poll_time: Time of the last poll as a UTC datetime.
+        """
+        self._last_poll_time_unix = calendar.timegm(
+            last_poll_time.utctimetuple())
+        self._completed_poll_time_unix = self._last_poll_time_unix
+        self._next_poll_deadline = None
+
     def last_poll_time(self):
-        return self._last_poll_time
+        """Returns the time of the last poll as a UTC datetime, or None."""
+        if self._last_poll_time_unix is None:
+            return None
+        return _unix_time_to_datetime(self._last_poll_time_unix)
+
+    def mark_poll_completed(self):
+        """Records that the poll at the last poll time has finished.
+
+        The polling thread calls this once the poll has queued its records.
+        """
+        self._completed_poll_time_unix = self._last_poll_time_unix
+
+    def last_completed_poll_time(self):
+        """Returns the time of the last completed poll as a UTC datetime.
+
+        Unlike last_poll_time(), does not advance until the poll has queued its
+        records, so saving this time never skips a poll that was interrupted.
+        Returns None if no poll has completed.
+        """
+        if self._completed_poll_time_unix is None:
+            return None
+        return _unix_time_to_datetime(self._completed_poll_time_unix)
 
 
 class _SensorPollWorkerBase(object):
@@ -145,7 +280,10 @@ class _SensorPollWorkerBase(object):
     background polling thread.
     """
 
-    def __init__(self, scheduler, record_queue, sensor):
+    # Name of the poller, under which the worker reports poll times.
+    _name = None
+
+    def __init__(self, scheduler, record_queue, sensor, readings, idle_seconds):
         """Create a new _SensorPollWorkerBase instance
 
         Args:
@@ -153,10 +291,15 @@ class _SensorPollWorkerBase(object):
             record_queue: Queue on which to place database records.
             sensor: A sensor to poll for status. The particular type of sensor
                 will vary depending on the poll worker subclass.
+            readings: Registry of latest sensor readings.
+            idle_seconds: Number of seconds to idle between checks for whether
+                to poll or stop.
         """
         self._scheduler = scheduler
         self._record_queue = record_queue
         self._sensor = sensor
+        self._readings = readings
+        self._idle_seconds = idle_seconds
         self._stopped = threading.Event()
 
     def _is_stopped(self):
@@ -164,7 +307,7 @@ class _SensorPollWorkerBase(object):
 
     def _wait_until_poll_time_or_stop(self):
         while not self._is_stopped():
-            if self._scheduler.wait_until_poll_time(_IDLE_SECONDS):
+            if self._scheduler.wait_until_poll_time(self._idle_seconds):
                 return
 
     def poll(self):
@@ -174,20 +317,49 @@ class _SensorPollWorkerBase(object):
             self._wait_until_poll_time_or_stop()
             if self._is_stopped():
                 break
-            self._poll_once()
+            with _poll_seconds.time((self._name,)):
+                self._poll_once()
+            self._scheduler.mark_poll_completed()
         logger.info('polling terminating for %s', self.__class__.__name__)
 
     def stop(self):
-        """End worker polling."""
+        """End worker polling.
+
+        A poll that is already in progress runs to completion.
+        """
         self._stopped.set()
 
+    def close(self):
+        """Releases the worker's resources once polling has ended."""
+        pass
+
+    def _read(self, sensor_name, read_func):
+        """Reads the sensor, sharing readings with other readers.
+
+        If another reader (e.g. the camera checking the light level) read the
+        same sensor moments ago, reuses that reading rather than reading the
+        hardware again.
+
+        Args:
+            sensor_name: Name under which the sensor's readings are registered.
+            read_func: Function that reads the sensor.
+
+        Returns:
+            The sensor reading.
+        """
+        return self._readings.read(sensor_name, latest_readings.DEFAULT_MAX_AGE,
+                                   read_func)
+
 
 class _TemperaturePollWorker(_SensorPollWorkerBase):
     """Polls a temperature sensor and stores the readings."""
 
+    _name = TEMPERATURE_POLLER
+
     def _poll_once(self):
         """Polls for current temperature and queues DB record."""
-        temperature = self._sensor.temperature()
+        temperature = self._read(latest_readings.TEMPERATURE,
+                                 self._sensor.temperature)
         self._record_queue.put(
             db_store.TemperatureRecord(self._scheduler.last_poll_time(),
                                        temperature))
@@ -196,9 +368,11 @@ class _TemperaturePollWorker(_SensorPollWorkerBase):
 class _HumidityPollWorker(_SensorPollWorkerBase):
     """Polls a humidity sensor and stores the readings."""
 
+    _name = HUMIDITY_POLLER
+
     def _poll_once(self):
         """Polls for and stores current relative humidity."""
-        humidity = self._sensor.humidity()
+        humidity = self._read(latest_readings.HUMIDITY, self._sensor.humidity)
         self._record_queue.put(
             db_store.HumidityRecord(self._scheduler.last_poll_time(), humidity))
 
@@ -206,8 +380,10 @@ class _HumidityPollWorker(_SensorPollWorkerBase):
 class _LightPollWorker(_SensorPollWorkerBase):
     """Polls a light sensor and stores the readings."""
 
+    _name = LIGHT_POLLER
+
     def _poll_once(self):
-        light = self._sensor.light()
+        light = self._read(latest_readings.LIGHT, self._sensor.light)
         self._record_queue.put(
             db_store.LightRecord(self._scheduler.last_poll_time(), light))
 
@@ -219,8 +395,10 @@ class _SoilWateringPollWorker(_SensorPollWorkerBase):
     the moisture drops too low. Records both soil moisture and watering events.
     """
 
-    def __init__(self, scheduler, record_queue, soil_moisture_sensor,
-                 pump_manager):
+    _name = SOIL_WATERING_POLLER
+
+    def __init__(self, scheduler, record_queue, soil_moisture_sensor, readings,
+                 pump_manager, idle_seconds):
         """Creates a new SoilWateringPoller object.
 
         Args:
@@ -229,10 +407,14 @@ class _SoilWateringPollWorker(_SensorPollWorkerBase):
                 watering event records for storage.
             soil_moisture_sensor: An interface for reading the soil moisture
                 level.
+            readings: Registry of latest sensor readings.
             pump_manager: An interface to manage a water pump.
+            idle_seconds: Number of seconds to idle between checks for whether
+                to poll or stop.
         """
-        super(_SoilWateringPollWorker, self).__init__(scheduler, record_queue,
-                                                      soil_moisture_sensor)
+        super(_SoilWateringPollWorker,
+              self).__init__(scheduler, record_queue, soil_moisture_sensor,
+                             readings, idle_seconds)
         self._pump_manager = pump_manager
 
     def _poll_once(self):
@@ -242,7 +424,8 @@ class _SoilWateringPollWorker(_SensorPollWorkerBase):
         current soil moisture level, checks if the pump needs to run, and if so,
         runs the pump and records the watering event.
         """
-        soil_moisture = self._sensor.soil_moisture()
+        soil_moisture = self._read(latest_readings.SOIL_MOISTURE,
+                                   self._sensor.soil_moisture)
         self._record_queue.put(
             db_store.SoilMoistureRecord(self._scheduler.last_poll_time(),
                                         soil_moisture))
@@ -256,15 +439,16 @@ class _SoilWateringPollWorker(_SensorPollWorkerBase):
 class _CameraPollWorker(_SensorPollWorkerBase):
     """Captures and stores pictures pictures from a camera."""
 
+    _name = CAMERA_POLLER
+
     def _poll_once(self):
         """Captures and stores an image."""
         if self._sensor.sufficient_light():
             self._sensor.save_photo()
 
-    def stop(self):
-        """End worker polling and close camera."""
+    def close(self):
+        """Closes the camera."""
         self._sensor.close()
-        super(_CameraPollWorker, self).stop()
 
 
 class _SensorPoller(object):
@@ -277,13 +461,36 @@ class _SensorPoller(object):
             poll_worker: Worker object that handles the polling work.
         """
         self._worker = poll_worker
+        self._thread = None
 
     def start_polling_async(self):
         """Starts a new thread to begin polling."""
-        t = threading.Thread(target=self._worker.poll)
-        t.setDaemon(True)
-        t.start()
+        # Name the thread after the worker so that it can be told apart in
+        # profiles and stack dumps.
+        self._thread = threading.Thread(
+            target=self._worker.poll, name=self._worker.__class__.__name__)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops scheduling new polls, without waiting for polling to end."""
+        self._worker.stop()
+
+    def join(self, timeout):
+        """Waits for the polling thread to end.
+
+        Args:
+            timeout: The maximum time (in seconds) to wait.
+
+        Returns:
+            True if polling has ended, False if the wait timed out.
+        """
+        if self._thread is None:
+            return True
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
 
     def close(self):
-        """Stops polling."""
+        """Stops polling and releases the poller's resources."""
         self._worker.stop()
+        self._worker.close()
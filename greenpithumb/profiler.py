@@ -0,0 +1,173 @@
+"""Samples the stacks of all threads to show where GreenPiThumb spends its time.
+
+Nothing runs until a profile is requested, so the profiler costs nothing while
+it is off.
+"""
+
+import collections
+import datetime
+import logging
+import os
+import sys
+import threading
+import traceback
+
+import monotonic as monotonic_clock
+
+logger = logging.getLogger(__name__)
+
+# Number of seconds between samples of every thread's stack.
+DEFAULT_SAMPLE_INTERVAL_SECONDS = 0.01
+# Format of the timestamp in the names of profile files.
+_FILENAME_TIMESTAMP_FORMAT = '%Y%m%dT%H%M%S'
+
+
+def _thread_names():
+    """Returns a dictionary of thread IDs to thread names."""
+    return {thread.ident: thread.name for thread in threading.enumerate()}
+
+
+def _stack_key(frame):
+    """Returns a frame's stack as a tuple of functions, outermost first."""
+    functions = []
+    while frame is not None:
+        code = frame.f_code
+        functions.append('%s (%s:%d)' %
+                         (code.co_name, os.path.basename(code.co_filename),
+                          frame.f_lineno))
+        frame = frame.f_back
+    return tuple(reversed(functions))
+
+
+def write_stack_dump(path):
+    """Writes the current stack of every thread to a file.
+
+    Args:
+        path: Path of the file to write.
+    """
+    names = _thread_names()
+    with open(path, 'w') as dump_file:
+        for thread_id, frame in sorted(sys._current_frames().items()):
+            dump_file.write('Thread %s (%d):\n' %
+                            (names.get(thread_id, 'unknown'), thread_id))
+            dump_file.write(''.join(traceback.format_stack(frame)))
+            dump_file.write('\n')
+
+
+def write_profile(path, sample_counts):
+    """Writes sampled stacks to a file in collapsed stack format.
+
+    Each line holds the thread name and the functions on the stack, separated
+    by semicolons, followed by the number of samples that saw that stack. The
+    format can be summarized with grep or rendered with flame graph tools.
+
+    Args:
+        path: Path of the file to write.
+        sample_counts: A dictionary of (thread name, stack) tuples to the
+            number of samples that saw them.
+    """
+    with open(path, 'w') as profile_file:
+        for (thread_name, stack), count in sorted(
+                sample_counts.items(), key=lambda item: (-item[1], item[0])):
+            profile_file.write('%s %d\n' % (';'.join((thread_name,) + stack),
+                                            count))
+
+
+class Profiler(object):
+    """Profiles all threads for a fixed time on request.
+
+    A profile is requested with request_profile(), which is safe to call from a
+    signal handler. The main loop then calls start_if_requested(), which takes a
+    stack dump of every thread and starts sampling on a background thread. When
+    sampling ends, the profiler writes the samples to a file next to the stack
+    dump.
+    """
+
+    def __init__(self,
+                 path_prefix,
+                 duration_seconds,
+                 sample_interval_seconds=DEFAULT_SAMPLE_INTERVAL_SECONDS):
+        """Creates a new Profiler instance.
+
+        Args:
+            path_prefix: Prefix of the paths of the profile and stack dump
+                files. The profiler appends a timestamp and file extension.
+            duration_seconds: Number of seconds to sample for each profile.
+            sample_interval_seconds: Number of seconds between samples.
+        """
+        self._path_prefix = path_prefix
+        self._duration_seconds = duration_seconds
+        self._sample_interval_seconds = sample_interval_seconds
+        self._profile_requested = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def request_profile(self):
+        """Requests that profiling start on the next check."""
+        self._profile_requested.set()
+
+    def start_if_requested(self):
+        """Starts profiling if a profile was requested.
+
+        Returns:
+            True if profiling started, False otherwise.
+        """
+        if not self._profile_requested.is_set():
+            return False
+        self._profile_requested.clear()
+        if self._thread and self._thread.is_alive():
+            logger.warning('ignoring profile request, already profiling')
+            return False
+        path_prefix = '%s-%s' % (
+            self._path_prefix,
+            datetime.datetime.now().strftime(_FILENAME_TIMESTAMP_FORMAT))
+        try:
+            write_stack_dump(path_prefix + '.stacks.txt')
+        except IOError as e:
+            logger.error('failed to write stack dump: %s', e)
+            return False
+        logger.info('wrote stack dump to %s.stacks.txt, profiling for %.f '
+                    'seconds', path_prefix, self._duration_seconds)
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._profile,
+            args=(path_prefix + '.profile.txt',),
+            name='Profiler')
+        self._thread.setDaemon(True)
+        self._thread.start()
+        return True
+
+    def _profile(self, path):
+        """Samples every other thread's stack, then writes the profile.
+
+        Always takes at least one sample, so a profile that is ended early still
+        shows what each thread was doing.
+        """
+        own_thread_id = threading.current_thread().ident
+        sample_counts = collections.Counter()
+        sample_total = 0
+        deadline = monotonic_clock.monotonic() + self._duration_seconds
+        while True:
+            names = _thread_names()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread_id:
+                    continue
+                sample_counts[(names.get(thread_id, 'unknown'),
+                               _stack_key(frame))] += 1
+            sample_total += 1
+            if (self._stopped.is_set() or
+                    monotonic_clock.monotonic() >= deadline):
+                break
+            self._stopped.wait(self._sample_interval_seconds)
+        try:
+            write_profile(path, sample_counts)
+        except IOError as e:
+            logger.error('failed to write profile: %s', e)
+            return
+        logger.info('wrote profile of %d samples to %s', sample_total, path)
+
+    def close(self):
+        """Ends any profile in progress early and writes what it sampled."""
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
@@ -1,5 +1,8 @@
 import logging
 
+import metrics
+import sleep_windows
+
 logger = logging.getLogger(__name__)
 
 # Pump rate in mL/s (4.3 L/min)
@@ -9,6 +12,11 @@ _PUMP_RATE_ML_PER_SEC = 4300.0 / 60.0
 # low soil moisture.
 DEFAULT_PUMP_AMOUNT = 200
 
+_pump_runs = metrics.counter('greenpithumb_pump_runs_total',
+                             'Number of times the pump ran.')
+_pump_run_seconds = metrics.counter('greenpithumb_pump_run_seconds_total',
+                                    'Total time the pump ran.')
+
 
 class Pump(object):
     """Wrapper for a Seaflo 12V water pump."""
@@ -24,6 +32,9 @@ class Pump(object):
         self._pi_io = pi_io
         self._clock = clock
         self._pump_pin = pump_pin
+        # Pin turned on by the run of the pump in progress, or None if the pump
+        # is not running.
+        self._running_pin = None
 
     def pump_water(self, amount_ml):
         """Pumps the specified amount of water.
@@ -39,18 +50,48 @@ class Pump(object):
         elif amount_ml < 0.0:
             raise ValueError('Cannot pump a negative amount of water')
         else:
-            logger.info('turning pump on (with GPIO pin %d)', self._pump_pin)
-            self._pi_io.turn_pin_on(self._pump_pin)
+            # Hold on to the pin so that the same pin is turned off even if
+            # set_pin() is called while the pump runs.
+            pump_pin = self._pump_pin
+            logger.info('turning pump on (with GPIO pin %d)', pump_pin)
+            self._running_pin = pump_pin
+            self._pi_io.turn_pin_on(pump_pin)
 
             wait_time_seconds = amount_ml / _PUMP_RATE_ML_PER_SEC
             self._clock.wait(wait_time_seconds)
 
-            logger.info('turning pump off (with GPIO pin %d)', self._pump_pin)
-            self._pi_io.turn_pin_off(self._pump_pin)
+            logger.info('turning pump off (with GPIO pin %d)', pump_pin)
+            self._pi_io.turn_pin_off(pump_pin)
+            self._running_pin = None
             logger.info('pumped %.f mL of water', amount_ml)
+            _pump_runs.inc()
+            _pump_run_seconds.inc(wait_time_seconds)
 
         return
 
+    def turn_off(self):
+        """Turns the pump off, even if a run of the pump was interrupted.
+
+        If a run was interrupted, turns off the pin that the run turned on,
+        even if set_pin() has since changed the pump's pin.
+        """
+        pump_pin = self._running_pin
+        if pump_pin is None:
+            pump_pin = self._pump_pin
+        logger.info('turning pump off (with GPIO pin %d)', pump_pin)
+        self._pi_io.turn_pin_off(pump_pin)
+        self._running_pin = None
+
+    def set_pin(self, pump_pin):
+        """Changes the Raspberry Pi pin to which the pump is connected.
+
+        Takes effect on the next run of the pump.
+
+        Args:
+            pump_pin: Raspberry Pi pin to which the pump is connected.
+        """
+        self._pump_pin = pump_pin
+
 
 class PumpManager(object):
     """Pump Manager manages the water pump."""
@@ -92,6 +133,10 @@ class PumpManager(object):
 
         return 0
 
+    def set_moisture_threshold(self, moisture_threshold):
+        """Changes the soil moisture threshold below which the pump runs."""
+        self._moisture_threshold = moisture_threshold
+
     def _should_pump(self, moisture):
         """Returns True if the pump should be run."""
         if not self._pump_scheduler.is_running_pump_allowed():
@@ -113,21 +158,20 @@ class PumpScheduler(object):
         self._local_clock = local_clock
         self._sleep_windows = sleep_windows
 
+    def set_sleep_windows(self, sleep_windows):
+        """Replaces the sleep windows during which the pump may not run.
+
+        Args:
+            sleep_windows: A list of 2-tuples, each representing a sleep window.
+                Tuple items are datetime.time objects.
+        """
+        self._sleep_windows = sleep_windows
+
     def is_running_pump_allowed(self):
         """Returns True if OK to run pump, otherwise False.
 
         Pump is not allowed to run from the start of a sleep window (inclusive)
         to the end of a sleep window (exclusive).
         """
-        current_time = self._local_clock.now().time()
-
-        for sleep_time, wake_time in self._sleep_windows:
-            # Check if sleep window wraps midnight.
-            if wake_time < sleep_time:
-                if current_time >= sleep_time or current_time < wake_time:
-                    return False
-            else:
-                if sleep_time <= current_time < wake_time:
-                    return False
-
-        return True
+        return not sleep_windows.contains(self._sleep_windows,
+                                          self._local_clock.now().time())
@@ -0,0 +1,428 @@
+"""Serves GreenPiThumb's stored data as JSON over HTTP for dashboards.
+
+Endpoints:
+    /readings/<sensor>?start=&end=&step=&points=&limit=&page_token=
+        Readings of a sensor (temperature, humidity, soil_moisture or light)
+        within a time range. With step (in seconds, a multiple of 60), returns
+        the mean, minimum and maximum of the readings in each step-sized bucket
+        instead. With points, returns at most that many readings from across
+        the whole range, chosen to keep the shape of a chart of every reading.
+    /watering_events?start=&end=&limit=&page_token=
+    /images?start=&end=&limit=&page_token=
+    /latest
+        The most recent reading of each sensor, watering event and image.
+    /events
+        A server-sent events stream of records as they are stored, without
+        reading the database.
+
+Times are UTC in ISO 8601 format (e.g. 2017-01-31T08:00Z). Responses that end
+early include a next_page_token to pass back for the next page. Each request
+uses its own read-only database connection, so requests never block
+GreenPiThumb from writing.
+"""
+
+import BaseHTTPServer
+import contextlib
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import logging
+import socket
+import SocketServer
+import threading
+import urlparse
+
+import pytz
+
+import db_store
+import record_publisher
+
+logger = logging.getLogger(__name__)
+
+# Default and maximum number of items in each page of results.
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+# Formats accepted for times in query parameters.
+_TIME_FORMATS = ('%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%dT%H:%MZ', '%Y-%m-%d')
+# Format of times in responses.
+_RESPONSE_TIME_FORMAT = '%Y-%m-%dT%H:%MZ'
+# Range of times used when a request gives no start or end.
+_EARLIEST_TIME = datetime.datetime(1970, 1, 1, tzinfo=pytz.utc)
+_LATEST_TIME = datetime.datetime(9999, 1, 1, tzinfo=pytz.utc)
+# Responses smaller than this many bytes are not worth compressing.
+_MIN_COMPRESS_BYTES = 1024
+# Number of seconds an event stream may be idle before it sends a comment to
+# keep the connection open and detect clients that went away.
+_KEEPALIVE_SECONDS = 15
+# Number of seconds to wait on a client that stops sending its request or stops
+# reading the response before dropping the connection.
+_CLIENT_TIMEOUT_SECONDS = 60
+
+# Store types for each kind of data, keyed by the name used in URLs.
+_SENSOR_STORES = {
+    'temperature': db_store.TemperatureStore,
+    'humidity': db_store.HumidityStore,
+    'soil_moisture': db_store.SoilMoistureStore,
+    'light': db_store.LightStore,
+}
+# Names of events in the event stream, keyed by record type.
+_EVENT_NAMES = {
+    db_store.TemperatureRecord: 'temperature',
+    db_store.HumidityRecord: 'humidity',
+    db_store.SoilMoistureRecord: 'soil_moisture',
+    db_store.LightRecord: 'light',
+    db_store.WateringEventRecord: 'watering_event',
+    db_store.ImageRecord: 'image',
+}
+
+
+class Error(Exception):
+    pass
+
+
+class BadRequestError(Error):
+    """Indicates that a request's parameters are invalid."""
+    pass
+
+
+class NotFoundError(Error):
+    """Indicates that a request's path does not name a resource."""
+    pass
+
+
+def _parse_time(value):
+    for time_format in _TIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, time_format).replace(
+                tzinfo=pytz.utc)
+        except ValueError:
+            pass
+    raise BadRequestError('Invalid time: %s' % value)
+
+
+def _parse_positive_int(name, value, maximum=None):
+    try:
+        parsed = int(value)
+    except ValueError:
+        raise BadRequestError('Invalid %s: %s' % (name, value))
+    if parsed < 1 or (maximum and parsed > maximum):
+        raise BadRequestError('%s must be between 1 and %s: %s' %
+                              (name, maximum or 'infinity', value))
+    return parsed
+
+
+def format_record(record):
+    """Converts a database record to a dictionary for JSON output."""
+    item = record._asdict()
+    item['timestamp'] = record.timestamp.strftime(_RESPONSE_TIME_FORMAT)
+    return item
+
+
+class _Query(object):
+    """Parameters of a request for a range of data."""
+
+    def __init__(self, parameters):
+        """Parses range query parameters.
+
+        Args:
+            parameters: A dictionary of query parameter names to lists of
+                values, as returned by urlparse.parse_qs().
+
+        Raises:
+            BadRequestError if any parameter is invalid.
+        """
+
+        def get(name):
+            values = parameters.get(name)
+            return values[-1] if values else None
+
+        self.start = _EARLIEST_TIME
+        if get('start'):
+            self.start = _parse_time(get('start'))
+        self.end = _LATEST_TIME
+        if get('end'):
+            self.end = _parse_time(get('end'))
+        self.limit = DEFAULT_PAGE_SIZE
+        if get('limit'):
+            self.limit = _parse_positive_int('limit',
+                                             get('limit'), MAX_PAGE_SIZE)
+        self.step_seconds = None
+        if get('step'):
+            self.step_seconds = _parse_positive_int('step', get('step'))
+            # Readings are stored with minute precision, so buckets must start
+            # on whole minutes for a bucket's start to work as a page token.
+            if self.step_seconds % 60:
+                raise BadRequestError(
+                    'step must be a multiple of 60: %s' % get('step'))
+        self.points = None
+        if get('points'):
+            self.points = _parse_positive_int('points',
+                                              get('points'), MAX_PAGE_SIZE)
+        self.page_token = get('page_token')
+
+
+def _get_page(store, query, items_name):
+    """Reads one page of a store's records within the query's range."""
+    try:
+        records, next_page_token = store.get_page(query.start, query.end,
+                                                  query.limit, query.page_token)
+    except ValueError as e:
+        raise BadRequestError(str(e))
+    return {
+        items_name: [format_record(record) for record in records],
+        'next_page_token': next_page_token,
+    }
+
+
+def _get_summaries(store, query):
+    """Reads one page of bucketed summaries of a store's readings."""
+    start = query.start
+    if query.page_token:
+        start = _parse_time(query.page_token)
+    summaries = store.get_summaries(start, query.end, query.step_seconds,
+                                    query.limit + 1)
+    next_page_token = None
+    if len(summaries) > query.limit:
+        next_page_token = summaries[query.limit].timestamp.strftime(
+            _RESPONSE_TIME_FORMAT)
+        summaries = summaries[:query.limit]
+    return {
+        'step': query.step_seconds,
+        'summaries': [format_record(summary) for summary in summaries],
+        'next_page_token': next_page_token,
+    }
+
+
+def _get_downsampled(store, query):
+    """Reads readings from across the query's range, downsampled."""
+    try:
+        readings = store.get_downsampled(query.start, query.end, query.points)
+    except ValueError as e:
+        raise BadRequestError(str(e))
+    return {
+        'points': query.points,
+        'readings': [format_record(reading) for reading in readings],
+    }
+
+
+def get_readings(connection, sensor, parameters):
+    """Handles a request for a sensor's readings."""
+    if sensor not in _SENSOR_STORES:
+        raise NotFoundError('Unknown sensor: %s' % sensor)
+    store = _SENSOR_STORES[sensor](connection)
+    query = _Query(parameters)
+    if query.step_seconds and query.points:
+        raise BadRequestError('step and points cannot be used together')
+    if query.step_seconds:
+        response = _get_summaries(store, query)
+    elif query.points:
+        response = _get_downsampled(store, query)
+    else:
+        response = _get_page(store, query, 'readings')
+    response['sensor'] = sensor
+    return response
+
+
+def get_watering_events(connection, parameters):
+    """Handles a request for watering events."""
+    return _get_page(
+        db_store.WateringEventStore(connection),
+        _Query(parameters), 'watering_events')
+
+
+def get_images(connection, parameters):
+    """Handles a request for image metadata."""
+    return _get_page(
+        db_store.ImageStore(connection), _Query(parameters), 'images')
+
+
+def get_latest(connection, unused_parameters):
+    """Handles a request for the most recent data of each kind."""
+    latest = {}
+    stores = dict(_SENSOR_STORES)
+    stores['watering_event'] = db_store.WateringEventStore
+    stores['image'] = db_store.ImageStore
+    for name, store_type in stores.items():
+        record = store_type(connection).get_latest()
+        latest[name] = format_record(record) if record else None
+    return latest
+
+
+def route(connection, path, parameters):
+    """Handles a request for a path.
+
+    Args:
+        connection: Read-only database connection.
+        path: The path of the request URL.
+        parameters: A dictionary of query parameter names to lists of values.
+
+    Returns:
+        The response as a dictionary to serialize to JSON.
+
+    Raises:
+        BadRequestError if the request's parameters are invalid.
+        NotFoundError if the path does not name a resource.
+    """
+    parts = path.strip('/').split('/')
+    if len(parts) == 2 and parts[0] == 'readings':
+        return get_readings(connection, parts[1], parameters)
+    handlers = {
+        'watering_events': get_watering_events,
+        'images': get_images,
+        'latest': get_latest,
+    }
+    if len(parts) == 1 and parts[0] in handlers:
+        return handlers[parts[0]](connection, parameters)
+    raise NotFoundError('Unknown path: %s' % path)
+
+
+def _make_etag(body):
+    return '"%s"' % hashlib.sha1(body).hexdigest()
+
+
+def _gzip(body):
+    compressed = io.BytesIO()
+    with gzip.GzipFile(fileobj=compressed, mode='wb') as gzip_file:
+        gzip_file.write(body)
+    return compressed.getvalue()
+
+
+class _ReadApiRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serves read API requests."""
+
+    # Ends event streams to clients that stopped reading, which would otherwise
+    # block their handler thread and hold a subscriber slot forever.
+    timeout = _CLIENT_TIMEOUT_SECONDS
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        if url.path.rstrip('/') == '/events':
+            self._stream_events()
+            return
+        try:
+            with contextlib.closing(
+                    db_store.open_read_only(self.server.db_path)) as connection:
+                response = route(connection, url.path,
+                                 urlparse.parse_qs(url.query))
+            status = 200
+        except BadRequestError as e:
+            status, response = 400, {'error': str(e)}
+        except NotFoundError as e:
+            status, response = 404, {'error': str(e)}
+        except IOError as e:
+            status, response = 503, {'error': str(e)}
+        self._send_json(status, response)
+
+    def _send_json(self, status, response):
+        body = json.dumps(response, sort_keys=True)
+        etag = _make_etag(body)
+        if status == 200 and etag in self.headers.get('If-None-Match', ''):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', etag)
+        self.send_header('Vary', 'Accept-Encoding')
+        if (len(body) >= _MIN_COMPRESS_BYTES and
+                'gzip' in self.headers.get('Accept-Encoding', '')):
+            body = _gzip(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream_events(self):
+        """Streams records to the client as they are stored."""
+        publisher = self.server.publisher
+        if not publisher:
+            self._send_json(404, {'error': 'Live events are unavailable'})
+            return
+        try:
+            subscription = publisher.subscribe()
+        except record_publisher.TooManySubscribersError as e:
+            self._send_json(503, {'error': str(e)})
+            return
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            while not subscription.is_closed():
+                record = subscription.next_record(_KEEPALIVE_SECONDS)
+                if subscription.is_closed():
+                    break
+                if record is None:
+                    self.wfile.write(': keepalive\n\n')
+                else:
+                    self.wfile.write(
+                        'event: %s\ndata: %s\n\n' %
+                        (_EVENT_NAMES[type(record)],
+                         json.dumps(format_record(record), sort_keys=True)))
+                self.wfile.flush()
+        except socket.error:
+            # Includes socket.timeout, raised when the client stops reading.
+            logger.debug('event stream client disconnected')
+        finally:
+            publisher.unsubscribe(subscription)
+
+    def finish(self):
+        try:
+            BaseHTTPServer.BaseHTTPRequestHandler.finish(self)
+        except socket.error:
+            # The client went away before it received everything written to
+            # it, such as an event stream's last event.
+            pass
+
+    def log_message(self, message_format, *args):
+        logger.debug('%s - %s', self.address_string(), message_format % args)
+
+
+class _ThreadingHTTPServer(SocketServer.ThreadingMixIn,
+                           BaseHTTPServer.HTTPServer):
+    """HTTP server that handles each request on its own thread."""
+    daemon_threads = True
+
+
+class ReadApiServer(object):
+    """Serves the read API over HTTP on a background thread."""
+
+    def __init__(self, address, port, db_path, publisher=None):
+        """Creates a new ReadApiServer instance.
+
+        Args:
+            address: Address on which to listen (e.g. '127.0.0.1').
+            port: Port on which to listen, or 0 to pick any free port.
+            db_path: Path to the GreenPiThumb database.
+            publisher: RecordPublisher whose records to stream to /events
+                clients, or None to not serve /events.
+        """
+        self._server = _ThreadingHTTPServer((address, port),
+                                            _ReadApiRequestHandler)
+        self._server.db_path = db_path
+        self._server.publisher = publisher
+        self._thread = None
+
+    @property
+    def port(self):
+        """The port on which the server listens."""
+        return self._server.server_port
+
+    def start(self):
+        """Starts serving requests in a background thread."""
+        logger.info('serving read API at http://%s:%d/',
+                    self._server.server_address[0], self.port)
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name='ReadApiServer')
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def close(self):
+        """Stops serving requests."""
+        if self._thread:
+            self._server.shutdown()
+            self._thread.join()
+        self._server.server_close()
@@ -1,6 +1,17 @@
+import logging
 import Queue
+import sqlite3
 
 import db_store
+import metrics
+
+logger = logging.getLogger(__name__)
+
+_records_stored = metrics.counter('greenpithumb_records_stored_total',
+                                  'Records written to the database.',
+                                  ('record_type',))
+_records_failed = metrics.counter('greenpithumb_records_failed_total',
+                                  'Records that could not be stored.')
 
 
 class Error(Exception):
@@ -14,14 +25,36 @@ class UnsupportedRecordError(Error):
 class RecordProcessor(object):
     """Stores records from a queue into database stores."""
 
-    def __init__(self, record_queue, soil_moisture_store, light_store,
-                 humidity_store, temperature_store, watering_event_store):
+    def __init__(self,
+                 record_queue,
+                 soil_moisture_store,
+                 light_store,
+                 humidity_store,
+                 temperature_store,
+                 watering_event_store,
+                 image_store,
+                 publisher=None):
+        """Creates a new RecordProcessor instance.
+
+        Args:
+            record_queue: Queue from which to take records.
+            soil_moisture_store: Store for soil moisture records.
+            light_store: Store for light records.
+            humidity_store: Store for humidity records.
+            temperature_store: Store for temperature records.
+            watering_event_store: Store for watering event records.
+            image_store: Store for image records.
+            publisher: RecordPublisher to which to publish each stored record,
+                or None to not publish records.
+        """
         self._record_queue = record_queue
         self._soil_moisture_store = soil_moisture_store
         self._light_store = light_store
         self._humidity_store = humidity_store
         self._temperature_store = temperature_store
         self._watering_event_store = watering_event_store
+        self._image_store = image_store
+        self._publisher = publisher
 
     def try_process_next_record(self):
         """Processes the next record from the queue, placing it in a store.
@@ -55,7 +88,51 @@ class RecordProcessor(object):
             self._temperature_store.insert(record)
         elif isinstance(record, db_store.WateringEventRecord):
             self._watering_event_store.insert(record)
+        elif isinstance(record, db_store.ImageRecord):
+            self._image_store.insert(record)
         else:
             raise UnsupportedRecordError(
                 'Unrecognized record type: %s' % str(record))
+        _records_stored.inc(label_values=(type(record).__name__,))
+        if self._publisher:
+            self._publisher.publish(record)
         return True
+
+    def set_poll_interval(self, poll_interval):
+        """Changes the poll interval against which reading gaps are recorded.
+
+        Must be called from the thread that processes records.
+
+        Args:
+            poll_interval: timedelta of how often non-camera sensors are
+                polled.
+        """
+        for store in (self._soil_moisture_store, self._light_store,
+                      self._humidity_store, self._temperature_store):
+            store.set_poll_interval(poll_interval)
+
+    def process_all_records(self):
+        """Processes every record in the queue, skipping records that fail.
+
+        Callers storing a large backlog should wrap the call in
+        db_store.deferred_commits() so that the records are committed together.
+
+        Must be called from the same thread from which the database connections
+        were created.
+
+        Returns:
+            A two-tuple where the first element is the number of records stored
+            and the second element is the number of records that could not be
+            stored.
+        """
+        stored = 0
+        failed = 0
+        while True:
+            try:
+                if not self.try_process_next_record():
+                    return stored, failed
+                stored += 1
+            except (Error, sqlite3.Error):
+                logger.exception('failed to store record')
+                _records_failed.inc()
+                failed += 1
@@ -0,0 +1,160 @@
+"""Publishes stored records to live subscribers, such as dashboards."""
+
+import logging
+import Queue
+import threading
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Default number of records that may wait for each subscriber before the
+# subscriber is considered too slow and is dropped.
+DEFAULT_BUFFER_SIZE = 100
+# Default maximum number of limited subscribers at once.
+DEFAULT_MAX_SUBSCRIBERS = 10
+
+_dropped_subscribers = metrics.counter(
+    'greenpithumb_dropped_subscribers_total',
+    'Live subscribers dropped for falling behind.')
+
+
+class Error(Exception):
+    pass
+
+
+class TooManySubscribersError(Error):
+    """Indicates that the publisher already has its maximum subscribers."""
+    pass
+
+
+class Subscription(object):
+    """A subscriber's buffer of published records."""
+
+    def __init__(self, buffer_size, limited):
+        self._records = Queue.Queue(maxsize=buffer_size)
+        self._closed = threading.Event()
+        # Whether the subscription counts toward the publisher's maximum
+        # number of subscribers.
+        self._limited = limited
+
+    def _offer(self, record):
+        """Adds a record to the buffer without waiting.
+
+        Returns:
+            True if the record was added, False if the buffer is full.
+        """
+        try:
+            self._records.put_nowait(record)
+            return True
+        except Queue.Full:
+            return False
+
+    def _close(self):
+        self._closed.set()
+        # Wakes a subscriber waiting for the next record, so that it notices
+        # the subscription ended. A full buffer already wakes it.
+        try:
+            self._records.put_nowait(None)
+        except Queue.Full:
+            pass
+
+    def is_closed(self):
+        """Returns True if the subscription ended or was dropped."""
+        return self._closed.is_set()
+
+    def next_record(self, timeout):
+        """Waits for the next published record.
+
+        Args:
+            timeout: The maximum time (in seconds) to wait.
+
+        Returns:
+            The next record, or None if none arrived within the timeout or the
+            subscription ended.
+        """
+        try:
+            return self._records.get(timeout=timeout)
+        except Queue.Empty:
+            return None
+
+
+class RecordPublisher(object):
+    """Hands each published record to every subscriber.
+
+    Publishing never waits on subscribers. A subscriber whose buffer is full
+    is dropped, so a slow client cannot hold up storing records.
+    """
+
+    def __init__(self,
+                 buffer_size=DEFAULT_BUFFER_SIZE,
+                 max_subscribers=DEFAULT_MAX_SUBSCRIBERS):
+        """Creates a new RecordPublisher instance.
+
+        Args:
+            buffer_size: Number of records that may wait for each subscriber.
+            max_subscribers: Maximum number of limited subscribers at once.
+        """
+        self._buffer_size = buffer_size
+        self._max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._subscriptions = []
+
+    def subscribe(self, limited=True):
+        """Subscribes to published records.
+
+        Args:
+            limited: Whether the subscription counts toward the maximum number
+                of subscribers. Subscribers within GreenPiThumb pass False so
+                that clients of the read API cannot lock them out.
+
+        Returns:
+            A Subscription that receives each record published from now on.
+            The caller must pass it to unsubscribe() when done.
+
+        Raises:
+            TooManySubscribersError if the subscription is limited and the
+            publisher has its maximum number of limited subscribers.
+        """
+        with self._lock:
+            limited_count = len([
+                subscription for subscription in self._subscriptions
+                if subscription._limited
+            ])
+            if limited and limited_count >= self._max_subscribers:
+                raise TooManySubscribersError(
+                    'Already serving %d subscribers' % limited_count)
+            subscription = Subscription(self._buffer_size, limited)
+            self._subscriptions.append(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription):
+        """Ends a subscription."""
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+        subscription._close()
+
+    def publish(self, record):
+        """Hands a record to every subscriber, dropping any that are full."""
+        if not self._subscriptions:
+            return
+        with self._lock:
+            full = [
+                subscription for subscription in self._subscriptions
+                if not subscription._offer(record)
+            ]
+            for subscription in full:
+                self._subscriptions.remove(subscription)
+        for subscription in full:
+            logger.warning('dropping live subscriber that fell behind')
+            _dropped_subscribers.inc()
+            subscription._close()
+
+    def close(self):
+        """Ends every subscription."""
+        with self._lock:
+            subscriptions = self._subscriptions
+            self._subscriptions = []
+        for subscription in subscriptions:
+            subscription._close()
@@ -0,0 +1,389 @@
+"""Simulated stand-ins for the GreenPiThumb's hardware.
+
+Lets the full GreenPiThumb pipeline run on an ordinary computer, for
+benchmarking and soak testing. The simulated devices share a simple model of a
+plant's environment, in which the soil dries out over time and gets wetter
+while the pump runs, and light, temperature and humidity follow the local time
+of day.
+
+Device latency is spent in real time, even when running on a simulated clock,
+because hardware reads happen while holding locks that simulated waits must
+not block on.
+"""
+
+import collections
+import logging
+import math
+import threading
+import time
+
+from PIL import Image
+from PIL import ImageDraw
+
+logger = logging.getLogger(__name__)
+
+# Maximum value the ADC can return.
+_ADC_MAX_VALUE = 1023
+# Soil moisture (in ADC counts) at the start of a simulation.
+_INITIAL_SOIL_MOISTURE = 700.0
+# Soil moisture (in ADC counts) of completely dry and completely saturated soil.
+_DRY_SOIL_MOISTURE = 250.0
+_SATURATED_SOIL_MOISTURE = 900.0
+# Rate at which soil dries out, in ADC counts per hour.
+_SOIL_DRYING_PER_HOUR = 0.4
+# Rate at which soil gets wetter while the pump runs, in ADC counts per second.
+_SOIL_WETTING_PER_SECOND = 25.0
+# Light level (as a percentage) at night, and at the peak of the day.
+_NIGHT_LIGHT_PCT = 5.0
+_PEAK_LIGHT_PCT = 90.0
+# Local hours of the day between which the sun is up.
+_SUNRISE_HOUR = 6.0
+_SUNSET_HOUR = 20.0
+# Average ambient temperature (in Celsius) and its daily variation.
+_MEAN_TEMPERATURE = 21.0
+_TEMPERATURE_VARIATION = 4.0
+# Average relative humidity (as a percentage) and its daily variation.
+_MEAN_HUMIDITY = 55.0
+_HUMIDITY_VARIATION = 10.0
+# Local hour of the day at which temperature peaks and humidity bottoms out.
+_WARMEST_HOUR = 15.0
+# Number of times to attempt a DHT11 read, matching Adafruit_DHT.read_retry.
+_DHT11_READ_ATTEMPTS = 15
+# Dimensions (in pixels) of images captured by the simulated camera.
+_IMAGE_SIZE = (1640, 1232)
+# Size of the plant in photos, as a fraction of the image height, at the start
+# of a simulation, and how much it grows each day.
+_INITIAL_PLANT_SIZE = 0.2
+_PLANT_GROWTH_PER_DAY = 0.01
+_MAX_PLANT_SIZE = 0.9
+_PLANT_COLOR = (40, 140, 40)
+# Number and color of the leaves drawn over the plant in each photo.
+_LEAF_COUNT = 6
+_LEAF_COLOR = (90, 200, 60)
+_SECONDS_PER_HOUR = 60 * 60
+_SECONDS_PER_DAY = 24 * _SECONDS_PER_HOUR
+
+# Settings that control how realistically the simulated devices behave.
+#
+# latency_seconds: Time each device operation takes.
+# noise: Standard deviation of noise added to sensor readings, as a fraction of
+#   each sensor's full-scale range.
+# failure_rate: Probability (between 0 and 1) that a device operation fails.
+Settings = collections.namedtuple('Settings',
+                                  ['latency_seconds', 'noise', 'failure_rate'])
+
+
+class Error(Exception):
+    pass
+
+
+class CameraError(Error):
+    pass
+
+
+def _clamp(value, minimum, maximum):
+    return max(minimum, min(maximum, value))
+
+
+class Garden(object):
+    """Models the environment measured by the simulated sensors.
+
+    This class is thread-safe.
+    """
+
+    def __init__(self, clock, local_clock):
+        """Creates a new Garden instance.
+
+        Args:
+            clock: A clock interface.
+            local_clock: A local clock interface, used to follow the time of
+                day.
+        """
+        self._clock = clock
+        self._local_clock = local_clock
+        self._lock = threading.Lock()
+        self._start_time = clock.monotonic()
+        self._soil_moisture = _INITIAL_SOIL_MOISTURE
+        self._soil_moisture_time = self._start_time
+        self._pump_running = False
+
+    def _update_soil_moisture(self):
+        """Updates soil moisture for the time since the last update.
+
+        Must be called while holding self._lock.
+        """
+        now = self._clock.monotonic()
+        elapsed_seconds = now - self._soil_moisture_time
+        self._soil_moisture_time = now
+        if self._pump_running:
+            self._soil_moisture += _SOIL_WETTING_PER_SECOND * elapsed_seconds
+        else:
+            self._soil_moisture -= (
+                _SOIL_DRYING_PER_HOUR * elapsed_seconds / _SECONDS_PER_HOUR)
+        self._soil_moisture = _clamp(self._soil_moisture, _DRY_SOIL_MOISTURE,
+                                     _SATURATED_SOIL_MOISTURE)
+
+    def set_pump_running(self, running):
+        """Starts or stops watering the soil."""
+        with self._lock:
+            self._update_soil_moisture()
+            if running != self._pump_running:
+                logger.info('simulated pump %s at soil moisture %.1f', 'started'
+                            if running else 'stopped', self._soil_moisture)
+            self._pump_running = running
+
+    def soil_moisture(self):
+        """Returns the soil moisture level, in ADC counts."""
+        with self._lock:
+            self._update_soil_moisture()
+            return self._soil_moisture
+
+    def _local_hour(self):
+        """Returns the local time of day, in fractional hours."""
+        now = self._local_clock.now()
+        return now.hour + (now.minute / 60.0) + (now.second / 3600.0)
+
+    def light(self):
+        """Returns the light level, as a percentage."""
+        hour = self._local_hour()
+        if not _SUNRISE_HOUR <= hour < _SUNSET_HOUR:
+            return _NIGHT_LIGHT_PCT
+        day_fraction = (hour - _SUNRISE_HOUR) / (_SUNSET_HOUR - _SUNRISE_HOUR)
+        return _NIGHT_LIGHT_PCT + ((_PEAK_LIGHT_PCT - _NIGHT_LIGHT_PCT) *
+                                   math.sin(math.pi * day_fraction))
+
+    def _daily_cycle(self):
+        """Returns a value between -1 and 1 that peaks at _WARMEST_HOUR."""
+        return math.cos(2 * math.pi *
+                        (self._local_hour() - _WARMEST_HOUR) / 24.0)
+
+    def temperature(self):
+        """Returns the ambient temperature, in Celsius."""
+        return _MEAN_TEMPERATURE + _TEMPERATURE_VARIATION * self._daily_cycle()
+
+    def humidity(self):
+        """Returns the relative humidity, as a percentage."""
+        return _MEAN_HUMIDITY - _HUMIDITY_VARIATION * self._daily_cycle()
+
+    def plant_size(self):
+        """Returns the size of the plant, as a fraction of the photo height."""
+        days = (self._clock.monotonic() - self._start_time) / _SECONDS_PER_DAY
+        return min(_MAX_PLANT_SIZE,
+                   _INITIAL_PLANT_SIZE + _PLANT_GROWTH_PER_DAY * days)
+
+
+class _Device(object):
+    """Base class for simulated devices."""
+
+    def __init__(self, garden, settings, random_generator):
+        """Creates a new simulated device.
+
+        Args:
+            garden: The Garden whose environment the device senses or affects.
+            settings: Settings that control the device's behavior.
+            random_generator: A random.Random instance to use for noise and
+                failures.
+        """
+        self._garden = garden
+        self._settings = settings
+        self._random = random_generator
+
+    def _operate(self):
+        """Spends the device's latency and decides whether the operation fails.
+
+        Returns:
+            True if the operation succeeds, False if it fails.
+        """
+        if self._settings.latency_seconds:
+            time.sleep(self._settings.latency_seconds)
+        return self._random.random() >= self._settings.failure_rate
+
+    def _add_noise(self, value, full_scale):
+        """Adds random noise to a reading.
+
+        Args:
+            value: The exact reading.
+            full_scale: The full-scale range of the sensor.
+
+        Returns:
+            The reading with noise.
+        """
+        if not self._settings.noise:
+            return value
+        return value + self._random.gauss(0, self._settings.noise * full_scale)
+
+
+class GPIO(object):
+    """Simulated RPi.GPIO module.
+
+    Turning on the pump pin runs the pump in the simulated garden.
+    """
+
+    BCM = 'BCM'
+    OUT = 'OUT'
+    HIGH = 1
+    LOW = 0
+
+    def __init__(self, garden, pump_pin):
+        """Creates a new simulated GPIO module.
+
+        Args:
+            garden: The Garden that the pump waters.
+            pump_pin: GPIO pin (in BCM numbering) to which the pump is
+                connected.
+        """
+        self._garden = garden
+        self._pump_pin = pump_pin
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pin, direction):
+        pass
+
+    def output(self, pin, value):
+        if pin == self._pump_pin:
+            self._garden.set_pump_running(value == self.HIGH)
+
+    def cleanup(self):
+        self._garden.set_pump_running(False)
+
+
+class MCP3008(_Device):
+    """Simulated MCP3008 analog to digital converter.
+
+    A failed read returns 0, as a loose connection would.
+    """
+
+    def __init__(self, garden, settings, random_generator, light_channel,
+                 soil_moisture_channel):
+        """Creates a new simulated MCP3008.
+
+        Args:
+            garden: The Garden whose light and soil moisture the ADC reads.
+            settings: Settings that control the device's behavior.
+            random_generator: A random.Random instance.
+            light_channel: ADC channel to which the light sensor is connected.
+            soil_moisture_channel: ADC channel to which the soil moisture sensor
+                is connected.
+        """
+        super(MCP3008, self).__init__(garden, settings, random_generator)
+        self._light_channel = light_channel
+        self._soil_moisture_channel = soil_moisture_channel
+
+    def read_adc(self, adc_number):
+        if not self._operate():
+            return 0
+        if adc_number == self._light_channel:
+            value = self._garden.light() * _ADC_MAX_VALUE / 100.0
+        elif adc_number == self._soil_moisture_channel:
+            value = self._garden.soil_moisture()
+        else:
+            value = 0
+        return int(
+            round(
+                _clamp(
+                    self._add_noise(value, _ADC_MAX_VALUE), 0, _ADC_MAX_VALUE)))
+
+
+class DHT11(_Device):
+    """Simulated DHT11 temperature and humidity sensor."""
+
+    def read_retry(self):
+        """Reads the sensor, retrying failed reads.
+
+        Returns:
+            A (humidity, temperature) tuple of whole numbers, as returned by
+            Adafruit_DHT.read_retry, or (None, None) if every attempt fails.
+        """
+        for _ in range(_DHT11_READ_ATTEMPTS):
+            if self._operate():
+                humidity = _clamp(
+                    self._add_noise(self._garden.humidity(), 100.0), 0, 100)
+                temperature = self._add_noise(self._garden.temperature(), 50.0)
+                return round(humidity), round(temperature)
+        return None, None
+
+
+class Camera(_Device):
+    """Simulated Raspberry Pi camera.
+
+    Captures images of a plant that grows over the course of the simulation,
+    lit according to the garden's light level.
+    """
+
+    def __init__(self, garden, settings, random_generator):
+        super(Camera, self).__init__(garden, settings, random_generator)
+        self.rotation = 0
+
+    def capture(self, output, format):
+        """Captures an image.
+
+        Args:
+            output: File-like object to which to write the image.
+            format: Image format. Only 'jpeg' is supported.
+
+        Raises:
+            CameraError: The simulated capture failed.
+        """
+        if not self._operate():
+            raise CameraError('simulated camera failure')
+        brightness = int(
+            _clamp(
+                self._add_noise(self._garden.light(), 100.0) * 255 / 100.0, 0,
+                255))
+        image = Image.new('RGB', _IMAGE_SIZE, (brightness,) * 3)
+        width, height = _IMAGE_SIZE
+        radius = self._garden.plant_size() * height / 2
+        draw = ImageDraw.Draw(image)
+        draw.ellipse(
+            (width / 2 - radius, height / 2 - radius, width / 2 + radius,
+             height / 2 + radius),
+            fill=_PLANT_COLOR)
+        # Leaves move between photos, so consecutive photos differ about as
+        # much as photos of a real plant.
+        leaf_radius = radius / 2
+        for _ in range(_LEAF_COUNT):
+            leaf_x = width / 2 + self._random.uniform(-2 * radius, 2 * radius)
+            leaf_y = height / 2 + self._random.uniform(-2 * radius, 2 * radius)
+            draw.ellipse(
+                (leaf_x - leaf_radius, leaf_y - leaf_radius,
+                 leaf_x + leaf_radius, leaf_y + leaf_radius),
+                fill=_LEAF_COLOR)
+        if self.rotation:
+            image = image.rotate(self.rotation)
+        image.save(output, format)
+
+    def close(self):
+        pass
+
+
+class Hardware(object):
+    """The full set of simulated GreenPiThumb hardware.
+
+    Attributes:
+        garden: The Garden shared by the simulated devices.
+        gpio: A simulated RPi.GPIO module.
+        mcp3008: A simulated MCP3008 ADC.
+        dht11: A simulated DHT11 sensor.
+        camera: A simulated camera.
+    """
+
+    def __init__(self, clock, local_clock, wiring_config, settings,
+                 random_generator):
+        """Creates a new set of simulated hardware.
+
+        Args:
+            clock: A clock interface.
+            local_clock: A local clock interface.
+            wiring_config: Wiring configuration for the GreenPiThumb.
+            settings: Settings that control the devices' behavior.
+            random_generator: A random.Random instance.
+        """
+        self.garden = Garden(clock, local_clock)
+        self.gpio = GPIO(self.garden, wiring_config.gpio_pins.pump)
+        self.mcp3008 = MCP3008(self.garden, settings, random_generator,
+                               wiring_config.adc_channels.light_sensor,
+                               wiring_config.adc_channels.soil_moisture_sensor)
+        self.dht11 = DHT11(self.garden, settings, random_generator)
+        self.camera = Camera(self.garden, settings, random_generator)
@@ -40,3 +40,29 @@ def parse(sleep_windows_raw):
         sleep_windows.append((sleep_time, wake_time))
 
     return sleep_windows
+
+
+def contains(sleep_windows, current_time):
+    """Checks whether a time of day falls within any of the sleep windows.
+
+    A sleep window runs from its sleep time (inclusive) to its wake time
+    (exclusive) and may wrap past midnight.
+
+    Args:
+        sleep_windows: A list of 2-tuples, each representing a sleep window.
+            Tuple items are datetime.time objects.
+        current_time: The datetime.time to check.
+
+    Returns:
+        True if current_time is within at least one of the sleep windows.
+    """
+    for sleep_time, wake_time in sleep_windows:
+        # Check if sleep window wraps midnight.
+        if wake_time < sleep_time:
+            if current_time >= sleep_time or current_time < wake_time:
+                return True
+        else:
+            if sleep_time <= current_time < wake_time:
+                return True
+
+    return False
@@ -0,0 +1,358 @@
+"""Keeps static JSON snapshots of recent data up to date for dashboards.
+
+Dashboards served as static files from the Pi read these snapshots instead of
+querying the database, so page loads cost no database work. Each snapshot is
+held in memory and updated from the records that GreenPiThumb stores, so
+keeping snapshots current costs work in proportion to the new records rather
+than to the history in the database.
+
+Snapshots, for each sensor (temperature, humidity, soil_moisture and light):
+    <sensor>-24h.json
+        Every reading from the last 24 hours.
+    <sensor>-7d.json, <sensor>-90d.json
+        The mean, minimum and maximum of the readings in each hour of the last
+        7 days and in each 6 hours of the last 90 days.
+And:
+    latest_image.json
+        Metadata of the most recent image.
+
+Records are formatted as in the read API.
+"""
+
+import bisect
+import calendar
+import collections
+import datetime
+import json
+import logging
+import os
+
+import pytz
+
+import db_store
+import read_api
+
+logger = logging.getLogger(__name__)
+
+# A span of time, ending now, that a snapshot covers.
+#  name: Name of the window in snapshot file names (e.g. '24h').
+#  duration: timedelta of the length of the window.
+#  step_seconds: Number of seconds that each summary bucket spans, or None to
+#    keep every reading.
+Window = collections.namedtuple('Window', ['name', 'duration', 'step_seconds'])
+
+DEFAULT_WINDOWS = [
+    Window('24h', datetime.timedelta(days=1), None),
+    Window('7d', datetime.timedelta(days=7), 60 * 60),
+    Window('90d', datetime.timedelta(days=90), 6 * 60 * 60),
+]
+
+# Store types for each sensor, keyed by the name used in snapshot file names.
+_SENSOR_STORES = {
+    'temperature': db_store.TemperatureStore,
+    'humidity': db_store.HumidityStore,
+    'soil_moisture': db_store.SoilMoistureStore,
+    'light': db_store.LightStore,
+}
+# Number of readings to read from the database at a time when loading a
+# snapshot.
+_LOAD_PAGE_SIZE = 1000
+# Time after which no record can have been stored.
+_LATEST_TIME = datetime.datetime(9999, 1, 1, tzinfo=pytz.utc)
+# Separators for compact JSON output.
+_JSON_SEPARATORS = (',', ':')
+
+
+def _to_epoch_seconds(timestamp):
+    return calendar.timegm(timestamp.utctimetuple())
+
+
+def _write_atomically(path, contents):
+    """Writes a file by renaming a temporary file over it.
+
+    Web servers reading the file see either the old or the new contents, never
+    a partially written file. The file is not synced to disk, as snapshots are
+    rebuilt at startup anyway.
+    """
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as temp_file:
+        temp_file.write(contents)
+    os.rename(temp_path, path)
+
+
+class _ReadingsSnapshot(object):
+    """Every reading of a sensor within a window."""
+
+    def __init__(self, sensor, window):
+        self.file_name = '%s-%s.json' % (sensor, window.name)
+        self._sensor = sensor
+        self._window = window
+        # Readings within the window in order of timestamp.
+        self._readings = []
+        self._start = None
+
+    def load(self, store, now):
+        """Reads the window's readings from the database."""
+        self._start = now - self._window.duration
+        self._readings = []
+        page_token = None
+        while True:
+            records, page_token = store.get_page(self._start, _LATEST_TIME,
+                                                 _LOAD_PAGE_SIZE, page_token)
+            self._readings.extend(records)
+            if not page_token:
+                break
+
+    def add(self, record):
+        """Adds a reading, returning True if it landed in the window.
+
+        Replaces any reading with the same timestamp, as the database does.
+        """
+        if record.timestamp < self._start:
+            return False
+        index = bisect.bisect_left(self._readings, (record.timestamp,))
+        if (index < len(self._readings) and
+                self._readings[index].timestamp == record.timestamp):
+            self._readings[index] = record
+        else:
+            self._readings.insert(index, record)
+        return True
+
+    def trim(self, now):
+        """Drops readings older than the window, returning True if any."""
+        self._start = now - self._window.duration
+        expired = bisect.bisect_left(self._readings, (self._start,))
+        del self._readings[:expired]
+        return expired > 0
+
+    def to_json(self):
+        return {
+            'sensor':
+            self._sensor,
+            'window':
+            self._window.name,
+            'readings':
+            [read_api.format_record(record) for record in self._readings],
+        }
+
+
+class _SummariesSnapshot(object):
+    """Summaries of a sensor's readings in fixed-size buckets within a window.
+
+    Buckets are aligned as in _ReadingStoreBase.get_summaries().
+    """
+
+    def __init__(self, sensor, window):
+        self.file_name = '%s-%s.json' % (sensor, window.name)
+        self._sensor = sensor
+        self._window = window
+        # Maps the start of each bucket (in seconds since the UNIX epoch) to a
+        # tuple of the total, minimum, maximum and count of its readings.
+        self._buckets = {}
+        self._first_bucket = None
+        # Store from which the snapshot was loaded.
+        self._store = None
+
+    def _bucket(self, timestamp):
+        step_seconds = self._window.step_seconds
+        return _to_epoch_seconds(timestamp) / step_seconds * step_seconds
+
+    def load(self, store, now):
+        """Reads summaries of the window's readings from the database."""
+        self._store = store
+        self._first_bucket = self._bucket(now - self._window.duration)
+        step_seconds = self._window.step_seconds
+        # The window spans at most one partial bucket at each end.
+        limit = (int(self._window.duration.total_seconds()) / step_seconds + 2)
+        summaries = store.get_summaries(
+            datetime.datetime.fromtimestamp(self._first_bucket, tz=pytz.utc),
+            _LATEST_TIME, step_seconds, limit)
+        self._buckets = {}
+        for summary in summaries:
+            self._set_bucket(summary)
+
+    def _set_bucket(self, summary):
+        self._buckets[_to_epoch_seconds(summary.timestamp)] = (
+            summary.mean * summary.count, summary.minimum, summary.maximum,
+            summary.count)
+
+    def add(self, record):
+        """Adds a reading, returning True if it landed in the window.
+
+        The reading may have replaced a stored reading with the same timestamp,
+        whose value the snapshot does not know, so rather than adding the
+        reading to its bucket, reads the bucket back from the database.
+        """
+        bucket = self._bucket(record.timestamp)
+        if bucket < self._first_bucket:
+            return False
+        step_seconds = self._window.step_seconds
+        summaries = self._store.get_summaries(
+            datetime.datetime.fromtimestamp(bucket, tz=pytz.utc),
+            datetime.datetime.fromtimestamp(bucket + step_seconds, tz=pytz.utc),
+            step_seconds, 1)
+        if summaries:
+            self._set_bucket(summaries[0])
+        else:
+            self._buckets.pop(bucket, None)
+        return True
+
+    def trim(self, now):
+        """Drops buckets older than the window, returning True if any."""
+        self._first_bucket = self._bucket(now - self._window.duration)
+        expired = [
+            bucket for bucket in self._buckets if bucket < self._first_bucket
+        ]
+        for bucket in expired:
+            del self._buckets[bucket]
+        return bool(expired)
+
+    def to_json(self):
+        summaries = []
+        for bucket, (total, minimum, maximum,
+                     count) in sorted(self._buckets.items()):
+            summaries.append(
+                read_api.format_record(
+                    db_store.ReadingSummary(
+                        datetime.datetime.fromtimestamp(bucket, tz=pytz.utc),
+                        float(total) / count, minimum, maximum, count)))
+        return {
+            'sensor': self._sensor,
+            'window': self._window.name,
+            'step': self._window.step_seconds,
+            'summaries': summaries,
+        }
+
+
+class _LatestImageSnapshot(object):
+    """Metadata of the most recent image."""
+
+    file_name = 'latest_image.json'
+
+    def __init__(self):
+        self._image = None
+
+    def load(self, store, unused_now):
+        self._image = store.get_latest()
+
+    def add(self, record):
+        """Adds an image, returning True if it is the most recent."""
+        if self._image and record.timestamp < self._image.timestamp:
+            return False
+        self._image = record
+        return True
+
+    def trim(self, unused_now):
+        return False
+
+    def to_json(self):
+        if not self._image:
+            return None
+        return read_api.format_record(self._image)
+
+
+class SnapshotWriter(object):
+    """Keeps snapshot files up to date with the records GreenPiThumb stores.
+
+    Snapshots are loaded from the database when the writer starts, and again
+    only if it falls too far behind the stored records to catch up. After
+    that, a snapshot file is rewritten only when new records land in its window
+    or old records age out of it.
+
+    Must be called from the same thread from which the database connection was
+    created, which must also be the thread that stores records.
+    """
+
+    def __init__(self,
+                 snapshot_dir,
+                 db_connection,
+                 publisher,
+                 utc_clock,
+                 windows=DEFAULT_WINDOWS):
+        """Creates a new SnapshotWriter instance.
+
+        Args:
+            snapshot_dir: Directory in which to write snapshot files.
+            db_connection: Database connection from which to load snapshots.
+            publisher: RecordPublisher that publishes each stored record.
+            utc_clock: A UTC clock interface.
+            windows: Windows for which to keep snapshots of each sensor.
+        """
+        if not os.path.exists(snapshot_dir):
+            os.makedirs(snapshot_dir)
+        self._snapshot_dir = snapshot_dir
+        self._db_connection = db_connection
+        self._publisher = publisher
+        self._utc_clock = utc_clock
+        self._subscription = None
+        # Snapshots that changed but could not be written, to retry on the
+        # next update.
+        self._unwritten = set()
+        # Maps each record type to a list of two-tuples of the store from which
+        # to load the record type's snapshots and a snapshot.
+        self._snapshots = collections.defaultdict(list)
+        for sensor, store_type in _SENSOR_STORES.items():
+            for window in windows:
+                if window.step_seconds:
+                    snapshot = _SummariesSnapshot(sensor, window)
+                else:
+                    snapshot = _ReadingsSnapshot(sensor, window)
+                self._snapshots[store_type._record_type].append((store_type,
+                                                                 snapshot))
+        self._snapshots[db_store.ImageRecord].append((db_store.ImageStore,
+                                                      _LatestImageSnapshot()))
+
+    def _all_snapshots(self):
+        for snapshots in self._snapshots.values():
+            for _, snapshot in snapshots:
+                yield snapshot
+
+    def _load(self, now):
+        """Loads every snapshot from the database and subscribes to records.
+
+        Records are only stored on this thread, so none can be stored between
+        loading and subscribing. The subscription does not count toward the
+        publisher's limit, so read API clients cannot keep snapshots from
+        loading.
+        """
+        logger.info('loading snapshots from the database')
+        for snapshots in self._snapshots.values():
+            for store_type, snapshot in snapshots:
+                snapshot.load(store_type(self._db_connection), now)
+        self._subscription = self._publisher.subscribe(limited=False)
+
+    def update(self):
+        """Applies newly stored records and rewrites the changed snapshots."""
+        now = self._utc_clock.now()
+        changed = self._unwritten
+        self._unwritten = set()
+        if not self._subscription or self._subscription.is_closed():
+            self._load(now)
+            changed.update(self._all_snapshots())
+        while True:
+            record = self._subscription.next_record(timeout=0)
+            if record is None:
+                break
+            for _, snapshot in self._snapshots.get(type(record), ()):
+                if snapshot.add(record):
+                    changed.add(snapshot)
+        for snapshot in self._all_snapshots():
+            if snapshot.trim(now):
+                changed.add(snapshot)
+        for snapshot in changed:
+            path = os.path.join(self._snapshot_dir, snapshot.file_name)
+            try:
+                _write_atomically(path,
+                                  json.dumps(
+                                      snapshot.to_json(),
+                                      sort_keys=True,
+                                      separators=_JSON_SEPARATORS))
+            except (IOError, OSError) as e:
+                logger.error('failed to write snapshot "%s": %s', path, e)
+                self._unwritten.add(snapshot)
+
+    def close(self):
+        """Stops receiving records."""
+        if self._subscription:
+            self._publisher.unsubscribe(self._subscription)
+            self._subscription = None
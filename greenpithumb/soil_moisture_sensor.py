@@ -1,5 +1,7 @@
 import logging
 
+import log_handlers
+
 logger = logging.getLogger(__name__)
 
 
@@ -32,7 +34,11 @@ class SoilMoistureSensor(object):
         try:
             self._pi_io.turn_pin_on(self._gpio_pin)
             moisture = self._adc.read_adc(self._channel)
-            logger.info('soil moisture reading = %d', moisture)
+            logger.info(
+                'soil moisture reading = %d',
+                moisture,
+                extra=log_handlers.hot_path(
+                    sensor='soil_moisture', value=moisture))
             return moisture
         finally:
             self._pi_io.turn_pin_off(self._gpio_pin)
@@ -0,0 +1,155 @@
+"""Saves poll schedules, the pump timer and retention progress between runs."""
+
+import collections
+import datetime
+import json
+import logging
+import os
+
+import pytz
+
+logger = logging.getLogger(__name__)
+
+# Version of the state file format. A file with a different version is ignored.
+_FORMAT_VERSION = 1
+# Format of timestamps in the state file (assumes timestamp is in UTC).
+_TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+# State of a running GreenPiThumb.
+#  last_poll_times: A dictionary of poller names to the UTC datetime of each
+#    poller's last completed poll.
+#  pump_deadline: UTC datetime at which the pump runs regardless of soil
+#    moisture, or None if unknown.
+#  retention_progress: A dictionary of image retention task names to the UTC
+#    datetime before which each task has examined every image.
+State = collections.namedtuple(
+    'State', ['last_poll_times', 'pump_deadline', 'retention_progress'])
+
+
+def _format_timestamp(timestamp):
+    if timestamp is None:
+        return None
+    return timestamp.astimezone(pytz.utc).strftime(_TIMESTAMP_FORMAT)
+
+
+def _parse_timestamp(timestamp):
+    if timestamp is None:
+        return None
+    return datetime.datetime.strptime(timestamp, _TIMESTAMP_FORMAT).replace(
+        tzinfo=pytz.utc)
+
+
+class StateFile(object):
+    """A JSON file holding GreenPiThumb's state between runs."""
+
+    def __init__(self, path):
+        """Creates a new StateFile instance.
+
+        Args:
+            path: Path to the state file.
+        """
+        self._path = path
+
+    def load(self):
+        """Loads the saved state.
+
+        Returns:
+            The saved State. If there is no saved state or the file cannot be
+            read, returns a State with no poll times, no pump deadline and no
+            retention progress.
+        """
+        empty_state = State(
+            last_poll_times={}, pump_deadline=None, retention_progress={})
+        if not os.path.exists(self._path):
+            logger.info('no saved state found at "%s"', self._path)
+            return empty_state
+        try:
+            with open(self._path) as state_file:
+                raw_state = json.load(state_file)
+            if raw_state.get('version') != _FORMAT_VERSION:
+                logger.warning('ignoring state file with unknown version: %s',
+                               raw_state.get('version'))
+                return empty_state
+            return State(
+                last_poll_times={
+                    name: _parse_timestamp(timestamp)
+                    for name, timestamp in raw_state['last_poll_times'].items()
+                },
+                pump_deadline=_parse_timestamp(raw_state['pump_deadline']),
+                # Files saved before retention progress was recorded lack it.
+                retention_progress={
+                    name: _parse_timestamp(timestamp)
+                    for name, timestamp in raw_state.get(
+                        'retention_progress', {}).items()
+                })
+        except (IOError, ValueError, KeyError, AttributeError, TypeError) as e:
+            logger.warning('ignoring unreadable state file "%s": %s',
+                           self._path, e)
+            return empty_state
+
+    def save(self, state):
+        """Saves state to the file.
+
+        Writes to a temporary file and renames it over the state file, so that
+        a crash or power loss leaves either the old or the new state, never a
+        partially written file.
+
+        Args:
+            state: The State to save.
+        """
+        raw_state = {
+            'version': _FORMAT_VERSION,
+            'last_poll_times': {
+                name: _format_timestamp(timestamp)
+                for name, timestamp in state.last_poll_times.items()
+            },
+            'pump_deadline': _format_timestamp(state.pump_deadline),
+            'retention_progress': {
+                name: _format_timestamp(timestamp)
+                for name, timestamp in state.retention_progress.items()
+            },
+        }
+        temp_path = self._path + '.tmp'
+        with open(temp_path, 'w') as temp_file:
+            json.dump(raw_state, temp_file, indent=2, sort_keys=True)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.rename(temp_path, self._path)
+
+
+class StateRecorder(object):
+    """Saves the state of schedulers, the pump timer and the retention job."""
+
+    def __init__(self, state_file, schedulers, pump_timer, retention_job):
+        """Creates a new StateRecorder instance.
+
+        Args:
+            state_file: StateFile to which to save state.
+            schedulers: A dictionary of poller names to their poll schedulers.
+            pump_timer: Timer that counts down until the next forced pump.
+            retention_job: RetentionJob whose progress to save.
+        """
+        self._state_file = state_file
+        self._schedulers = schedulers
+        self._pump_timer = pump_timer
+        self._retention_job = retention_job
+        self._saved_state = None
+
+    def save_if_changed(self):
+        """Saves the current state if it changed since the last save."""
+        state = State(
+            last_poll_times={
+                name: scheduler.last_completed_poll_time()
+                for name, scheduler in self._schedulers.items()
+                if scheduler.last_completed_poll_time()
+            },
+            pump_deadline=self._pump_timer.deadline(),
+            retention_progress=self._retention_job.progress())
+        if state == self._saved_state:
+            return
+        try:
+            self._state_file.save(state)
+        except (IOError, OSError) as e:
+            logger.error('failed to save state: %s', e)
+            return
+        self._saved_state = state
@@ -1,5 +1,7 @@
 import logging
 
+import log_handlers
+
 logger = logging.getLogger(__name__)
 
 
@@ -17,5 +19,9 @@ class TemperatureSensor(object):
     def temperature(self):
         """Returns ambient temperature in Celcius."""
         temperature = self._dht11.temperature()
-        logging.info('temperature reading = %.1f C', temperature)
+        logger.info(
+            'temperature reading = %.1f C',
+            temperature,
+            extra=log_handlers.hot_path(
+                sensor='temperature', value=temperature))
         return temperature
@@ -7,6 +7,7 @@ import mock
 import pytz
 
 from greenpithumb import camera_manager
+from greenpithumb import latest_readings
 
 
 class TestCameraManager(unittest.TestCase):
@@ -16,6 +17,12 @@ class TestCameraManager(unittest.TestCase):
         self.mock_local_clock = mock.Mock()
         self.mock_camera = mock.Mock()
         self.mock_light_sensor = mock.Mock()
+        self.mock_utc_clock = mock.Mock()
+        self.mock_utc_clock.now.return_value = datetime.datetime(
+            2016, 7, 23, 10, 50, 0, tzinfo=pytz.utc)
+        self.mock_utc_clock.monotonic.return_value = 1000.0
+        self.readings = latest_readings.LatestReadings(self.mock_utc_clock)
+        self.mock_image_processor = mock.Mock()
 
     @mock.patch.object(os.path, 'exists')
     @mock.patch.object(os, 'makedirs')
@@ -23,16 +30,23 @@ class TestCameraManager(unittest.TestCase):
         mock_exists.return_value = True
         self.mock_local_clock.now.return_value = datetime.datetime(
             2016, 7, 23, 10, 51, 9, 928000, tzinfo=pytz.utc)
+        self.mock_camera.capture.side_effect = (
+            lambda stream, format: stream.write('dummy JPEG data'))
         with contextlib.closing(
                 camera_manager.CameraManager(
                     self.image_path, self.mock_local_clock, self.mock_camera,
-                    self.mock_light_sensor)) as manager:
+                    self.mock_light_sensor, self.readings,
+                    self.mock_image_processor)) as manager:
             manager.save_photo()
-        self.mock_camera.capture.assert_called_once_with(
-            'C:/Users/Jeet/2016-07-23T1051Z.jpg')
+        self.assertEqual('jpeg',
+                         self.mock_camera.capture.call_args[1]['format'])
+        self.mock_image_processor.submit.assert_called_once_with(
+            datetime.datetime(2016, 7, 23, 10, 51, 9, 928000, tzinfo=pytz.utc),
+            '2016/07/23/2016-07-23T1051Z.jpg', 'dummy JPEG data')
         mock_exists.assert_called_once_with(self.image_path)
         mock_makedirs.assert_not_called()
         self.mock_camera.close.assert_called()
+        self.mock_image_processor.close.assert_called()
 
     @mock.patch.object(os.path, 'exists')
     @mock.patch.object(os, 'makedirs')
@@ -41,7 +55,8 @@ class TestCameraManager(unittest.TestCase):
         with contextlib.closing(
                 camera_manager.CameraManager(
                     self.image_path, self.mock_local_clock, self.mock_camera,
-                    self.mock_light_sensor)):
+                    self.mock_light_sensor, self.readings,
+                    self.mock_image_processor)):
             pass
         mock_exists.assert_called_once_with(self.image_path)
         mock_makedirs.assert_called_once_with(self.image_path)
@@ -54,7 +69,8 @@ class TestCameraManager(unittest.TestCase):
         with contextlib.closing(
                 camera_manager.CameraManager(
                     self.image_path, self.mock_local_clock, self.mock_camera,
-                    self.mock_light_sensor)) as manager:
+                    self.mock_light_sensor, self.readings,
+                    self.mock_image_processor)) as manager:
             self.assertFalse(manager.sufficient_light())
 
     @mock.patch.object(os.path, 'exists')
@@ -65,7 +81,8 @@ class TestCameraManager(unittest.TestCase):
         with contextlib.closing(
                 camera_manager.CameraManager(
                     self.image_path, self.mock_local_clock, self.mock_camera,
-                    self.mock_light_sensor)) as manager:
+                    self.mock_light_sensor, self.readings,
+                    self.mock_image_processor)) as manager:
             self.assertTrue(manager.sufficient_light())
 
     @mock.patch.object(os.path, 'exists')
@@ -76,5 +93,41 @@ class TestCameraManager(unittest.TestCase):
         with contextlib.closing(
                 camera_manager.CameraManager(
                     self.image_path, self.mock_local_clock, self.mock_camera,
-                    self.mock_light_sensor)) as manager:
+                    self.mock_light_sensor, self.readings,
+                    self.mock_image_processor)) as manager:
             self.assertTrue(manager.sufficient_light())
+
+    @mock.patch.object(os.path, 'exists')
+    @mock.patch.object(os, 'makedirs')
+    def test_sufficient_light_reuses_recent_reading(self, mock_makedirs,
+                                                    mock_exists):
+        self.readings.publish(latest_readings.LIGHT,
+                              camera_manager.LIGHT_THRESHOLD_PCT + 1)
+        self.mock_utc_clock.monotonic.return_value += 5
+        self.mock_light_sensor.light.return_value = (
+            camera_manager.LIGHT_THRESHOLD_PCT - 1)
+        with contextlib.closing(
+                camera_manager.CameraManager(
+                    self.image_path, self.mock_local_clock, self.mock_camera,
+                    self.mock_light_sensor, self.readings,
+                    self.mock_image_processor)) as manager:
+            self.assertTrue(manager.sufficient_light())
+        self.mock_light_sensor.light.assert_not_called()
+
+    @mock.patch.object(os.path, 'exists')
+    @mock.patch.object(os, 'makedirs')
+    def test_sufficient_light_reads_sensor_if_reading_is_stale(
+            self, mock_makedirs, mock_exists):
+        self.readings.publish(latest_readings.LIGHT,
+                              camera_manager.LIGHT_THRESHOLD_PCT + 1)
+        self.mock_utc_clock.monotonic.return_value += 15 * 60
+        self.mock_light_sensor.light.return_value = (
+            camera_manager.LIGHT_THRESHOLD_PCT - 1)
+        with contextlib.closing(
+                camera_manager.CameraManager(
+                    self.image_path, self.mock_local_clock, self.mock_camera,
+                    self.mock_light_sensor, self.readings,
+                    self.mock_image_processor)) as manager:
+            self.assertFalse(manager.sufficient_light())
+        self.assertEqual(camera_manager.LIGHT_THRESHOLD_PCT - 1,
+                         self.readings.latest(latest_readings.LIGHT).value)
@@ -1,4 +1,5 @@
 import datetime
+import threading
 import time
 import unittest
 
@@ -7,6 +8,9 @@ import pytz
 
 from greenpithumb import clock
 
+SECONDS_PER_DAY = 24 * 60 * 60
+TEST_TIMEOUT_SECONDS = 0.5
+
 
 class ClockTest(unittest.TestCase):
 
@@ -33,105 +37,243 @@ class ClockTest(unittest.TestCase):
         """now() should always return a tz-aware datetime."""
         self.assertIsNotNone(self.clock.now().tzinfo)
 
+    @mock.patch.object(time, 'time')
+    def test_now_unix_returns_whole_seconds(self, mock_time):
+        mock_time.return_value = 1491738209.928
+        self.assertEqual(1491738209, self.clock.now_unix())
+
+    def test_monotonic_does_not_go_backwards(self):
+        first = self.clock.monotonic()
+        self.assertGreaterEqual(self.clock.monotonic(), first)
+
+
+class LocalClockTest(unittest.TestCase):
+
+    @mock.patch.object(clock.tzlocal, 'get_localzone')
+    def test_now_uses_timezone_resolved_at_creation(self, mock_get_localzone):
+        mock_get_localzone.return_value = pytz.timezone('America/New_York')
+        local_clock = clock.LocalClock()
+        local_clock.now()
+        local_clock.now()
+        mock_get_localzone.assert_called_once()
+        self.assertEqual('America/New_York', local_clock.now().tzinfo.zone)
+
+    @mock.patch.object(clock.tzlocal, 'reload_localzone')
+    @mock.patch.object(clock.tzlocal, 'get_localzone')
+    def test_refresh_timezone_picks_up_new_timezone(self, mock_get_localzone,
+                                                    mock_reload_localzone):
+        mock_get_localzone.return_value = pytz.timezone('America/New_York')
+        mock_reload_localzone.return_value = pytz.timezone('Europe/London')
+        local_clock = clock.LocalClock()
+        local_clock.refresh_timezone()
+        self.assertEqual('Europe/London', local_clock.now().tzinfo.zone)
+
 
 class TimerTest(unittest.TestCase):
 
     def setUp(self):
         self.mock_clock = mock.Mock()
+        self.mock_clock.now.return_value = datetime.datetime(
+            2017, 4, 9, 12, 0, 0, tzinfo=pytz.utc)
 
     def test_timer_duration_exceeded(self):
         duration = datetime.timedelta(hours=3 * 24)
-        self.mock_clock.now.side_effect = [
-            datetime.datetime(
-                2000, 1, 1, 0, 0, 0, 0, tzinfo=pytz.utc),
-            datetime.datetime(
-                2000, 1, 5, 0, 0, 0, 0, tzinfo=pytz.utc)
-        ]  # yapf: disable
+        self.mock_clock.monotonic.side_effect = [0.0, 4 * SECONDS_PER_DAY]
         self.assertTrue(clock.Timer(self.mock_clock, duration).expired())
 
     def test_timer_duration_matched(self):
         duration = datetime.timedelta(hours=3 * 24)
-        self.mock_clock.now.side_effect = [
-            datetime.datetime(
-                2000, 1, 1, 0, 0, 0, 0, tzinfo=pytz.utc),
-            datetime.datetime(
-                2000, 1, 4, 0, 0, 0, 0, tzinfo=pytz.utc)
-        ]  # yapf: disable
+        self.mock_clock.monotonic.side_effect = [0.0, 3 * SECONDS_PER_DAY]
         self.assertTrue(clock.Timer(self.mock_clock, duration).expired())
 
     def test_timer_duration_not_matched_or_exceeded(self):
         duration = datetime.timedelta(hours=3 * 24)
-        self.mock_clock.now.side_effect = [
-            datetime.datetime(
-                2000, 1, 1, 0, 0, 0, 0, tzinfo=pytz.utc),
-            datetime.datetime(
-                2000, 1, 3, 0, 0, 0, 0, tzinfo=pytz.utc)
-        ]  # yapf: disable
+        self.mock_clock.monotonic.side_effect = [0.0, 2 * SECONDS_PER_DAY]
         self.assertFalse(clock.Timer(self.mock_clock, duration).expired())
 
     def test_set_remaining_fails_when_remaining_is_longer_than_duration(self):
         duration = datetime.timedelta(days=3)
-        self.mock_clock.now.return_value = datetime.datetime(
-            2000, 1, 1, 0, 0, 0, 0, tzinfo=pytz.utc)
+        self.mock_clock.monotonic.return_value = 0.0
         timer = clock.Timer(self.mock_clock, duration)
         with self.assertRaises(ValueError):
             timer.set_remaining(datetime.timedelta(days=4))
 
     def test_set_remaining_fails_when_remaining_is_negative(self):
         duration = datetime.timedelta(days=3)
-        self.mock_clock.now.return_value = datetime.datetime(
-            2000, 1, 1, 0, 0, 0, 0, tzinfo=pytz.utc)
+        self.mock_clock.monotonic.return_value = 0.0
         timer = clock.Timer(self.mock_clock, duration)
         with self.assertRaises(ValueError):
             timer.set_remaining(datetime.timedelta(days=-1))
 
     def test_set_remaining_succeeds_when_remaining_is_zero(self):
         duration = datetime.timedelta(days=3)
-        self.mock_clock.now.return_value = datetime.datetime(
-            2000, 1, 1, 0, 0, 0, 0, tzinfo=pytz.utc)
+        self.mock_clock.monotonic.return_value = 0.0
         timer = clock.Timer(self.mock_clock, duration)
         timer.set_remaining(datetime.timedelta(seconds=0))
         self.assertTrue(timer.expired())
 
     def test_set_remaining_succeeds_when_remaining_equals_duration(self):
         duration = datetime.timedelta(days=3)
-        self.mock_clock.now.return_value = datetime.datetime(
-            2000, 1, 1, 0, 0, 0, 0, tzinfo=pytz.utc)
+        self.mock_clock.monotonic.return_value = 0.0
         timer = clock.Timer(self.mock_clock, duration)
         timer.set_remaining(datetime.timedelta(days=3))
-        self.mock_clock.now.return_value = datetime.datetime(
-            2000, 1, 3, 23, 59, 59, 999999, tzinfo=pytz.utc)
+        self.mock_clock.monotonic.return_value = 3 * SECONDS_PER_DAY - 0.001
         self.assertFalse(timer.expired())
-        self.mock_clock.now.return_value = datetime.datetime(
-            2000, 1, 4, 0, 0, 0, 0, tzinfo=pytz.utc)
+        self.mock_clock.monotonic.return_value = 3 * SECONDS_PER_DAY
         self.assertTrue(timer.expired())
 
     def test_set_remaining_succeeds_when_remaining_is_less_than_duration(self):
         duration = datetime.timedelta(days=3)
-        self.mock_clock.now.return_value = datetime.datetime(
-            2000, 1, 1, 0, 0, 0, 0, tzinfo=pytz.utc)
+        self.mock_clock.monotonic.return_value = 0.0
         timer = clock.Timer(self.mock_clock, duration)
         timer.set_remaining(datetime.timedelta(days=1))
-        self.mock_clock.now.return_value = datetime.datetime(
-            2000, 1, 1, 23, 59, 59, 999999, tzinfo=pytz.utc)
+        self.mock_clock.monotonic.return_value = SECONDS_PER_DAY - 0.001
         self.assertFalse(timer.expired())
-        self.mock_clock.now.return_value = datetime.datetime(
-            2000, 1, 2, 0, 0, 0, 0, tzinfo=pytz.utc)
+        self.mock_clock.monotonic.return_value = SECONDS_PER_DAY
         self.assertTrue(timer.expired())
 
     def test_reset(self):
         duration = datetime.timedelta(hours=3 * 24)
-        self.mock_clock.now.return_value = datetime.datetime(
-            2000, 1, 1, 0, 0, 0, 0, tzinfo=pytz.utc)
+        self.mock_clock.monotonic.return_value = 0.0
         timer = clock.Timer(self.mock_clock, duration)
-        self.mock_clock.now.return_value = datetime.datetime(
-            2000, 1, 2, 0, 0, 0, 0, tzinfo=pytz.utc)
+        self.mock_clock.monotonic.return_value = SECONDS_PER_DAY
         timer.reset()
-        self.mock_clock.now.return_value = datetime.datetime(
-            2000, 1, 4, 23, 59, 59, 999999, tzinfo=pytz.utc)
-        # First expired call is one microsecond before when the timer should
+        self.mock_clock.monotonic.return_value = 4 * SECONDS_PER_DAY - 0.001
+        # First expired call is one millisecond before when the timer should
         # expire, second is right when it should expire.
         self.assertFalse(timer.expired())
+        self.mock_clock.monotonic.return_value = 4 * SECONDS_PER_DAY
+        self.assertTrue(timer.expired())
+
+    def test_deadline_is_set_when_countdown_is_set(self):
+        duration = datetime.timedelta(days=3)
+        self.mock_clock.monotonic.return_value = 0.0
+        timer = clock.Timer(self.mock_clock, duration)
+        self.assertEqual(
+            datetime.datetime(2017, 4, 12, 12, 0, 0, tzinfo=pytz.utc),
+            timer.deadline())
+        timer.set_remaining(datetime.timedelta(days=1))
+        self.assertEqual(
+            datetime.datetime(2017, 4, 10, 12, 0, 0, tzinfo=pytz.utc),
+            timer.deadline())
+        # Deadline stays fixed as time passes.
         self.mock_clock.now.return_value = datetime.datetime(
-            2000, 1, 5, 0, 0, 0, 0, tzinfo=pytz.utc)
+            2017, 4, 9, 13, 0, 0, tzinfo=pytz.utc)
+        self.assertEqual(
+            datetime.datetime(2017, 4, 10, 12, 0, 0, tzinfo=pytz.utc),
+            timer.deadline())
+
+    def test_wall_clock_changes_do_not_affect_timer(self):
+        duration = datetime.timedelta(hours=1)
+        self.mock_clock.monotonic.return_value = 0.0
+        self.mock_clock.now.return_value = datetime.datetime(
+            1970, 1, 1, 0, 0, 0, 0, tzinfo=pytz.utc)
+        timer = clock.Timer(self.mock_clock, duration)
+        # NTP sync moves the wall clock forward by decades.
+        self.mock_clock.now.return_value = datetime.datetime(
+            2017, 4, 9, 11, 43, 29, tzinfo=pytz.utc)
+        self.mock_clock.monotonic.return_value = 60.0
+        self.assertFalse(timer.expired())
+
+
+class SimulatedClockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.start_time = datetime.datetime(
+            2017, 4, 9, 11, 43, 29, tzinfo=pytz.utc)
+        self.clock = clock.SimulatedClock(self.start_time)
+
+    def run_in_thread(self, target):
+        thread = threading.Thread(target=target)
+        thread.setDaemon(True)
+        thread.start()
+        return thread
+
+    def test_starts_at_start_time(self):
+        self.assertEqual(self.start_time, self.clock.now())
+        self.assertEqual(1491738209, self.clock.now_unix())
+        self.assertEqual(0.0, self.clock.monotonic())
+
+    def test_wait_advances_virtual_time(self):
+        self.clock.set_participant_count(1)
+        self.clock.wait(3 * SECONDS_PER_DAY)
+        self.assertEqual(
+            self.start_time + datetime.timedelta(days=3), self.clock.now())
+        self.assertEqual(3 * SECONDS_PER_DAY, self.clock.monotonic())
+
+    def test_negative_wait_raises_ValueError(self):
+        with self.assertRaises(ValueError):
+            self.clock.wait(-1.0)
+
+    def test_threads_wake_in_order_of_virtual_time(self):
+        self.clock.set_participant_count(2)
+        wake_events = []
+        wake_lock = threading.Lock()
+
+        def waiter(name, wait_seconds, count):
+            for _ in range(count):
+                self.clock.wait(wait_seconds)
+                with wake_lock:
+                    wake_events.append((self.clock.monotonic(), name))
+
+        threads = [
+            self.run_in_thread(lambda: waiter('fast', 10, 6)),
+            self.run_in_thread(lambda: waiter('slow', 25, 2)),
+        ]
+        for thread in threads:
+            thread.join(TEST_TIMEOUT_SECONDS)
+            self.assertFalse(thread.is_alive())
+
+        self.assertEqual([(10.0, 'fast'), (20.0, 'fast'), (25.0, 'slow'),
+                          (30.0, 'fast'), (40.0, 'fast'), (50.0, 'fast'),
+                          (50.0, 'slow'), (60.0, 'fast')], sorted(wake_events))
+
+    def test_time_does_not_advance_until_all_participants_wait(self):
+        self.clock.set_participant_count(2)
+        thread = self.run_in_thread(lambda: self.clock.wait(10))
+        thread.join(TEST_TIMEOUT_SECONDS)
+        # The second participant has not started yet, so time stands still.
+        self.assertTrue(thread.is_alive())
+        self.assertEqual(0.0, self.clock.monotonic())
+
+        self.clock.wait(60)
+        thread.join(TEST_TIMEOUT_SECONDS)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(60.0, self.clock.monotonic())
+
+    def test_leave_lets_other_participants_continue(self):
+        self.clock.set_participant_count(2)
+        self.clock.wait(0)
+        thread = self.run_in_thread(lambda: self.clock.wait(10))
+        self.clock.leave()
+        thread.join(TEST_TIMEOUT_SECONDS)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(10.0, self.clock.monotonic())
+
+    def test_exited_participant_does_not_block_others(self):
+        self.clock.set_participant_count(2)
+        short_lived = self.run_in_thread(lambda: self.clock.wait(10))
+        self.clock.wait(60)
+        short_lived.join(TEST_TIMEOUT_SECONDS)
+        self.assertFalse(short_lived.is_alive())
+        self.assertEqual(60.0, self.clock.monotonic())
+
+    def test_runs_timer_on_virtual_time(self):
+        self.clock.set_participant_count(1)
+        timer = clock.Timer(self.clock, datetime.timedelta(days=7))
+        self.clock.wait(7 * SECONDS_PER_DAY - 1)
+        self.assertFalse(timer.expired())
+        self.clock.wait(1)
         self.assertTrue(timer.expired())
+
+    @mock.patch.object(clock.tzlocal, 'get_localzone')
+    def test_local_view_shares_virtual_time(self, mock_get_localzone):
+        mock_get_localzone.return_value = pytz.timezone('America/New_York')
+        local_clock = clock.SimulatedLocalClock(self.clock)
+        self.clock.set_participant_count(1)
+        local_clock.wait(60)
+        self.assertEqual(60.0, self.clock.monotonic())
+        self.assertEqual(
+            datetime.datetime(2017, 4, 9, 7, 44, 29),
+            local_clock.now().replace(tzinfo=None))
+        self.assertEqual('America/New_York', local_clock.now().tzinfo.zone)
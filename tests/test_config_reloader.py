@@ -0,0 +1,149 @@
+import datetime
+import unittest
+
+import mock
+
+from greenpithumb import config_reloader
+from greenpithumb import poller
+from greenpithumb import sleep_windows
+from greenpithumb import wiring_config_parser
+
+WIRING_CONFIG = """
+[gpio_pins]
+pump: 26
+dht11: 21
+soil_moisture: 16
+mcp3008_clk: 18
+mcp3008_dout: 23
+mcp3008_din: 24
+mcp3008_cs_shdn: 25
+
+[adc_channels]
+soil_moisture_sensor: 7
+light_sensor: 0
+"""
+SLEEP_WINDOWS = [(datetime.time(23, 0), datetime.time(7, 0))]
+
+
+def _make_settings():
+    return config_reloader.Settings(
+        moisture_threshold=500,
+        sleep_windows=SLEEP_WINDOWS,
+        poll_interval=datetime.timedelta(minutes=15),
+        photo_interval=datetime.timedelta(hours=4),
+        wiring_config=wiring_config_parser.parse(WIRING_CONFIG))
+
+
+class ConfigReloaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.settings = _make_settings()
+        self.mock_load_settings = mock.Mock()
+        self.mock_pump_manager = mock.Mock()
+        self.mock_pump_scheduler = mock.Mock()
+        self.mock_water_pump = mock.Mock()
+        self.mock_retention_job = mock.Mock()
+        self.mock_sensor_scheduler = mock.Mock()
+        self.mock_camera_scheduler = mock.Mock()
+        self.mock_record_processor = mock.Mock()
+        self.reloader = config_reloader.ConfigReloader(
+            self.mock_load_settings, self.settings, self.mock_pump_manager,
+            self.mock_pump_scheduler, self.mock_water_pump,
+            self.mock_retention_job, {
+                poller.TEMPERATURE_POLLER: self.mock_sensor_scheduler,
+                poller.CAMERA_POLLER: self.mock_camera_scheduler,
+            }, self.mock_record_processor)
+
+    def assert_nothing_changed(self):
+        self.mock_pump_manager.set_moisture_threshold.assert_not_called()
+        self.mock_pump_scheduler.set_sleep_windows.assert_not_called()
+        self.mock_retention_job.set_sleep_windows.assert_not_called()
+        self.mock_sensor_scheduler.set_poll_interval.assert_not_called()
+        self.mock_camera_scheduler.set_poll_interval.assert_not_called()
+        self.mock_record_processor.set_poll_interval.assert_not_called()
+        self.mock_water_pump.set_pin.assert_not_called()
+
+    def test_does_nothing_until_reload_requested(self):
+        self.assertFalse(self.reloader.reload_if_requested())
+        self.mock_load_settings.assert_not_called()
+
+    def test_reloads_once_per_request(self):
+        self.mock_load_settings.return_value = self.settings
+        self.reloader.request_reload()
+        self.assertTrue(self.reloader.reload_if_requested())
+        self.assertFalse(self.reloader.reload_if_requested())
+        self.mock_load_settings.assert_called_once()
+
+    def test_unchanged_settings_change_nothing(self):
+        self.mock_load_settings.return_value = _make_settings()
+        self.reloader.request_reload()
+        self.assertTrue(self.reloader.reload_if_requested())
+        self.assert_nothing_changed()
+
+    def test_applies_changed_settings(self):
+        new_sleep_windows = [(datetime.time(22, 0), datetime.time(6, 0))]
+        self.mock_load_settings.return_value = self.settings._replace(
+            moisture_threshold=600,
+            sleep_windows=new_sleep_windows,
+            poll_interval=datetime.timedelta(minutes=5),
+            photo_interval=datetime.timedelta(hours=1),
+            wiring_config=wiring_config_parser.parse(
+                WIRING_CONFIG.replace('pump: 26', 'pump: 13')))
+        self.reloader.request_reload()
+        self.assertTrue(self.reloader.reload_if_requested())
+        self.mock_pump_manager.set_moisture_threshold.assert_called_once_with(
+            600)
+        self.mock_pump_scheduler.set_sleep_windows.assert_called_once_with(
+            new_sleep_windows)
+        self.mock_retention_job.set_sleep_windows.assert_called_once_with(
+            new_sleep_windows)
+        self.mock_sensor_scheduler.set_poll_interval.assert_called_once_with(
+            datetime.timedelta(minutes=5))
+        self.mock_camera_scheduler.set_poll_interval.assert_called_once_with(
+            datetime.timedelta(hours=1))
+        self.mock_record_processor.set_poll_interval.assert_called_once_with(
+            datetime.timedelta(minutes=5))
+        self.mock_water_pump.set_pin.assert_called_once_with(13)
+
+    def test_only_applies_settings_that_changed_since_last_reload(self):
+        self.mock_load_settings.return_value = self.settings._replace(
+            moisture_threshold=600)
+        self.reloader.request_reload()
+        self.reloader.reload_if_requested()
+        self.reloader.request_reload()
+        self.reloader.reload_if_requested()
+        self.mock_pump_manager.set_moisture_threshold.assert_called_once_with(
+            600)
+
+    def test_keeps_settings_when_moisture_threshold_is_invalid(self):
+        self.mock_load_settings.return_value = self.settings._replace(
+            moisture_threshold=2000,
+            poll_interval=datetime.timedelta(minutes=5))
+        self.reloader.request_reload()
+        self.assertFalse(self.reloader.reload_if_requested())
+        self.assert_nothing_changed()
+
+    def test_keeps_settings_when_poll_interval_is_too_short(self):
+        self.mock_load_settings.return_value = self.settings._replace(
+            moisture_threshold=600, photo_interval=datetime.timedelta(0))
+        self.reloader.request_reload()
+        self.assertFalse(self.reloader.reload_if_requested())
+        self.assert_nothing_changed()
+
+    def test_keeps_settings_when_loading_fails(self):
+        for error in (IOError('missing config file'),
+                      sleep_windows.InvalidWindowFormatError('bad window'),
+                      wiring_config_parser.InvalidConfigError('bad config'),
+                      config_reloader.InvalidSettingsError('bad arguments')):
+            self.mock_load_settings.side_effect = error
+            self.reloader.request_reload()
+            self.assertFalse(self.reloader.reload_if_requested())
+        self.assert_nothing_changed()
+
+    def test_ignores_changes_to_wiring_other_than_pump_pin(self):
+        self.mock_load_settings.return_value = self.settings._replace(
+            wiring_config=wiring_config_parser.parse(
+                WIRING_CONFIG.replace('dht11: 21', 'dht11: 20')))
+        self.reloader.request_reload()
+        self.assertTrue(self.reloader.reload_if_requested())
+        self.assert_nothing_changed()
@@ -8,6 +8,7 @@ import unittest
 
 import mock
 from dateutil import tz
+import numpy
 import pytz
 
 from greenpithumb import db_store
@@ -28,15 +29,95 @@ class OpenOrCreateTest(unittest.TestCase):
     def test_does_not_initialize_existing_db_file(self, mock_connect):
         mock_connection = mock.Mock()
         mock_connect.return_value = mock_connection
+        mock_cursor = mock.Mock()
+        mock_connection.cursor.return_value = mock_cursor
+        mock_cursor.fetchone.return_value = (
+            len(db_store._SCHEMA_UPGRADE_COMMANDS),)
         # Simulate an existing database file
         with tempfile.NamedTemporaryFile() as temp_file:
             with contextlib.closing(db_store.open_or_create_db(temp_file.name)):
                 mock_connect.assert_called_once_with(temp_file.name)
-        # If the database already existed, we should not do anything except
-        # call sqlite3.connect().
-        mock_connection.cursor.assert_not_called()
+        # If the database already existed with the latest schema, we should not
+        # do anything except call sqlite3.connect() and check the schema
+        # version.
+        mock_cursor.execute.assert_called_once_with('PRAGMA user_version')
+        mock_cursor.executescript.assert_not_called()
         mock_connection.commit.assert_not_called()
 
+    def test_upgrades_existing_db_with_original_schema(self):
+        db_path = os.path.join(self._temp_dir, 'test.db')
+        # Create a database with only the original GreenPiThumb tables.
+        with contextlib.closing(sqlite3.connect(db_path)) as connection:
+            for sql_command in db_store._CREATE_TABLE_COMMANDS.split(';\n'):
+                connection.execute(sql_command)
+            connection.execute('INSERT INTO light VALUES (?, ?)',
+                               ('2016-07-23T10:51Z', 75.2))
+            connection.commit()
+        with contextlib.closing(
+                db_store.open_or_create_db(db_path)) as connection:
+            # Existing data should be preserved.
+            self.assertEqual(
+                [('2016-07-23T10:51Z', 75.2)],
+                connection.execute('SELECT * FROM light').fetchall())
+            # Tables added in later schema versions should be usable.
+            connection.execute(
+                'INSERT INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                ('2016-07-23T10:51Z', '2016/07/23/2016-07-23T1051Z.jpg',
+                 '2016/07/23/2016-07-23T1051Z-thumb.jpg',
+                 '2016/07/23/2016-07-23T1051Z-web.jpg', 3280, 2464, 2500000,
+                 62.5))
+            self.assertEqual(
+                len(db_store._SCHEMA_UPGRADE_COMMANDS),
+                connection.execute('PRAGMA user_version').fetchone()[0])
+
+    def test_failed_upgrade_step_keeps_earlier_steps_and_their_version(self):
+        db_path = os.path.join(self._temp_dir, 'test.db')
+        db_store.open_or_create_db(db_path).close()
+        latest_version = len(db_store._SCHEMA_UPGRADE_COMMANDS)
+        upgrade_commands = db_store._SCHEMA_UPGRADE_COMMANDS + [
+            'CREATE TABLE applied (value INTEGER);',
+            'CREATE TABLE not_applied (value INTEGER);\n'
+            'SELECT no_such_function(1);',
+        ]
+        with mock.patch.object(db_store, '_SCHEMA_UPGRADE_COMMANDS',
+                               upgrade_commands):
+            with self.assertRaises(sqlite3.OperationalError):
+                db_store.open_or_create_db(db_path)
+        with contextlib.closing(sqlite3.connect(db_path)) as connection:
+            self.assertEqual(
+                latest_version + 1,
+                connection.execute('PRAGMA user_version').fetchone()[0])
+            self.assertEqual([('applied',)],
+                             connection.execute(
+                                 'SELECT name FROM sqlite_master WHERE name '
+                                 'IN ("applied", "not_applied")').fetchall())
+        # The next start resumes from the failed step instead of replaying the
+        # steps that already applied.
+        with mock.patch.object(db_store, '_SCHEMA_UPGRADE_COMMANDS',
+                               upgrade_commands[:-1]):
+            db_store.open_or_create_db(db_path).close()
+
+    def test_upgrade_keeps_last_of_readings_with_same_timestamp(self):
+        db_path = os.path.join(self._temp_dir, 'test.db')
+        with contextlib.closing(sqlite3.connect(db_path)) as connection:
+            for sql_command in db_store._CREATE_TABLE_COMMANDS.split(';\n'):
+                connection.execute(sql_command)
+            connection.executemany('INSERT INTO light VALUES (?, ?)', [
+                ('2016-07-23T10:51Z', 75.2),
+                ('2016-07-23T10:52Z', 80.0),
+                ('2016-07-23T10:51Z', 76.0),
+            ])
+            connection.commit()
+        with contextlib.closing(
+                db_store.open_or_create_db(db_path)) as connection:
+            self.assertEqual(
+                [('2016-07-23T10:51Z', 76.0), ('2016-07-23T10:52Z', 80.0)],
+                connection.execute(
+                    'SELECT * FROM light ORDER BY timestamp').fetchall())
+            with self.assertRaises(sqlite3.IntegrityError):
+                connection.execute('INSERT INTO light VALUES (?, ?)',
+                                   ('2016-07-23T10:52Z', 81.0))
+
     def test_creates_file_and_tables_when_db_does_not_already_exist(self):
         # Create a path for a file that does not already exist.
         db_path = os.path.join(self._temp_dir, 'test.db')
@@ -54,6 +135,12 @@ class OpenOrCreateTest(unittest.TestCase):
                            ('2016-07-23T10:51Z', 75.2))
             cursor.execute('INSERT INTO watering_events VALUES (?, ?)',
                            ('2016-07-23T10:51Z', 258.9))
+            cursor.execute(
+                'INSERT INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                ('2016-07-23T10:51Z', '2016/07/23/2016-07-23T1051Z.jpg',
+                 '2016/07/23/2016-07-23T1051Z-thumb.jpg',
+                 '2016/07/23/2016-07-23T1051Z-web.jpg', 3280, 2464, 2500000,
+                 62.5))
             connection.commit()
 
 
@@ -73,8 +160,8 @@ class StoreClassesTest(unittest.TestCase):
         store = db_store.SoilMoistureStore(self.mock_connection)
         store.insert(record)
         self.mock_cursor.execute.assert_called_once_with(
-            'INSERT INTO soil_moisture VALUES (?, ?)', ('2016-07-23T10:51Z',
-                                                        300))
+            'INSERT OR REPLACE INTO soil_moisture VALUES (?, ?)',
+            ('2016-07-23T10:51Z', 300))
         self.mock_connection.commit.assert_called_once()
 
     def test_insert_soil_moisture_with_non_utc_time(self):
@@ -86,9 +173,28 @@ class StoreClassesTest(unittest.TestCase):
         store = db_store.SoilMoistureStore(self.mock_connection)
         store.insert(record)
         self.mock_cursor.execute.assert_called_once_with(
-            'INSERT INTO soil_moisture VALUES (?, ?)', ('2016-07-23T15:51Z',
-                                                        300))
+            'INSERT OR REPLACE INTO soil_moisture VALUES (?, ?)',
+            ('2016-07-23T15:51Z', 300))
+        self.mock_connection.commit.assert_called_once()
+
+    def test_deferred_commits_commits_inserts_once(self):
+        store = db_store.SoilMoistureStore(self.mock_connection)
+        with db_store.deferred_commits(self.mock_connection):
+            for minute in range(3):
+                store.insert(
+                    db_store.SoilMoistureRecord(
+                        timestamp=datetime.datetime(
+                            2016, 7, 23, 10, minute, 0, tzinfo=pytz.utc),
+                        soil_moisture=300))
+            self.mock_connection.commit.assert_not_called()
         self.mock_connection.commit.assert_called_once()
+        # Inserts after the block commit individually again.
+        store.insert(
+            db_store.SoilMoistureRecord(
+                timestamp=datetime.datetime(
+                    2016, 7, 23, 10, 51, 0, tzinfo=pytz.utc),
+                soil_moisture=300))
+        self.assertEqual(2, self.mock_connection.commit.call_count)
 
     def test_get_soil_moisture(self):
         store = db_store.SoilMoistureStore(self.mock_connection)
@@ -122,7 +228,8 @@ class StoreClassesTest(unittest.TestCase):
         store = db_store.LightStore(self.mock_connection)
         store.insert(light_record)
         self.mock_cursor.execute.assert_called_once_with(
-            'INSERT INTO light VALUES (?, ?)', ('2016-07-23T10:51Z', 50.0))
+            'INSERT OR REPLACE INTO light VALUES (?, ?)', ('2016-07-23T10:51Z',
+                                                           50.0))
         self.mock_connection.commit.assert_called_once()
 
     def test_insert_light_with_non_utc_time(self):
@@ -134,7 +241,8 @@ class StoreClassesTest(unittest.TestCase):
         store = db_store.LightStore(self.mock_connection)
         store.insert(light_record)
         self.mock_cursor.execute.assert_called_once_with(
-            'INSERT INTO light VALUES (?, ?)', ('2016-07-23T15:51Z', 50.0))
+            'INSERT OR REPLACE INTO light VALUES (?, ?)', ('2016-07-23T15:51Z',
+                                                           50.0))
         self.mock_connection.commit.assert_called_once()
 
     def test_get_light(self):
@@ -168,7 +276,8 @@ class StoreClassesTest(unittest.TestCase):
         store = db_store.HumidityStore(self.mock_connection)
         store.insert(humidity_record)
         self.mock_cursor.execute.assert_called_once_with(
-            'INSERT INTO humidity VALUES (?, ?)', ('2016-07-23T10:51Z', 50.0))
+            'INSERT OR REPLACE INTO humidity VALUES (?, ?)',
+            ('2016-07-23T10:51Z', 50.0))
         self.mock_connection.commit.assert_called_once()
 
     def test_insert_humidity_with_non_utc_time(self):
@@ -180,7 +289,8 @@ class StoreClassesTest(unittest.TestCase):
         store = db_store.HumidityStore(self.mock_connection)
         store.insert(humidity_record)
         self.mock_cursor.execute.assert_called_once_with(
-            'INSERT INTO humidity VALUES (?, ?)', ('2016-07-23T15:51Z', 50.0))
+            'INSERT OR REPLACE INTO humidity VALUES (?, ?)',
+            ('2016-07-23T15:51Z', 50.0))
         self.mock_connection.commit.assert_called_once()
 
     def test_get_humidity(self):
@@ -214,8 +324,8 @@ class StoreClassesTest(unittest.TestCase):
         store = db_store.TemperatureStore(self.mock_connection)
         store.insert(temperature_record)
         self.mock_cursor.execute.assert_called_once_with(
-            'INSERT INTO temperature VALUES (?, ?)', ('2016-07-23T10:51Z',
-                                                      21.1))
+            'INSERT OR REPLACE INTO temperature VALUES (?, ?)',
+            ('2016-07-23T10:51Z', 21.1))
         self.mock_connection.commit.assert_called_once()
 
     def test_insert_temperature_with_non_utc_time(self):
@@ -227,8 +337,8 @@ class StoreClassesTest(unittest.TestCase):
         store = db_store.TemperatureStore(self.mock_connection)
         store.insert(temperature_record)
         self.mock_cursor.execute.assert_called_once_with(
-            'INSERT INTO temperature VALUES (?, ?)', ('2016-07-23T15:51Z',
-                                                      21.1))
+            'INSERT OR REPLACE INTO temperature VALUES (?, ?)',
+            ('2016-07-23T15:51Z', 21.1))
         self.mock_connection.commit.assert_called_once()
 
     def test_get_temperature(self):
@@ -302,3 +412,600 @@ class StoreClassesTest(unittest.TestCase):
         self.mock_cursor.fetchall.return_value = []
         watering_event_data = store.get()
         self.assertEqual(watering_event_data, [])
+
+    def test_insert_image(self):
+        """Should insert timestamp and image metadata into database."""
+        image_record = db_store.ImageRecord(
+            timestamp=datetime.datetime(
+                2016, 7, 23, 10, 51, 0, tzinfo=pytz.utc),
+            path='2016/07/23/2016-07-23T1051Z.jpg',
+            thumbnail_path='2016/07/23/2016-07-23T1051Z-thumb.jpg',
+            web_path='2016/07/23/2016-07-23T1051Z-web.jpg',
+            width=3280,
+            height=2464,
+            size_bytes=2500000,
+            brightness=62.5)
+        store = db_store.ImageStore(self.mock_connection)
+        store.insert(image_record)
+        self.mock_cursor.execute.assert_called_once_with(
+            'INSERT INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            ('2016-07-23T10:51Z', '2016/07/23/2016-07-23T1051Z.jpg',
+             '2016/07/23/2016-07-23T1051Z-thumb.jpg',
+             '2016/07/23/2016-07-23T1051Z-web.jpg', 3280, 2464, 2500000, 62.5))
+        self.mock_connection.commit.assert_called_once()
+
+    def test_get_image(self):
+        store = db_store.ImageStore(self.mock_connection)
+        self.mock_cursor.fetchall.return_value = [
+            ('2016-07-23T10:51Z', '2016/07/23/2016-07-23T1051Z.jpg',
+             '2016/07/23/2016-07-23T1051Z-thumb.jpg',
+             '2016/07/23/2016-07-23T1051Z-web.jpg', 3280, 2464, 2500000, 62.5)
+        ]
+        self.assertEqual([
+            db_store.ImageRecord(
+                timestamp=datetime.datetime(
+                    2016, 7, 23, 10, 51, 0, tzinfo=pytz.utc),
+                path='2016/07/23/2016-07-23T1051Z.jpg',
+                thumbnail_path='2016/07/23/2016-07-23T1051Z-thumb.jpg',
+                web_path='2016/07/23/2016-07-23T1051Z-web.jpg',
+                width=3280,
+                height=2464,
+                size_bytes=2500000,
+                brightness=62.5)
+        ], store.get())
+
+
+def make_image_record(timestamp, brightness=62.5):
+    """Creates an image record for an image captured at a given time."""
+    path = timestamp.strftime('%Y/%m/%d/%Y-%m-%dT%H%MZ.jpg')
+    return db_store.ImageRecord(
+        timestamp=timestamp,
+        path=path,
+        thumbnail_path=None,
+        web_path=None,
+        width=3280,
+        height=2464,
+        size_bytes=2500000,
+        brightness=brightness)
+
+
+class ImageStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self.connection = db_store.open_or_create_db(
+            os.path.join(self._temp_dir, 'test.db'))
+        self.store = db_store.ImageStore(self.connection)
+
+    def tearDown(self):
+        self.connection.close()
+        shutil.rmtree(self._temp_dir)
+
+    def test_get_nearest_returns_None_when_there_are_no_images(self):
+        self.assertIsNone(
+            self.store.get_nearest(
+                datetime.datetime(2016, 7, 23, 10, 51, 0, tzinfo=pytz.utc)))
+
+    def test_get_nearest_returns_exact_match(self):
+        for hour in (8, 12, 16):
+            self.store.insert(
+                make_image_record(
+                    datetime.datetime(2016, 7, 23, hour, 0, 0,
+                                      tzinfo=pytz.utc)))
+        self.assertEqual(
+            '2016/07/23/2016-07-23T1200Z.jpg',
+            self.store.get_nearest(
+                datetime.datetime(2016, 7, 23, 12, 0, 0, tzinfo=pytz.utc)).path)
+
+    def test_get_nearest_returns_closest_earlier_image(self):
+        for hour in (8, 12, 16):
+            self.store.insert(
+                make_image_record(
+                    datetime.datetime(2016, 7, 23, hour, 0, 0,
+                                      tzinfo=pytz.utc)))
+        self.assertEqual('2016/07/23/2016-07-23T1200Z.jpg',
+                         self.store.get_nearest(
+                             datetime.datetime(
+                                 2016, 7, 23, 13, 59, 0, tzinfo=pytz.utc)).path)
+
+    def test_get_nearest_returns_closest_later_image(self):
+        for hour in (8, 12, 16):
+            self.store.insert(
+                make_image_record(
+                    datetime.datetime(2016, 7, 23, hour, 0, 0,
+                                      tzinfo=pytz.utc)))
+        self.assertEqual(
+            '2016/07/23/2016-07-23T1600Z.jpg',
+            self.store.get_nearest(
+                datetime.datetime(2016, 7, 23, 14, 1, 0, tzinfo=pytz.utc)).path)
+
+    def test_get_nearest_handles_times_outside_range_of_images(self):
+        for hour in (8, 12, 16):
+            self.store.insert(
+                make_image_record(
+                    datetime.datetime(2016, 7, 23, hour, 0, 0,
+                                      tzinfo=pytz.utc)))
+        self.assertEqual(
+            '2016/07/23/2016-07-23T0800Z.jpg',
+            self.store.get_nearest(
+                datetime.datetime(2016, 7, 1, 0, 0, 0, tzinfo=pytz.utc)).path)
+        self.assertEqual(
+            '2016/07/23/2016-07-23T1600Z.jpg',
+            self.store.get_nearest(
+                datetime.datetime(2016, 8, 1, 0, 0, 0, tzinfo=pytz.utc)).path)
+
+    def test_get_nearest_converts_non_utc_time(self):
+        for hour in (8, 12, 16):
+            self.store.insert(
+                make_image_record(
+                    datetime.datetime(2016, 7, 23, hour, 0, 0,
+                                      tzinfo=pytz.utc)))
+        # 07:00 UTC-5 is 12:00 UTC.
+        self.assertEqual(
+            '2016/07/23/2016-07-23T1200Z.jpg',
+            self.store.get_nearest(
+                datetime.datetime(2016, 7, 23, 7, 0, 0,
+                                  tzinfo=UTC_MINUS_5)).path)
+
+    def test_get_nearest_uses_timestamp_index(self):
+        query_plan = self.connection.execute(
+            'EXPLAIN QUERY PLAN SELECT * FROM images WHERE timestamp <= ? '
+            'ORDER BY timestamp DESC LIMIT 1',
+            ('2016-07-23T10:51Z',)).fetchall()
+        self.assertIn('images_timestamp', str(query_plan))
+
+    def test_delete(self):
+        record_a = make_image_record(
+            datetime.datetime(2016, 7, 23, 8, 0, 0, tzinfo=pytz.utc))
+        record_b = make_image_record(
+            datetime.datetime(2016, 7, 23, 12, 0, 0, tzinfo=pytz.utc))
+        self.store.insert(record_a)
+        self.store.insert(record_b)
+        self.store.delete(record_a.path)
+        self.assertEqual([record_b], self.store.get())
+
+    def test_get_range(self):
+        for hour in (8, 12, 16, 20):
+            self.store.insert(
+                make_image_record(
+                    datetime.datetime(2016, 7, 23, hour, 0, 0,
+                                      tzinfo=pytz.utc)))
+        records = self.store.get_range(
+            datetime.datetime(2016, 7, 23, 12, 0, 0, tzinfo=pytz.utc),
+            datetime.datetime(2016, 7, 23, 20, 0, 0, tzinfo=pytz.utc),
+            limit=10)
+        self.assertEqual([
+            '2016/07/23/2016-07-23T1200Z.jpg', '2016/07/23/2016-07-23T1600Z.jpg'
+        ], [record.path for record in records])
+
+    def test_get_range_respects_limit(self):
+        for hour in (8, 12, 16, 20):
+            self.store.insert(
+                make_image_record(
+                    datetime.datetime(2016, 7, 23, hour, 0, 0,
+                                      tzinfo=pytz.utc)))
+        records = self.store.get_range(
+            datetime.datetime(2016, 7, 23, 0, 0, 0, tzinfo=pytz.utc),
+            datetime.datetime(2016, 7, 24, 0, 0, 0, tzinfo=pytz.utc),
+            limit=2)
+        self.assertEqual([
+            '2016/07/23/2016-07-23T0800Z.jpg', '2016/07/23/2016-07-23T1200Z.jpg'
+        ], [record.path for record in records])
+
+    def test_get_superseded_by_daily_best(self):
+        self.store.insert(
+            make_image_record(
+                datetime.datetime(2016, 7, 22, 12, 0, 0, tzinfo=pytz.utc),
+                brightness=50.0))
+        for hour, brightness in ((8, 40.0), (12, 70.0), (16, 60.0)):
+            self.store.insert(
+                make_image_record(
+                    datetime.datetime(2016, 7, 23, hour, 0, 0, tzinfo=pytz.utc),
+                    brightness=brightness))
+        records = self.store.get_superseded_by_daily_best(
+            datetime.datetime(2016, 7, 1, 0, 0, 0, tzinfo=pytz.utc),
+            datetime.datetime(2016, 7, 24, 0, 0, 0, tzinfo=pytz.utc),
+            limit=10)
+        # The only image on 7/22 and the brightest image on 7/23 are kept.
+        self.assertEqual([
+            '2016/07/23/2016-07-23T0800Z.jpg', '2016/07/23/2016-07-23T1600Z.jpg'
+        ], [record.path for record in records])
+
+    def test_get_superseded_by_daily_best_breaks_ties_by_time(self):
+        for hour in (8, 12, 16):
+            self.store.insert(
+                make_image_record(
+                    datetime.datetime(2016, 7, 23, hour, 0, 0,
+                                      tzinfo=pytz.utc)))
+        records = self.store.get_superseded_by_daily_best(
+            datetime.datetime(2016, 7, 1, 0, 0, 0, tzinfo=pytz.utc),
+            datetime.datetime(2016, 7, 24, 0, 0, 0, tzinfo=pytz.utc),
+            limit=10)
+        self.assertEqual([
+            '2016/07/23/2016-07-23T1200Z.jpg', '2016/07/23/2016-07-23T1600Z.jpg'
+        ], [record.path for record in records])
+
+    def test_get_superseded_by_daily_best_ignores_recent_images(self):
+        for hour, brightness in ((8, 40.0), (12, 70.0), (16, 60.0)):
+            self.store.insert(
+                make_image_record(
+                    datetime.datetime(2016, 7, 23, hour, 0, 0, tzinfo=pytz.utc),
+                    brightness=brightness))
+        records = self.store.get_superseded_by_daily_best(
+            datetime.datetime(2016, 7, 1, 0, 0, 0, tzinfo=pytz.utc),
+            datetime.datetime(2016, 7, 23, 10, 0, 0, tzinfo=pytz.utc),
+            limit=10)
+        self.assertEqual(['2016/07/23/2016-07-23T0800Z.jpg'],
+                         [record.path for record in records])
+
+    def test_get_superseded_by_daily_best_ignores_images_before_start(self):
+        for day, hour, brightness in ((22, 8, 40.0), (22, 12, 70.0),
+                                      (23, 8, 40.0), (23, 12, 70.0)):
+            self.store.insert(
+                make_image_record(
+                    datetime.datetime(
+                        2016, 7, day, hour, 0, 0, tzinfo=pytz.utc),
+                    brightness=brightness))
+        records = self.store.get_superseded_by_daily_best(
+            datetime.datetime(2016, 7, 23, 0, 0, 0, tzinfo=pytz.utc),
+            datetime.datetime(2016, 7, 24, 0, 0, 0, tzinfo=pytz.utc),
+            limit=10)
+        self.assertEqual(['2016/07/23/2016-07-23T0800Z.jpg'],
+                         [record.path for record in records])
+
+    def test_update(self):
+        record = make_image_record(
+            datetime.datetime(2016, 7, 23, 8, 0, 0, tzinfo=pytz.utc))
+        self.store.insert(record)
+        updated_record = record._replace(
+            width=1640, height=1232, size_bytes=600000)
+        self.store.update(updated_record)
+        self.assertEqual([updated_record], self.store.get())
+
+
+class WateringEventStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self.connection = db_store.open_or_create_db(
+            os.path.join(self._temp_dir, 'test.db'))
+        self.store = db_store.WateringEventStore(self.connection)
+
+    def tearDown(self):
+        self.connection.close()
+        shutil.rmtree(self._temp_dir)
+
+    def test_keeps_events_with_same_timestamp(self):
+        timestamp = datetime.datetime(2016, 7, 23, 10, 0, tzinfo=pytz.utc)
+        self.store.insert(db_store.WateringEventRecord(timestamp, 100.0))
+        self.store.insert(db_store.WateringEventRecord(timestamp, 50.0))
+
+        self.assertEqual([100.0, 50.0],
+                         [record.water_pumped for record in self.store.get()])
+
+    def test_get_page(self):
+        for minute in range(3):
+            self.store.insert(
+                db_store.WateringEventRecord(
+                    datetime.datetime(2016, 7, 23, 10, minute, tzinfo=pytz.utc),
+                    100.0))
+
+        records, next_page_token = self.store.get_page(
+            datetime.datetime(2016, 7, 23, tzinfo=pytz.utc),
+            datetime.datetime(2016, 7, 24, tzinfo=pytz.utc), 2)
+
+        self.assertEqual([0, 1],
+                         [record.timestamp.minute for record in records])
+        self.assertIsNotNone(next_page_token)
+
+
+class ReadingStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self._temp_dir, 'test.db')
+        self.connection = db_store.open_or_create_db(self.db_path)
+        self.store = db_store.LightStore(self.connection)
+
+    def tearDown(self):
+        self.connection.close()
+        shutil.rmtree(self._temp_dir)
+
+    def _insert(self, minute, light):
+        self.store.insert(
+            db_store.LightRecord(
+                datetime.datetime(2016, 7, 23, 10, minute, tzinfo=pytz.utc),
+                light))
+
+    def test_get_page_continues_after_page_token(self):
+        for minute, light in ((0, 10.0), (1, 20.0), (2, 30.0), (3, 40.0)):
+            self._insert(minute, light)
+        start = datetime.datetime(2016, 7, 23, 10, 0, tzinfo=pytz.utc)
+        end = datetime.datetime(2016, 7, 23, 11, 0, tzinfo=pytz.utc)
+
+        records, page_token = self.store.get_page(start, end, limit=2)
+        self.assertEqual([10.0, 20.0], [record.light for record in records])
+        records, page_token = self.store.get_page(
+            start, end, limit=2, page_token=page_token)
+        self.assertEqual([30.0, 40.0], [record.light for record in records])
+        self.assertIsNone(page_token)
+
+    def test_iter_records_continues_across_pages(self):
+        for minute, light in ((0, 10.0), (1, 20.0), (2, 30.0), (3, 40.0)):
+            self._insert(minute, light)
+        start = datetime.datetime(2016, 7, 23, 10, 0, tzinfo=pytz.utc)
+        end = datetime.datetime(2016, 7, 23, 11, 0, tzinfo=pytz.utc)
+
+        with mock.patch.object(db_store, '_ITER_PAGE_SIZE', 2):
+            records = list(self.store.iter_records(start, end))
+            self.assertEqual([10.0, 20.0, 30.0, 40.0],
+                             [record.light for record, _ in records])
+            # Each record's page token continues after that record.
+            self.assertEqual([30.0, 40.0], [
+                record.light
+                for record, _ in self.store.iter_records(
+                    start, end, page_token=records[1][1])
+            ])
+
+    def test_get_page_rejects_invalid_page_token(self):
+        with self.assertRaises(ValueError):
+            self.store.get_page(
+                datetime.datetime(2016, 7, 23, tzinfo=pytz.utc),
+                datetime.datetime(2016, 7, 24, tzinfo=pytz.utc),
+                limit=2,
+                page_token='bogus')
+
+    def test_get_summaries(self):
+        for minute, light in ((0, 10.0), (4, 20.0), (5, 40.0), (20, 60.0)):
+            self._insert(minute, light)
+        summaries = self.store.get_summaries(
+            datetime.datetime(2016, 7, 23, 10, 0, tzinfo=pytz.utc),
+            datetime.datetime(2016, 7, 23, 11, 0, tzinfo=pytz.utc),
+            step_seconds=300,
+            limit=10)
+        self.assertEqual([
+            db_store.ReadingSummary(
+                datetime.datetime(2016, 7, 23, 10, 0, tzinfo=pytz.utc), 15.0,
+                10.0, 20.0, 2),
+            db_store.ReadingSummary(
+                datetime.datetime(2016, 7, 23, 10, 5, tzinfo=pytz.utc), 40.0,
+                40.0, 40.0, 1),
+            db_store.ReadingSummary(
+                datetime.datetime(2016, 7, 23, 10, 20, tzinfo=pytz.utc), 60.0,
+                60.0, 60.0, 1),
+        ], summaries)
+
+    def test_to_arrays(self):
+        for minute, light in ((2, 30.0), (0, 10.0), (1, 20.0), (30, 99.0)):
+            self._insert(minute, light)
+        timestamps, values = self.store.to_arrays(
+            datetime.datetime(2016, 7, 23, 10, 0, tzinfo=pytz.utc),
+            datetime.datetime(2016, 7, 23, 10, 30, tzinfo=pytz.utc))
+        numpy.testing.assert_array_equal(
+            numpy.array(
+                ['2016-07-23T10:00', '2016-07-23T10:01', '2016-07-23T10:02'],
+                dtype='datetime64[s]'), timestamps)
+        numpy.testing.assert_array_equal([10.0, 20.0, 30.0], values)
+        self.assertEqual(numpy.float64, values.dtype)
+
+    def test_to_arrays_reads_in_chunks(self):
+        for minute in range(5):
+            self._insert(minute, float(minute))
+        with mock.patch.object(db_store, '_ARRAY_CHUNK_SIZE', 2):
+            _, values = self.store.to_arrays(
+                datetime.datetime(2016, 7, 23, 10, 0, tzinfo=pytz.utc),
+                datetime.datetime(2016, 7, 23, 11, 0, tzinfo=pytz.utc))
+        numpy.testing.assert_array_equal([0.0, 1.0, 2.0, 3.0, 4.0], values)
+
+    def test_to_arrays_with_no_readings(self):
+        timestamps, values = self.store.to_arrays(
+            datetime.datetime(2016, 7, 23, 10, 0, tzinfo=pytz.utc),
+            datetime.datetime(2016, 7, 23, 11, 0, tzinfo=pytz.utc))
+        self.assertEqual(0, len(timestamps))
+        self.assertEqual(0, len(values))
+
+    def test_load_aligned_readings(self):
+
+        def minute(m):
+            return datetime.datetime(2016, 7, 23, 10, m, tzinfo=pytz.utc)
+
+        db_store.TemperatureStore(self.connection).insert(
+            db_store.TemperatureRecord(minute(0), 21.0))
+        db_store.TemperatureStore(self.connection).insert(
+            db_store.TemperatureRecord(minute(5), 22.0))
+        db_store.HumidityStore(self.connection).insert(
+            db_store.HumidityRecord(minute(5), 40.0))
+        db_store.HumidityStore(self.connection).insert(
+            db_store.HumidityRecord(minute(5), 45.0))
+        self._insert(1, 60.0)
+
+        aligned = db_store.load_aligned_readings(self.connection,
+                                                 minute(0), minute(30))
+
+        numpy.testing.assert_array_equal(
+            numpy.array(
+                ['2016-07-23T10:00', '2016-07-23T10:01', '2016-07-23T10:05'],
+                dtype='datetime64[s]'), aligned.timestamp)
+        numpy.testing.assert_array_equal([21.0, numpy.nan, 22.0],
+                                         aligned.temperature)
+        numpy.testing.assert_array_equal([numpy.nan, numpy.nan, 45.0],
+                                         aligned.humidity)
+        numpy.testing.assert_array_equal([numpy.nan, 60.0, numpy.nan],
+                                         aligned.light)
+        numpy.testing.assert_array_equal([numpy.nan] * 3, aligned.soil_moisture)
+
+    def test_get_downsampled_keeps_extremes(self):
+        for minute, light in ((0, 10.0), (1, 11.0), (2, 90.0), (3, 12.0),
+                              (4, 11.0), (5, 13.0), (6, 12.0)):
+            self._insert(minute, light)
+        records = self.store.get_downsampled(
+            datetime.datetime(2016, 7, 23, 10, 0, tzinfo=pytz.utc),
+            datetime.datetime(2016, 7, 23, 11, 0, tzinfo=pytz.utc),
+            max_points=3)
+        self.assertEqual([
+            db_store.LightRecord(
+                datetime.datetime(2016, 7, 23, 10, 0, tzinfo=pytz.utc), 10.0),
+            db_store.LightRecord(
+                datetime.datetime(2016, 7, 23, 10, 2, tzinfo=pytz.utc), 90.0),
+            db_store.LightRecord(
+                datetime.datetime(2016, 7, 23, 10, 6, tzinfo=pytz.utc), 12.0),
+        ], records)
+
+    def test_get_downsampled_returns_every_reading_below_max_points(self):
+        self._insert(0, 10.0)
+        self._insert(1, 20.0)
+        records = self.store.get_downsampled(
+            datetime.datetime(2016, 7, 23, 10, 0, tzinfo=pytz.utc),
+            datetime.datetime(2016, 7, 23, 11, 0, tzinfo=pytz.utc),
+            max_points=3)
+        self.assertEqual([10.0, 20.0], [record.light for record in records])
+
+    def test_insert_replaces_reading_with_same_timestamp(self):
+        self._insert(0, 10.0)
+        self._insert(0, 20.0)
+
+        self.assertEqual([20.0], [record.light for record in self.store.get()])
+
+    def _insert_polled(self, store, *minutes):
+        for minute in minutes:
+            store.insert(
+                db_store.LightRecord(
+                    datetime.datetime(2016, 7, 23, 10, minute, tzinfo=pytz.utc),
+                    50.0))
+
+    def _gaps(self, store):
+        return [(gap.start.minute, gap.end.minute, gap.missing_ticks)
+                for gap in store.get_gaps(
+                    datetime.datetime(2016, 7, 23, tzinfo=pytz.utc),
+                    datetime.datetime(2016, 7, 24, tzinfo=pytz.utc))]
+
+    def test_records_gap_after_missed_polls(self):
+        store = db_store.LightStore(
+            self.connection, datetime.timedelta(minutes=1))
+        self._insert_polled(store, 0, 1, 4, 5)
+
+        self.assertEqual([(1, 4, 2)], self._gaps(store))
+
+    def test_gaps_tolerate_late_polls(self):
+        store = db_store.LightStore(
+            self.connection, datetime.timedelta(minutes=15))
+        self._insert_polled(store, 0, 17, 30, 59)
+
+        self.assertEqual([], self._gaps(store))
+
+    def test_backfilled_reading_splits_gap(self):
+        store = db_store.LightStore(
+            self.connection, datetime.timedelta(minutes=1))
+        self._insert_polled(store, 0, 6, 3)
+        self.assertEqual([(0, 3, 2), (3, 6, 2)], self._gaps(store))
+
+        self._insert_polled(store, 1, 2, 3)
+        self.assertEqual([(3, 6, 2)], self._gaps(store))
+
+    def test_backfilled_reading_before_first_reading_records_gap(self):
+        store = db_store.LightStore(
+            self.connection, datetime.timedelta(minutes=1))
+        self._insert_polled(store, 5, 6, 0, 4)
+
+        self.assertEqual([(0, 4, 3)], self._gaps(store))
+
+    def test_gaps_keep_poll_interval_when_recorded(self):
+        store = db_store.LightStore(
+            self.connection, datetime.timedelta(minutes=1))
+        self._insert_polled(store, 0, 4)
+        store.set_poll_interval(datetime.timedelta(minutes=2))
+        self._insert_polled(store, 6, 10, 2)
+
+        self.assertEqual([(0, 2, 1), (2, 4, 1), (6, 10, 1)], self._gaps(store))
+
+    def test_get_gaps_returns_gaps_that_overlap_range(self):
+        store = db_store.LightStore(
+            self.connection, datetime.timedelta(minutes=1))
+        self._insert_polled(store, 0, 10, 20)
+
+        self.assertEqual(
+            [(10, 20, 9)],
+            [(gap.start.minute, gap.end.minute, gap.missing_ticks)
+             for gap in store.get_gaps(
+                 datetime.datetime(2016, 7, 23, 10, 11, tzinfo=pytz.utc),
+                 datetime.datetime(2016, 7, 23, 10, 30, tzinfo=pytz.utc))])
+
+    def test_rebuild_gaps_finds_gaps_in_every_reading(self):
+        self._insert_polled(self.store, 0, 1, 4, 5, 9)
+        self.assertEqual([], self._gaps(self.store))
+
+        self.store.rebuild_gaps(datetime.timedelta(minutes=1))
+
+        self.assertEqual([(1, 4, 2), (5, 9, 3)], self._gaps(self.store))
+
+    def test_get_latest(self):
+        self.assertIsNone(self.store.get_latest())
+        self._insert(5, 50.0)
+        self._insert(1, 10.0)
+        self.assertEqual(50.0, self.store.get_latest().light)
+
+    def test_range_queries_use_timestamp_index(self):
+        query_plan = self.connection.execute(
+            'EXPLAIN QUERY PLAN SELECT * FROM light WHERE timestamp >= ? '
+            'ORDER BY timestamp', ('2016-07-23T10:51Z',)).fetchall()
+        self.assertIn('light_timestamp', str(query_plan))
+
+    def test_open_read_only_refuses_writes(self):
+        self._insert(0, 10.0)
+        with contextlib.closing(
+                db_store.open_read_only(self.db_path)) as read_only:
+            self.assertEqual(10.0,
+                             db_store.LightStore(read_only).get_latest().light)
+            with self.assertRaises(sqlite3.OperationalError):
+                read_only.execute('DELETE FROM light')
+
+    def test_open_read_only_requires_existing_database(self):
+        with self.assertRaises(IOError):
+            db_store.open_read_only(os.path.join(self._temp_dir, 'none.db'))
+
+    def test_deferred_indexes_rolls_back_block_that_fails(self):
+        self._insert(0, 10.0)
+        with self.assertRaises(ValueError):
+            with db_store.deferred_indexes(self.connection, 'light'):
+                self._insert(1, 20.0)
+                raise ValueError('interrupted')
+
+        self.assertEqual([10.0], [record.light for record in self.store.get()])
+        self.assertEqual(
+            [('light_timestamp',)],
+            self.connection.execute(
+                'SELECT name FROM sqlite_master WHERE type = \'index\' AND '
+                'tbl_name = \'light\'').fetchall())
+
+    def test_deferred_indexes_keeps_indexes_if_process_dies(self):
+        self._insert(0, 10.0)
+        with db_store.deferred_indexes(self.connection, 'light'):
+            self._insert(1, 20.0)
+            # Another connection sees the database as it would be after a
+            # crash at this point.
+            other_connection = sqlite3.connect(self.db_path)
+            self.assertEqual(
+                [('light_timestamp',)],
+                other_connection.execute(
+                    'SELECT name FROM sqlite_master WHERE type = \'index\' '
+                    'AND tbl_name = \'light\'').fetchall())
+            self.assertEqual(
+                [(10.0,)],
+                other_connection.execute('SELECT light FROM light').fetchall())
+            other_connection.close()
+
+    def test_deferred_indexes_rebuilds_indexes_after_block(self):
+        with db_store.deferred_indexes(self.connection, 'light'):
+            self.assertEqual(
+                [],
+                self.connection.execute(
+                    'SELECT name FROM sqlite_master WHERE type = \'index\' AND '
+                    'tbl_name = \'light\'').fetchall())
+            self._insert(0, 10.0)
+
+        self.assertEqual(10.0, self.store.get_latest().light)
+        self.assertEqual(
+            [('light_timestamp',)],
+            self.connection.execute(
+                'SELECT name FROM sqlite_master WHERE type = \'index\' AND '
+                'tbl_name = \'light\'').fetchall())
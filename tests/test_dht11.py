@@ -49,6 +49,21 @@ class CachingDHT11Test(unittest.TestCase):
         caching_dht11.temperature()
         self.assertEqual(1, self.mock_dht11_read_func.call_count)
 
+    def test_counts_cached_and_sensor_reads(self):
+        caching_dht11 = dht11.CachingDHT11(self.mock_dht11_read_func,
+                                           self.mock_clock)
+        self.mock_dht11_read_func.return_value = (50.0, 21.0)
+        self.mock_clock.now.return_value = (datetime.datetime(
+            2016, 1, 1, 0, 0, 0, 0, tzinfo=pytz.utc))
+        sensor_reads = dht11._reads.value(('sensor',))
+        cache_reads = dht11._reads.value(('cache',))
+
+        caching_dht11.humidity()
+        caching_dht11.temperature()
+
+        self.assertEqual(sensor_reads + 1, dht11._reads.value(('sensor',)))
+        self.assertEqual(cache_reads + 1, dht11._reads.value(('cache',)))
+
     def test_refreshes_cache_after_cached_values_expire(self):
         caching_dht11 = dht11.CachingDHT11(self.mock_dht11_read_func,
                                            self.mock_clock)
@@ -0,0 +1,36 @@
+import unittest
+
+import numpy
+
+from greenpithumb import downsampling
+
+
+class LargestTriangleThreeBucketsTest(unittest.TestCase):
+
+    def test_keeps_peaks_and_troughs(self):
+        x = range(10)
+        y = [5, 5, 9, 5, 5, 5, 1, 5, 5, 5]
+        self.assertEqual(
+            [0, 2, 6, 9],
+            list(downsampling.largest_triangle_three_buckets(x, y, 4)))
+
+    def test_keeps_first_and_last_points(self):
+        x = numpy.arange(1000)
+        y = numpy.sin(x / 10.0)
+        indices = downsampling.largest_triangle_three_buckets(x, y, 100)
+        self.assertEqual(100, len(indices))
+        self.assertEqual(0, indices[0])
+        self.assertEqual(999, indices[-1])
+        self.assertTrue(numpy.all(numpy.diff(indices) > 0))
+
+    def test_keeps_every_point_of_short_series(self):
+        self.assertEqual([0, 1, 2],
+                         list(
+                             downsampling.largest_triangle_three_buckets(
+                                 [0, 1, 2], [3, 4, 5], 3)))
+        self.assertEqual(
+            [], list(downsampling.largest_triangle_three_buckets([], [], 3)))
+
+    def test_rejects_threshold_below_three(self):
+        with self.assertRaises(ValueError):
+            downsampling.largest_triangle_three_buckets([0, 1, 2], [3, 4, 5], 2)
@@ -0,0 +1,123 @@
+import csv
+import datetime
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import pytz
+
+from greenpithumb import db_store
+from greenpithumb import exporter
+
+
+def _minute(minute):
+    return datetime.datetime(2016, 7, 23, 10, minute, tzinfo=pytz.utc)
+
+
+class ExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self._temp_dir, 'test.db')
+        self.output_dir = os.path.join(self._temp_dir, 'export')
+        self.connection = db_store.open_or_create_db(self.db_path)
+        self.temperature_store = db_store.TemperatureStore(self.connection)
+        for minute, temperature in ((0, 20.0), (1, 21.5), (2, 22.0)):
+            self.temperature_store.insert(
+                db_store.TemperatureRecord(_minute(minute), temperature))
+
+    def tearDown(self):
+        self.connection.close()
+        shutil.rmtree(self._temp_dir)
+
+    def _export(self, **kwargs):
+        options = {
+            'tables': ['temperature'],
+            'file_format': 'csv',
+            'compress': False,
+        }
+        options.update(kwargs)
+        return exporter.export(self.db_path, self.output_dir, **options)
+
+    def _export_files(self):
+        return sorted(
+            name for name in os.listdir(self.output_dir)
+            if name != 'export-state.json')
+
+    def _read_export(self, compress=False):
+        path = os.path.join(self.output_dir, self._export_files()[-1])
+        if compress:
+            with gzip.open(path, 'rb') as export_file:
+                return export_file.read()
+        with open(path, 'rb') as export_file:
+            return export_file.read()
+
+    def test_exports_csv(self):
+        self.assertEqual({'temperature': 3}, self._export())
+        self.assertEqual([
+            ['timestamp', 'temperature'],
+            ['2016-07-23T10:00Z', '20.0'],
+            ['2016-07-23T10:01Z', '21.5'],
+            ['2016-07-23T10:02Z', '22.0'],
+        ], list(csv.reader(self._read_export().splitlines())))
+
+    def test_exports_gzipped_json_lines(self):
+        self._export(file_format='jsonl', compress=True)
+        self.assertTrue(self._export_files()[0].endswith('.jsonl.gz'))
+        self.assertEqual(
+            [
+                {
+                    'timestamp': '2016-07-23T10:00Z',
+                    'temperature': 20.0
+                },
+                {
+                    'timestamp': '2016-07-23T10:01Z',
+                    'temperature': 21.5
+                },
+                {
+                    'timestamp': '2016-07-23T10:02Z',
+                    'temperature': 22.0
+                },
+            ], [
+                json.loads(line)
+                for line in self._read_export(compress=True).splitlines()
+            ])
+
+    def test_exports_time_range(self):
+        self._export(start=_minute(1), end=_minute(2))
+        self.assertEqual([['timestamp', 'temperature'],
+                          ['2016-07-23T10:01Z', '21.5']],
+                         list(csv.reader(self._read_export().splitlines())))
+
+    def test_writes_no_file_for_table_without_records(self):
+        self.assertEqual({'humidity': 0}, self._export(tables=['humidity']))
+        self.assertEqual([], self._export_files())
+
+    def test_resumes_after_last_exported_record(self):
+        self.assertEqual({'temperature': 3}, self._export(resume=True))
+        self.assertEqual({'temperature': 0}, self._export(resume=True))
+
+        self.temperature_store.insert(
+            db_store.TemperatureRecord(_minute(2), 23.0))
+        self.temperature_store.insert(
+            db_store.TemperatureRecord(_minute(3), 24.0))
+        self.assertEqual({'temperature': 2}, self._export(resume=True))
+        self.assertEqual([
+            ['timestamp', 'temperature'],
+            ['2016-07-23T10:02Z', '23.0'],
+            ['2016-07-23T10:03Z', '24.0'],
+        ], list(csv.reader(self._read_export().splitlines())))
+
+    def test_exports_everything_without_resume(self):
+        self._export(resume=True)
+        self.assertEqual({'temperature': 3}, self._export())
+
+    def test_ignores_unreadable_state(self):
+        os.makedirs(self.output_dir)
+        with open(os.path.join(self.output_dir, 'export-state.json'),
+                  'w') as state_file:
+            state_file.write('{not json')
+        self.assertEqual({'temperature': 3}, self._export(resume=True))
@@ -0,0 +1,212 @@
+import datetime
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import mock
+import pytz
+
+from greenpithumb import config_reloader
+from greenpithumb import db_store
+from greenpithumb import greenpithumb
+
+# Top-level packages that are slow to import or that are only installed on a
+# Raspberry Pi.
+_HEAVY_PACKAGES = ('Adafruit_DHT', 'Adafruit_MCP3008', 'PIL', 'RPi', 'dateutil',
+                   'numpy', 'picamera')
+
+
+class StartupTest(unittest.TestCase):
+
+    def test_import_does_not_load_heavy_packages(self):
+        repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        loaded_modules = subprocess.check_output(
+            [
+                sys.executable, '-c',
+                'import sys; import greenpithumb.greenpithumb; '
+                'print "\\n".join(sys.modules)'
+            ],
+            cwd=repo_root).split()
+        loaded_packages = set(module.split('.')[0] for module in loaded_modules)
+        self.assertEqual(set(), loaded_packages.intersection(_HEAVY_PACKAGES))
+
+
+class ParseCommandLineTest(unittest.TestCase):
+
+    def test_runs_greenpithumb_when_no_command_given(self):
+        command, args = greenpithumb.parse_command_line(
+            ['--poll_interval', '5'])
+        self.assertEqual(greenpithumb.main, command)
+        self.assertEqual(5, args.poll_interval)
+
+    def test_parses_migrate_command(self):
+        command, args = greenpithumb.parse_command_line(
+            ['migrate', '--db_file', 'foo.db'])
+        self.assertEqual(greenpithumb.migrate, command)
+        self.assertEqual('foo.db', args.db_file)
+
+    def test_parses_export_command(self):
+        command, args = greenpithumb.parse_command_line([
+            'export', '-o', 'backup', '--tables', 'light', 'images', '--start',
+            '2017-01-31'
+        ])
+        self.assertEqual(greenpithumb.export, command)
+        self.assertEqual('backup', args.output_dir)
+        self.assertEqual(['light', 'images'], args.tables)
+        self.assertEqual(
+            datetime.datetime(2017, 1, 31, tzinfo=pytz.utc), args.start)
+        self.assertIsNone(args.end)
+
+    def test_parses_import_command(self):
+        command, args = greenpithumb.parse_command_line(
+            ['import', 'light-20170131T020000.csv.gz', 'old.db'])
+        self.assertEqual(greenpithumb.import_data, command)
+        self.assertEqual(['light-20170131T020000.csv.gz', 'old.db'],
+                         args.sources)
+        self.assertIsNone(args.table)
+
+    def test_parses_report_command(self):
+        command, args = greenpithumb.parse_command_line(
+            ['report', '--rebuild_gaps', '-p', '5'])
+        self.assertEqual(greenpithumb.report, command)
+        self.assertTrue(args.rebuild_gaps)
+        self.assertEqual(5, args.poll_interval)
+        self.assertIsNone(args.start)
+
+
+class MigrateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.db_dir)
+
+    @mock.patch.object(greenpithumb, 'configure_logging')
+    def test_migrate_creates_database(self, _):
+        db_path = os.path.join(self.db_dir, 'test.db')
+        command, args = greenpithumb.parse_command_line(
+            ['migrate', '--db_file', db_path])
+        command(args)
+        connection = db_store.open_or_create_db(db_path)
+        self.assertEqual([], db_store.SoilMoistureStore(connection).get())
+        connection.close()
+
+
+class MakePumpTimerTest(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self.connection = db_store.open_or_create_db(
+            os.path.join(self._temp_dir, 'test.db'))
+        self.mock_utc_clock = mock.Mock()
+        self.mock_utc_clock.now.return_value = datetime.datetime(
+            2017, 4, 1, 12, 0, 0, tzinfo=pytz.utc)
+
+    def tearDown(self):
+        self.connection.close()
+        shutil.rmtree(self._temp_dir)
+
+    def _make_pump_timer(self, saved_deadline=None):
+        return greenpithumb.make_pump_timer(
+            pump_interval=datetime.timedelta(hours=4),
+            utc_clock=self.mock_utc_clock,
+            db_connection=self.connection,
+            saved_deadline=saved_deadline)
+
+    @mock.patch.object(greenpithumb.clock, 'Timer')
+    def test_pumps_immediately_without_watering_history(self, mock_timer):
+        self._make_pump_timer()
+        mock_timer.return_value.set_remaining.assert_called_once_with(
+            datetime.timedelta(seconds=0))
+
+    @mock.patch.object(greenpithumb.clock, 'Timer')
+    def test_waits_for_pump_interval_after_last_watering(self, mock_timer):
+        db_store.WateringEventStore(self.connection).insert(
+            db_store.WateringEventRecord(
+                datetime.datetime(2017, 4, 1, 11, 0, 0, tzinfo=pytz.utc),
+                200.0))
+
+        self._make_pump_timer()
+        mock_timer.return_value.set_remaining.assert_called_once_with(
+            datetime.timedelta(hours=3))
+
+    @mock.patch.object(greenpithumb.clock, 'Timer')
+    def test_saved_deadline_overrides_watering_history(self, mock_timer):
+        db_store.WateringEventStore(self.connection).insert(
+            db_store.WateringEventRecord(
+                datetime.datetime(2017, 4, 1, 11, 0, 0, tzinfo=pytz.utc),
+                200.0))
+
+        self._make_pump_timer(saved_deadline=datetime.datetime(
+            2017, 4, 1, 13, 0, 0, tzinfo=pytz.utc))
+        mock_timer.return_value.set_remaining.assert_called_once_with(
+            datetime.timedelta(hours=1))
+
+
+class LoadSettingsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.config_dir = tempfile.mkdtemp()
+        self.wiring_config_path = os.path.join(self.config_dir, 'wiring.ini')
+        shutil.copy(
+            os.path.join(
+                os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                'greenpithumb', 'wiring_config.ini.example'),
+            self.wiring_config_path)
+        self.args_path = os.path.join(self.config_dir, 'greenpithumb.args')
+
+    def tearDown(self):
+        shutil.rmtree(self.config_dir)
+
+    def write_args(self, args):
+        with open(self.args_path, 'w') as args_file:
+            args_file.write('\n'.join(args))
+
+    def test_rereads_argument_file(self):
+        self.write_args(['--moisture_threshold', '500'])
+        argv = ['-c', self.wiring_config_path, '@' + self.args_path]
+        self.assertEqual(500,
+                         greenpithumb.load_settings(argv).moisture_threshold)
+        self.write_args(
+            ['--moisture_threshold', '600', '--sleep_window', '23:00-07:00'])
+        settings = greenpithumb.load_settings(argv)
+        self.assertEqual(600, settings.moisture_threshold)
+        self.assertEqual([(datetime.time(23, 0), datetime.time(7, 0))],
+                         settings.sleep_windows)
+        self.assertEqual(26, settings.wiring_config.gpio_pins.pump)
+
+    @mock.patch('sys.stderr')
+    def test_invalid_arguments_raise_InvalidSettingsError(self, _):
+        self.write_args(['--moisture_threshold', 'dry'])
+        with self.assertRaises(config_reloader.InvalidSettingsError):
+            greenpithumb.load_settings(
+                ['-c', self.wiring_config_path, '@' + self.args_path])
+
+
+class ShutdownTest(unittest.TestCase):
+
+    def test_wait_for_pollers_counts_unfinished_pollers(self):
+        finished_poller = mock.Mock()
+        finished_poller.join.return_value = True
+        unfinished_poller = mock.Mock()
+        unfinished_poller.join.return_value = False
+        self.assertEqual(1,
+                         greenpithumb.wait_for_pollers(
+                             [finished_poller, unfinished_poller],
+                             timeout_seconds=5.0))
+        for current_poller in (finished_poller, unfinished_poller):
+            timeout = current_poller.join.call_args[0][0]
+            self.assertTrue(0 <= timeout <= 5.0)
+
+    def test_flush_records_commits_once(self):
+        mock_connection = mock.Mock()
+        mock_record_processor = mock.Mock()
+        mock_record_processor.process_all_records.return_value = (12, 1)
+        self.assertEqual((12, 1),
+                         greenpithumb.flush_records(mock_record_processor,
+                                                    mock_connection))
+        mock_connection.commit.assert_called_once()
@@ -0,0 +1,149 @@
+import datetime
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from PIL import Image
+import pytz
+
+from greenpithumb import db_store
+from greenpithumb import image_layout
+
+
+def write_jpeg(path, width, height):
+    """Writes a solid-color JPEG image of the given size to a path."""
+    stream = io.BytesIO()
+    Image.new('RGB', (width, height), (255, 255, 255)).save(stream, 'JPEG')
+    with open(path, 'wb') as image_file:
+        image_file.write(stream.getvalue())
+
+
+class RelativePathTest(unittest.TestCase):
+
+    def test_relative_path_is_in_directory_for_capture_date(self):
+        self.assertEqual(
+            '2016/07/23/2016-07-23T1051Z.jpg',
+            image_layout.relative_path(
+                datetime.datetime(2016, 7, 23, 10, 51, 9, tzinfo=pytz.utc)))
+
+
+class MigrateFlatLayoutTest(unittest.TestCase):
+
+    def setUp(self):
+        self.image_path = tempfile.mkdtemp()
+        self.db_dir = tempfile.mkdtemp()
+        self.connection = db_store.open_or_create_db(
+            os.path.join(self.db_dir, 'test.db'))
+        self.image_store = db_store.ImageStore(self.connection)
+
+    def tearDown(self):
+        self.connection.close()
+        shutil.rmtree(self.image_path)
+        shutil.rmtree(self.db_dir)
+
+    def test_moves_flat_images_into_date_directories(self):
+        write_jpeg(
+            os.path.join(self.image_path, '2016-07-23T1051Z.jpg'), 64, 48)
+        write_jpeg(
+            os.path.join(self.image_path, '2016-07-24T0400Z.jpg'), 64, 48)
+
+        self.assertEqual(2,
+                         image_layout.migrate_flat_layout(
+                             self.image_path, self.image_store))
+
+        self.assertTrue(
+            os.path.exists(
+                os.path.join(self.image_path,
+                             '2016/07/23/2016-07-23T1051Z.jpg')))
+        self.assertTrue(
+            os.path.exists(
+                os.path.join(self.image_path,
+                             '2016/07/24/2016-07-24T0400Z.jpg')))
+        self.assertItemsEqual(['2016'], os.listdir(self.image_path))
+
+    def test_indexes_migrated_images(self):
+        image_file = os.path.join(self.image_path, '2016-07-23T1051Z.jpg')
+        write_jpeg(image_file, 64, 48)
+        size_bytes = os.path.getsize(image_file)
+
+        image_layout.migrate_flat_layout(self.image_path, self.image_store)
+
+        records = self.image_store.get()
+        self.assertEqual(1, len(records))
+        self.assertEqual(
+            datetime.datetime(2016, 7, 23, 10, 51, tzinfo=pytz.utc),
+            records[0].timestamp)
+        self.assertEqual('2016/07/23/2016-07-23T1051Z.jpg', records[0].path)
+        self.assertIsNone(records[0].thumbnail_path)
+        self.assertIsNone(records[0].web_path)
+        self.assertEqual(64, records[0].width)
+        self.assertEqual(48, records[0].height)
+        self.assertEqual(size_bytes, records[0].size_bytes)
+        self.assertAlmostEqual(100.0, records[0].brightness, places=0)
+
+    def test_moves_derived_images_and_replaces_existing_metadata(self):
+        for filename in ('2016-07-23T1051Z.jpg', '2016-07-23T1051Z-thumb.jpg',
+                         '2016-07-23T1051Z-web.jpg'):
+            write_jpeg(os.path.join(self.image_path, filename), 64, 48)
+        self.image_store.insert(
+            db_store.ImageRecord(
+                timestamp=datetime.datetime(
+                    2016, 7, 23, 10, 51, tzinfo=pytz.utc),
+                path='2016-07-23T1051Z.jpg',
+                thumbnail_path='2016-07-23T1051Z-thumb.jpg',
+                web_path='2016-07-23T1051Z-web.jpg',
+                width=64,
+                height=48,
+                size_bytes=500,
+                brightness=None))
+
+        image_layout.migrate_flat_layout(self.image_path, self.image_store)
+
+        self.assertItemsEqual([
+            '2016-07-23T1051Z.jpg', '2016-07-23T1051Z-thumb.jpg',
+            '2016-07-23T1051Z-web.jpg'
+        ], os.listdir(os.path.join(self.image_path, '2016/07/23')))
+        records = self.image_store.get()
+        self.assertEqual(1, len(records))
+        self.assertEqual('2016/07/23/2016-07-23T1051Z.jpg', records[0].path)
+        self.assertEqual('2016/07/23/2016-07-23T1051Z-thumb.jpg',
+                         records[0].thumbnail_path)
+        self.assertEqual('2016/07/23/2016-07-23T1051Z-web.jpg',
+                         records[0].web_path)
+
+    def test_ignores_images_already_in_date_directories(self):
+        os.makedirs(os.path.join(self.image_path, '2016/07/23'))
+        write_jpeg(
+            os.path.join(self.image_path, '2016/07/23/2016-07-23T1051Z.jpg'),
+            64, 48)
+        with open(os.path.join(self.image_path, 'notes.txt'), 'w') as f:
+            f.write('not an image')
+
+        self.assertEqual(0,
+                         image_layout.migrate_flat_layout(
+                             self.image_path, self.image_store))
+        self.assertEqual([], self.image_store.get())
+
+    def test_skips_images_that_cannot_be_migrated(self):
+        with open(os.path.join(self.image_path, '2016-07-23T1051Z.jpg'),
+                  'wb') as f:
+            f.write('not a jpeg')
+        write_jpeg(
+            os.path.join(self.image_path, '2016-13-40T1051Z.jpg'), 64, 48)
+        write_jpeg(
+            os.path.join(self.image_path, '2016-07-24T0400Z.jpg'), 64, 48)
+
+        self.assertEqual(1,
+                         image_layout.migrate_flat_layout(
+                             self.image_path, self.image_store))
+
+        self.assertTrue(
+            os.path.exists(
+                os.path.join(self.image_path, '2016-07-23T1051Z.jpg')))
+        self.assertTrue(
+            os.path.exists(
+                os.path.join(self.image_path, '2016-13-40T1051Z.jpg')))
+        self.assertEqual(['2016/07/24/2016-07-24T0400Z.jpg'],
+                         [record.path for record in self.image_store.get()])
@@ -0,0 +1,224 @@
+import datetime
+import io
+import os
+import Queue
+import shutil
+import tempfile
+import unittest
+
+from PIL import Image
+import pytz
+
+from greenpithumb import image_processor
+
+TIMESTAMP_A = datetime.datetime(2016, 7, 23, 10, 51, 9, 928000, tzinfo=pytz.utc)
+
+
+def make_jpeg(width, height):
+    """Creates JPEG data for a solid-color image of the given size."""
+    stream = io.BytesIO()
+    Image.new('RGB', (width, height), (40, 160, 40)).save(stream, 'JPEG')
+    return stream.getvalue()
+
+
+def make_gradient_jpeg(reverse=False, brightness_offset=0):
+    """Creates JPEG data for an image that brightens from left to right.
+
+    Args:
+        reverse: If True, the image darkens from left to right instead.
+        brightness_offset: Amount to add to the brightness of every pixel.
+    """
+    image = Image.new('L', (256, 192))
+    image.putdata([
+        max(0, min(255, (255 - x if reverse else x) + brightness_offset))
+        for _ in range(192) for x in range(256)
+    ])
+    stream = io.BytesIO()
+    image.convert('RGB').save(stream, 'JPEG')
+    return stream.getvalue()
+
+
+class ImageProcessorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.image_path = tempfile.mkdtemp()
+        self.record_queue = Queue.Queue()
+        self.processor = image_processor.ImageProcessor(
+            self.image_path,
+            self.record_queue,
+            worker_count=2,
+            max_duplicate_distance=None,
+            max_duplicate_age=None)
+        self.processor.start()
+
+    def tearDown(self):
+        self.processor.close()
+        shutil.rmtree(self.image_path)
+
+    def test_saves_full_resolution_and_downscaled_images(self):
+        jpeg_data = make_jpeg(2592, 1944)
+        self.processor.submit(TIMESTAMP_A, '2016/07/23/2016-07-23T1051Z.jpg',
+                              jpeg_data)
+        self.processor.close()
+
+        with open(
+                os.path.join(self.image_path,
+                             '2016/07/23/2016-07-23T1051Z.jpg'),
+                'rb') as full_resolution_file:
+            self.assertEqual(jpeg_data, full_resolution_file.read())
+        web_image = Image.open(
+            os.path.join(self.image_path,
+                         '2016/07/23/2016-07-23T1051Z-web.jpg'))
+        self.assertEqual((1280, 960), web_image.size)
+        thumbnail_image = Image.open(
+            os.path.join(self.image_path,
+                         '2016/07/23/2016-07-23T1051Z-thumb.jpg'))
+        self.assertEqual((320, 240), thumbnail_image.size)
+
+    def test_queues_image_record(self):
+        jpeg_data = make_jpeg(2592, 1944)
+        self.processor.submit(TIMESTAMP_A, '2016/07/23/2016-07-23T1051Z.jpg',
+                              jpeg_data)
+        self.processor.close()
+
+        record = self.record_queue.get_nowait()
+        self.assertEqual(TIMESTAMP_A, record.timestamp)
+        self.assertEqual('2016/07/23/2016-07-23T1051Z.jpg', record.path)
+        self.assertEqual('2016/07/23/2016-07-23T1051Z-thumb.jpg',
+                         record.thumbnail_path)
+        self.assertEqual('2016/07/23/2016-07-23T1051Z-web.jpg', record.web_path)
+        self.assertEqual(2592, record.width)
+        self.assertEqual(1944, record.height)
+        self.assertEqual(len(jpeg_data), record.size_bytes)
+        # The test image is a solid color whose luma is 110 out of 255.
+        self.assertAlmostEqual(43.3, record.brightness, places=0)
+        self.assertTrue(self.record_queue.empty())
+
+    def test_processes_all_submitted_frames_before_close_returns(self):
+        for minute in range(5):
+            self.processor.submit(TIMESTAMP_A,
+                                  '2016-07-23T10%02dZ.jpg' % minute,
+                                  make_jpeg(64, 48))
+        self.processor.close()
+
+        self.assertEqual(5, self.record_queue.qsize())
+
+    def test_images_in_same_directory_do_not_conflict(self):
+        for minute in range(5):
+            self.processor.submit(TIMESTAMP_A,
+                                  '2016/07/23/2016-07-23T10%02dZ.jpg' % minute,
+                                  make_jpeg(64, 48))
+        self.processor.close()
+
+        self.assertEqual(5, self.record_queue.qsize())
+        self.assertEqual(
+            15, len(os.listdir(os.path.join(self.image_path, '2016/07/23'))))
+
+    def test_invalid_frame_does_not_stop_processing(self):
+        self.processor.submit(TIMESTAMP_A, '2016-07-23T1050Z.jpg',
+                              'not JPEG data')
+        self.processor.submit(TIMESTAMP_A, '2016-07-23T1051Z.jpg',
+                              make_jpeg(64, 48))
+        self.processor.close()
+
+        self.assertEqual('2016-07-23T1051Z.jpg',
+                         self.record_queue.get_nowait().path)
+        self.assertTrue(self.record_queue.empty())
+
+
+class ImageProcessorDuplicateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.image_path = tempfile.mkdtemp()
+        self.record_queue = Queue.Queue()
+        self.processor = image_processor.ImageProcessor(
+            self.image_path,
+            self.record_queue,
+            worker_count=1,
+            max_duplicate_distance=4,
+            max_duplicate_age=datetime.timedelta(hours=24))
+        self.processor.start()
+
+    def tearDown(self):
+        self.processor.close()
+        shutil.rmtree(self.image_path)
+
+    def test_discards_near_duplicate_of_last_saved_frame(self):
+        self.processor.submit(TIMESTAMP_A, '2016/07/23/2016-07-23T1000Z.jpg',
+                              make_gradient_jpeg())
+        # Same scene with slightly different exposure.
+        self.processor.submit(
+            TIMESTAMP_A,
+            '2016/07/23/2016-07-23T1400Z.jpg',
+            make_gradient_jpeg(brightness_offset=-3))
+        self.processor.close()
+
+        self.assertEqual('2016/07/23/2016-07-23T1000Z.jpg',
+                         self.record_queue.get_nowait().path)
+        self.assertTrue(self.record_queue.empty())
+        self.assertFalse(
+            os.path.exists(
+                os.path.join(self.image_path,
+                             '2016/07/23/2016-07-23T1400Z.jpg')))
+
+    def test_saves_frame_that_differs_from_last_saved_frame(self):
+        self.processor.submit(TIMESTAMP_A, '2016/07/23/2016-07-23T1000Z.jpg',
+                              make_gradient_jpeg())
+        self.processor.submit(
+            TIMESTAMP_A,
+            '2016/07/23/2016-07-23T1400Z.jpg',
+            make_gradient_jpeg(reverse=True))
+        self.processor.close()
+
+        self.assertEqual('2016/07/23/2016-07-23T1000Z.jpg',
+                         self.record_queue.get_nowait().path)
+        self.assertEqual('2016/07/23/2016-07-23T1400Z.jpg',
+                         self.record_queue.get_nowait().path)
+
+    def test_compares_against_last_saved_frame_not_last_discarded_frame(self):
+        self.processor.submit(TIMESTAMP_A, '2016/07/23/2016-07-23T1000Z.jpg',
+                              make_gradient_jpeg())
+        self.processor.submit(
+            TIMESTAMP_A,
+            '2016/07/23/2016-07-23T1400Z.jpg',
+            make_gradient_jpeg(brightness_offset=-3))
+        self.processor.submit(
+            TIMESTAMP_A,
+            '2016/07/23/2016-07-23T1800Z.jpg',
+            make_gradient_jpeg(reverse=True))
+        self.processor.submit(TIMESTAMP_A, '2016/07/24/2016-07-24T1000Z.jpg',
+                              make_gradient_jpeg())
+        self.processor.close()
+
+        saved_paths = []
+        while not self.record_queue.empty():
+            saved_paths.append(self.record_queue.get_nowait().path)
+        self.assertEqual([
+            '2016/07/23/2016-07-23T1000Z.jpg',
+            '2016/07/23/2016-07-23T1800Z.jpg', '2016/07/24/2016-07-24T1000Z.jpg'
+        ], saved_paths)
+
+    def test_saves_near_duplicate_captured_long_after_last_saved_frame(self):
+        self.processor.submit(TIMESTAMP_A, '2016/07/23/2016-07-23T1051Z.jpg',
+                              make_gradient_jpeg())
+        self.processor.submit(
+            TIMESTAMP_A + datetime.timedelta(hours=12),
+            '2016/07/23/2016-07-23T2251Z.jpg',
+            make_gradient_jpeg(brightness_offset=-3))
+        self.processor.submit(
+            TIMESTAMP_A + datetime.timedelta(hours=24),
+            '2016/07/24/2016-07-24T1051Z.jpg',
+            make_gradient_jpeg(brightness_offset=-3))
+        self.processor.submit(
+            TIMESTAMP_A + datetime.timedelta(hours=36),
+            '2016/07/24/2016-07-24T2251Z.jpg',
+            make_gradient_jpeg())
+        self.processor.close()
+
+        saved_paths = []
+        while not self.record_queue.empty():
+            saved_paths.append(self.record_queue.get_nowait().path)
+        self.assertEqual([
+            '2016/07/23/2016-07-23T1051Z.jpg',
+            '2016/07/24/2016-07-24T1051Z.jpg',
+        ], saved_paths)
@@ -0,0 +1,259 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+from PIL import Image
+import pytz
+
+from greenpithumb import db_store
+from greenpithumb import image_retention
+
+# Sleep window that covers the whole day except for the last minute.
+ALWAYS_SLEEPING = [(datetime.time(0, 0), datetime.time(23, 59))]
+NOW = datetime.datetime(2017, 1, 31, 3, 0, 0, tzinfo=pytz.utc)
+
+
+class RetentionJobTest(unittest.TestCase):
+
+    def setUp(self):
+        self.image_path = tempfile.mkdtemp()
+        self.db_dir = tempfile.mkdtemp()
+        self.connection = db_store.open_or_create_db(
+            os.path.join(self.db_dir, 'test.db'))
+        self.image_store = db_store.ImageStore(self.connection)
+        self.mock_local_clock = mock.Mock()
+        self.mock_local_clock.now.return_value = NOW
+
+    def tearDown(self):
+        self.connection.close()
+        shutil.rmtree(self.image_path)
+        shutil.rmtree(self.db_dir)
+
+    def make_job(self,
+                 full_resolution_period=None,
+                 daily_period=None,
+                 sleep_windows=None):
+        return image_retention.RetentionJob(
+            self.image_path, self.image_store, self.mock_local_clock,
+            sleep_windows or ALWAYS_SLEEPING, full_resolution_period,
+            daily_period)
+
+    def add_image(self, timestamp, width=3280, height=2464, brightness=50.0):
+        """Writes an image and its derived images and indexes them."""
+        path = timestamp.strftime('%Y/%m/%d/%Y-%m-%dT%H%MZ.jpg')
+        thumbnail_path = path.replace('.jpg', '-thumb.jpg')
+        web_path = path.replace('.jpg', '-web.jpg')
+        directory = os.path.join(self.image_path, os.path.dirname(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        Image.new('RGB', (width, height)).save(
+            os.path.join(self.image_path, path), 'JPEG')
+        for derived_path in (thumbnail_path, web_path):
+            Image.new('RGB', (32, 24)).save(
+                os.path.join(self.image_path, derived_path), 'JPEG')
+        record = db_store.ImageRecord(
+            timestamp=timestamp,
+            path=path,
+            thumbnail_path=thumbnail_path,
+            web_path=web_path,
+            width=width,
+            height=height,
+            size_bytes=os.path.getsize(os.path.join(self.image_path, path)),
+            brightness=brightness)
+        self.image_store.insert(record)
+        return record
+
+    def test_downscales_images_older_than_full_resolution_period(self):
+        old_record = self.add_image(
+            datetime.datetime(2017, 1, 1, 12, 0, tzinfo=pytz.utc))
+        new_record = self.add_image(
+            datetime.datetime(2017, 1, 30, 12, 0, tzinfo=pytz.utc))
+        job = self.make_job(full_resolution_period=datetime.timedelta(days=7))
+
+        self.assertEqual(1, job.run_batch())
+
+        self.assertEqual(
+            (1640, 1232),
+            Image.open(os.path.join(self.image_path, old_record.path)).size)
+        self.assertEqual(
+            (3280, 2464),
+            Image.open(os.path.join(self.image_path, new_record.path)).size)
+        records = self.image_store.get()
+        self.assertEqual(1640, records[0].width)
+        self.assertEqual(1232, records[0].height)
+        self.assertEqual(
+            os.path.getsize(os.path.join(self.image_path, old_record.path)),
+            records[0].size_bytes)
+        self.assertEqual(new_record, records[1])
+
+    def test_skips_images_already_downscaled(self):
+        self.add_image(
+            datetime.datetime(2017, 1, 1, 12, 0, tzinfo=pytz.utc),
+            width=1280,
+            height=960)
+        job = self.make_job(full_resolution_period=datetime.timedelta(days=7))
+
+        self.assertEqual(0, job.run_batch())
+
+    def test_removes_index_entry_of_missing_image(self):
+        record = self.add_image(
+            datetime.datetime(2017, 1, 1, 12, 0, tzinfo=pytz.utc))
+        os.remove(os.path.join(self.image_path, record.path))
+        job = self.make_job(full_resolution_period=datetime.timedelta(days=7))
+
+        job.run_batch()
+
+        self.assertEqual([], self.image_store.get())
+
+    def test_keeps_only_brightest_image_per_day_after_daily_period(self):
+        dim_record = self.add_image(
+            datetime.datetime(2016, 6, 1, 8, 0, tzinfo=pytz.utc),
+            brightness=30.0)
+        bright_record = self.add_image(
+            datetime.datetime(2016, 6, 1, 12, 0, tzinfo=pytz.utc),
+            brightness=80.0)
+        recent_record = self.add_image(
+            datetime.datetime(2017, 1, 30, 8, 0, tzinfo=pytz.utc),
+            brightness=30.0)
+        self.add_image(
+            datetime.datetime(2017, 1, 30, 12, 0, tzinfo=pytz.utc),
+            brightness=80.0)
+        job = self.make_job(daily_period=datetime.timedelta(days=90))
+
+        self.assertEqual(1, job.run_batch())
+
+        for path in (dim_record.path, dim_record.thumbnail_path,
+                     dim_record.web_path):
+            self.assertFalse(
+                os.path.exists(os.path.join(self.image_path, path)))
+        self.assertTrue(
+            os.path.exists(os.path.join(self.image_path, bright_record.path)))
+        self.assertTrue(
+            os.path.exists(os.path.join(self.image_path, recent_record.path)))
+        self.assertEqual(3, len(self.image_store.get()))
+
+    def test_processes_images_in_batches(self):
+        for day in range(1, 16):
+            self.add_image(
+                datetime.datetime(2017, 1, day, 12, 0, tzinfo=pytz.utc),
+                width=64,
+                height=48)
+            self.add_image(
+                datetime.datetime(2017, 1, day, 16, 0, tzinfo=pytz.utc),
+                width=64,
+                height=48,
+                brightness=10.0)
+        job = self.make_job(daily_period=datetime.timedelta(days=7))
+
+        self.assertEqual(10, job.run_batch())
+        # Next batch should not run until the batch interval passes.
+        self.assertEqual(0, job.run_batch())
+        self.mock_local_clock.now.return_value = NOW + datetime.timedelta(
+            minutes=1)
+        self.assertEqual(5, job.run_batch())
+        self.assertEqual(15, len(self.image_store.get()))
+
+    def test_does_not_run_outside_sleep_windows(self):
+        self.add_image(datetime.datetime(2017, 1, 1, 12, 0, tzinfo=pytz.utc))
+        job = self.make_job(
+            full_resolution_period=datetime.timedelta(days=7),
+            sleep_windows=[(datetime.time(22, 0), datetime.time(2, 0))])
+
+        self.assertEqual(0, job.run_batch())
+        self.assertEqual(3280, self.image_store.get()[0].width)
+
+    def test_set_sleep_windows_changes_when_job_runs(self):
+        self.add_image(datetime.datetime(2017, 1, 1, 12, 0, tzinfo=pytz.utc))
+        job = self.make_job(
+            full_resolution_period=datetime.timedelta(days=7),
+            sleep_windows=[(datetime.time(22, 0), datetime.time(2, 0))])
+        job.set_sleep_windows(ALWAYS_SLEEPING)
+
+        self.assertEqual(1, job.run_batch())
+
+    def test_does_nothing_when_periods_are_None(self):
+        self.add_image(datetime.datetime(2016, 1, 1, 12, 0, tzinfo=pytz.utc))
+        self.add_image(datetime.datetime(2016, 1, 1, 16, 0, tzinfo=pytz.utc))
+        job = self.make_job()
+
+        self.assertEqual(0, job.run_batch())
+        self.assertEqual(2, len(self.image_store.get()))
+
+    def test_skips_image_that_cannot_be_downscaled(self):
+        corrupt_record = self.add_image(
+            datetime.datetime(2017, 1, 1, 12, 0, tzinfo=pytz.utc))
+        corrupt_path = os.path.join(self.image_path, corrupt_record.path)
+        with open(corrupt_path, 'rb') as image_file:
+            jpeg_data = image_file.read()
+        with open(corrupt_path, 'wb') as image_file:
+            image_file.write(jpeg_data[:len(jpeg_data) // 2])
+        good_record = self.add_image(
+            datetime.datetime(2017, 1, 2, 12, 0, tzinfo=pytz.utc))
+        job = self.make_job(full_resolution_period=datetime.timedelta(days=7))
+
+        self.assertEqual(1, job.run_batch())
+
+        self.assertEqual(
+            (1640, 1232),
+            Image.open(os.path.join(self.image_path, good_record.path)).size)
+        self.assertEqual([
+            '2017-01-01T1200Z-thumb.jpg', '2017-01-01T1200Z-web.jpg',
+            '2017-01-01T1200Z.jpg'
+        ], sorted(os.listdir(os.path.dirname(corrupt_path))))
+        self.assertEqual([3280, 1640],
+                         [record.width for record in self.image_store.get()])
+
+    def test_resumes_from_restored_progress(self):
+        self.add_image(datetime.datetime(2017, 1, 1, 12, 0, tzinfo=pytz.utc))
+        self.add_image(
+            datetime.datetime(2017, 1, 1, 16, 0, tzinfo=pytz.utc),
+            brightness=10.0)
+        job = self.make_job(
+            full_resolution_period=datetime.timedelta(days=7),
+            daily_period=datetime.timedelta(days=7))
+        job.restore_progress({
+            'downscale':
+            datetime.datetime(2017, 1, 2, tzinfo=pytz.utc),
+            'thin_out':
+            datetime.datetime(2017, 1, 2, tzinfo=pytz.utc),
+        })
+
+        self.assertEqual(0, job.run_batch())
+        self.assertEqual(2, len(self.image_store.get()))
+
+    def test_progress_advances_past_examined_images(self):
+        for day in range(1, 16):
+            self.add_image(
+                datetime.datetime(2017, 1, day, 12, 0, tzinfo=pytz.utc),
+                width=64,
+                height=48)
+            self.add_image(
+                datetime.datetime(2017, 1, day, 16, 0, tzinfo=pytz.utc),
+                width=64,
+                height=48,
+                brightness=10.0)
+        job = self.make_job(
+            full_resolution_period=datetime.timedelta(days=7),
+            daily_period=datetime.timedelta(days=7))
+
+        job.run_batch()
+        # The batch stopped partway through the images, so thinning out
+        # resumes at the start of the day of the last image it deleted.
+        self.assertEqual({
+            'downscale':
+            datetime.datetime(2017, 1, 10, 12, 1, tzinfo=pytz.utc),
+            'thin_out':
+            datetime.datetime(2017, 1, 10, tzinfo=pytz.utc),
+        }, job.progress())
+
+        self.mock_local_clock.now.return_value = NOW + datetime.timedelta(
+            minutes=1)
+        job.run_batch()
+        # Every old image was examined, so thinning out resumes at the start
+        # of the day on which the daily period ends.
+        self.assertEqual(
+            datetime.datetime(2017, 1, 24, tzinfo=pytz.utc),
+            job.progress()['thin_out'])
@@ -0,0 +1,238 @@
+import contextlib
+import datetime
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+import pytz
+
+from greenpithumb import db_store
+from greenpithumb import exporter
+from greenpithumb import importer
+
+
+def _minute(minute):
+    return datetime.datetime(2016, 7, 23, 10, minute, tzinfo=pytz.utc)
+
+
+class ImportTest(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self._temp_dir, 'test.db')
+        self.connection = db_store.open_or_create_db(self.db_path)
+        self.temperature_store = db_store.TemperatureStore(self.connection)
+
+    def tearDown(self):
+        self.connection.close()
+        shutil.rmtree(self._temp_dir)
+
+    def _write(self, file_name, contents):
+        path = os.path.join(self._temp_dir, file_name)
+        if file_name.endswith('.gz'):
+            with contextlib.closing(gzip.open(path, 'wb')) as output:
+                output.write(contents)
+        else:
+            with open(path, 'wb') as output:
+                output.write(contents)
+        return path
+
+    def _counts(self, all_stats):
+        """Returns each ImportStats without its timing, which varies."""
+        return [stats._replace(seconds=None) for stats in all_stats]
+
+    def _temperatures(self):
+        return [(record.timestamp, record.temperature)
+                for record in sorted(self.temperature_store.get())]
+
+    def test_imports_csv(self):
+        path = self._write('temperature-20160723T120000.csv',
+                           'timestamp,temperature\r\n'
+                           '2016-07-23T10:00Z,20.0\r\n'
+                           '2016-07-23T10:01Z,21.5\r\n')
+
+        self.assertEqual(
+            [importer.ImportStats('temperature', 2, 0, 0, 2, None)],
+            self._counts(importer.import_files(self.connection, [path])))
+        self.assertEqual([(_minute(0), 20.0), (_minute(1), 21.5)],
+                         self._temperatures())
+
+    def test_imports_gzipped_json_lines_into_given_table(self):
+        path = self._write(
+            'backup.jsonl.gz', '{"timestamp": "2016-07-23T10:00Z", '
+            '"temperature": 20.0}\n\n'
+            '{"timestamp": "2016-07-23T10:01Z", "temperature": 0}\n')
+
+        importer.import_files(self.connection, [path], table='temperature')
+
+        self.assertEqual([(_minute(0), 20.0), (_minute(1), 0.0)],
+                         self._temperatures())
+
+    def test_converts_timestamps_to_utc(self):
+        path = self._write('temperature.csv', 'timestamp,temperature\r\n'
+                           '2016-07-23T11:00+01:00,20.0\r\n'
+                           '2016-07-23 10:01:30,21.0\r\n'
+                           '1469268120,22.0\r\n')
+
+        importer.import_files(self.connection, [path])
+
+        self.assertEqual([
+            (_minute(0), 20.0),
+            (_minute(1), 21.0),
+            (_minute(2), 22.0),
+        ], self._temperatures())
+
+    def test_rejects_invalid_timestamps_and_values(self):
+        path = self._write('temperature.csv', 'timestamp,temperature\r\n'
+                           'yesterday,20.0\r\n'
+                           ',21.0\r\n'
+                           '2016-07-23T10:02Z,warm\r\n'
+                           '2016-07-23T10:03Z,\r\n')
+
+        self.assertEqual(
+            [importer.ImportStats('temperature', 4, 3, 0, 1, None)],
+            self._counts(importer.import_files(self.connection, [path])))
+        self.assertEqual([(_minute(3), None)], self._temperatures())
+
+    def test_rejects_malformed_json_lines(self):
+        path = self._write('temperature.jsonl',
+                           '{"timestamp": "2016-07-23T10:00Z", '
+                           '"temperature": 20.0}\n'
+                           '{"timestamp": "2016-07-23T10:01Z", "temper\n'
+                           '[1469268060, 21.0]\n'
+                           '{"timestamp": "2016-07-23T10:02Z", '
+                           '"temperature": 22.0}\n')
+
+        self.assertEqual(
+            [importer.ImportStats('temperature', 4, 2, 0, 2, None)],
+            self._counts(importer.import_files(self.connection, [path])))
+        self.assertEqual([(_minute(0), 20.0), (_minute(2), 22.0)],
+                         self._temperatures())
+
+    def test_skips_duplicates(self):
+        self.temperature_store.insert(
+            db_store.TemperatureRecord(_minute(0), 20.0))
+        path = self._write('temperature.csv', 'timestamp,temperature\r\n'
+                           '2016-07-23T10:00Z,25.0\r\n'
+                           '2016-07-23T10:01Z,21.0\r\n'
+                           '2016-07-23T10:01Z,26.0\r\n')
+
+        self.assertEqual(
+            [importer.ImportStats('temperature', 3, 0, 2, 1, None)],
+            self._counts(importer.import_files(self.connection, [path])))
+        self.assertEqual([(_minute(0), 20.0), (_minute(1), 21.0)],
+                         self._temperatures())
+
+    def test_rebuilds_indexes_after_large_import(self):
+        path = self._write('temperature.csv', 'timestamp,temperature\r\n'
+                           '2016-07-23T10:00Z,20.0\r\n')
+
+        importer.import_files(self.connection, [path])
+
+        self.assertIn(
+            'temperature_timestamp',
+            str(
+                self.connection.execute(
+                    'EXPLAIN QUERY PLAN SELECT * FROM temperature '
+                    'WHERE timestamp >= ?', ('2016-07-23T10:00Z',)).fetchall()))
+
+    def test_rebuilds_gaps_after_import(self):
+        for minute in (0, 1, 5):
+            self.temperature_store.insert(
+                db_store.TemperatureRecord(_minute(minute), 20.0))
+        path = self._write('temperature.csv', 'timestamp,temperature\r\n'
+                           '2016-07-23T10:03Z,20.0\r\n')
+
+        importer.import_files(
+            self.connection, [path],
+            poll_interval=datetime.timedelta(minutes=1))
+
+        self.assertEqual([
+            db_store.ReadingGap(_minute(1), _minute(3), 1),
+            db_store.ReadingGap(_minute(3), _minute(5), 1),
+        ], self.temperature_store.get_gaps(_minute(0), _minute(10)))
+
+    def test_does_not_record_gaps_in_watering_events(self):
+        path = self._write('watering_events.csv', 'timestamp,water_pumped\r\n'
+                           '2016-07-23T10:00Z,100.0\r\n'
+                           '2016-07-23T10:05Z,100.0\r\n')
+
+        importer.import_files(
+            self.connection, [path],
+            poll_interval=datetime.timedelta(minutes=1))
+
+        self.assertEqual(
+            2, len(db_store.WateringEventStore(self.connection).get()))
+        self.assertEqual(
+            [],
+            self.connection.execute('SELECT * FROM reading_gaps').fetchall())
+
+    def test_rejects_file_of_unknown_table(self):
+        path = self._write('readings.csv', 'timestamp,temperature\r\n')
+
+        with self.assertRaises(importer.UnknownTableError):
+            importer.import_files(self.connection, [path])
+
+    def test_imports_database(self):
+        source_path = os.path.join(self._temp_dir, 'source.db')
+        with contextlib.closing(
+                db_store.open_or_create_db(source_path)) as source:
+            db_store.TemperatureStore(source).insert(
+                db_store.TemperatureRecord(_minute(0), 20.0))
+            db_store.WateringEventStore(source).insert(
+                db_store.WateringEventRecord(_minute(1), 100.0))
+
+        all_stats = importer.import_database(self.connection, source_path)
+
+        self.assertEqual([
+            ('temperature', 1),
+            ('humidity', 0),
+            ('soil_moisture', 0),
+            ('light', 0),
+            ('watering_events', 1),
+            ('images', 0),
+        ], [(stats.table, stats.inserted) for stats in all_stats])
+        self.assertEqual([(_minute(0), 20.0)], self._temperatures())
+        self.assertEqual([_minute(1)], [
+            record.timestamp
+            for record in db_store.WateringEventStore(self.connection).get()
+        ])
+
+    def test_import_database_requires_existing_database(self):
+        with self.assertRaises(IOError):
+            importer.import_database(self.connection,
+                                     os.path.join(self._temp_dir, 'none.db'))
+
+    def test_imports_export(self):
+        image = db_store.ImageRecord(
+            timestamp=_minute(0),
+            path='2016-07-23/2016-07-23T1000Z.jpg',
+            thumbnail_path='2016-07-23/2016-07-23T1000Z-thumb.jpg',
+            web_path='2016-07-23/2016-07-23T1000Z-web.jpg',
+            width=3280,
+            height=2464,
+            size_bytes=1024,
+            brightness=50.0)
+        db_store.ImageStore(self.connection).insert(image)
+        self.temperature_store.insert(
+            db_store.TemperatureRecord(_minute(1), 21.5))
+        export_dir = os.path.join(self._temp_dir, 'export')
+        exporter.export(self.db_path, export_dir, ['temperature', 'images'],
+                        'csv', True)
+        import_path = os.path.join(self._temp_dir, 'import.db')
+
+        with contextlib.closing(
+                db_store.open_or_create_db(import_path)) as connection:
+            importer.import_files(connection, [
+                os.path.join(export_dir, name)
+                for name in os.listdir(export_dir)
+                if name != 'export-state.json'
+            ])
+
+            self.assertEqual([image],
+                             db_store.ImageStore(connection).get_range(
+                                 _minute(0), _minute(2), 10))
+            self.assertEqual([db_store.TemperatureRecord(_minute(1), 21.5)],
+                             db_store.TemperatureStore(connection).get())
@@ -0,0 +1,82 @@
+import datetime
+import unittest
+
+import mock
+import pytz
+
+from greenpithumb import latest_readings
+
+TIMESTAMP_A = datetime.datetime(2017, 4, 9, 11, 45, 0, tzinfo=pytz.utc)
+
+
+class LatestReadingsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_clock = mock.Mock()
+        self.mock_clock.now.return_value = TIMESTAMP_A
+        self.mock_clock.monotonic.return_value = 1000.0
+        self.readings = latest_readings.LatestReadings(self.mock_clock)
+        self.mock_read_func = mock.Mock(return_value=42.0)
+
+    def test_latest_is_None_before_any_reading(self):
+        self.assertIsNone(self.readings.latest(latest_readings.LIGHT))
+
+    def test_publish_records_reading_with_timestamp(self):
+        self.readings.publish(latest_readings.LIGHT, 50.0)
+        self.assertEqual(
+            latest_readings.Reading(timestamp=TIMESTAMP_A, value=50.0),
+            self.readings.latest(latest_readings.LIGHT))
+        self.assertIsNone(self.readings.latest(latest_readings.HUMIDITY))
+
+    def test_read_calls_read_func_when_no_reading(self):
+        self.assertEqual(42.0,
+                         self.readings.read(
+                             latest_readings.LIGHT,
+                             datetime.timedelta(seconds=30),
+                             self.mock_read_func))
+        self.mock_read_func.assert_called_once()
+        self.assertEqual(
+            latest_readings.Reading(timestamp=TIMESTAMP_A, value=42.0),
+            self.readings.latest(latest_readings.LIGHT))
+
+    def test_read_reuses_fresh_reading(self):
+        self.readings.publish(latest_readings.LIGHT, 50.0)
+        self.mock_clock.monotonic.return_value += 30
+        self.assertEqual(50.0,
+                         self.readings.read(
+                             latest_readings.LIGHT,
+                             datetime.timedelta(seconds=30),
+                             self.mock_read_func))
+        self.mock_read_func.assert_not_called()
+
+    def test_read_replaces_stale_reading(self):
+        self.readings.publish(latest_readings.LIGHT, 50.0)
+        self.mock_clock.monotonic.return_value += 31
+        self.assertEqual(42.0,
+                         self.readings.read(
+                             latest_readings.LIGHT,
+                             datetime.timedelta(seconds=30),
+                             self.mock_read_func))
+        self.assertEqual(42.0,
+                         self.readings.latest(latest_readings.LIGHT).value)
+
+    def test_read_ignores_wall_clock_jumps(self):
+        self.readings.publish(latest_readings.LIGHT, 50.0)
+        # Wall clock moves back a day, but a minute passes.
+        self.mock_clock.now.return_value = (
+            TIMESTAMP_A - datetime.timedelta(days=1))
+        self.mock_clock.monotonic.return_value += 60
+        self.assertEqual(42.0,
+                         self.readings.read(
+                             latest_readings.LIGHT,
+                             datetime.timedelta(seconds=30),
+                             self.mock_read_func))
+
+    def test_read_does_not_publish_when_read_func_fails(self):
+        self.mock_read_func.side_effect = IOError('sensor failure')
+        with self.assertRaises(IOError):
+            self.readings.read(
+                latest_readings.LIGHT,
+                datetime.timedelta(seconds=30),
+                self.mock_read_func)
+        self.assertIsNone(self.readings.latest(latest_readings.LIGHT))
@@ -0,0 +1,134 @@
+import json
+import logging
+import StringIO
+import unittest
+
+import mock
+
+from greenpithumb import log_handlers
+
+
+def _make_record(message='dummy message',
+                 level=logging.INFO,
+                 lineno=10,
+                 extra=None):
+    record = logging.LogRecord('dummy', level, 'dummy.py', lineno, message, (),
+                               None)
+    for key, value in (extra or {}).items():
+        setattr(record, key, value)
+    return record
+
+
+class RateLimitFilterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_monotonic = mock.Mock(return_value=100.0)
+        self.rate_limit_filter = log_handlers.RateLimitFilter(
+            60.0, self.mock_monotonic)
+
+    def test_does_not_limit_ordinary_records(self):
+        for _ in range(3):
+            self.assertTrue(self.rate_limit_filter.filter(_make_record()))
+
+    def test_limits_each_hot_path_call_site(self):
+        extra = log_handlers.hot_path(sensor='light', value=50)
+        self.assertTrue(
+            self.rate_limit_filter.filter(_make_record(extra=extra)))
+        self.assertFalse(
+            self.rate_limit_filter.filter(_make_record(extra=extra)))
+        # A different call site has its own limit.
+        self.assertTrue(
+            self.rate_limit_filter.filter(_make_record(lineno=20, extra=extra)))
+
+    def test_reports_dropped_messages_after_interval(self):
+        extra = log_handlers.hot_path(sensor='light', value=50)
+        self.rate_limit_filter.filter(_make_record(extra=extra))
+        self.rate_limit_filter.filter(_make_record(extra=extra))
+        self.rate_limit_filter.filter(_make_record(extra=extra))
+        self.mock_monotonic.return_value = 160.0
+
+        record = _make_record('light reading = 50', extra=extra)
+        self.assertTrue(self.rate_limit_filter.filter(record))
+        self.assertEqual('light reading = 50 (dropped 2 similar messages)',
+                         record.getMessage())
+
+
+class JsonFormatterTest(unittest.TestCase):
+
+    def test_includes_structured_fields(self):
+        record = _make_record(
+            'light reading = 50',
+            extra=log_handlers.hot_path(sensor='light', value=50))
+        entry = json.loads(log_handlers.JsonFormatter().format(record))
+        self.assertEqual('light reading = 50', entry['message'])
+        self.assertEqual('INFO', entry['level'])
+        self.assertEqual('light', entry['sensor'])
+        self.assertEqual(50, entry['value'])
+
+
+class BatchingStreamHandlerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = StringIO.StringIO()
+        self.handler = log_handlers.BatchingStreamHandler(
+            self.stream, flush_interval_seconds=60)
+        self.handler.setFormatter(logging.Formatter('%(message)s'))
+
+    def tearDown(self):
+        self.handler.close()
+
+    def test_collects_records_until_flush(self):
+        self.handler.handle(_make_record('first'))
+        self.handler.handle(_make_record('second'))
+        self.assertEqual('', self.stream.getvalue())
+        self.handler.flush()
+        self.assertEqual('first\nsecond\n', self.stream.getvalue())
+
+    def test_writes_warnings_immediately(self):
+        self.handler.handle(_make_record('first'))
+        self.handler.handle(_make_record('uh oh', level=logging.WARNING))
+        self.assertEqual('first\nuh oh\n', self.stream.getvalue())
+
+    def test_close_writes_collected_records(self):
+        self.handler.handle(_make_record('first'))
+        self.handler.close()
+        self.assertEqual('first\n', self.stream.getvalue())
+
+
+class RingBufferHandlerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stream = StringIO.StringIO()
+        self.target = logging.StreamHandler(self.stream)
+        self.target.setFormatter(logging.Formatter('%(message)s'))
+        self.target.setLevel(logging.WARNING)
+        self.logger = logging.getLogger('greenpithumb.test_ring_buffer')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(
+            log_handlers.RingBufferHandler(self.target, capacity=2))
+        self.logger.addHandler(self.target)
+
+    def tearDown(self):
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+
+    def _log(self, message, level):
+        self.logger.log(level, message)
+
+    def test_dumps_recent_context_on_error(self):
+        self._log('dropped', logging.INFO)
+        self._log('kept 1', logging.INFO)
+        self._log('warning', logging.WARNING)
+        self._log('kept 2', logging.INFO)
+        self.assertEqual('warning\n', self.stream.getvalue())
+        self._log('error', logging.ERROR)
+        self.assertEqual('warning\nkept 1\nkept 2\nerror\n',
+                         self.stream.getvalue())
+
+    def test_dumps_each_record_once(self):
+        self._log('context', logging.INFO)
+        self._log('first error', logging.ERROR)
+        self._log('second error', logging.ERROR)
+        self.assertEqual('context\nfirst error\nsecond error\n',
+                         self.stream.getvalue())
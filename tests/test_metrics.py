@@ -0,0 +1,110 @@
+import contextlib
+import unittest
+import urllib2
+
+import mock
+
+from greenpithumb import metrics
+
+
+class CounterTest(unittest.TestCase):
+
+    def test_renders_total_per_label(self):
+        counter = metrics.Counter('dummy_total', 'Dummy counter.', ('kind',))
+        counter.inc(label_values=('b',))
+        counter.inc(2, label_values=('a',))
+        counter.inc(label_values=('a',))
+        self.assertEqual(3, counter.value(('a',)))
+        self.assertEqual(('# HELP dummy_total Dummy counter.\n'
+                          '# TYPE dummy_total counter\n'
+                          'dummy_total{kind="a"} 3.0\n'
+                          'dummy_total{kind="b"} 1.0\n'), counter.render())
+
+    def test_escapes_label_values(self):
+        counter = metrics.Counter('dummy_total', 'Dummy counter.', ('kind',))
+        counter.inc(label_values=('say "hi"\\\n',))
+        self.assertIn(r'dummy_total{kind="say \"hi\"\\\n"} 1.0',
+                      counter.render())
+
+    def test_counter_without_labels_starts_at_zero(self):
+        counter = metrics.Counter('dummy_total', 'Dummy counter.', ())
+        self.assertIn('dummy_total 0.0\n', counter.render())
+
+    def test_rejects_negative_amounts(self):
+        counter = metrics.Counter('dummy_total', 'Dummy counter.', ())
+        with self.assertRaises(ValueError):
+            counter.inc(-1)
+
+    def test_rejects_wrong_number_of_labels(self):
+        counter = metrics.Counter('dummy_total', 'Dummy counter.', ('kind',))
+        with self.assertRaises(ValueError):
+            counter.inc()
+
+
+class HistogramTest(unittest.TestCase):
+
+    def test_renders_cumulative_buckets(self):
+        histogram = metrics.Histogram('dummy_seconds', 'Dummy histogram.', (),
+                                      (0.1, 1.0))
+        histogram.observe(0.05)
+        histogram.observe(0.1)
+        histogram.observe(0.5)
+        histogram.observe(5.0)
+        self.assertEqual(('# HELP dummy_seconds Dummy histogram.\n'
+                          '# TYPE dummy_seconds histogram\n'
+                          'dummy_seconds_bucket{le="0.1"} 2\n'
+                          'dummy_seconds_bucket{le="1.0"} 3\n'
+                          'dummy_seconds_bucket{le="+Inf"} 4\n'
+                          'dummy_seconds_sum 5.65\n'
+                          'dummy_seconds_count 4\n'), histogram.render())
+
+    @mock.patch.object(metrics.monotonic_clock, 'monotonic')
+    def test_time_observes_duration_of_block(self, mock_monotonic):
+        histogram = metrics.Histogram('dummy_seconds', 'Dummy histogram.',
+                                      ('poller',), (1.0,))
+        mock_monotonic.side_effect = [10.0, 10.5]
+        with histogram.time(('light',)):
+            pass
+        self.assertEqual(1, histogram.count(('light',)))
+        self.assertIn('dummy_seconds_sum{poller="light"} 0.5',
+                      histogram.render())
+
+
+class RegistryTest(unittest.TestCase):
+
+    def test_renders_gauge_from_function(self):
+        registry = metrics.Registry()
+        registry.register('dummy_depth',
+                          metrics._GaugeFunction('dummy_depth', 'Dummy gauge.',
+                                                 lambda: 7))
+        self.assertEqual(('# HELP dummy_depth Dummy gauge.\n'
+                          '# TYPE dummy_depth gauge\n'
+                          'dummy_depth 7.0\n'), registry.render())
+
+
+class MetricsServerTest(unittest.TestCase):
+
+    def setUp(self):
+        registry = metrics.Registry()
+        counter = registry.register('dummy_total',
+                                    metrics.Counter('dummy_total',
+                                                    'Dummy counter.', ()))
+        counter.inc()
+        self.server = metrics.MetricsServer('127.0.0.1', 0, registry)
+        self.server.start()
+        self.url = 'http://127.0.0.1:%d' % self.server.port
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_serves_metrics(self):
+        with contextlib.closing(urllib2.urlopen(self.url + '/metrics')) as (
+                response):
+            self.assertEqual('text/plain; version=0.0.4; charset=utf-8',
+                             response.info()['Content-Type'])
+            self.assertIn('dummy_total 1.0\n', response.read())
+
+    def test_unknown_path_returns_404(self):
+        with self.assertRaises(urllib2.HTTPError) as context:
+            urllib2.urlopen(self.url + '/other')
+        self.assertEqual(404, context.exception.code)
@@ -0,0 +1,50 @@
+import unittest
+
+from PIL import Image
+
+from greenpithumb import perceptual_hash
+
+
+def make_gradient(width, height, reverse=False):
+    """Creates a grayscale image that brightens from left to right."""
+    image = Image.new('L', (width, height))
+    image.putdata([
+        int(255.0 * (width - 1 - x if reverse else x) / (width - 1))
+        for _ in range(height) for x in range(width)
+    ])
+    return image
+
+
+class DifferenceHashTest(unittest.TestCase):
+
+    def test_hash_is_64_bits(self):
+        image_hash = perceptual_hash.difference_hash(
+            make_gradient(64, 48, reverse=True))
+        self.assertEqual(2**64 - 1, image_hash)
+
+    def test_solid_image_hashes_to_zero(self):
+        self.assertEqual(0,
+                         perceptual_hash.difference_hash(
+                             Image.new('RGB', (64, 48), (40, 160, 40))))
+
+    def test_hash_does_not_depend_on_image_size(self):
+        self.assertEqual(
+            perceptual_hash.difference_hash(make_gradient(64, 48)),
+            perceptual_hash.difference_hash(make_gradient(640, 480)))
+
+    def test_opposite_images_have_maximum_distance(self):
+        self.assertEqual(
+            64,
+            perceptual_hash.distance(
+                perceptual_hash.difference_hash(make_gradient(64, 48)),
+                perceptual_hash.difference_hash(
+                    make_gradient(64, 48, reverse=True))))
+
+
+class DistanceTest(unittest.TestCase):
+
+    def test_identical_hashes_have_zero_distance(self):
+        self.assertEqual(0, perceptual_hash.distance(0xf0f0, 0xf0f0))
+
+    def test_counts_differing_bits(self):
+        self.assertEqual(3, perceptual_hash.distance(0b1010, 0b0110 | 0b10000))
@@ -1,3 +1,4 @@
+import calendar
 import contextlib
 import datetime
 import Queue
@@ -7,21 +8,32 @@ import unittest
 import mock
 import pytz
 
+from greenpithumb import clock
 from greenpithumb import db_store
+from greenpithumb import latest_readings
 from greenpithumb import poller
 
 TEST_TIMEOUT_SECONDS = 0.5
 TIMESTAMP_A = datetime.datetime(2016, 7, 23, 10, 51, 9, 928000, tzinfo=pytz.utc)
 
 
+def _unix_time(dt):
+    return calendar.timegm(dt.utctimetuple())
+
+
 class SchedulerTest(unittest.TestCase):
 
     def setUp(self):
         self.mock_clock = mock.Mock()
+        self.mock_clock.monotonic.return_value = 1000.0
+
+    def advance_clocks(self, seconds):
+        self.mock_clock.now_unix.return_value += seconds
+        self.mock_clock.monotonic.return_value += seconds
 
     def test_wait_less_than_timeout_returns_True(self):
-        self.mock_clock.now.return_value = datetime.datetime(
-            2017, 4, 9, 11, 43, 29, tzinfo=pytz.utc)
+        self.mock_clock.now_unix.return_value = _unix_time(
+            datetime.datetime(2017, 4, 9, 11, 43, 29, tzinfo=pytz.utc))
         scheduler = poller.Scheduler(
             self.mock_clock, poll_interval=datetime.timedelta(minutes=5))
         self.assertTrue(scheduler.wait_until_poll_time(timeout=(10 * 60)))
@@ -30,8 +42,8 @@ class SchedulerTest(unittest.TestCase):
         self.mock_clock.wait.assert_called_with(91)
 
     def test_wait_more_than_timeout_returns_False(self):
-        self.mock_clock.now.return_value = datetime.datetime(
-            2017, 4, 9, 11, 43, 29, tzinfo=pytz.utc)
+        self.mock_clock.now_unix.return_value = _unix_time(
+            datetime.datetime(2017, 4, 9, 11, 43, 29, tzinfo=pytz.utc))
         scheduler = poller.Scheduler(
             self.mock_clock, poll_interval=datetime.timedelta(minutes=5))
         # If it's 11:43:29, at 5m polling intervals, next poll is at 11:45:00,
@@ -40,8 +52,8 @@ class SchedulerTest(unittest.TestCase):
         self.mock_clock.wait.assert_called_with(90)
 
     def test_wait_equal_to_timeout_returns_True(self):
-        self.mock_clock.now.return_value = datetime.datetime(
-            2017, 4, 9, 11, 43, 29, tzinfo=pytz.utc)
+        self.mock_clock.now_unix.return_value = _unix_time(
+            datetime.datetime(2017, 4, 9, 11, 43, 29, tzinfo=pytz.utc))
         scheduler = poller.Scheduler(
             self.mock_clock, poll_interval=datetime.timedelta(minutes=5))
         # If it's 11:43:29, at 5m polling intervals, next poll is at 11:45:00,
@@ -50,8 +62,8 @@ class SchedulerTest(unittest.TestCase):
         self.mock_clock.wait.assert_called_with(91)
 
     def test_no_wait_if_first_call_is_on_interval_boundary(self):
-        self.mock_clock.now.return_value = datetime.datetime(
-            2017, 4, 9, 11, 45, 0, tzinfo=pytz.utc)
+        self.mock_clock.now_unix.return_value = _unix_time(
+            datetime.datetime(2017, 4, 9, 11, 45, 0, tzinfo=pytz.utc))
         scheduler = poller.Scheduler(
             self.mock_clock, poll_interval=datetime.timedelta(minutes=5))
         self.assertTrue(scheduler.wait_until_poll_time(timeout=(10 * 60)))
@@ -59,8 +71,8 @@ class SchedulerTest(unittest.TestCase):
         self.mock_clock.wait.assert_not_called()
 
     def test_increments_wait_if_consecutive_calls_on_same_poll_boundary(self):
-        self.mock_clock.now.return_value = datetime.datetime(
-            2017, 4, 9, 11, 45, 0, tzinfo=pytz.utc)
+        self.mock_clock.now_unix.return_value = _unix_time(
+            datetime.datetime(2017, 4, 9, 11, 45, 0, tzinfo=pytz.utc))
         scheduler = poller.Scheduler(
             self.mock_clock, poll_interval=datetime.timedelta(minutes=5))
         self.assertTrue(scheduler.wait_until_poll_time(timeout=(10 * 60)))
@@ -71,17 +83,48 @@ class SchedulerTest(unittest.TestCase):
         self.assertTrue(scheduler.wait_until_poll_time(timeout=(10 * 60)))
         self.mock_clock.wait.assert_called_with(5 * 60)
 
+    def test_set_poll_interval_reschedules_next_poll(self):
+        self.mock_clock.now_unix.return_value = _unix_time(
+            datetime.datetime(2017, 4, 9, 11, 43, 29, tzinfo=pytz.utc))
+        scheduler = poller.Scheduler(
+            self.mock_clock, poll_interval=datetime.timedelta(minutes=15))
+        # Next poll is at 11:45:00, 91 seconds later.
+        self.assertFalse(scheduler.wait_until_poll_time(timeout=60))
+        self.advance_clocks(60)
+        scheduler.set_poll_interval(datetime.timedelta(minutes=30))
+        # At 11:44:29, at 30m polling intervals, next poll is at 12:00:00.
+        self.assertTrue(scheduler.wait_until_poll_time(timeout=(20 * 60)))
+        self.mock_clock.wait.assert_called_with(931)
+        self.assertEqual(
+            datetime.datetime(2017, 4, 9, 12, 0, 0, tzinfo=pytz.utc),
+            scheduler.last_poll_time())
+
+    def test_restored_last_poll_time_prevents_repeating_its_tick(self):
+        self.mock_clock.now_unix.return_value = _unix_time(
+            datetime.datetime(2017, 4, 9, 11, 45, 0, tzinfo=pytz.utc))
+        scheduler = poller.Scheduler(
+            self.mock_clock, poll_interval=datetime.timedelta(minutes=5))
+        scheduler.restore_last_poll_time(
+            datetime.datetime(2017, 4, 9, 11, 45, 0, tzinfo=pytz.utc))
+        # A previous run already polled at 11:45:00, so wait for the next
+        # boundary.
+        self.assertTrue(scheduler.wait_until_poll_time(timeout=(10 * 60)))
+        self.mock_clock.wait.assert_called_with(5 * 60)
+        self.assertEqual(
+            datetime.datetime(2017, 4, 9, 11, 50, 0, tzinfo=pytz.utc),
+            scheduler.last_poll_time())
+
     def test_last_poll_time_is_None_before_wait_called(self):
-        self.mock_clock.now.return_value = datetime.datetime(
-            2017, 4, 9, 11, 43, 29, tzinfo=pytz.utc)
+        self.mock_clock.now_unix.return_value = _unix_time(
+            datetime.datetime(2017, 4, 9, 11, 43, 29, tzinfo=pytz.utc))
         scheduler = poller.Scheduler(
             self.mock_clock, poll_interval=datetime.timedelta(minutes=5))
         # If no poll has happened, last_poll_time should be None.
         self.assertIsNone(scheduler.last_poll_time())
 
     def test_last_poll_time_is_None_before_poll_wait_completes(self):
-        self.mock_clock.now.return_value = datetime.datetime(
-            2017, 4, 9, 11, 43, 29, tzinfo=pytz.utc)
+        self.mock_clock.now_unix.return_value = _unix_time(
+            datetime.datetime(2017, 4, 9, 11, 43, 29, tzinfo=pytz.utc))
         scheduler = poller.Scheduler(
             self.mock_clock, poll_interval=datetime.timedelta(minutes=5))
 
@@ -91,8 +134,8 @@ class SchedulerTest(unittest.TestCase):
         self.assertIsNone(scheduler.last_poll_time())
 
     def test_last_poll_time_updates_when_wait_completes(self):
-        self.mock_clock.now.return_value = datetime.datetime(
-            2017, 4, 9, 11, 43, 29, tzinfo=pytz.utc)
+        self.mock_clock.now_unix.return_value = _unix_time(
+            datetime.datetime(2017, 4, 9, 11, 43, 29, tzinfo=pytz.utc))
         scheduler = poller.Scheduler(
             self.mock_clock, poll_interval=datetime.timedelta(minutes=5))
 
@@ -103,13 +146,117 @@ class SchedulerTest(unittest.TestCase):
             datetime.datetime(2017, 4, 9, 11, 45, 0, tzinfo=pytz.utc),
             scheduler.last_poll_time())
 
-        self.mock_clock.now.return_value = datetime.datetime(
-            2017, 4, 9, 11, 49, 29, tzinfo=pytz.utc)
+        self.mock_clock.now_unix.return_value = _unix_time(
+            datetime.datetime(2017, 4, 9, 11, 49, 29, tzinfo=pytz.utc))
         self.assertTrue(scheduler.wait_until_poll_time(timeout=120))
         self.assertEqual(
             datetime.datetime(2017, 4, 9, 11, 50, 0, tzinfo=pytz.utc),
             scheduler.last_poll_time())
 
+    def test_last_completed_poll_time_updates_when_poll_is_marked_completed(
+            self):
+        self.mock_clock.now_unix.return_value = _unix_time(
+            datetime.datetime(2017, 4, 9, 11, 43, 29, tzinfo=pytz.utc))
+        scheduler = poller.Scheduler(
+            self.mock_clock, poll_interval=datetime.timedelta(minutes=5))
+        scheduler.restore_last_poll_time(
+            datetime.datetime(2017, 4, 9, 11, 40, 0, tzinfo=pytz.utc))
+        self.assertEqual(
+            datetime.datetime(2017, 4, 9, 11, 40, 0, tzinfo=pytz.utc),
+            scheduler.last_completed_poll_time())
+
+        # The poll at 11:45:00 has started but not yet queued its records.
+        self.assertTrue(scheduler.wait_until_poll_time(timeout=120))
+        self.assertEqual(
+            datetime.datetime(2017, 4, 9, 11, 40, 0, tzinfo=pytz.utc),
+            scheduler.last_completed_poll_time())
+
+        scheduler.mark_poll_completed()
+        self.assertEqual(
+            datetime.datetime(2017, 4, 9, 11, 45, 0, tzinfo=pytz.utc),
+            scheduler.last_completed_poll_time())
+
+    def test_resumes_wait_after_timeout(self):
+        self.mock_clock.now_unix.return_value = _unix_time(
+            datetime.datetime(2017, 4, 9, 11, 43, 29, tzinfo=pytz.utc))
+        scheduler = poller.Scheduler(
+            self.mock_clock, poll_interval=datetime.timedelta(minutes=5))
+        self.assertFalse(scheduler.wait_until_poll_time(timeout=60))
+        self.advance_clocks(60)
+        self.assertTrue(scheduler.wait_until_poll_time(timeout=60))
+        self.mock_clock.wait.assert_called_with(31)
+        self.assertEqual(
+            datetime.datetime(2017, 4, 9, 11, 45, 0, tzinfo=pytz.utc),
+            scheduler.last_poll_time())
+
+    def test_reschedules_when_wall_clock_jumps_forward(self):
+        # Before NTP syncs, the wall clock is far behind the real time.
+        self.mock_clock.now_unix.return_value = _unix_time(
+            datetime.datetime(1970, 1, 1, 0, 3, 29, tzinfo=pytz.utc))
+        scheduler = poller.Scheduler(
+            self.mock_clock, poll_interval=datetime.timedelta(minutes=5))
+        self.assertFalse(scheduler.wait_until_poll_time(timeout=60))
+        # NTP syncs, moving the wall clock forward, while only 60 seconds pass.
+        self.mock_clock.now_unix.return_value = _unix_time(
+            datetime.datetime(2017, 4, 9, 11, 43, 29, tzinfo=pytz.utc))
+        self.mock_clock.monotonic.return_value += 60
+        # Poll is rescheduled against the new wall clock time rather than
+        # firing immediately.
+        self.assertFalse(scheduler.wait_until_poll_time(timeout=60))
+        self.advance_clocks(60)
+        self.assertTrue(scheduler.wait_until_poll_time(timeout=60))
+        self.mock_clock.wait.assert_called_with(31)
+        self.assertEqual(
+            datetime.datetime(2017, 4, 9, 11, 45, 0, tzinfo=pytz.utc),
+            scheduler.last_poll_time())
+
+    def test_reschedules_when_wall_clock_jumps_backward(self):
+        self.mock_clock.now_unix.return_value = _unix_time(
+            datetime.datetime(2017, 4, 9, 14, 43, 29, tzinfo=pytz.utc))
+        scheduler = poller.Scheduler(
+            self.mock_clock, poll_interval=datetime.timedelta(minutes=5))
+        self.assertFalse(scheduler.wait_until_poll_time(timeout=60))
+        # Wall clock moves back three hours while only 60 seconds pass.
+        self.mock_clock.now_unix.return_value = _unix_time(
+            datetime.datetime(2017, 4, 9, 11, 44, 29, tzinfo=pytz.utc))
+        self.mock_clock.monotonic.return_value += 60
+        # The poll happens at the next boundary of the new wall clock time
+        # rather than stalling for three hours.
+        self.assertTrue(scheduler.wait_until_poll_time(timeout=60))
+        self.mock_clock.wait.assert_called_with(31)
+        self.assertEqual(
+            datetime.datetime(2017, 4, 9, 11, 45, 0, tzinfo=pytz.utc),
+            scheduler.last_poll_time())
+
+    def test_small_wall_clock_drift_does_not_reschedule(self):
+        self.mock_clock.now_unix.return_value = _unix_time(
+            datetime.datetime(2017, 4, 9, 11, 43, 29, tzinfo=pytz.utc))
+        scheduler = poller.Scheduler(
+            self.mock_clock, poll_interval=datetime.timedelta(minutes=5))
+        self.assertFalse(scheduler.wait_until_poll_time(timeout=60))
+        # The wall clock runs one second fast relative to the monotonic clock.
+        self.mock_clock.now_unix.return_value += 61
+        self.mock_clock.monotonic.return_value += 60
+        self.assertTrue(scheduler.wait_until_poll_time(timeout=60))
+        self.mock_clock.wait.assert_called_with(31)
+
+    def test_polls_on_schedule_with_simulated_clock(self):
+        simulated_clock = clock.SimulatedClock(
+            datetime.datetime(2017, 4, 9, 11, 43, 29, tzinfo=pytz.utc))
+        simulated_clock.set_participant_count(1)
+        scheduler = poller.Scheduler(
+            simulated_clock, poll_interval=datetime.timedelta(minutes=15))
+        poll_times = []
+        while len(poll_times) < 96:
+            if scheduler.wait_until_poll_time(timeout=60):
+                poll_times.append(scheduler.last_poll_time())
+        self.assertEqual(
+            datetime.datetime(2017, 4, 9, 11, 45, 0, tzinfo=pytz.utc),
+            poll_times[0])
+        self.assertEqual(
+            datetime.datetime(2017, 4, 10, 11, 30, 0, tzinfo=pytz.utc),
+            poll_times[-1])
+
 
 class PollerTest(unittest.TestCase):
 
@@ -119,12 +266,13 @@ class PollerTest(unittest.TestCase):
         self.mock_is_poll_time = False
         self.mock_scheduler.wait_until_poll_time.side_effect = (
             self.mock_wait_until_poll_time)
-        make_scheduler_func = lambda: self.mock_scheduler
+        make_scheduler_func = lambda _: self.mock_scheduler
         self.mock_sensor = mock.Mock()
         self.mock_store = mock.Mock()
         self.record_queue = Queue.Queue()
-        self.factory = poller.SensorPollerFactory(make_scheduler_func,
-                                                  self.record_queue)
+        self.readings = latest_readings.LatestReadings(clock.Clock())
+        self.factory = poller.SensorPollerFactory(
+            make_scheduler_func, self.record_queue, self.readings)
 
     def mock_wait_until_poll_time(self, _):
         wait_result = self.mock_is_poll_time
@@ -198,6 +346,25 @@ class SimplePollerClassesTest(PollerTest):
             self.record_queue.get(block=True, timeout=TEST_TIMEOUT_SECONDS))
         # Should be no more items in the queue.
         self.assertTrue(self.record_queue.empty())
+        self.assertEqual(50.0,
+                         self.readings.latest(latest_readings.LIGHT).value)
+
+    def test_light_poller_reuses_recent_reading(self):
+        # Another reader (e.g. the camera) just read the light sensor.
+        self.readings.publish(latest_readings.LIGHT, 75.0)
+        with contextlib.closing(
+                self.factory.create_light_poller(
+                    self.mock_sensor)) as light_poller:
+            self.mock_is_poll_time = True
+            self.mock_scheduler.last_poll_time.return_value = TIMESTAMP_A
+
+            light_poller.start_polling_async()
+            self.block_until_poll_completes()
+
+        self.assertEqual(
+            db_store.LightRecord(timestamp=TIMESTAMP_A, light=75.0),
+            self.record_queue.get(block=True, timeout=TEST_TIMEOUT_SECONDS))
+        self.mock_sensor.light.assert_not_called()
 
 
 class SoilWateringPollerTest(PollerTest):
@@ -290,3 +457,48 @@ class CameraPollerTest(PollerTest):
         self.mock_camera_manager.save_photo.assert_not_called()
         self.mock_camera_manager.close.assert_called()
         self.assertTrue(self.record_queue.empty())
+
+    def test_stop_does_not_close_camera(self):
+        camera_poller = self.factory.create_camera_poller(
+            self.mock_camera_manager)
+        camera_poller.start_polling_async()
+        camera_poller.stop()
+        self.assertTrue(camera_poller.join(TEST_TIMEOUT_SECONDS))
+        self.mock_camera_manager.close.assert_not_called()
+        camera_poller.close()
+        self.mock_camera_manager.close.assert_called_once()
+
+
+class JoinTest(PollerTest):
+
+    def test_join_returns_True_when_never_started(self):
+        temperature_poller = self.factory.create_temperature_poller(
+            self.mock_sensor)
+        self.assertTrue(temperature_poller.join(TEST_TIMEOUT_SECONDS))
+
+    def test_join_waits_for_poll_in_progress(self):
+        poll_started = threading.Event()
+        finish_poll = threading.Event()
+
+        def slow_temperature():
+            poll_started.set()
+            finish_poll.wait(TEST_TIMEOUT_SECONDS)
+            return 21.0
+
+        self.mock_sensor.temperature.side_effect = slow_temperature
+        self.mock_scheduler.last_poll_time.return_value = TIMESTAMP_A
+        self.mock_is_poll_time = True
+        temperature_poller = self.factory.create_temperature_poller(
+            self.mock_sensor)
+        temperature_poller.start_polling_async()
+        poll_started.wait(TEST_TIMEOUT_SECONDS)
+        temperature_poller.stop()
+        self.assertFalse(temperature_poller.join(0.01))
+        self.mock_scheduler.mark_poll_completed.assert_not_called()
+        finish_poll.set()
+        self.assertTrue(temperature_poller.join(TEST_TIMEOUT_SECONDS))
+        self.mock_scheduler.mark_poll_completed.assert_called_once_with()
+        # The poll in progress still queues its record.
+        self.assertEqual(
+            db_store.TemperatureRecord(timestamp=TIMESTAMP_A, temperature=21.0),
+            self.record_queue.get_nowait())
@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from greenpithumb import profiler
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path_prefix = os.path.join(self.temp_dir, 'greenpithumb-profile')
+        self.worker_stopped = threading.Event()
+        self.worker = threading.Thread(
+            target=self.worker_stopped.wait, name='_DummyPollWorker')
+        self.worker.start()
+
+    def tearDown(self):
+        self.worker_stopped.set()
+        self.worker.join()
+        shutil.rmtree(self.temp_dir)
+
+    def _read_output(self, extension):
+        paths = [
+            os.path.join(self.temp_dir, name)
+            for name in os.listdir(self.temp_dir) if name.endswith(extension)
+        ]
+        self.assertEqual(1, len(paths))
+        with open(paths[0]) as output_file:
+            return output_file.read()
+
+    def test_does_nothing_until_requested(self):
+        local_profiler = profiler.Profiler(self.path_prefix, 0)
+        self.assertFalse(local_profiler.start_if_requested())
+        local_profiler.close()
+        self.assertEqual([], os.listdir(self.temp_dir))
+
+    def test_writes_stack_dump_and_profile_with_thread_names(self):
+        local_profiler = profiler.Profiler(
+            self.path_prefix, 0.05, sample_interval_seconds=0.01)
+        local_profiler.request_profile()
+        self.assertTrue(local_profiler.start_if_requested())
+        local_profiler.close()
+
+        stacks = self._read_output('.stacks.txt')
+        self.assertIn('Thread _DummyPollWorker', stacks)
+        self.assertIn('test_writes_stack_dump_and_profile_with_thread_names',
+                      stacks)
+        profile = self._read_output('.profile.txt')
+        self.assertIn('_DummyPollWorker;', profile)
+        self.assertNotIn('Profiler;', profile)
+
+    def test_close_right_after_start_still_writes_a_sample(self):
+        local_profiler = profiler.Profiler(self.path_prefix, 60)
+        local_profiler.request_profile()
+        self.assertTrue(local_profiler.start_if_requested())
+        local_profiler.close()
+
+        self.assertIn('_DummyPollWorker;', self._read_output('.profile.txt'))
+
+    def test_ignores_request_while_profiling(self):
+        local_profiler = profiler.Profiler(self.path_prefix, 60)
+        local_profiler.request_profile()
+        self.assertTrue(local_profiler.start_if_requested())
+        local_profiler.request_profile()
+        self.assertFalse(local_profiler.start_if_requested())
+        local_profiler.close()
+
+
+class WriteProfileTest(unittest.TestCase):
+
+    def test_writes_most_sampled_stacks_first(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'profile.txt')
+            profiler.write_profile(path, {
+                ('Main', ('main (a.py:1)',)):
+                1,
+                ('Poller', ('poll (b.py:2)', 'read (c.py:3)')):
+                3,
+            })
+            with open(path) as profile_file:
+                self.assertEqual(('Poller;poll (b.py:2);read (c.py:3) 3\n'
+                                  'Main;main (a.py:1) 1\n'),
+                                 profile_file.read())
+        finally:
+            shutil.rmtree(temp_dir)
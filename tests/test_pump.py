@@ -52,6 +52,38 @@ class PumpTest(unittest.TestCase):
         self.assertFalse(self.mock_clock.wait.called)
         self.assertFalse(self.mock_pi_io.turn_pin_off.called)
 
+    def test_set_pin_changes_pin_on_next_run(self):
+        water_pump = pump.Pump(self.mock_pi_io, self.mock_clock, pump_pin=6)
+        water_pump.set_pin(13)
+        water_pump.pump_water(200.0)
+        self.mock_pi_io.turn_pin_on.assert_called_once_with(13)
+        self.mock_pi_io.turn_pin_off.assert_called_once_with(13)
+
+    def test_set_pin_while_running_turns_off_original_pin(self):
+        water_pump = pump.Pump(self.mock_pi_io, self.mock_clock, pump_pin=6)
+        self.mock_clock.wait.side_effect = lambda _: water_pump.set_pin(13)
+        water_pump.pump_water(200.0)
+        self.mock_pi_io.turn_pin_on.assert_called_once_with(6)
+        self.mock_pi_io.turn_pin_off.assert_called_once_with(6)
+
+    def test_turn_off_turns_pump_pin_off(self):
+        pump.Pump(self.mock_pi_io, self.mock_clock, pump_pin=6).turn_off()
+        self.mock_pi_io.turn_pin_off.assert_called_once_with(6)
+        self.mock_pi_io.turn_pin_on.assert_not_called()
+
+    def test_turn_off_after_interrupted_run_turns_original_pin_off(self):
+        water_pump = pump.Pump(self.mock_pi_io, self.mock_clock, pump_pin=6)
+
+        def interrupt_run(_):
+            water_pump.set_pin(13)
+            raise KeyboardInterrupt()
+
+        self.mock_clock.wait.side_effect = interrupt_run
+        with self.assertRaises(KeyboardInterrupt):
+            water_pump.pump_water(200.0)
+        water_pump.turn_off()
+        self.mock_pi_io.turn_pin_off.assert_called_once_with(6)
+
     def test_pump_negative_amount_raises_ValueError(self):
         """Attempting to pump a negative amount of water raises an exception."""
         with self.assertRaises(ValueError):
@@ -137,6 +169,18 @@ class PumpManagerTest(unittest.TestCase):
         self.mock_timer.reset.assert_called_once()
         self.assertEqual(ml_pumped, 200)
 
+    def test_set_moisture_threshold_changes_when_pump_runs(self):
+        manager = pump.PumpManager(
+            pump=self.mock_pump,
+            pump_scheduler=self.mock_pump_scheduler,
+            moisture_threshold=300,
+            pump_amount=200,
+            timer=self.mock_timer)
+        self.mock_pump_scheduler.is_running_pump_allowed.return_value = True
+        self.mock_timer.expired.return_value = False
+        manager.set_moisture_threshold(700)
+        self.assertEqual(200, manager.pump_if_needed(650))
+
 
 class PumpSchedulerTest(unittest.TestCase):
 
@@ -192,6 +236,16 @@ class PumpSchedulerTest(unittest.TestCase):
                                             sleep_windows)
         self.assertFalse(pump_scheduler.is_running_pump_allowed())
 
+    def test_set_sleep_windows_replaces_sleep_windows(self):
+        self.mock_local_clock.now.return_value = (datetime.datetime(
+            2016, 7, 23, 10, 51, 9, 928000, tzinfo=pytz.utc))
+        pump_scheduler = pump.PumpScheduler(self.mock_local_clock,
+                                            [(datetime.time(2, 11),
+                                              datetime.time(8, 33))])
+        pump_scheduler.set_sleep_windows([(datetime.time(10, 0), datetime.time(
+            11, 0))])
+        self.assertFalse(pump_scheduler.is_running_pump_allowed())
+
     def test_current_hour_and_minute_equal_to_wake_time(self):
         """Running pump should be allowed."""
         now = datetime.datetime(2016, 7, 23, 10, 51, 9, 928000, tzinfo=pytz.utc)
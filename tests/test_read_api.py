@@ -0,0 +1,219 @@
+import contextlib
+import datetime
+import gzip
+import httplib
+import io
+import json
+import os
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+import urllib2
+
+import mock
+import pytz
+
+from greenpithumb import db_store
+from greenpithumb import read_api
+from greenpithumb import record_publisher
+
+
+class ReadApiTest(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        db_path = os.path.join(self._temp_dir, 'test.db')
+        self.connection = db_store.open_or_create_db(db_path)
+        for minute, temperature in ((0, 20.0), (1, 21.0), (2, 22.0)):
+            db_store.TemperatureStore(self.connection).insert(
+                db_store.TemperatureRecord(
+                    datetime.datetime(2016, 7, 23, 10, minute, tzinfo=pytz.utc),
+                    temperature))
+        db_store.WateringEventStore(self.connection).insert(
+            db_store.WateringEventRecord(
+                datetime.datetime(2016, 7, 23, 10, 2, tzinfo=pytz.utc), 200.0))
+        self.publisher = record_publisher.RecordPublisher()
+        self.server = read_api.ReadApiServer('127.0.0.1', 0, db_path,
+                                             self.publisher)
+        self.server.start()
+
+    def tearDown(self):
+        self.publisher.close()
+        self.server.close()
+        self.connection.close()
+        shutil.rmtree(self._temp_dir)
+
+    def _open(self, path, headers=None):
+        return urllib2.urlopen(
+            urllib2.Request(
+                'http://127.0.0.1:%d%s' % (self.server.port, path),
+                headers=headers or {}))
+
+    def _get(self, path):
+        with contextlib.closing(self._open(path)) as response:
+            return json.load(response)
+
+    def test_pages_through_readings(self):
+        response = self._get('/readings/temperature?start=2016-07-23T10:01Z'
+                             '&limit=1')
+        self.assertEqual('temperature', response['sensor'])
+        self.assertEqual([{
+            'timestamp': '2016-07-23T10:01Z',
+            'temperature': 21.0
+        }], response['readings'])
+
+        response = self._get(
+            '/readings/temperature?start=2016-07-23T10:01Z&limit=1'
+            '&page_token=%s' % response['next_page_token'])
+        self.assertEqual([22.0], [
+            reading['temperature'] for reading in response['readings']
+        ])
+        self.assertIsNone(response['next_page_token'])
+
+    def test_summarizes_readings_by_step(self):
+        response = self._get('/readings/temperature?step=120')
+        self.assertEqual([(20.5, 2), (22.0, 1)],
+                         [(summary['mean'], summary['count'])
+                          for summary in response['summaries']])
+
+    def test_pages_through_summaries(self):
+        temperature_store = db_store.TemperatureStore(self.connection)
+        for minute in range(3, 6):
+            temperature_store.insert(
+                db_store.TemperatureRecord(
+                    datetime.datetime(2016, 7, 23, 10, minute, tzinfo=pytz.utc),
+                    20.0 + minute))
+        counts = []
+        page_token = None
+        for _ in range(10):
+            path = '/readings/temperature?step=120&limit=1'
+            if page_token:
+                path += '&page_token=' + page_token
+            response = self._get(path)
+            counts.extend(summary['count'] for summary in response['summaries'])
+            page_token = response['next_page_token']
+            if not page_token:
+                break
+        self.assertIsNone(page_token)
+        self.assertEqual([2, 2, 2], counts)
+
+    def test_rejects_step_that_is_not_whole_minutes(self):
+        with self.assertRaises(urllib2.HTTPError) as context:
+            self._open('/readings/temperature?step=90')
+        self.assertEqual(400, context.exception.code)
+
+    def test_latest(self):
+        response = self._get('/latest')
+        self.assertEqual(22.0, response['temperature']['temperature'])
+        self.assertEqual(200.0, response['watering_event']['water_pumped'])
+        self.assertIsNone(response['image'])
+
+    def test_returns_not_modified_for_matching_etag(self):
+        with contextlib.closing(self._open('/watering_events')) as response:
+            etag = response.info()['ETag']
+        with self.assertRaises(urllib2.HTTPError) as context:
+            self._open('/watering_events', {'If-None-Match': etag})
+        self.assertEqual(304, context.exception.code)
+
+    def test_compresses_large_responses(self):
+        temperature_store = db_store.TemperatureStore(self.connection)
+        for hour in range(11, 23):
+            for minute in range(60):
+                temperature_store.insert(
+                    db_store.TemperatureRecord(
+                        datetime.datetime(
+                            2016, 7, 23, hour, minute, tzinfo=pytz.utc), 25.0))
+        with contextlib.closing(
+                self._open('/readings/temperature', {'Accept-Encoding': 'gzip'
+                                                    })) as response:
+            self.assertEqual('gzip', response.info()['Content-Encoding'])
+            body = gzip.GzipFile(fileobj=io.BytesIO(response.read())).read()
+        self.assertEqual(723, len(json.loads(body)['readings']))
+
+    def test_rejects_invalid_parameters(self):
+        with self.assertRaises(urllib2.HTTPError) as context:
+            self._open('/readings/temperature?start=yesterday')
+        self.assertEqual(400, context.exception.code)
+
+    def test_downsamples_readings(self):
+        response = self._get('/readings/temperature?points=3')
+        self.assertEqual(3, response['points'])
+        self.assertEqual([20.0, 21.0, 22.0], [
+            reading['temperature'] for reading in response['readings']
+        ])
+
+    def test_rejects_step_with_points(self):
+        with self.assertRaises(urllib2.HTTPError) as context:
+            self._open('/readings/temperature?step=60&points=100')
+        self.assertEqual(400, context.exception.code)
+
+    def test_unknown_sensor_returns_404(self):
+        with self.assertRaises(urllib2.HTTPError) as context:
+            self._open('/readings/wind')
+        self.assertEqual(404, context.exception.code)
+
+    @mock.patch.object(read_api._ReadApiRequestHandler, 'timeout', 0.2)
+    def test_ends_stream_to_client_that_stops_reading(self):
+        # Buffers every record, so that only the timeout can end the stream.
+        publisher = record_publisher.RecordPublisher(
+            buffer_size=100000, max_subscribers=1)
+        server = read_api.ReadApiServer('127.0.0.1', 0, None, publisher)
+        server.start()
+        client = socket.socket()
+        try:
+            client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+            client.settimeout(30)
+            client.connect(('127.0.0.1', server.port))
+            client.sendall('GET /events HTTP/1.0\r\n\r\n')
+            self.assertIn('200', client.recv(16))
+            # Publishes more than the socket buffers hold while the client
+            # reads nothing.
+            path = 'x' * 1000
+            for minute in range(5000):
+                publisher.publish(
+                    db_store.ImageRecord(
+                        datetime.datetime(2016, 7, 23, 10, 3, tzinfo=pytz.utc) +
+                        datetime.timedelta(minutes=minute),
+                        path,
+                        path,
+                        path,
+                        3280,
+                        2464,
+                        2500000,
+                        62.5))
+            # The stalled stream frees its subscriber slot.
+            deadline = time.time() + 30
+            while True:
+                try:
+                    publisher.unsubscribe(publisher.subscribe())
+                    break
+                except record_publisher.TooManySubscribersError:
+                    self.assertLess(time.time(), deadline)
+                    time.sleep(0.01)
+            # The server dropped the connection, so the client reads what was
+            # buffered and then reaches the end of the stream.
+            while client.recv(65536):
+                pass
+        finally:
+            client.close()
+            publisher.close()
+            server.close()
+
+    def test_streams_published_records(self):
+        connection = httplib.HTTPConnection('127.0.0.1', self.server.port)
+        with contextlib.closing(connection):
+            connection.request('GET', '/events')
+            response = connection.getresponse()
+            self.assertEqual('text/event-stream',
+                             response.getheader('Content-Type'))
+            self.publisher.publish(
+                db_store.LightRecord(
+                    datetime.datetime(2016, 7, 23, 10, 3, tzinfo=pytz.utc),
+                    55.0))
+            # Reads unbuffered, as the stream has no end.
+            self.assertEqual('event: light\n', response.fp.readline())
+            self.assertEqual(
+                'data: {"light": 55.0, "timestamp": "2016-07-23T10:03Z"}\n',
+                response.fp.readline())
@@ -1,5 +1,6 @@
 import datetime
 import Queue
+import sqlite3
 import unittest
 
 import mock
@@ -18,13 +19,23 @@ class RecordProcessorTest(unittest.TestCase):
         self.mock_humidity_store = mock.Mock()
         self.mock_temperature_store = mock.Mock()
         self.mock_watering_event_store = mock.Mock()
+        self.mock_image_store = mock.Mock()
         self.processor = record_processor.RecordProcessor(
             record_queue=self.record_queue,
             soil_moisture_store=self.mock_soil_moisture_store,
             light_store=self.mock_light_store,
             humidity_store=self.mock_humidity_store,
             temperature_store=self.mock_temperature_store,
-            watering_event_store=self.mock_watering_event_store)
+            watering_event_store=self.mock_watering_event_store,
+            image_store=self.mock_image_store)
+
+    def test_set_poll_interval_updates_reading_stores(self):
+        self.processor.set_poll_interval(datetime.timedelta(minutes=5))
+
+        for store in (self.mock_soil_moisture_store, self.mock_light_store,
+                      self.mock_humidity_store, self.mock_temperature_store):
+            store.set_poll_interval.assert_called_once_with(
+                datetime.timedelta(minutes=5))
 
     def test_process_empty_queue_returns_False(self):
         self.assertFalse(self.processor.try_process_next_record())
@@ -38,6 +49,50 @@ class RecordProcessorTest(unittest.TestCase):
         self.assertTrue(self.processor.try_process_next_record())
         self.mock_soil_moisture_store.insert.assert_called_with(record)
 
+    def test_counts_stored_records_by_type(self):
+        stored = record_processor._records_stored.value(('LightRecord',))
+        self.record_queue.put(
+            db_store.LightRecord(
+                timestamp=datetime.datetime(
+                    2016, 7, 23, 10, 51, 9, 928000, tzinfo=pytz.utc),
+                light=50.0))
+        self.processor.try_process_next_record()
+        self.assertEqual(stored + 1,
+                         record_processor._records_stored.value(
+                             ('LightRecord',)))
+
+    def test_publishes_stored_records(self):
+        mock_publisher = mock.Mock()
+        processor = record_processor.RecordProcessor(
+            self.record_queue, self.mock_soil_moisture_store,
+            self.mock_light_store, self.mock_humidity_store,
+            self.mock_temperature_store, self.mock_watering_event_store,
+            self.mock_image_store, mock_publisher)
+        record = db_store.LightRecord(
+            timestamp=datetime.datetime(
+                2016, 7, 23, 10, 51, 9, 928000, tzinfo=pytz.utc),
+            light=50.0)
+        self.record_queue.put(record)
+        processor.try_process_next_record()
+        mock_publisher.publish.assert_called_once_with(record)
+
+    def test_does_not_publish_records_that_fail(self):
+        mock_publisher = mock.Mock()
+        processor = record_processor.RecordProcessor(
+            self.record_queue, self.mock_soil_moisture_store,
+            self.mock_light_store, self.mock_humidity_store,
+            self.mock_temperature_store, self.mock_watering_event_store,
+            self.mock_image_store, mock_publisher)
+        self.mock_light_store.insert.side_effect = sqlite3.OperationalError(
+            'disk I/O error')
+        self.record_queue.put(
+            db_store.LightRecord(
+                timestamp=datetime.datetime(
+                    2016, 7, 23, 10, 51, 9, 928000, tzinfo=pytz.utc),
+                light=50.0))
+        processor.process_all_records()
+        mock_publisher.publish.assert_not_called()
+
     def test_process_light_record(self):
         record = db_store.LightRecord(
             timestamp=datetime.datetime(
@@ -74,8 +129,40 @@ class RecordProcessorTest(unittest.TestCase):
         self.assertTrue(self.processor.try_process_next_record())
         self.mock_watering_event_store.insert.assert_called_with(record)
 
+    def test_process_image_record(self):
+        record = db_store.ImageRecord(
+            timestamp=datetime.datetime(
+                2016, 7, 23, 10, 51, 9, 928000, tzinfo=pytz.utc),
+            path='2016-07-23T1051Z.jpg',
+            thumbnail_path='2016-07-23T1051Z-thumb.jpg',
+            web_path='2016-07-23T1051Z-web.jpg',
+            width=3280,
+            height=2464,
+            size_bytes=2500000,
+            brightness=62.5)
+        self.record_queue.put(record)
+        self.assertTrue(self.processor.try_process_next_record())
+        self.mock_image_store.insert.assert_called_with(record)
+
     def test_rejects_unsupported_record(self):
         record = 'dummy invalid record'
         self.record_queue.put(record)
         with self.assertRaises(record_processor.UnsupportedRecordError):
             self.processor.try_process_next_record()
+
+    def test_process_all_records_skips_records_that_fail(self):
+        timestamp = datetime.datetime(
+            2016, 7, 23, 10, 51, 9, 928000, tzinfo=pytz.utc)
+        self.mock_light_store.insert.side_effect = sqlite3.OperationalError(
+            'database is locked')
+        self.record_queue.put(db_store.LightRecord(timestamp, 29.2))
+        self.record_queue.put('dummy invalid record')
+        self.record_queue.put(db_store.HumidityRecord(timestamp, 50.0))
+        self.record_queue.put(db_store.TemperatureRecord(timestamp, 21.0))
+        self.assertEqual((2, 2), self.processor.process_all_records())
+        self.assertTrue(self.record_queue.empty())
+        self.mock_humidity_store.insert.assert_called_once()
+        self.mock_temperature_store.insert.assert_called_once()
+
+    def test_process_all_records_with_empty_queue(self):
+        self.assertEqual((0, 0), self.processor.process_all_records())
@@ -0,0 +1,61 @@
+import unittest
+
+from greenpithumb import record_publisher
+
+
+class RecordPublisherTest(unittest.TestCase):
+
+    def test_publishes_to_every_subscriber(self):
+        publisher = record_publisher.RecordPublisher()
+        subscription_a = publisher.subscribe()
+        subscription_b = publisher.subscribe()
+        publisher.publish('dummy record')
+        self.assertEqual('dummy record', subscription_a.next_record(timeout=0))
+        self.assertEqual('dummy record', subscription_b.next_record(timeout=0))
+
+    def test_next_record_returns_None_on_timeout(self):
+        publisher = record_publisher.RecordPublisher()
+        subscription = publisher.subscribe()
+        self.assertIsNone(subscription.next_record(timeout=0))
+
+    def test_drops_subscriber_whose_buffer_is_full(self):
+        publisher = record_publisher.RecordPublisher(buffer_size=2)
+        slow_subscription = publisher.subscribe()
+        publisher.publish('record 1')
+        publisher.publish('record 2')
+        self.assertFalse(slow_subscription.is_closed())
+
+        publisher.publish('record 3')
+
+        self.assertTrue(slow_subscription.is_closed())
+        # Later records no longer go to the dropped subscriber.
+        slow_subscription.next_record(timeout=0)
+        slow_subscription.next_record(timeout=0)
+        publisher.publish('record 4')
+        self.assertIsNone(slow_subscription.next_record(timeout=0))
+
+    def test_limits_number_of_subscribers(self):
+        publisher = record_publisher.RecordPublisher(max_subscribers=1)
+        subscription = publisher.subscribe()
+        with self.assertRaises(record_publisher.TooManySubscribersError):
+            publisher.subscribe()
+        publisher.unsubscribe(subscription)
+        publisher.subscribe()
+
+    def test_unlimited_subscriptions_do_not_count_toward_limit(self):
+        publisher = record_publisher.RecordPublisher(max_subscribers=1)
+        publisher.subscribe(limited=False)
+        subscription = publisher.subscribe()
+        publisher.subscribe(limited=False)
+        with self.assertRaises(record_publisher.TooManySubscribersError):
+            publisher.subscribe()
+        publisher.publish('record 1')
+        self.assertEqual('record 1', subscription.next_record(timeout=0))
+
+    def test_close_ends_subscriptions(self):
+        publisher = record_publisher.RecordPublisher()
+        subscription = publisher.subscribe()
+        publisher.close()
+        self.assertTrue(subscription.is_closed())
+        # Waiting subscribers wake immediately rather than at the timeout.
+        self.assertIsNone(subscription.next_record(timeout=60))
@@ -0,0 +1,153 @@
+import datetime
+import io
+import random
+import unittest
+
+import mock
+from PIL import Image
+import pytz
+
+from greenpithumb import simulated_hardware
+
+NOON = datetime.datetime(2017, 4, 9, 12, 0, 0, tzinfo=pytz.utc)
+MIDNIGHT = datetime.datetime(2017, 4, 9, 0, 0, 0, tzinfo=pytz.utc)
+EXACT_SETTINGS = simulated_hardware.Settings(
+    latency_seconds=0, noise=0, failure_rate=0)
+FAILING_SETTINGS = simulated_hardware.Settings(
+    latency_seconds=0, noise=0, failure_rate=1)
+LIGHT_CHANNEL = 0
+SOIL_MOISTURE_CHANNEL = 7
+PUMP_PIN = 26
+
+
+class GardenTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_clock = mock.Mock()
+        self.mock_clock.monotonic.return_value = 0.0
+        self.mock_local_clock = mock.Mock()
+        self.mock_local_clock.now.return_value = NOON
+        self.garden = simulated_hardware.Garden(self.mock_clock,
+                                                self.mock_local_clock)
+
+    def test_soil_dries_out_over_time(self):
+        initial_moisture = self.garden.soil_moisture()
+        self.mock_clock.monotonic.return_value = 10 * 60 * 60
+        self.assertAlmostEqual(initial_moisture - 4.0,
+                               self.garden.soil_moisture())
+
+    def test_soil_gets_wetter_while_pump_runs(self):
+        initial_moisture = self.garden.soil_moisture()
+        self.garden.set_pump_running(True)
+        self.mock_clock.monotonic.return_value = 2.0
+        self.garden.set_pump_running(False)
+        self.mock_clock.monotonic.return_value = 3.0
+        self.assertAlmostEqual(
+            initial_moisture + 50.0, self.garden.soil_moisture(), places=2)
+
+    def test_soil_moisture_stays_within_limits(self):
+        self.garden.set_pump_running(True)
+        self.mock_clock.monotonic.return_value = 60 * 60
+        self.assertEqual(900.0, self.garden.soil_moisture())
+        self.garden.set_pump_running(False)
+        self.mock_clock.monotonic.return_value = 365 * 24 * 60 * 60
+        self.assertEqual(250.0, self.garden.soil_moisture())
+
+    def test_light_follows_time_of_day(self):
+        self.mock_local_clock.now.return_value = MIDNIGHT
+        self.assertEqual(5.0, self.garden.light())
+        self.mock_local_clock.now.return_value = datetime.datetime(
+            2017, 4, 9, 13, 0, 0, tzinfo=pytz.utc)
+        self.assertAlmostEqual(90.0, self.garden.light())
+
+    def test_warmest_and_least_humid_in_afternoon(self):
+        self.mock_local_clock.now.return_value = datetime.datetime(
+            2017, 4, 9, 15, 0, 0, tzinfo=pytz.utc)
+        self.assertAlmostEqual(25.0, self.garden.temperature())
+        self.assertAlmostEqual(45.0, self.garden.humidity())
+        self.mock_local_clock.now.return_value = datetime.datetime(
+            2017, 4, 9, 3, 0, 0, tzinfo=pytz.utc)
+        self.assertAlmostEqual(17.0, self.garden.temperature())
+        self.assertAlmostEqual(65.0, self.garden.humidity())
+
+
+class DevicesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_garden = mock.Mock()
+        self.mock_garden.light.return_value = 50.0
+        self.mock_garden.soil_moisture.return_value = 700.0
+        self.mock_garden.temperature.return_value = 21.2
+        self.mock_garden.humidity.return_value = 55.4
+        self.mock_garden.plant_size.return_value = 0.3
+        self.random = random.Random(1)
+
+    def test_gpio_runs_pump_when_pump_pin_changes(self):
+        gpio = simulated_hardware.GPIO(self.mock_garden, PUMP_PIN)
+        gpio.setmode(gpio.BCM)
+        gpio.setup(PUMP_PIN, gpio.OUT)
+        gpio.output(PUMP_PIN, gpio.HIGH)
+        self.mock_garden.set_pump_running.assert_called_once_with(True)
+        gpio.output(PUMP_PIN, gpio.LOW)
+        self.mock_garden.set_pump_running.assert_called_with(False)
+
+    def test_gpio_ignores_other_pins(self):
+        gpio = simulated_hardware.GPIO(self.mock_garden, PUMP_PIN)
+        gpio.output(16, gpio.HIGH)
+        self.mock_garden.set_pump_running.assert_not_called()
+
+    def test_gpio_cleanup_stops_pump(self):
+        gpio = simulated_hardware.GPIO(self.mock_garden, PUMP_PIN)
+        gpio.cleanup()
+        self.mock_garden.set_pump_running.assert_called_once_with(False)
+
+    def test_mcp3008_reads_channels(self):
+        adc = simulated_hardware.MCP3008(self.mock_garden, EXACT_SETTINGS,
+                                         self.random, LIGHT_CHANNEL,
+                                         SOIL_MOISTURE_CHANNEL)
+        self.assertEqual(512, adc.read_adc(LIGHT_CHANNEL))
+        self.assertEqual(700, adc.read_adc(SOIL_MOISTURE_CHANNEL))
+        self.assertEqual(0, adc.read_adc(3))
+
+    def test_mcp3008_failed_read_returns_zero(self):
+        adc = simulated_hardware.MCP3008(self.mock_garden, FAILING_SETTINGS,
+                                         self.random, LIGHT_CHANNEL,
+                                         SOIL_MOISTURE_CHANNEL)
+        self.assertEqual(0, adc.read_adc(SOIL_MOISTURE_CHANNEL))
+
+    def test_mcp3008_noise_stays_within_adc_range(self):
+        self.mock_garden.soil_moisture.return_value = 1023.0
+        adc = simulated_hardware.MCP3008(self.mock_garden,
+                                         simulated_hardware.Settings(
+                                             latency_seconds=0,
+                                             noise=0.5,
+                                             failure_rate=0), self.random,
+                                         LIGHT_CHANNEL, SOIL_MOISTURE_CHANNEL)
+        for _ in range(100):
+            self.assertTrue(0 <= adc.read_adc(SOIL_MOISTURE_CHANNEL) <= 1023)
+
+    def test_dht11_returns_whole_number_readings(self):
+        dht11 = simulated_hardware.DHT11(self.mock_garden, EXACT_SETTINGS,
+                                         self.random)
+        self.assertEqual((55.0, 21.0), dht11.read_retry())
+
+    def test_dht11_returns_None_when_every_attempt_fails(self):
+        dht11 = simulated_hardware.DHT11(self.mock_garden, FAILING_SETTINGS,
+                                         self.random)
+        self.assertEqual((None, None), dht11.read_retry())
+
+    def test_camera_captures_jpeg(self):
+        camera = simulated_hardware.Camera(self.mock_garden, EXACT_SETTINGS,
+                                           self.random)
+        stream = io.BytesIO()
+        camera.capture(stream, format='jpeg')
+        stream.seek(0)
+        image = Image.open(stream)
+        self.assertEqual('JPEG', image.format)
+        self.assertEqual((1640, 1232), image.size)
+
+    def test_camera_failure_raises_CameraError(self):
+        camera = simulated_hardware.Camera(self.mock_garden, FAILING_SETTINGS,
+                                           self.random)
+        with self.assertRaises(simulated_hardware.CameraError):
+            camera.capture(io.BytesIO(), format='jpeg')
@@ -45,3 +45,31 @@ class TestSleepWindowParser(unittest.TestCase):
         for invalid_input in invalid_inputs:
             with self.assertRaises(sleep_windows.InvalidWindowFormatError):
                 sleep_windows.parse(invalid_input)
+
+
+class TestSleepWindowContains(unittest.TestCase):
+
+    def test_time_inside_window(self):
+        self.assertTrue(
+            sleep_windows.contains([(datetime.time(1, 0), datetime.time(3, 15))
+                                   ], datetime.time(2, 0)))
+
+    def test_window_start_is_inclusive_and_end_is_exclusive(self):
+        windows = [(datetime.time(1, 0), datetime.time(3, 15))]
+        self.assertTrue(sleep_windows.contains(windows, datetime.time(1, 0)))
+        self.assertFalse(sleep_windows.contains(windows, datetime.time(3, 15)))
+
+    def test_time_outside_all_windows(self):
+        self.assertFalse(
+            sleep_windows.contains([(datetime.time(1, 0), datetime.time(
+                3, 15)), (datetime.time(13, 45), datetime.time(16, 0))],
+                                   datetime.time(12, 0)))
+
+    def test_window_that_wraps_midnight(self):
+        windows = [(datetime.time(23, 15), datetime.time(7, 0))]
+        self.assertTrue(sleep_windows.contains(windows, datetime.time(23, 30)))
+        self.assertTrue(sleep_windows.contains(windows, datetime.time(3, 0)))
+        self.assertFalse(sleep_windows.contains(windows, datetime.time(7, 0)))
+
+    def test_no_windows(self):
+        self.assertFalse(sleep_windows.contains([], datetime.time(2, 0)))
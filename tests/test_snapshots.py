@@ -0,0 +1,251 @@
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+import pytz
+
+from greenpithumb import db_store
+from greenpithumb import record_publisher
+from greenpithumb import snapshots
+
+_NOW = datetime.datetime(2016, 7, 23, 10, 30, tzinfo=pytz.utc)
+
+
+class SnapshotWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self.snapshot_dir = os.path.join(self._temp_dir, 'snapshots')
+        self.connection = db_store.open_or_create_db(
+            os.path.join(self._temp_dir, 'test.db'))
+        self.temperature_store = db_store.TemperatureStore(self.connection)
+        self.publisher = record_publisher.RecordPublisher()
+        self.mock_clock = mock.Mock()
+        self.mock_clock.now.return_value = _NOW
+        self.writer = snapshots.SnapshotWriter(
+            self.snapshot_dir, self.connection, self.publisher, self.mock_clock)
+
+    def tearDown(self):
+        self.writer.close()
+        self.connection.close()
+        shutil.rmtree(self._temp_dir)
+
+    def _store(self, record):
+        """Stores a record as the record processor does."""
+        store_type = {
+            db_store.TemperatureRecord: db_store.TemperatureStore,
+            db_store.HumidityRecord: db_store.HumidityStore,
+            db_store.ImageRecord: db_store.ImageStore,
+        }[type(record)]
+        store_type(self.connection).insert(record)
+        self.publisher.publish(record)
+
+    def _read(self, file_name):
+        with open(os.path.join(self.snapshot_dir, file_name)) as snapshot:
+            return json.load(snapshot)
+
+    def _remove_snapshots(self):
+        for file_name in os.listdir(self.snapshot_dir):
+            os.remove(os.path.join(self.snapshot_dir, file_name))
+
+    def test_loads_snapshots_from_database(self):
+        for record in [
+                db_store.TemperatureRecord(
+                    _NOW - datetime.timedelta(days=2), 10.0),
+                db_store.TemperatureRecord(
+                    _NOW - datetime.timedelta(hours=2, minutes=20), 20.0),
+                db_store.TemperatureRecord(
+                    _NOW - datetime.timedelta(hours=2, minutes=10), 22.0),
+                db_store.TemperatureRecord(
+                    _NOW - datetime.timedelta(minutes=10), 30.0),
+        ]:
+            self.temperature_store.insert(record)
+
+        self.writer.update()
+
+        self.assertEqual({
+            'sensor':
+            'temperature',
+            'window':
+            '24h',
+            'readings': [
+                {
+                    'timestamp': '2016-07-23T08:10Z',
+                    'temperature': 20.0
+                },
+                {
+                    'timestamp': '2016-07-23T08:20Z',
+                    'temperature': 22.0
+                },
+                {
+                    'timestamp': '2016-07-23T10:20Z',
+                    'temperature': 30.0
+                },
+            ],
+        }, self._read('temperature-24h.json'))
+        self.assertEqual({
+            'sensor':
+            'temperature',
+            'window':
+            '7d',
+            'step':
+            3600,
+            'summaries': [
+                {
+                    'timestamp': '2016-07-21T10:00Z',
+                    'mean': 10.0,
+                    'minimum': 10.0,
+                    'maximum': 10.0,
+                    'count': 1
+                },
+                {
+                    'timestamp': '2016-07-23T08:00Z',
+                    'mean': 21.0,
+                    'minimum': 20.0,
+                    'maximum': 22.0,
+                    'count': 2
+                },
+                {
+                    'timestamp': '2016-07-23T10:00Z',
+                    'mean': 30.0,
+                    'minimum': 30.0,
+                    'maximum': 30.0,
+                    'count': 1
+                },
+            ],
+        }, self._read('temperature-7d.json'))
+        self.assertEqual([], self._read('humidity-24h.json')['readings'])
+        self.assertIsNone(self._read('latest_image.json'))
+
+    def test_rewrites_only_snapshots_that_new_records_land_in(self):
+        self.writer.update()
+        self._remove_snapshots()
+
+        self._store(
+            db_store.HumidityRecord(_NOW - datetime.timedelta(minutes=5), 50.0))
+        self.writer.update()
+
+        self.assertEqual(
+            ['humidity-24h.json', 'humidity-7d.json', 'humidity-90d.json'],
+            sorted(os.listdir(self.snapshot_dir)))
+        self.assertEqual([{
+            'timestamp': '2016-07-23T10:25Z',
+            'humidity': 50.0
+        }], self._read('humidity-24h.json')['readings'])
+
+    def test_updates_summaries_with_new_readings(self):
+        self.temperature_store.insert(
+            db_store.TemperatureRecord(
+                _NOW - datetime.timedelta(minutes=20), 20.0))
+        self.writer.update()
+
+        self._store(
+            db_store.TemperatureRecord(
+                _NOW - datetime.timedelta(minutes=10), 23.0))
+        self.writer.update()
+
+        self.assertEqual([{
+            'timestamp': '2016-07-23T06:00Z',
+            'mean': 21.5,
+            'minimum': 20.0,
+            'maximum': 23.0,
+            'count': 2
+        }], self._read('temperature-90d.json')['summaries'])
+
+    def test_replaces_reading_with_same_timestamp(self):
+        self.temperature_store.insert(
+            db_store.TemperatureRecord(
+                _NOW - datetime.timedelta(minutes=20), 20.0))
+        self.writer.update()
+
+        self._store(
+            db_store.TemperatureRecord(
+                _NOW - datetime.timedelta(minutes=20), 23.0))
+        self.writer.update()
+
+        self.assertEqual([{
+            'timestamp': '2016-07-23T10:10Z',
+            'temperature': 23.0
+        }], self._read('temperature-24h.json')['readings'])
+        self.assertEqual([{
+            'timestamp': '2016-07-23T06:00Z',
+            'mean': 23.0,
+            'minimum': 23.0,
+            'maximum': 23.0,
+            'count': 1
+        }], self._read('temperature-90d.json')['summaries'])
+
+    def test_ignores_records_older_than_window(self):
+        self.writer.update()
+        self._remove_snapshots()
+
+        self._store(
+            db_store.HumidityRecord(_NOW - datetime.timedelta(days=3), 50.0))
+        self.writer.update()
+
+        self.assertEqual(['humidity-7d.json', 'humidity-90d.json'],
+                         sorted(os.listdir(self.snapshot_dir)))
+
+    def test_rewrites_snapshots_that_records_age_out_of(self):
+        self.temperature_store.insert(
+            db_store.TemperatureRecord(
+                _NOW - datetime.timedelta(hours=23), 20.0))
+        self.writer.update()
+        self._remove_snapshots()
+
+        self.mock_clock.now.return_value = _NOW + datetime.timedelta(hours=2)
+        self.writer.update()
+
+        self.assertEqual(['temperature-24h.json'],
+                         os.listdir(self.snapshot_dir))
+        self.assertEqual([], self._read('temperature-24h.json')['readings'])
+
+    def test_writes_latest_image(self):
+        self.writer.update()
+        image = db_store.ImageRecord(
+            timestamp=_NOW,
+            path='2016-07-23/2016-07-23T1030Z.jpg',
+            thumbnail_path='2016-07-23/2016-07-23T1030Z-thumb.jpg',
+            web_path='2016-07-23/2016-07-23T1030Z-web.jpg',
+            width=3280,
+            height=2464,
+            size_bytes=1024,
+            brightness=50.0)
+        self._store(image)
+        self._store(
+            image._replace(
+                timestamp=_NOW - datetime.timedelta(hours=1),
+                path='2016-07-23/2016-07-23T0930Z.jpg'))
+        self.writer.update()
+
+        self.assertEqual('2016-07-23/2016-07-23T1030Z.jpg',
+                         self._read('latest_image.json')['path'])
+
+    def test_loads_while_publisher_has_maximum_subscribers(self):
+        for _ in range(record_publisher.DEFAULT_MAX_SUBSCRIBERS):
+            self.publisher.subscribe()
+        self._store(db_store.TemperatureRecord(_NOW, 20.0))
+
+        self.writer.update()
+        self._store(
+            db_store.TemperatureRecord(
+                _NOW - datetime.timedelta(minutes=1), 21.0))
+        self.writer.update()
+
+        self.assertEqual(2, len(self._read('temperature-24h.json')['readings']))
+
+    def test_reloads_from_database_after_falling_behind(self):
+        self.writer.update()
+        for minute in range(record_publisher.DEFAULT_BUFFER_SIZE + 1):
+            self._store(
+                db_store.TemperatureRecord(
+                    _NOW - datetime.timedelta(minutes=minute), 20.0))
+
+        self.writer.update()
+
+        self.assertEqual(record_publisher.DEFAULT_BUFFER_SIZE + 1,
+                         len(self._read('temperature-24h.json')['readings']))
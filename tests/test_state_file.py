@@ -0,0 +1,159 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+import pytz
+
+from greenpithumb import state_file
+
+TIMESTAMP_A = datetime.datetime(2017, 4, 9, 11, 45, 0, tzinfo=pytz.utc)
+TIMESTAMP_B = datetime.datetime(2017, 4, 9, 12, 0, 0, tzinfo=pytz.utc)
+TIMESTAMP_C = datetime.datetime(2017, 4, 12, 8, 30, 0, tzinfo=pytz.utc)
+
+
+class StateFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+        self.state_path = os.path.join(self.state_dir, 'state.json')
+        self.state_file = state_file.StateFile(self.state_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.state_dir)
+
+    def test_loads_saved_state(self):
+        state = state_file.State(
+            last_poll_times={
+                'temperature': TIMESTAMP_A,
+                'camera': TIMESTAMP_B,
+            },
+            pump_deadline=TIMESTAMP_C,
+            retention_progress={'downscale': TIMESTAMP_B})
+        self.state_file.save(state)
+        self.assertEqual(state, self.state_file.load())
+        self.assertEqual(['state.json'], os.listdir(self.state_dir))
+
+    def test_save_replaces_previous_state(self):
+        self.state_file.save(
+            state_file.State(
+                last_poll_times={'temperature': TIMESTAMP_A},
+                pump_deadline=TIMESTAMP_C,
+                retention_progress={'downscale': TIMESTAMP_A}))
+        state = state_file.State(
+            last_poll_times={'temperature': TIMESTAMP_B},
+            pump_deadline=None,
+            retention_progress={'downscale': TIMESTAMP_B})
+        self.state_file.save(state)
+        self.assertEqual(state, self.state_file.load())
+
+    def test_converts_timestamps_to_utc(self):
+        self.state_file.save(
+            state_file.State(
+                last_poll_times={
+                    'light':
+                    pytz.timezone('America/New_York').localize(
+                        datetime.datetime(2017, 4, 9, 7, 45, 0))
+                },
+                pump_deadline=None,
+                retention_progress={}))
+        self.assertEqual(TIMESTAMP_A,
+                         self.state_file.load().last_poll_times['light'])
+
+    def test_load_returns_empty_state_when_file_is_missing(self):
+        self.assertEqual(
+            state_file.State(
+                last_poll_times={}, pump_deadline=None, retention_progress={}),
+            self.state_file.load())
+
+    def test_load_returns_empty_state_when_file_is_corrupt(self):
+        with open(self.state_path, 'w') as f:
+            f.write('{"version": 1, "last_poll_')
+        self.assertEqual(
+            state_file.State(
+                last_poll_times={}, pump_deadline=None, retention_progress={}),
+            self.state_file.load())
+
+    def test_load_returns_empty_state_when_file_has_wrong_shape(self):
+        with open(self.state_path, 'w') as f:
+            f.write('{"version": 1, "last_poll_times": {"light": 1491738300}, '
+                    '"pump_deadline": null}')
+        self.assertEqual(
+            state_file.State(
+                last_poll_times={}, pump_deadline=None, retention_progress={}),
+            self.state_file.load())
+
+    def test_load_returns_empty_state_when_file_is_not_an_object(self):
+        with open(self.state_path, 'w') as f:
+            f.write('[1, 2, 3]')
+        self.assertEqual(
+            state_file.State(
+                last_poll_times={}, pump_deadline=None, retention_progress={}),
+            self.state_file.load())
+
+    def test_loads_state_saved_without_retention_progress(self):
+        with open(self.state_path, 'w') as f:
+            f.write('{"version": 1, "last_poll_times": {}, '
+                    '"pump_deadline": "2017-04-12T08:30:00Z"}')
+        self.assertEqual(
+            state_file.State(
+                last_poll_times={},
+                pump_deadline=TIMESTAMP_C,
+                retention_progress={}), self.state_file.load())
+
+    def test_load_returns_empty_state_when_version_is_unknown(self):
+        with open(self.state_path, 'w') as f:
+            f.write('{"version": 99, "last_poll_times": {}, '
+                    '"pump_deadline": null}')
+        self.assertEqual(
+            state_file.State(
+                last_poll_times={}, pump_deadline=None, retention_progress={}),
+            self.state_file.load())
+
+
+class StateRecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_state_file = mock.Mock()
+        self.mock_temperature_scheduler = mock.Mock()
+        self.mock_camera_scheduler = mock.Mock()
+        self.mock_pump_timer = mock.Mock()
+        self.mock_retention_job = mock.Mock()
+        self.mock_temperature_scheduler.last_completed_poll_time.return_value = (
+            TIMESTAMP_A)
+        self.mock_camera_scheduler.last_completed_poll_time.return_value = None
+        self.mock_pump_timer.deadline.return_value = TIMESTAMP_C
+        self.mock_retention_job.progress.return_value = {
+            'downscale': TIMESTAMP_B
+        }
+        self.recorder = state_file.StateRecorder(self.mock_state_file, {
+            'temperature':
+            self.mock_temperature_scheduler,
+            'camera':
+            self.mock_camera_scheduler,
+        }, self.mock_pump_timer, self.mock_retention_job)
+
+    def test_saves_state_of_schedulers_that_have_polled(self):
+        self.recorder.save_if_changed()
+        self.mock_state_file.save.assert_called_once_with(
+            state_file.State(
+                last_poll_times={'temperature': TIMESTAMP_A},
+                pump_deadline=TIMESTAMP_C,
+                retention_progress={'downscale': TIMESTAMP_B}))
+
+    def test_saves_only_when_state_changes(self):
+        self.recorder.save_if_changed()
+        self.recorder.save_if_changed()
+        self.assertEqual(1, self.mock_state_file.save.call_count)
+        self.mock_temperature_scheduler.last_completed_poll_time.return_value = (
+            TIMESTAMP_B)
+        self.recorder.save_if_changed()
+        self.assertEqual(2, self.mock_state_file.save.call_count)
+
+    def test_retries_after_failed_save(self):
+        self.mock_state_file.save.side_effect = [IOError('disk full'), None]
+        self.recorder.save_if_changed()
+        self.recorder.save_if_changed()
+        self.assertEqual(2, self.mock_state_file.save.call_count)